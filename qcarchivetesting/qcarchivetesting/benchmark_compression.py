@@ -0,0 +1,125 @@
+"""
+Benchmarks compression of results (as done by compute managers) on the procedure test data
+
+Run with ``python -m qcarchivetesting.benchmark_compression``. Reports the compression ratio and throughput
+for different compression settings. The dictionary is trained on half of the results and tested on the other half.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import msgpack
+import tabulate
+
+from qcfractalcompute.compress import compress_result, train_result_dictionary, _convert_numpy
+from .helpers import _my_path, read_procedure_data
+
+_result_schemas = ("qcschema_output", "qcschema_optimization_output")
+
+
+def _find_results(data: Any, results: List[Dict[str, Any]]):
+    """
+    Finds all QCSchema results (singlepoint & optimization) in the procedure data
+    """
+
+    if hasattr(data, "model_dump"):
+        data = data.model_dump()
+
+    if isinstance(data, dict):
+        if data.get("schema_name", None) in _result_schemas:
+            results.append(data)
+        else:
+            for v in data.values():
+                _find_results(v, results)
+    elif isinstance(data, (list, tuple)):
+        for v in data:
+            _find_results(v, results)
+
+
+def load_all_results() -> List[Dict[str, Any]]:
+    results = []
+
+    for filename in sorted(os.listdir(os.path.join(_my_path, "procedure_data"))):
+        name = filename.split(".")[0]
+        _find_results(read_procedure_data(name), results)
+
+    return results
+
+
+def _benchmark(results: List[Dict[str, Any]], repeat: int, **kwargs) -> tuple[int, int, float]:
+    raw_size = sum(len(msgpack.packb(_convert_numpy(r), use_bin_type=True)) for r in results)
+
+    compressed_size = 0
+    elapsed = 0.0
+    for i in range(repeat):
+        time_0 = time.perf_counter()
+        compressed = [compress_result(r, **kwargs) for r in results]
+        elapsed += time.perf_counter() - time_0
+        compressed_size = sum(len(x) for x in compressed)
+
+    return raw_size, compressed_size, elapsed / repeat
+
+
+def main(repeat: int = 3, levels: Optional[List[int]] = None, dict_size: int = 65536):
+    if levels is None:
+        levels = [3, 9]
+
+    all_results = load_all_results()
+
+    # Train on every other result, test on the rest
+    train_results = all_results[0::2]
+    test_results = all_results[1::2]
+
+    print(f"Loaded {len(all_results)} results. Training dictionary on {len(train_results)}")
+
+    dict_data = train_result_dictionary(train_results, dict_size)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dict_path = os.path.join(tmpdir, "results.zdict")
+        with open(dict_path, "wb") as f:
+            f.write(dict_data)
+
+        configurations = [("default", {})]
+        configurations += [(f"level {x}", {"compression_level": x}) for x in levels]
+        configurations += [(f"level {x}, all threads", {"compression_level": x, "n_threads": -1}) for x in levels]
+        configurations += [("default, dictionary", {"dictionary_path": dict_path})]
+        configurations += [
+            (f"level {x}, dictionary", {"compression_level": x, "dictionary_path": dict_path}) for x in levels
+        ]
+
+        rows = []
+        for name, kwargs in configurations:
+            raw_size, compressed_size, elapsed = _benchmark(test_results, repeat, **kwargs)
+            rows.append(
+                (
+                    name,
+                    raw_size / 1048576,
+                    compressed_size / 1048576,
+                    raw_size / compressed_size,
+                    raw_size / 1048576 / elapsed,
+                    len(test_results) / elapsed,
+                )
+            )
+
+    print(
+        tabulate.tabulate(
+            rows,
+            headers=["settings", "raw (MiB)", "compressed (MiB)", "ratio", "MiB/s", "results/s"],
+            floatfmt=".2f",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark compression of results using the procedure test data")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to compress each result")
+    parser.add_argument("--levels", type=int, nargs="+", default=[3, 9], help="zstd compression levels to test")
+    parser.add_argument("--dict-size", type=int, default=65536, help="Size of the trained dictionary (bytes)")
+    args = parser.parse_args()
+
+    main(args.repeat, args.levels, args.dict_size)
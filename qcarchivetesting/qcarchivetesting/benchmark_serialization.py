@@ -0,0 +1,124 @@
+"""
+Benchmarks returning molecules to the client, as done in molecule and record fetches
+
+Run with ``python -m qcarchivetesting.benchmark_serialization``. Reports the server CPU time (reading the
+columns as stored in the database, then serializing the response), the size of the response, and the client
+CPU time (deserializing into Molecule objects) for different encodings.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import tabulate
+
+from qcfractal.components.molecules.db_models import MoleculeORM, _molecule_fields_to_ndarray
+from qcfractal.db_socket.column_types import MsgpackExt
+from qcportal.molecules import Molecule
+from qcportal.serialization import serialize, deserialize
+from .helpers import load_molecule_data
+
+_msgpackext_columns = [c.name for c in MoleculeORM.__table__.columns if isinstance(c.type, MsgpackExt)]
+
+
+def _replicate_molecule(molecule: Molecule, n_copies: int) -> Molecule:
+    # Make a larger molecule from copies of a molecule, spaced out along the x axis
+    if n_copies == 1:
+        return molecule
+
+    geometry = [molecule.geometry + [20.0 * i, 0.0, 0.0] for i in range(n_copies)]
+    return Molecule(symbols=list(molecule.symbols) * n_copies, geometry=np.concatenate(geometry))
+
+
+def generate_rows(n_molecules: int, molecule_name: str, n_copies: int) -> List[Dict[str, Any]]:
+    """
+    Generates molecules (with perturbed geometries), as they would be stored in the database
+
+    Each molecule is made up of n_copies of the test molecule.
+    """
+
+    base_molecule = _replicate_molecule(load_molecule_data(molecule_name), n_copies)
+    rng = np.random.default_rng(42)
+    column_type = MsgpackExt()
+
+    rows = []
+    for _ in range(n_molecules):
+        geometry = base_molecule.geometry + rng.normal(scale=0.01, size=base_molecule.geometry.shape)
+        mol = Molecule(**base_molecule.model_dump(exclude={"geometry", "identifiers"}), geometry=geometry)
+        d = MoleculeORM.insert_dict_from_model(mol)
+        # Match what is returned from the database (see MoleculeORM)
+        del d["molecule_hash"]
+        d.update(validated=True, fix_com=True, fix_orientation=True)
+
+        # Store msgpack columns as the raw bytes that would be in the database
+        rows.append(
+            {k: column_type.process_bind_param(v, None) if k in _msgpackext_columns else v for k, v in d.items()}
+        )
+
+    return rows
+
+
+def _server_response(rows: List[Dict[str, Any]], content_type: str) -> bytes:
+    column_type = MsgpackExt()
+    ret = []
+    for row in rows:
+        d = {k: column_type.process_result_value(v, None) if k in _msgpackext_columns else v for k, v in row.items()}
+
+        # Arrays are only sent to clients that accept them (see MoleculeORM.model_dict)
+        if content_type == "application/msgpack-ndarray":
+            d = _molecule_fields_to_ndarray(d)
+
+        ret.append(d)
+
+    return serialize(ret, content_type)
+
+
+def _benchmark(rows: List[Dict[str, Any]], content_type: str, repeat: int) -> tuple[int, float, float]:
+    server_time = 0.0
+    client_time = 0.0
+    for i in range(repeat):
+        time_0 = time.perf_counter()
+        data = _server_response(rows, content_type)
+        time_1 = time.perf_counter()
+        deserialize(data, content_type, List[Molecule])
+        time_2 = time.perf_counter()
+
+        server_time += time_1 - time_0
+        client_time += time_2 - time_1
+
+    return len(data), server_time / repeat, client_time / repeat
+
+
+def main(n_molecules: int = 10000, molecule_name: str = "benzene_dimer", n_copies: int = 1, repeat: int = 3):
+    db_rows = generate_rows(n_molecules, molecule_name, n_copies)
+
+    content_types = ["application/json", "application/msgpack", "application/msgpack-ndarray"]
+
+    rows = []
+    for content_type in content_types:
+        size, server_time, client_time = _benchmark(db_rows, content_type, repeat)
+        rows.append((content_type, size / 1048576, server_time, client_time))
+
+    n_atoms = len(MsgpackExt().process_result_value(db_rows[0]["symbols"], None))
+    print(f"Fetching {n_molecules} molecules ({molecule_name} x {n_copies}, {n_atoms} atoms)")
+    print(
+        tabulate.tabulate(
+            rows,
+            headers=["encoding", "response (MiB)", "server time (s)", "client time (s)"],
+            floatfmt=".3f",
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serialization of molecules returned to the client")
+    parser.add_argument("--n-molecules", type=int, default=10000, help="Number of molecules to fetch")
+    parser.add_argument("--molecule", type=str, default="benzene_dimer", help="Test molecule to use")
+    parser.add_argument("--copies", type=int, default=1, help="Number of copies of the test molecule in each molecule")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to run each benchmark")
+    args = parser.parse_args()
+
+    main(args.n_molecules, args.molecule, args.copies, args.repeat)
@@ -0,0 +1,199 @@
+"""
+Benchmarks loading the completed dependencies of a service, as done at the start of each service iteration
+
+Run with ``python -m qcarchivetesting.benchmark_service_iteration``. A temporary postgres instance is created
+containing a torsiondrive service that depends on many completed optimizations (for example, one wave of a 2D
+torsiondrive). Reports the number of SQL statements and the time taken to load the dependencies and the
+geometries of their molecules, both one dependency at a time and in bulk.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from typing import List, Tuple
+
+import numpy as np
+import tabulate
+from sqlalchemy import event, select
+from sqlalchemy.orm import selectinload, joinedload
+
+from qcfractal.components.molecules.db_models import MoleculeORM
+from qcfractal.components.optimization.record_db_models import OptimizationRecordORM
+from qcfractal.components.services.db_models import ServiceQueueORM, ServiceDependencyORM
+from qcfractal.components.torsiondrive.testing_helpers import load_procedure_data
+from qcfractal.db_socket import SQLAlchemySocket
+from qcportal.molecules import Molecule
+from qcportal.record_models import RecordStatusEnum, PriorityEnum
+from qcportal.utils import reshape_molecule
+from .testing_classes import QCATestingPostgresServer
+from .testing_fixtures import _generate_default_config
+
+
+def populate_service(storage_socket: SQLAlchemySocket, n_dependencies: int, n_copies: int) -> int:
+    """
+    Adds a torsiondrive service with n_dependencies completed optimizations as dependencies
+
+    Each molecule is made up of n_copies of the test molecule. Returns the id of the service.
+    """
+
+    input_spec, molecules, _ = load_procedure_data("td_H2O2_mopac_pm6")
+    meta, td_ids = storage_socket.records.torsiondrive.add(
+        [molecules], input_spec, True, "*", PriorityEnum.normal, None, True
+    )
+    assert meta.success
+
+    # Initial and final molecules of each optimization, with perturbed geometries
+    base_molecule = molecules[0]
+    geometry = np.concatenate([base_molecule.geometry + [20.0 * i, 0.0, 0.0] for i in range(n_copies)])
+    symbols = list(base_molecule.symbols) * n_copies
+
+    rng = np.random.default_rng(42)
+    new_molecules = [
+        Molecule(symbols=symbols, geometry=geometry + rng.normal(scale=0.01, size=geometry.shape))
+        for _ in range(2 * n_dependencies)
+    ]
+    meta, mol_ids = storage_socket.molecules.add(new_molecules)
+    assert meta.success
+
+    meta, spec_id = storage_socket.records.optimization.add_specification(input_spec.optimization_specification)
+    assert meta.success
+
+    with storage_socket.session_scope() as session:
+        service_id = session.execute(
+            select(ServiceQueueORM.id).where(ServiceQueueORM.record_id == td_ids[0])
+        ).scalar_one()
+
+        opt_orms = [
+            OptimizationRecordORM(
+                is_service=False,
+                status=RecordStatusEnum.complete,
+                specification_id=spec_id,
+                initial_molecule_id=mol_ids[2 * i],
+                final_molecule_id=mol_ids[2 * i + 1],
+                energies=[-150.0, -150.0 - i * 1.0e-4],
+            )
+            for i in range(n_dependencies)
+        ]
+        session.add_all(opt_orms)
+        session.flush()
+
+        for i, opt_orm in enumerate(opt_orms):
+            session.add(
+                ServiceDependencyORM(
+                    service_id=service_id,
+                    record_id=opt_orm.id,
+                    extras={"position": i, "td_api_key": f"[{i}]"},
+                )
+            )
+
+    return service_id
+
+
+def _load_per_dependency(storage_socket: SQLAlchemySocket, service_id: int) -> List[Tuple[list, list, float]]:
+    # Loads each dependency (and its molecules) as it is accessed
+    with storage_socket.session_scope(True) as session:
+        stmt = select(ServiceQueueORM).options(selectinload(ServiceQueueORM.dependencies))
+        service_orm = session.execute(stmt.where(ServiceQueueORM.id == service_id)).scalar_one()
+        assert {x.record.status for x in service_orm.dependencies} == {RecordStatusEnum.complete}
+
+        results = []
+        for task in sorted(service_orm.dependencies, key=lambda x: x.extras["position"]):
+            opt_record = task.record
+            mol_ids = [opt_record.initial_molecule_id, opt_record.final_molecule_id]
+            mol_data = storage_socket.molecules.get(molecule_id=mol_ids, include=["geometry"], session=session)
+
+            initial_mol_geom = reshape_molecule(np.asarray(mol_data[0]["geometry"]).ravel().tolist())
+            final_mol_geom = reshape_molecule(np.asarray(mol_data[1]["geometry"]).ravel().tolist())
+            results.append((initial_mol_geom, final_mol_geom, opt_record.energies[-1]))
+
+        return results
+
+
+def _load_bulk(storage_socket: SQLAlchemySocket, service_id: int) -> List[Tuple[list, list, float]]:
+    # Loads the dependencies as is done in service iteration
+    with storage_socket.session_scope(True) as session:
+        stmt = select(ServiceQueueORM)
+        stmt = stmt.options(selectinload(ServiceQueueORM.dependencies).selectinload(ServiceDependencyORM.record))
+        service_orm = session.execute(stmt.where(ServiceQueueORM.id == service_id)).scalar_one()
+        assert {x.record.status for x in service_orm.dependencies} == {RecordStatusEnum.complete}
+
+        complete_tasks = storage_socket.records.torsiondrive.load_service_dependencies(
+            session,
+            service_orm,
+            OptimizationRecordORM,
+            [
+                joinedload(OptimizationRecordORM.initial_molecule).load_only(MoleculeORM.geometry),
+                joinedload(OptimizationRecordORM.final_molecule).load_only(MoleculeORM.geometry),
+            ],
+        )
+
+        results = []
+        for _, opt_record in complete_tasks:
+            initial_mol_geom = np.asarray(opt_record.initial_molecule.geometry).reshape(-1, 3).tolist()
+            final_mol_geom = np.asarray(opt_record.final_molecule.geometry).reshape(-1, 3).tolist()
+            results.append((initial_mol_geom, final_mol_geom, opt_record.energies[-1]))
+
+        return results
+
+
+def _benchmark(storage_socket: SQLAlchemySocket, service_id: int, func, repeat: int) -> Tuple[int, float, list]:
+    n_statements = 0
+
+    def _count_statements(*args, **kwargs):
+        nonlocal n_statements
+        n_statements += 1
+
+    event.listen(storage_socket.engine, "before_cursor_execute", _count_statements)
+    try:
+        time_0 = time.perf_counter()
+        for _ in range(repeat):
+            results = func(storage_socket, service_id)
+        time_1 = time.perf_counter()
+    finally:
+        event.remove(storage_socket.engine, "before_cursor_execute", _count_statements)
+
+    return n_statements // repeat, (time_1 - time_0) / repeat, results
+
+
+def main(n_dependencies: int = 576, n_copies: int = 1, repeat: int = 3):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pg_server = QCATestingPostgresServer(tmpdir)
+
+        try:
+            pg_harness = pg_server.get_new_harness("benchmark_service_iteration")
+            storage_socket = SQLAlchemySocket(_generate_default_config(pg_harness))
+            service_id = populate_service(storage_socket, n_dependencies, n_copies)
+
+            configurations = [
+                ("per dependency", _load_per_dependency),
+                ("bulk", _load_bulk),
+            ]
+
+            rows = []
+            all_results = []
+            for name, func in configurations:
+                n_statements, load_time, results = _benchmark(storage_socket, service_id, func, repeat)
+                rows.append((name, n_statements, load_time))
+                all_results.append(results)
+
+            assert all(x == all_results[0] for x in all_results)
+
+            storage_socket.engine.dispose()
+        finally:
+            pg_server.harness.shutdown()
+
+    n_atoms = len(all_results[0][0][0])
+    print(f"Loading {n_dependencies} completed optimizations ({n_atoms} atoms) for a service iteration")
+    print(tabulate.tabulate(rows, headers=["loading", "SQL statements", "time (s)"], floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark loading the dependencies of a service iteration")
+    parser.add_argument("--n-dependencies", type=int, default=576, help="Number of completed dependencies")
+    parser.add_argument("--copies", type=int, default=1, help="Number of copies of the test molecule in each molecule")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to run each benchmark")
+    args = parser.parse_args()
+
+    main(args.n_dependencies, args.copies, args.repeat)
@@ -0,0 +1,118 @@
+"""
+Benchmarks claiming tasks from a large task queue
+
+Run with ``python -m qcarchivetesting.benchmark_task_claim``. A temporary postgres instance is created
+containing many waiting tasks spread over several compute tags. Reports the time taken to claim tasks
+when a manager has to search through different numbers of (mostly empty) compute tags.
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+from typing import List, Tuple
+
+import tabulate
+from sqlalchemy import text
+
+from qcfractal.db_socket import SQLAlchemySocket
+from qcportal.managers import ManagerName
+from .testing_classes import QCATestingPostgresServer
+from .testing_fixtures import _generate_default_config
+
+_programs = {"qcengine": ["unknown"], "psi4": ["unknown"]}
+
+_insert_records_sql = """
+    INSERT INTO base_record (id, record_type, is_service, extras, status, created_on, modified_on)
+    SELECT i, 'singlepoint', false, '{}'::jsonb, 'waiting', now(), now()
+    FROM generate_series(1, :n_tasks) AS i
+"""
+
+_insert_tasks_sql = """
+    INSERT INTO task_queue (id, function, function_kwargs_compressed, required_programs, sort_date,
+                            compute_tag, compute_priority, available, record_id)
+    SELECT i, 'qcengine.compute', ''::bytea, ARRAY['qcengine', 'psi4'], now() + i * interval '1 ms',
+           'tag' || (i % :n_tags), i % 3, true, i
+    FROM generate_series(1, :n_tasks) AS i
+"""
+
+
+def populate_task_queue(storage_socket: SQLAlchemySocket, n_tasks: int, n_tags: int):
+    """
+    Adds n_tasks waiting tasks, spread over the compute tags tag0 ... tag{n_tags-1}
+    """
+
+    # Insert directly into the tables. Going through the record sockets would take far too long.
+    # All tasks already have their function generated, so claiming does not need to build them.
+    with storage_socket.session_scope() as session:
+        session.execute(text(_insert_records_sql), {"n_tasks": n_tasks})
+        session.execute(text(_insert_tasks_sql), {"n_tasks": n_tasks, "n_tags": n_tags})
+        session.execute(text("SELECT setval('base_record_id_seq', :n_tasks)"), {"n_tasks": n_tasks})
+        session.execute(text("SELECT setval('task_queue_id_seq', :n_tasks)"), {"n_tasks": n_tasks})
+
+    with storage_socket.engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM ANALYZE task_queue, base_record"))
+
+
+def _benchmark(
+    storage_socket: SQLAlchemySocket, manager_name: str, claim_tags: List[str], limit: int, repeat: int
+) -> Tuple[float, float]:
+    timings = []
+    for _ in range(repeat):
+        time_0 = time.perf_counter()
+        tasks = storage_socket.tasks.claim_tasks(manager_name, _programs, claim_tags, limit)
+        timings.append(time.perf_counter() - time_0)
+
+        assert len(tasks) == limit
+        assert all(t["tag"] == claim_tags[-1] for t in tasks)
+
+    return min(timings), max(timings)
+
+
+def main(n_tasks: int = 1_000_000, n_tags: int = 50, limit: int = 200, repeat: int = 5):
+    # Tasks are spread over the "tagN" tags. The "emptyN" tags do not have any tasks
+    all_tags = [f"tag{i}" for i in range(n_tags)] + [f"empty{i}" for i in range(n_tags)]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pg_server = QCATestingPostgresServer(tmpdir)
+
+        try:
+            pg_harness = pg_server.get_new_harness("benchmark_task_claim")
+            storage_socket = SQLAlchemySocket(_generate_default_config(pg_harness))
+
+            mname = ManagerName(cluster="test_cluster", hostname="a_host", uuid="1234-5678-1234-5678")
+            storage_socket.managers.activate(
+                name_data=mname,
+                manager_version="v2.0",
+                username="bill",
+                programs=_programs,
+                compute_tags=all_tags,
+            )
+
+            populate_task_queue(storage_socket, n_tasks, n_tags)
+
+            rows = []
+            for n_claim_tags in sorted({1, min(10, n_tags), n_tags}):
+                # The highest-priority tags do not have any tasks, so all the given tags must be searched
+                claim_tags = [f"empty{i}" for i in range(n_claim_tags - 1)] + ["tag0"]
+                min_time, max_time = _benchmark(storage_socket, mname.fullname, claim_tags, limit, repeat)
+                rows.append((n_claim_tags, min_time * 1000, max_time * 1000))
+
+            storage_socket.engine.dispose()
+        finally:
+            pg_server.harness.shutdown()
+
+    print(f"Claiming {limit} tasks from {n_tasks} waiting tasks")
+    print(tabulate.tabulate(rows, headers=["compute tags", "min (ms)", "max (ms)"], floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark claiming tasks from a large task queue")
+    parser.add_argument("--n-tasks", type=int, default=1_000_000, help="Number of waiting tasks")
+    parser.add_argument("--n-tags", type=int, default=50, help="Number of compute tags containing tasks")
+    parser.add_argument("--limit", type=int, default=200, help="Number of tasks to claim at once")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of times to run each benchmark")
+    args = parser.parse_args()
+
+    main(args.n_tasks, args.n_tags, args.limit, args.repeat)
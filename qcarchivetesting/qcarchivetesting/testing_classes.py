@@ -227,6 +227,10 @@ class QCATestingSnowflake(FractalSnowflake):
 
         if self._api_thread is None:
             self.start_api(wait=True)
+        else:
+            # The API keeps database connections open while listening for record status
+            # and user/session changes
+            self._api_thread.stop_status_listener()
 
         self._pg_harness.recreate_database()
 
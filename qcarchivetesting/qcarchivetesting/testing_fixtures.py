@@ -97,6 +97,9 @@ def storage_socket(session_storage_socket):
 
     socket, pg_harness = session_storage_socket
     yield socket
+
+    # The auth cache keeps a database connection open while listening for changes
+    socket.auth.stop_cache_listener()
     pg_harness.recreate_database()
 
 
@@ -0,0 +1,25 @@
+"""Add task queue tag sort index
+
+Revision ID: 3c1f9e7a2b4d
+Revises: 865e4be6ef5c
+Create Date: 2026-10-16 09:12:44.519203
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c1f9e7a2b4d"
+down_revision = "865e4be6ef5c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX ix_task_queue_tag_sort ON task_queue (compute_tag, compute_priority DESC, sort_date, id) WHERE available = True;"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_task_queue_tag_sort", table_name="task_queue")
@@ -0,0 +1,23 @@
+"""Add service dependency record index
+
+Revision ID: 5d2e8b4c7a91
+Revises: 3c1f9e7a2b4d
+Create Date: 2026-10-17 10:03:27.861530
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5d2e8b4c7a91"
+down_revision = "3c1f9e7a2b4d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_service_dependency_record_id", "service_dependency", ["record_id"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_service_dependency_record_id", table_name="service_dependency")
@@ -0,0 +1,46 @@
+"""Add record status notify trigger
+
+Revision ID: 8a4f1c2e6b3d
+Revises: 5d2e8b4c7a91
+Create Date: 2026-10-17 11:41:09.302716
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8a4f1c2e6b3d"
+down_revision = "5d2e8b4c7a91"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.qca_record_status_notify()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $_$
+            BEGIN
+              PERFORM pg_notify('record_status', NEW.id::text);
+              RETURN NEW;
+            END
+            $_$
+        ;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER qca_base_record_status_tr
+        AFTER UPDATE OF status ON base_record
+        FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE PROCEDURE qca_record_status_notify();
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER qca_base_record_status_tr ON base_record;")
+    op.execute("DROP FUNCTION qca_record_status_notify();")
@@ -0,0 +1,26 @@
+"""Add properties dataset attachment type
+
+Revision ID: b7e3d5a9c1f2
+Revises: 8a4f1c2e6b3d
+Create Date: 2026-10-17 15:20:37.118204
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b7e3d5a9c1f2"
+down_revision = "8a4f1c2e6b3d"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Adding a value to an enum can't be done inside a transaction on older versions of postgres
+    with op.get_context().autocommit_block():
+        op.execute(sa.text("ALTER TYPE datasetattachmenttype ADD VALUE IF NOT EXISTS 'properties'"))
+
+
+def downgrade():
+    raise NotImplementedError("Cannot downgrade")
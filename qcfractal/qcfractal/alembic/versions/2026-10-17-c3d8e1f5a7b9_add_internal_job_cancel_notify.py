@@ -0,0 +1,58 @@
+"""Add internal job cancel notify trigger
+
+Revision ID: c3d8e1f5a7b9
+Revises: 4e9a2c6d8f13
+Create Date: 2026-10-17 16:02:47.518230
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c3d8e1f5a7b9"
+down_revision = "4e9a2c6d8f13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.qca_internal_jobs_cancel_notify()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $_$
+            BEGIN
+              PERFORM pg_notify('internal_job_cancelled', OLD.id::text);
+              RETURN NULL;
+            END
+            $_$
+        ;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER qca_internal_jobs_update_tr
+        AFTER UPDATE OF status, runner_uuid ON internal_jobs
+        FOR EACH ROW WHEN (
+            OLD.status = 'running' AND (NEW.status != 'running' OR OLD.runner_uuid IS DISTINCT FROM NEW.runner_uuid)
+        )
+        EXECUTE PROCEDURE qca_internal_jobs_cancel_notify();
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER qca_internal_jobs_delete_tr
+        AFTER DELETE ON internal_jobs
+        FOR EACH ROW WHEN (OLD.status = 'running')
+        EXECUTE PROCEDURE qca_internal_jobs_cancel_notify();
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER qca_internal_jobs_delete_tr ON internal_jobs;")
+    op.execute("DROP TRIGGER qca_internal_jobs_update_tr ON internal_jobs;")
+    op.execute("DROP FUNCTION qca_internal_jobs_cancel_notify();")
@@ -0,0 +1,69 @@
+"""Add notify triggers for changes to users and sessions
+
+Revision ID: e6a2b9d4c1f7
+Revises: c3d8e1f5a7b9
+Create Date: 2026-10-17 18:24:51.730415
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e6a2b9d4c1f7"
+down_revision = "c3d8e1f5a7b9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION public.qca_auth_changed_notify()
+        RETURNS trigger
+        LANGUAGE plpgsql
+        AS $_$
+            BEGIN
+              IF TG_TABLE_NAME = 'user' THEN
+                PERFORM pg_notify('auth_changed', OLD.id::text);
+              ELSIF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('auth_changed', NEW.user_id::text);
+              ELSE
+                PERFORM pg_notify('auth_changed', OLD.user_id::text);
+              END IF;
+              RETURN NULL;
+            END
+            $_$
+        ;
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER qca_user_changed_tr
+        AFTER UPDATE OR DELETE ON "user"
+        FOR EACH ROW EXECUTE PROCEDURE qca_auth_changed_notify();
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER qca_user_groups_changed_tr
+        AFTER INSERT OR DELETE ON user_groups
+        FOR EACH ROW EXECUTE PROCEDURE qca_auth_changed_notify();
+        """
+    )
+
+    op.execute(
+        """
+        CREATE TRIGGER qca_user_session_deleted_tr
+        AFTER DELETE ON user_session
+        FOR EACH ROW EXECUTE PROCEDURE qca_auth_changed_notify();
+        """
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER qca_user_session_deleted_tr ON user_session;")
+    op.execute("DROP TRIGGER qca_user_groups_changed_tr ON user_groups;")
+    op.execute('DROP TRIGGER qca_user_changed_tr ON "user";')
+    op.execute("DROP FUNCTION qca_auth_changed_notify();")
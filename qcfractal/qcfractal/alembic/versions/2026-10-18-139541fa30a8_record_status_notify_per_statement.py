@@ -0,0 +1,80 @@
+"""Send record status notifications once per statement rather than once per row
+
+Revision ID: 139541fa30a8
+Revises: e2a7c4b91d35
+Create Date: 2026-10-18 16:47:52.610384
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "139541fa30a8"
+down_revision = "e2a7c4b91d35"
+branch_labels = None
+depends_on = None
+
+_new_notify_triggerfunc = """
+    CREATE OR REPLACE FUNCTION public.qca_record_status_notify()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        DECLARE
+          changed_ids text;
+        BEGIN
+          FOR changed_ids IN
+            SELECT string_agg(c.id::text, ',')
+            FROM (
+              SELECT n.id, (row_number() OVER (ORDER BY n.id) - 1) / 500 AS grp
+              FROM new_records n INNER JOIN old_records o ON o.id = n.id
+              WHERE o.status IS DISTINCT FROM n.status
+            ) c
+            GROUP BY c.grp
+          LOOP
+            PERFORM pg_notify('record_status', changed_ids);
+          END LOOP;
+          RETURN NULL;
+        END
+        $_$
+    ;
+"""
+
+_new_notify_trigger = """
+    CREATE TRIGGER qca_base_record_status_tr
+    AFTER UPDATE ON base_record
+    REFERENCING OLD TABLE AS old_records NEW TABLE AS new_records
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE qca_record_status_notify();
+"""
+
+_old_notify_triggerfunc = """
+    CREATE OR REPLACE FUNCTION public.qca_record_status_notify()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        BEGIN
+          PERFORM pg_notify('record_status', NEW.id::text);
+          RETURN NEW;
+        END
+        $_$
+    ;
+"""
+
+_old_notify_trigger = """
+    CREATE TRIGGER qca_base_record_status_tr
+    AFTER UPDATE OF status ON base_record
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE PROCEDURE qca_record_status_notify();
+"""
+
+
+def upgrade():
+    op.execute("DROP TRIGGER qca_base_record_status_tr ON base_record;")
+    op.execute(_new_notify_triggerfunc)
+    op.execute(_new_notify_trigger)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER qca_base_record_status_tr ON base_record;")
+    op.execute(_old_notify_triggerfunc)
+    op.execute(_old_notify_trigger)
@@ -0,0 +1,28 @@
+"""Add claimed_generated_inline to compute_manager
+
+Revision ID: 5b2e8d4f7a16
+Revises: e6a2b9d4c1f7
+Create Date: 2026-10-18 09:12:44.305127
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b2e8d4f7a16"
+down_revision = "e6a2b9d4c1f7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "compute_manager",
+        sa.Column("claimed_generated_inline", sa.Integer(), nullable=False, server_default=sa.text("0")),
+    )
+    op.alter_column("compute_manager", "claimed_generated_inline", server_default=None)
+
+
+def downgrade():
+    op.drop_column("compute_manager", "claimed_generated_inline")
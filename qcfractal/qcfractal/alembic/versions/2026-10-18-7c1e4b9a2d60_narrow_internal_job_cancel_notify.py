@@ -0,0 +1,45 @@
+"""Only notify internal job runners when a running job is cancelled or taken over
+
+Revision ID: 7c1e4b9a2d60
+Revises: 9d3f6a1c8e52
+Create Date: 2026-10-18 11:21:09.304518
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7c1e4b9a2d60"
+down_revision = "9d3f6a1c8e52"
+branch_labels = None
+depends_on = None
+
+_new_update_trigger = """
+    CREATE TRIGGER qca_internal_jobs_update_tr
+    AFTER UPDATE OF status, runner_uuid ON internal_jobs
+    FOR EACH ROW WHEN (
+        OLD.status = 'running' AND (
+            NEW.status = 'cancelled' OR (NEW.status = 'running' AND OLD.runner_uuid IS DISTINCT FROM NEW.runner_uuid)
+        )
+    )
+    EXECUTE PROCEDURE qca_internal_jobs_cancel_notify();
+"""
+
+_old_update_trigger = """
+    CREATE TRIGGER qca_internal_jobs_update_tr
+    AFTER UPDATE OF status, runner_uuid ON internal_jobs
+    FOR EACH ROW WHEN (
+        OLD.status = 'running' AND (NEW.status != 'running' OR OLD.runner_uuid IS DISTINCT FROM NEW.runner_uuid)
+    )
+    EXECUTE PROCEDURE qca_internal_jobs_cancel_notify();
+"""
+
+
+def upgrade():
+    op.execute("DROP TRIGGER qca_internal_jobs_update_tr ON internal_jobs;")
+    op.execute(_new_update_trigger)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER qca_internal_jobs_update_tr ON internal_jobs;")
+    op.execute(_old_update_trigger)
@@ -0,0 +1,24 @@
+"""Add former_manager_name to task_queue
+
+Revision ID: 9d3f6a1c8e52
+Revises: 5b2e8d4f7a16
+Create Date: 2026-10-18 10:03:27.581946
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9d3f6a1c8e52"
+down_revision = "5b2e8d4f7a16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("task_queue", sa.Column("former_manager_name", sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column("task_queue", "former_manager_name")
@@ -0,0 +1,49 @@
+"""Add the id of the transaction that last changed a record
+
+Revision ID: e2a7c4b91d35
+Revises: 7c1e4b9a2d60
+Create Date: 2026-10-18 14:02:37.118245
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e2a7c4b91d35"
+down_revision = "7c1e4b9a2d60"
+branch_labels = None
+depends_on = None
+
+_change_xid_triggerfunc = """
+    CREATE OR REPLACE FUNCTION public.qca_record_change_xid()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        BEGIN
+          NEW.change_xid := txid_current();
+          RETURN NEW;
+        END
+        $_$
+    ;
+"""
+
+_change_xid_trigger = """
+    CREATE TRIGGER qca_base_record_change_xid_tr
+    BEFORE INSERT OR UPDATE ON base_record
+    FOR EACH ROW
+    EXECUTE PROCEDURE qca_record_change_xid();
+"""
+
+
+def upgrade():
+    # Existing records are left as NULL, which is treated as older than any transaction
+    op.add_column("base_record", sa.Column("change_xid", sa.BigInteger(), nullable=True))
+    op.execute(_change_xid_triggerfunc)
+    op.execute(_change_xid_trigger)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER qca_base_record_change_xid_tr ON base_record;")
+    op.execute("DROP FUNCTION qca_record_change_xid();")
+    op.drop_column("base_record", "change_xid")
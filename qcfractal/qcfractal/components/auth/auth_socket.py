@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from datetime import timedelta
 from typing import TYPE_CHECKING, Tuple, List, Any, Optional
 
 from sqlalchemy import select, delete
@@ -9,6 +10,7 @@ from sqlalchemy.dialects.postgresql import insert
 from qcportal.auth import UserInfo
 from qcportal.exceptions import AuthenticationFailure, SecurityNotEnabledError
 from qcportal.utils import now_at_utc
+from .cache import AuthCache
 from .db_models import UserORM, UserSessionORM
 from .permission_evaluation import evaluate_global_permissions
 from .role_permissions import AuthorizedEnum
@@ -31,11 +33,24 @@ class AuthSocket:
         self.security_enabled = self.root_socket.qcf_config.enable_security
         self.allow_unauthenticated_read = self.root_socket.qcf_config.allow_unauthenticated_read
 
+        # Caching of users and user sessions (for browser-based sessions)
+        self._user_session_access_interval = self.root_socket.qcf_config.api.user_session_access_interval
+        self._cache = AuthCache(
+            root_socket.engine, self.root_socket.qcf_config.api.user_cache_size, self._user_session_access_interval
+        )
+
+    def stop_cache_listener(self) -> None:
+        """
+        Stops the background thread that listens for changes to users and sessions, and clears the cache
+        """
+
+        self._cache.stop()
+
     def verify(self, user_id: int, *, session: Optional[Session] = None) -> UserInfo:
         """
         Verifies that a given user id exists and is enabled, returning info about the user and their role
 
-        This does not check the user's password.
+        This does not check the user's password. If no session is given, the user info may come from the cache.
 
         If the user is not found, or is disabled, an exception is raised.
 
@@ -53,6 +68,14 @@ class AuthSocket:
             All information about the user, and all information about the user's role
         """
 
+        use_cache = session is None and self._cache.enabled
+        if use_cache:
+            # Only enabled users are cached
+            user_info = self._cache.get_user(user_id)
+            if user_info is not None:
+                return user_info
+            generation = self._cache.generation
+
         stmt = select(UserORM)
         stmt = stmt.where(UserORM.id == user_id)
 
@@ -66,7 +89,11 @@ class AuthSocket:
                 raise AuthenticationFailure(f"User {user_id} is disabled.")
 
             user_info = user_orm.to_model(UserInfo)
-            return user_info
+
+        if use_cache:
+            self._cache.set_user(user_info, generation)
+
+        return user_info
 
     def check_global_permission(
         self, role: Optional[str], resource: str, action: str, require_security: bool
@@ -101,17 +128,40 @@ class AuthSocket:
     ) -> None:
         """
         Saves user/flask session data to the database
+
+        If the data has not changed, the session is only written (to update the last accessed time)
+        if it was last accessed more than user_session_access_interval seconds ago.
         """
 
+        use_cache = session is None and self._cache.enabled
+        if use_cache:
+            cached = self._cache.get_session(user_session_key)
+            if cached is not None:
+                cached_user_id, cached_data, last_accessed = cached
+                recently_accessed = now_at_utc() - last_accessed < timedelta(seconds=self._user_session_access_interval)
+                if cached_user_id == user_id and cached_data == dict(user_session_data) and recently_accessed:
+                    return
+
+            generation = self._cache.generation
+
+        last_accessed = now_at_utc()
         with self.root_socket.optional_session(session, False) as session:
             stmt = insert(UserSessionORM)
-            stmt = stmt.values(user_id=user_id, session_key=user_session_key, session_data=user_session_data)
+            stmt = stmt.values(
+                user_id=user_id,
+                session_key=user_session_key,
+                session_data=user_session_data,
+                last_accessed=last_accessed,
+            )
             stmt = stmt.on_conflict_do_update(
                 index_elements=[UserSessionORM.session_key],
-                set_={"session_data": user_session_data, "last_accessed": now_at_utc()},
+                set_={"session_data": user_session_data, "last_accessed": last_accessed},
             )
             session.execute(stmt)
 
+        if use_cache:
+            self._cache.set_session(user_session_key, user_id, dict(user_session_data), last_accessed, generation)
+
     def load_user_session(
         self, user_session_key: str, *, session: Optional[Session] = None
     ) -> Tuple[Any, datetime.datetime]:
@@ -120,8 +170,17 @@ class AuthSocket:
 
         Will return None if the session_key does not exist in the database
 
-        Returns a tuple of the session data and the last accessed time
+        Returns a tuple of the session data and the last accessed time. If no session is given,
+        the data may come from the cache.
         """
+
+        use_cache = session is None and self._cache.enabled
+        if use_cache:
+            cached = self._cache.get_session(user_session_key)
+            if cached is not None:
+                return cached[1], cached[2]
+            generation = self._cache.generation
+
         with self.root_socket.optional_session(session, True) as session:
             stmt = select(UserSessionORM).where(UserSessionORM.session_key == user_session_key)
             flask_session_orm = session.execute(stmt).scalar_one_or_none()
@@ -129,7 +188,14 @@ class AuthSocket:
             if not flask_session_orm:
                 return None, now_at_utc()
 
-            return flask_session_orm.session_data, flask_session_orm.last_accessed
+            session_data, last_accessed = flask_session_orm.session_data, flask_session_orm.last_accessed
+
+            if use_cache:
+                self._cache.set_session(
+                    user_session_key, flask_session_orm.user_id, session_data, last_accessed, generation
+                )
+
+            return session_data, last_accessed
 
     def delete_user_session(
         self,
@@ -157,6 +223,10 @@ class AuthSocket:
 
             session.execute(stmt)
 
+        # Other processes are notified by the database, but remove from our cache right away
+        if user_session_key is not None:
+            self._cache.delete_session(session_key=user_session_key)
+
     def list_all_user_sessions(self, *, session: Optional[Session] = None) -> List[Tuple[int, datetime.datetime]]:
         """
         List all sessions currently in the database
@@ -189,3 +259,5 @@ class AuthSocket:
             stmt = delete(UserSessionORM)
             stmt = stmt.where(UserSessionORM.user_id == user_id)
             session.execute(stmt)
+
+        self._cache.delete_session(user_id=user_id)
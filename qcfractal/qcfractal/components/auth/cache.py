@@ -0,0 +1,255 @@
+"""
+Caching of user information and user (browser) sessions
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import select as io_select
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+import psycopg2.extensions
+
+if TYPE_CHECKING:
+    import datetime
+    from sqlalchemy.engine import Engine
+    from typing import Any, Optional, Tuple
+    from qcportal.auth import UserInfo
+
+# Channel used in the postgres NOTIFY sent by the user, user_groups, and user_session triggers
+_auth_changed_channel = "auth_changed"
+
+
+class AuthCache:
+    """
+    In-process LRU cache of user information and user sessions
+
+    Postgres sends a notification (with the user id) whenever a user or their groups are changed, or one of
+    their sessions is deleted. A single background thread (per process) listens for these notifications and
+    removes anything cached for that user. Nothing is cached unless the thread is listening, since
+    changes could otherwise be missed.
+
+    User sessions are also only kept for session_ttl seconds, so that the last accessed time
+    written by other processes is picked up.
+    """
+
+    # Users are normally removed by notifications. This is just a catch all
+    user_ttl = 300.0
+
+    def __init__(self, engine: Engine, maxsize: int, session_ttl: float):
+        self._engine = engine
+        self._logger = logging.getLogger(__name__)
+
+        self._maxsize = maxsize
+        self._session_ttl = session_ttl
+
+        # user id -> (time cached, UserInfo)
+        self._users: OrderedDict[int, Tuple[float, UserInfo]] = OrderedDict()
+
+        # session key -> (time cached, user id, session data, last accessed)
+        self._sessions: OrderedDict[str, Tuple[float, int, Any, datetime.datetime]] = OrderedDict()
+
+        # Incremented whenever anything is removed, so that data read from the database before then isn't cached
+        self._generation = 0
+        self._listening = False
+        self._lock = threading.Lock()
+
+        self._end_event = threading.Event()
+        self._thread = None
+        self._finalizer = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._maxsize > 0
+
+    # Classmethod because finalizer can't handle bound methods
+    @classmethod
+    def _stop(cls, end_event: threading.Event, thread: threading.Thread):
+        end_event.set()
+        thread.join()
+
+    def stop(self) -> None:
+        """
+        Stops listening for changes and clears the cache
+
+        Listening will be started again when needed
+        """
+
+        if self._finalizer is not None:
+            self._finalizer()
+
+        self._thread = None
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        # Lock should be held by the caller
+        self._users.clear()
+        self._sessions.clear()
+        self._generation += 1
+
+    def _start(self) -> None:
+        # Lock should be held by the caller
+        if self._thread is not None:
+            return
+
+        self._end_event.clear()
+        self._thread = threading.Thread(
+            target=self._listen_loop,
+            args=(weakref.ref(self), self._engine, self._end_event, self._logger),
+            name="AuthCacheListener",
+            daemon=True,
+        )
+        self._thread.start()
+        self._finalizer = weakref.finalize(self, self._stop, self._end_event, self._thread)
+
+    def _set_listening(self, listening: bool) -> None:
+        with self._lock:
+            # Anything could have changed while we weren't listening
+            self._clear()
+            self._listening = listening
+
+    def _invalidate_users(self, user_ids) -> None:
+        with self._lock:
+            user_ids = set(user_ids)
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+            for key in [k for k, v in self._sessions.items() if v[1] in user_ids]:
+                del self._sessions[key]
+
+            self._generation += 1
+
+    @classmethod
+    def _listen_loop(cls, cache_ref, engine, end_event, logger):
+        # Classmethod so that the thread doesn't hold a reference to the cache object
+        while not end_event.is_set():
+            conn = None
+
+            try:
+                # We use a raw psycopg2 connection; sqlalchemy doesn't directly support LISTEN/NOTIFY
+                # This connection is detached from the pool, since its isolation level is changed
+                conn = engine.raw_connection()
+                conn.detach()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {_auth_changed_channel};")
+
+                cache = cache_ref()
+                if cache is None:
+                    break
+                cache._set_listening(True)
+                del cache
+
+                while not end_event.is_set():
+                    # Wait in 2 second intervals (to check for end_event)
+                    if io_select.select([conn], [], [], 2.0) == ([], [], []):
+                        continue
+
+                    conn.poll()
+                    user_ids = [int(n.payload) for n in conn.notifies]
+                    conn.notifies.clear()
+
+                    cache = cache_ref()
+                    if cache is None:
+                        return
+                    cache._invalidate_users(user_ids)
+                    del cache
+
+            except Exception:
+                logger.exception("Error listening for user/session notifications. Will retry")
+                end_event.wait(5.0)
+
+            finally:
+                cache = cache_ref()
+                if cache is not None:
+                    cache._set_listening(False)
+                del cache
+
+                if conn is not None:
+                    conn.close()
+
+    @property
+    def generation(self) -> int:
+        """
+        Current generation of the cache. Should be obtained before reading data from the database,
+        and passed to the set functions
+        """
+
+        with self._lock:
+            self._start()
+            return self._generation
+
+    def _store(self, cache: OrderedDict, key, value, generation: int) -> None:
+        # Lock should be held by the caller
+        if not self._listening or generation != self._generation:
+            return
+
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self._maxsize:
+            cache.popitem(last=False)
+
+    def get_user(self, user_id: int) -> Optional[UserInfo]:
+        with self._lock:
+            self._start()
+
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic() - self.user_ttl:
+                del self._users[user_id]
+                return None
+
+            self._users.move_to_end(user_id)
+            return entry[1]
+
+    def set_user(self, user_info: UserInfo, generation: int) -> None:
+        with self._lock:
+            self._store(self._users, user_info.id, (time.monotonic(), user_info), generation)
+
+    def get_session(self, session_key: str) -> Optional[Tuple[int, Any, datetime.datetime]]:
+        """
+        Returns the user id, (a copy of the) session data, and last accessed time of a session, if cached
+        """
+
+        with self._lock:
+            self._start()
+
+            entry = self._sessions.get(session_key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic() - self._session_ttl:
+                del self._sessions[session_key]
+                return None
+
+            self._sessions.move_to_end(session_key)
+            return entry[1], copy.deepcopy(entry[2]), entry[3]
+
+    def set_session(
+        self, session_key: str, user_id: int, session_data: Any, last_accessed: datetime.datetime, generation: int
+    ) -> None:
+        entry = (time.monotonic(), user_id, copy.deepcopy(session_data), last_accessed)
+        with self._lock:
+            self._store(self._sessions, session_key, entry, generation)
+
+    def delete_session(self, session_key: Optional[str] = None, user_id: Optional[int] = None) -> None:
+        """
+        Removes a session (by key) or all sessions of a user from this process's cache
+        """
+
+        with self._lock:
+            if session_key is not None:
+                self._sessions.pop(session_key, None)
+            if user_id is not None:
+                for key in [k for k, v in self._sessions.items() if v[1] == user_id]:
+                    del self._sessions[key]
+            self._generation += 1
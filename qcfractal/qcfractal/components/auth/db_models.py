@@ -14,6 +14,8 @@ from sqlalchemy import (
     Enum,
     select,
     TIMESTAMP,
+    DDL,
+    event,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
@@ -123,6 +125,64 @@ class UserPreferencesORM(BaseORM):
     preferences = Column(JSONB, nullable=False)
 
 
+# Function that sends a postgres NOTIFY (with the user id) when a user, their groups, or their sessions change.
+# This is used to invalidate cached users and sessions
+_auth_changed_triggerfunc = DDL(
+    """
+    CREATE OR REPLACE FUNCTION public.qca_auth_changed_notify()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        BEGIN
+          IF TG_TABLE_NAME = 'user' THEN
+            PERFORM pg_notify('auth_changed', OLD.id::text);
+          ELSIF TG_OP = 'INSERT' THEN
+            PERFORM pg_notify('auth_changed', NEW.user_id::text);
+          ELSE
+            PERFORM pg_notify('auth_changed', OLD.user_id::text);
+          END IF;
+          RETURN NULL;
+        END
+        $_$
+    ;
+"""
+)
+
+_user_changed_trigger = DDL(
+    """
+    CREATE TRIGGER qca_user_changed_tr
+    AFTER UPDATE OR DELETE ON "user"
+    FOR EACH ROW EXECUTE PROCEDURE qca_auth_changed_notify();
+    """
+)
+
+_user_groups_changed_trigger = DDL(
+    """
+    CREATE TRIGGER qca_user_groups_changed_tr
+    AFTER INSERT OR DELETE ON user_groups
+    FOR EACH ROW EXECUTE PROCEDURE qca_auth_changed_notify();
+    """
+)
+
+_user_session_deleted_trigger = DDL(
+    """
+    CREATE TRIGGER qca_user_session_deleted_tr
+    AFTER DELETE ON user_session
+    FOR EACH ROW EXECUTE PROCEDURE qca_auth_changed_notify();
+    """
+)
+
+# The function doesn't depend on the tables, and may be replaced. So create it before whichever table comes first
+for _table in (UserORM.__table__, UserGroupORM.__table__, UserSessionORM.__table__):
+    event.listen(_table, "before_create", _auth_changed_triggerfunc.execute_if(dialect=("postgresql")))
+
+event.listen(UserORM.__table__, "after_create", _user_changed_trigger.execute_if(dialect=("postgresql")))
+event.listen(UserGroupORM.__table__, "after_create", _user_groups_changed_trigger.execute_if(dialect=("postgresql")))
+event.listen(
+    UserSessionORM.__table__, "after_create", _user_session_deleted_trigger.execute_if(dialect=("postgresql"))
+)
+
+
 _user_id_map_subq = select(UserORM.id.label("id"), UserORM.username.label("username")).subquery()
 
 
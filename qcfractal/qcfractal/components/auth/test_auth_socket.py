@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from qcportal.auth import UserInfo, GroupInfo
+from qcportal.exceptions import AuthenticationFailure
+
+if TYPE_CHECKING:
+    from qcfractal.db_socket import SQLAlchemySocket
+
+
+def _wait_for_listener(storage_socket: SQLAlchemySocket):
+    # The cache listener is started on first use, and nothing is cached until it is listening
+    storage_socket.auth._cache.generation
+    for _ in range(50):
+        if storage_socket.auth._cache._listening:
+            return
+        time.sleep(0.1)
+
+    raise RuntimeError("Auth cache listener did not start")
+
+
+def test_auth_socket_verify_cached(storage_socket: SQLAlchemySocket):
+    storage_socket.groups.add(GroupInfo(groupname="group1"))
+    storage_socket.users.add(UserInfo(username="george", role="read", enabled=True), password="oldpw123")
+    uid = storage_socket.users.get("george")["id"]
+
+    _wait_for_listener(storage_socket)
+
+    uinfo = storage_socket.auth.verify(uid)
+    assert uinfo.username == "george"
+    assert storage_socket.auth._cache.get_user(uid) == uinfo
+
+    # Changing the user removes it from the cache (via notification from the database)
+    uinfo = uinfo.model_copy(update={"groups": ["group1"]})
+    storage_socket.users.modify(uinfo, as_admin=True)
+
+    time.sleep(0.5)
+    assert storage_socket.auth._cache.get_user(uid) is None
+    assert storage_socket.auth.verify(uid).groups == ["group1"]
+
+    # Disabling the user
+    uinfo = uinfo.model_copy(update={"enabled": False})
+    storage_socket.users.modify(uinfo, as_admin=True)
+
+    time.sleep(0.5)
+    with pytest.raises(AuthenticationFailure, match=r"disabled"):
+        storage_socket.auth.verify(uid)
+
+
+def test_auth_socket_user_session_cached(storage_socket: SQLAlchemySocket):
+    storage_socket.users.add(UserInfo(username="george", role="read", enabled=True), password="oldpw123")
+    uid = storage_socket.users.get("george")["id"]
+
+    _wait_for_listener(storage_socket)
+
+    storage_socket.auth.save_user_session(uid, "session_key_1", {"user_id": uid})
+    data, last_accessed = storage_socket.auth.load_user_session("session_key_1")
+    assert data == {"user_id": uid}
+
+    # Saving unchanged data within the access interval doesn't write to the database
+    time.sleep(0.1)
+    storage_socket.auth.save_user_session(uid, "session_key_1", {"user_id": uid})
+    sessions = storage_socket.auth.list_user_sessions(uid)
+    assert len(sessions) == 1
+    assert sessions[0]["last_accessed"] == last_accessed
+
+    # Changed data is always written
+    storage_socket.auth.save_user_session(uid, "session_key_1", {"user_id": uid, "other": 1})
+    sessions = storage_socket.auth.list_user_sessions(uid)
+    assert sessions[0]["last_accessed"] > last_accessed
+    data, _ = storage_socket.auth.load_user_session("session_key_1")
+    assert data == {"user_id": uid, "other": 1}
+
+    # Deleted sessions are removed from the cache
+    storage_socket.auth.clear_user_sessions(uid)
+    data, _ = storage_socket.auth.load_user_session("session_key_1")
+    assert data is None
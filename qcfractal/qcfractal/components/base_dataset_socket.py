@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import logging
+from datetime import datetime
 from typing import Tuple, Optional, Sequence, Iterable, Any, Union, Dict, List
 
 import pydantic_core
-from sqlalchemy import select, func, text, delete, and_, literal
+from sqlalchemy import select, func, text, delete, and_, literal, tuple_
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, lazyload, joinedload, load_only, noload
@@ -17,7 +18,7 @@ from qcfractal.components.services.db_models import ServiceQueueORM
 from qcfractal.components.tasks.db_models import TaskQueueORM
 from qcfractal.db_socket import SQLAlchemySocket, BaseORM
 from qcfractal.db_socket.helpers import get_general, get_query_proj_options, get_count
-from qcportal.dataset_models import DatasetModifyMetadata
+from qcportal.dataset_models import DatasetModifyMetadata, DatasetRecordChanges
 from qcportal.exceptions import MissingDataError, AlreadyExistsError, UserReportableError
 from qcportal.metadata_models import InsertMetadata, InsertCountsMetadata, DeleteMetadata, UpdateMetadata
 from qcportal.record_models import PriorityEnum, RecordStatusEnum
@@ -1167,6 +1168,79 @@ class BaseDatasetSocket:
             record_items = session.execute(stmt).scalars().all()
             return [(x.entry_name, x.specification_name, x.record_id) for x in record_items]
 
+    def fetch_record_changes(
+        self,
+        dataset_id: int,
+        since: Optional[int],
+        after: Optional[Tuple[int, int]] = None,
+        limit: Optional[int] = None,
+        *,
+        session: Optional[Session] = None,
+    ) -> DatasetRecordChanges:
+        """
+        Obtain information about records of a dataset that have been changed since a given transaction
+
+        Changes are tracked by the id of the (database) transaction that last changed each record, rather
+        than the modification time. The returned `as_of` is a transaction id such that all earlier transactions
+        had finished when the changes were fetched. Passing it as `since` in a later call returns everything that
+        has changed since (as well as possibly some changes that were already returned).
+
+        Results are ordered by transaction id, then record id. To get the next batch of results, pass in the
+        transaction id and record id of the last result as `after` (keeping `since` the same).
+
+        Parameters
+        ----------
+        dataset_id
+            ID of a dataset
+        since
+            Only return records changed by this transaction or later. If None, return all records of the dataset
+        after
+            If given, only return records after this (transaction id, record id)
+        limit
+            Maximum number of results to return
+        session
+            An existing SQLAlchemy session to use. If None, one will be created. If an existing session
+            is used, it will be flushed (but not committed) before returning from this function.
+
+        Returns
+        -------
+        :
+            Changes in the form (entry_name, specification_name, record_id, status, modified_on, change_xid),
+            and the transaction id the changes are complete up to.
+        """
+
+        # Records not changed since change_xid was added have no transaction id. They are older than everything
+        change_xid = func.coalesce(BaseRecordORM.change_xid, 0)
+
+        stmt = select(
+            self.record_item_orm.entry_name,
+            self.record_item_orm.specification_name,
+            self.record_item_orm.record_id,
+            BaseRecordORM.status,
+            BaseRecordORM.modified_on,
+            change_xid,
+        )
+        stmt = stmt.join(BaseRecordORM, BaseRecordORM.id == self.record_item_orm.record_id)
+        stmt = stmt.where(self.record_item_orm.dataset_id == dataset_id)
+
+        if since is not None:
+            stmt = stmt.where(change_xid >= since)
+        if after is not None:
+            stmt = stmt.where(tuple_(change_xid, BaseRecordORM.id) > after)
+
+        stmt = stmt.order_by(change_xid.asc(), BaseRecordORM.id.asc())
+
+        if limit is not None:
+            stmt = stmt.limit(limit)
+
+        with self.root_socket.optional_session(session, True) as session:
+            # The oldest transaction that was still running. Must be obtained before fetching the
+            # changes, so that every transaction before it has finished by the time they are fetched
+            as_of = session.execute(select(func.txid_snapshot_xmin(func.txid_current_snapshot()))).scalar_one()
+            changes = [tuple(x) for x in session.execute(stmt)]
+
+        return DatasetRecordChanges(changes=changes, as_of=as_of)
+
     def remove_records(
         self,
         dataset_id: int,
@@ -3,11 +3,11 @@ from __future__ import annotations
 from typing import Optional, Type, Union, Tuple, Sequence, List, Dict, Any
 
 from sqlalchemy import select, func
-from sqlalchemy.orm import Session, lazyload, defer, joinedload, undefer, defaultload
+from sqlalchemy.orm import Session, lazyload, defer, joinedload, undefer, defaultload, selectinload
 
 from qcfractal.components.record_db_models import BaseRecordORM, OutputStoreORM, RecordComputeHistoryORM, NativeFileORM
 from qcfractal.components.record_db_views import RecordDirectChildrenView
-from qcfractal.components.services.db_models import ServiceQueueORM
+from qcfractal.components.services.db_models import ServiceQueueORM, ServiceDependencyORM
 from qcfractal.components.tasks.db_models import TaskQueueORM
 from qcfractal.db_socket import SQLAlchemySocket
 from qcportal.all_results import AllResultTypes
@@ -181,6 +181,16 @@ class BaseRecordSocket:
             f"update_completed_schema_v1 not implemented for {type(self)}! This is a developer error"
         )
 
+    def update_completed_schema_v1_multi(self, session: Session, results: Sequence[Tuple[int, AllResultTypes]]) -> None:
+        """
+        Update multiple record ORMs based on the results of successfully-completed computations
+
+        By default, this just calls update_completed_schema_v1 for each result. Record types
+        that can do this more efficiently should override this.
+        """
+        for record_id, result in results:
+            self.update_completed_schema_v1(session, record_id, result)
+
     def insert_full_qcportal_records_v1(
         self, session: Session, records: Sequence[AllResultTypes], creator_user_id: Optional[int]
     ) -> List[BaseRecordORM]:
@@ -223,6 +233,30 @@ class BaseRecordSocket:
         """
         raise NotImplementedError(f"iterate_service not implemented for {type(self)}! This is a developer error")
 
+    @staticmethod
+    def load_service_dependencies(
+        session: Session,
+        service_orm: ServiceQueueORM,
+        orm_type: Type[BaseRecordORM],
+        options: Sequence[Any] = (),
+    ) -> List[Tuple[ServiceDependencyORM, BaseRecordORM]]:
+        """
+        Loads the records that a service depends on, sorted by their position
+
+        All the records (which must be of type orm_type) are loaded in a single query, along with
+        anything specified in the loader options. This avoids loading the records (and their molecules, etc)
+        one at a time when iterating over the dependencies.
+
+        Returns the dependency ORM and the corresponding record ORM for each dependency of the service.
+        """
+
+        record_ids = [x.record_id for x in service_orm.dependencies]
+        stmt = select(orm_type).where(orm_type.id.in_(record_ids)).options(*options)
+        record_map = {r.id: r for r in session.execute(stmt).scalars()}
+
+        dependencies = sorted(service_orm.dependencies, key=lambda x: x.extras["position"])
+        return [(x, record_map[x.record_id]) for x in dependencies]
+
     def available(self) -> bool:
         """
         Returns True if this is not a service, or if it is a service and available for iteration
@@ -376,7 +410,8 @@ class BaseRecordSocket:
         *,
         session: Optional[Session] = None,
     ) -> Tuple[bytes, CompressionEnum]:
-        stmt = select(OutputStoreORM.data, OutputStoreORM.compression_type)
+        stmt = select(OutputStoreORM)
+        stmt = stmt.options(undefer(OutputStoreORM.data), selectinload(OutputStoreORM.chunks))
         stmt = stmt.join(RecordComputeHistoryORM, RecordComputeHistoryORM.id == OutputStoreORM.history_id)
         stmt = stmt.join(self.record_orm, RecordComputeHistoryORM.record_id == self.record_orm.id)
         stmt = stmt.where(RecordComputeHistoryORM.record_id == record_id)
@@ -384,13 +419,15 @@ class BaseRecordSocket:
         stmt = stmt.where(OutputStoreORM.output_type == output_type)
 
         with self.root_socket.optional_session(session, True) as session:
-            output_data = session.execute(stmt).one_or_none()
-            if output_data is None:
+            output_orm = session.execute(stmt).scalar_one_or_none()
+            if output_orm is None:
                 raise MissingDataError(
                     f"Record {record_id}/history {history_id} does not have {output_type} output (or record/history does not exist)"
                 )
 
-            return output_data[0], output_data[1]
+            # Any appended (but not yet compacted) chunks are merged in here
+            output_data, ctype, _ = output_orm.get_merged_data()
+            return output_data, ctype
 
     def get_single_output_uncompressed(
         self, record_id: int, history_id: int, output_type: OutputTypeEnum, *, session: Optional[Session] = None
@@ -1 +1,2 @@
+from .properties import create_properties_file, properties_file_formats
 from .views import create_view_file
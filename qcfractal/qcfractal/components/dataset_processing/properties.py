@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from sqlalchemy import select, func, cast, Text, null
+
+from qcfractal.components.internal_jobs.status import JobProgress
+from qcfractal.components.record_db_models import BaseRecordORM
+from qcportal.record_models import RecordStatusEnum
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm.session import Session
+    from qcfractal.db_socket.socket import SQLAlchemySocket
+    from typing import Optional, Iterable, Sequence, List, Tuple, Any
+
+# Format name -> file extension
+properties_file_formats = {"parquet": "parquet", "arrow": "arrow"}
+
+
+def _property_column(session: Session, base_stmt, property_name: str) -> Tuple[Any, Any]:
+    """
+    Determine the arrow field for a property, and the SQL expression used to extract it from the properties column
+
+    Numbers, strings, and booleans are extracted as those types. Anything else (arrays, objects, or a mixture of types)
+    is extracted as a JSON string.
+    """
+
+    import pyarrow as pa
+
+    prop = BaseRecordORM.properties[property_name]
+
+    stmt = base_stmt.with_only_columns(func.jsonb_typeof(prop)).distinct()
+    json_types = set(session.execute(stmt).scalars().all())
+    json_types -= {None, "null"}
+
+    if not json_types:
+        return pa.field(property_name, pa.null()), null()
+    if json_types == {"number"}:
+        return pa.field(property_name, pa.float64()), prop.as_float()
+    if json_types == {"string"}:
+        return pa.field(property_name, pa.string()), prop.as_string()
+    if json_types == {"boolean"}:
+        return pa.field(property_name, pa.bool_()), prop.as_boolean()
+
+    return pa.field(property_name, pa.string(), metadata={"encoding": "json"}), cast(prop, Text)
+
+
+def create_properties_file(
+    session: Session,
+    socket: SQLAlchemySocket,
+    dataset_id: int,
+    dataset_type: str,
+    output_path: str,
+    properties: Sequence[str],
+    status: Optional[Iterable[RecordStatusEnum]] = None,
+    file_format: str = "parquet",
+    *,
+    row_group_size: int = 50000,
+    job_progress: Optional[JobProgress] = None,
+):
+    """
+    Creates a columnar (Parquet or Arrow IPC) file containing properties of the records of a dataset
+
+    The file contains one row per record, with columns for the entry name, specification name, record id,
+    record status, and then one column per requested property. Properties are extracted from the
+    record properties in the database, and written in row groups, so the full set of records is never
+    held in memory.
+
+    Note: the job progress object will be filled to 90% to leave room for uploading
+
+    Parameters
+    ----------
+    session
+        An existing SQLAlchemy session to use.
+    socket
+        Full SQLAlchemy socket to use for getting records
+    dataset_id
+        ID of the dataset to export
+    dataset_type
+        Type of the dataset (as a string)
+    output_path
+        Full path (including filename) to output the file to. Must not already exist
+    properties
+        Keys of the record properties to include as columns
+    status
+        List of statuses to include. Default is to include records with any status
+    file_format
+        Format of the output file. Either "parquet" or "arrow" (Arrow IPC file format)
+    row_group_size
+        Number of records in each row group (parquet) or record batch (arrow)
+    job_progress
+        Object used to track the progress of the job
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format not in properties_file_formats:
+        raise RuntimeError(f"Unknown file format for properties: {file_format}")
+
+    if os.path.exists(output_path):
+        raise RuntimeError(f"File {output_path} exists - will not overwrite")
+
+    ds_socket = socket.datasets.get_socket(dataset_type)
+    record_item_orm = ds_socket.record_item_orm
+
+    base_stmt = select(record_item_orm.record_id)
+    base_stmt = base_stmt.join(BaseRecordORM, BaseRecordORM.id == record_item_orm.record_id)
+    base_stmt = base_stmt.where(record_item_orm.dataset_id == dataset_id)
+
+    if status is not None:
+        base_stmt = base_stmt.where(BaseRecordORM.status.in_(status))
+
+    if job_progress is not None:
+        job_progress.raise_if_cancelled()
+        job_progress.update_progress(0, "Determining property types")
+
+    fields = [
+        pa.field("entry_name", pa.string()),
+        pa.field("specification_name", pa.string()),
+        pa.field("record_id", pa.int64()),
+        pa.field("status", pa.string()),
+    ]
+    prop_columns = []
+
+    for prop_name in properties:
+        prop_field, prop_column = _property_column(session, base_stmt, prop_name)
+        fields.append(prop_field)
+        prop_columns.append(prop_column)
+
+    schema = pa.schema(
+        fields,
+        metadata={
+            "dataset_id": str(dataset_id),
+            "dataset_type": dataset_type,
+        },
+    )
+
+    record_count = session.execute(base_stmt.with_only_columns(func.count())).scalar_one()
+
+    stmt = base_stmt.with_only_columns(
+        record_item_orm.entry_name,
+        record_item_orm.specification_name,
+        record_item_orm.record_id,
+        BaseRecordORM.status,
+        *prop_columns,
+    )
+    stmt = stmt.order_by(record_item_orm.entry_name, record_item_orm.specification_name)
+    stmt = stmt.execution_options(yield_per=row_group_size)
+
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(output_path, schema)
+    else:
+        writer = pa.ipc.new_file(output_path, schema)
+
+    finished_count = 0
+
+    with writer:
+        for rows in session.execute(stmt).partitions():
+            columns: List[List[Any]] = [list(c) for c in zip(*rows)]
+            columns[3] = [s.value for s in columns[3]]
+
+            batch = pa.RecordBatch.from_arrays(columns, schema=schema)
+            if file_format == "parquet":
+                writer.write_batch(batch, row_group_size=row_group_size)
+            else:
+                writer.write_batch(batch)
+
+            finished_count += len(rows)
+            if job_progress is not None:
+                job_progress.raise_if_cancelled()
+                job_progress.update_progress(
+                    5 + int(85 * finished_count / max(record_count, 1)), "Writing record properties"
+                )
@@ -1,25 +1,68 @@
 from __future__ import annotations
 
 import os
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
+import apsw
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 from qcfractal.components.internal_jobs.status import JobProgress
 from qcfractal.components.record_db_models import BaseRecordORM
-from qcportal.cache import DatasetCache
+from qcportal.cache import DatasetCache, compress_for_cache
 from qcportal.dataset_models import BaseDataset
-from qcportal.record_models import RecordStatusEnum, BaseRecord
+from qcportal.record_models import RecordStatusEnum
 from qcportal.utils import chunk_iterable, make_list
 
 if TYPE_CHECKING:
     from sqlalchemy.orm.session import Session
     from qcfractal.db_socket.socket import SQLAlchemySocket
-    from typing import Optional, Iterable
-    from typing import Iterable
-    from sqlalchemy.orm.session import Session
+    from typing import Optional, Iterable, List, Dict, Any, Tuple
+
+# Page size of newly-created view files. Records are stored as (sometimes large) blobs, so
+# larger pages mean fewer overflow pages
+_view_page_size = 65536
+
+
+def _compress_records(record_dicts: List[Dict[str, Any]]) -> List[Tuple[int, str, float, bytes]]:
+    """
+    Compresses records (as dictionaries returned from the record sockets) for storing in a view file
+
+    This skips constructing the record models - the dictionaries are compressed directly.
+    """
+
+    rows = []
+    for r in record_dicts:
+        # Handle deprecated fields the same as the BaseRecord constructor does
+        # (the cache is read with validation only, so the constructor is not called)
+        if "owner_user" in r:
+            r["creator_user"] = r.pop("owner_user")
+        r.pop("owner_group", None)
+
+        rows.append((r["id"], r["status"], r["modified_on"].timestamp(), compress_for_cache(r)))
+
+    return rows
+
+
+def _open_view_file(output_path: str, dataset_type: type[BaseDataset], new_file: bool) -> DatasetCache:
+    if new_file:
+        # The page size must be set before anything is written to the file. VACUUM on the
+        # empty file is what actually writes it
+        conn = apsw.Connection(output_path)
+        conn.pragma("page_size", _view_page_size)
+        conn.execute("VACUUM")
+        conn.close()
+
+    view_db = DatasetCache(output_path, read_only=False, dataset_type=dataset_type)
+
+    # Only a new file can be written without the journal. An existing file (being refreshed) would
+    # be corrupted by a crash while writing
+    if new_file:
+        view_db.set_bulk_write_mode()
+
+    return view_db
 
 
 def create_view_file(
@@ -33,11 +76,21 @@ def create_view_file(
     exclude: Optional[Iterable[str]] = None,
     *,
     include_children: bool = True,
+    refresh: bool = False,
+    record_batch_size: int = 250,
+    n_workers: int = 4,
     job_progress: Optional[JobProgress] = None,
 ):
     """
     Creates a view file for a dataset
 
+    Data is streamed from the database and written in batches, so the records are never all in memory
+    at once. Records are compressed by a pool of worker threads while the next batch is fetched.
+
+    If `refresh` is True, then an existing view file (at `output_path`) is updated. Only records that
+    have been modified since they were stored in the file (or that are new) are rewritten. The other
+    options (status, include, exclude, include_children) should match those used to create the file.
+
     Note: the job progress object will be filled to 90% to leave room for uploading
 
     Parameters
@@ -51,7 +104,8 @@ def create_view_file(
     dataset_id
         ID of the dataset to create the view for
     output_path
-        Full path (including filename) to output the view data to. Must not already exist
+        Full path (including filename) to output the view data to. Must not already exist, unless
+        `refresh` is True
     status
         List of statuses to include. Default is to include records with any status
     include
@@ -61,29 +115,43 @@ def create_view_file(
     include_children
         Specifies whether child records associated with the main records should also be included (recursively)
         in the view file.
+    refresh
+        If True, update an existing view file rather than creating a new one
+    record_batch_size
+        Number of records to fetch from the database at a time
+    n_workers
+        Number of threads to use for compressing records
     job_progress
         Object used to track the progress of the job
     """
 
-    if os.path.exists(output_path):
-        raise RuntimeError(f"File {output_path} exists - will not overwrite")
-
     if os.path.isdir(output_path):
         raise RuntimeError(f"{output_path} is a directory")
 
+    if refresh and not os.path.exists(output_path):
+        raise RuntimeError(f"File {output_path} does not exist - cannot refresh")
+
+    if not refresh and os.path.exists(output_path):
+        raise RuntimeError(f"File {output_path} exists - will not overwrite")
+
     ds_socket = socket.datasets.get_socket(dataset_type)
     ptl_dataset_type = BaseDataset.get_subclass(dataset_type)
 
     ptl_entry_type = ptl_dataset_type._entry_type
     ptl_specification_type = ptl_dataset_type._specification_type
 
-    view_db = DatasetCache(output_path, read_only=False, dataset_type=ptl_dataset_type)
+    view_db = _open_view_file(output_path, ptl_dataset_type, not refresh)
 
     stmt = select(ds_socket.dataset_orm).where(ds_socket.dataset_orm.id == dataset_id)
     stmt = stmt.options(selectinload("*"))
     ds_orm = session.execute(stmt).scalar_one()
 
     # Metadata
+    if refresh:
+        existing_id = view_db.get_metadata("dataset_metadata")["id"]
+        if existing_id != dataset_id:
+            raise RuntimeError(f"View file is for dataset {existing_id}, not {dataset_id}")
+
     view_db.update_metadata("dataset_metadata", ds_orm.model_dict())
 
     # Entries
@@ -94,10 +162,17 @@ def create_view_file(
     stmt = select(ds_socket.entry_orm)
     stmt = stmt.options(selectinload("*"))
     stmt = stmt.where(ds_socket.entry_orm.dataset_id == dataset_id)
+    stmt = stmt.execution_options(yield_per=1000)
+
+    existing_entries = set(view_db.get_entry_names()) if refresh else set()
+    for entries in session.execute(stmt).scalars().partitions():
+        entries = [e.to_model(ptl_entry_type) for e in entries]
+        view_db.update_entries(entries)
+        existing_entries.difference_update(e.name for e in entries)
 
-    entries = session.execute(stmt).scalars().all()
-    entries = [e.to_model(ptl_entry_type) for e in entries]
-    view_db.update_entries(entries)
+    # Entries that have been removed from the dataset since the view was created
+    for entry_name in existing_entries:
+        view_db.delete_entry(entry_name)
 
     if job_progress is not None:
         job_progress.raise_if_cancelled()
@@ -112,16 +187,27 @@ def create_view_file(
     specs = [s.to_model(ptl_specification_type) for s in specs]
     view_db.update_specifications(specs)
 
+    for spec_name in set(view_db.get_specification_names()) - {s.name for s in specs}:
+        view_db.delete_specification(spec_name)
+
     if job_progress is not None:
         job_progress.raise_if_cancelled()
         job_progress.update_progress(10, "Loading record information")
 
-    # Now all the records
-    stmt = select(ds_socket.record_item_orm).where(ds_socket.record_item_orm.dataset_id == dataset_id)
-    stmt = stmt.order_by(ds_socket.record_item_orm.record_id.asc())
-    record_items = session.execute(stmt).scalars().all()
+    # The dataset <-> record association. Only the ids are kept in memory
+    record_item_orm = ds_socket.record_item_orm
+    stmt = select(record_item_orm.entry_name, record_item_orm.specification_name, record_item_orm.record_id)
+    stmt = stmt.where(record_item_orm.dataset_id == dataset_id)
+    stmt = stmt.execution_options(yield_per=10000)
+
+    if refresh:
+        view_db.delete_dataset_records(None, None)
+
+    record_ids = set()
+    for record_items in session.execute(stmt).partitions():
+        view_db.update_dataset_records(record_items)
+        record_ids.update(ri[2] for ri in record_items)
 
-    record_ids = set(ri.record_id for ri in record_items)
     all_ids = set(record_ids)
 
     if include_children:
@@ -135,19 +221,28 @@ def create_view_file(
 
     ############################################################################
     # Determine the record types of all the ids (top-level and children if desired)
+    # If refreshing, only records modified since they were stored in the view are needed
     ############################################################################
-    stmt = select(BaseRecordORM.id, BaseRecordORM.record_type)
+    stmt = select(BaseRecordORM.id, BaseRecordORM.record_type, BaseRecordORM.modified_on)
 
     if status is not None:
         stmt = stmt.where(BaseRecordORM.status.in_(status))
 
+    existing_records = view_db.get_records_modified_on() if refresh else {}
+
     # Sort into a dictionary with keys being the record type
     record_type_map = defaultdict(list)
+    found_ids = set()
 
     for id_chunk in chunk_iterable(all_ids, 500):
         stmt2 = stmt.where(BaseRecordORM.id.in_(id_chunk))
-        for record_id, record_type in session.execute(stmt2).yield_per(100):
-            record_type_map[record_type].append(record_id)
+        for record_id, record_type, modified_on in session.execute(stmt2):
+            found_ids.add(record_id)
+            if existing_records.get(record_id) != modified_on.timestamp():
+                record_type_map[record_type].append(record_id)
+
+    # Records no longer part of the dataset (or no longer with the requested status)
+    view_db.delete_records(set(existing_records) - found_ids)
 
     if job_progress is not None:
         job_progress.raise_if_cancelled()
@@ -155,21 +250,24 @@ def create_view_file(
 
     ############################################################################
     # Actually fetch the record data now
-    # We go one over the different types of records, then load them in batches
+    # We go one over the different types of records, then load them in batches.
+    # Batches are compressed in worker threads while the next batch is fetched
     ############################################################################
-    record_count = len(all_ids)
+    record_count = sum(len(x) for x in record_type_map.values())
     finished_count = 0
 
-    for record_type_str, record_ids in record_type_map.items():
-        record_socket = socket.records.get_socket(record_type_str)
-        record_type = BaseRecord.get_subclass(record_type_str)
+    # Number of batches being compressed at once. Limits the amount of memory used
+    max_pending = 2 * n_workers
+    pending = deque()
+
+    def _write_finished(n_remaining: int):
+        nonlocal finished_count
 
-        for id_chunk in chunk_iterable(record_ids, 20):
-            record_dicts = record_socket.get(id_chunk, include=include, exclude=exclude, session=session)
-            record_data = [record_type(**r) for r in record_dicts]
-            view_db.update_records(record_data)
+        while len(pending) > n_remaining:
+            record_rows = pending.popleft().result()
+            view_db.update_records_compressed(record_rows)
 
-            finished_count += len(id_chunk)
+            finished_count += len(record_rows)
             if job_progress is not None:
                 job_progress.raise_if_cancelled()
 
@@ -178,6 +276,13 @@ def create_view_file(
                     15 + int(75 * finished_count / record_count), "Processing individual records"
                 )
 
-    # Update the dataset <-> record association
-    record_info = [(ri.entry_name, ri.specification_name, ri.record_id) for ri in record_items]
-    view_db.update_dataset_records(record_info)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for record_type_str, type_record_ids in record_type_map.items():
+            record_socket = socket.records.get_socket(record_type_str)
+
+            for id_chunk in chunk_iterable(type_record_ids, record_batch_size):
+                record_dicts = record_socket.get(id_chunk, include=include, exclude=exclude, session=session)
+                pending.append(executor.submit(_compress_records, record_dicts))
+                _write_finished(max_pending)
+
+        _write_finished(0)
@@ -12,9 +12,12 @@ from qcportal.dataset_models import (
     DatasetAddBody,
     DatasetQueryModel,
     DatasetFetchRecordsBody,
+    DatasetFetchRecordChangesBody,
+    DatasetRecordChanges,
     DatasetFetchEntryBody,
     DatasetFetchSpecificationBody,
     DatasetCreateViewBody,
+    DatasetCreatePropertiesFileBody,
     DatasetSubmitBody,
     DatasetDeleteStrBody,
     DatasetRecordModifyBody,
@@ -201,6 +204,24 @@ def create_dataset_view_v1(dataset_type: str, dataset_id: int, body_data: Datase
         include=body_data.include,
         exclude=body_data.exclude,
         include_children=body_data.include_children,
+        refresh_view_id=body_data.refresh_view_id,
+    )
+
+
+@api_v1.route("/datasets/<string:dataset_type>/<int:dataset_id>/create_properties_file", methods=["POST"])
+@check_permissions("datasets", "modify")
+@serialization()
+def create_dataset_properties_file_v1(
+    dataset_type: str, dataset_id: int, body_data: DatasetCreatePropertiesFileBody
+) -> int:
+    return storage_socket.datasets.add_create_properties_attachment_job(
+        dataset_id,
+        dataset_type,
+        description=body_data.description,
+        provenance=body_data.provenance,
+        properties=body_data.properties,
+        status=body_data.status,
+        file_format=body_data.file_format,
     )
 
 
@@ -385,6 +406,24 @@ def fetch_dataset_records_v1(dataset_type: str, dataset_id: int, body_data: Data
     )
 
 
+@api_v1.route("/datasets/<string:dataset_type>/<int:dataset_id>/records/changes", methods=["POST"])
+@check_permissions("datasets", "read")
+@serialization()
+def fetch_dataset_record_changes_v1(
+    dataset_type: str, dataset_id: int, body_data: DatasetFetchRecordChangesBody
+) -> DatasetRecordChanges:
+    max_limit = current_app.config["QCFRACTAL_CONFIG"].api_limits.get_dataset_record_changes
+    limit = max_limit if body_data.limit is None else min(body_data.limit, max_limit)
+
+    ds_socket = storage_socket.datasets.get_socket(dataset_type)
+    return ds_socket.fetch_record_changes(
+        dataset_id,
+        since=body_data.since,
+        after=body_data.after,
+        limit=limit,
+    )
+
+
 @api_v1.route("/datasets/<string:dataset_type>/<int:dataset_id>/records/bulkDelete", methods=["POST"])
 @check_permissions("datasets", "modify")
 @serialization()
@@ -19,7 +19,7 @@ from qcfractal.components.dataset_db_models import (
     DatasetRecordCountORM,
 )
 from qcfractal.components.dataset_db_views import DatasetDirectRecordsView
-from qcfractal.components.dataset_processing import create_view_file
+from qcfractal.components.dataset_processing import create_view_file, create_properties_file, properties_file_formats
 from qcfractal.components.internal_jobs.db_models import InternalJobORM
 from qcfractal.db_socket.helpers import (
     get_general,
@@ -461,6 +461,28 @@ class DatasetSocket:
             self._logger.info(f"Dataset attachment {file_path} successfully uploaded to S3. ID is {file_id}")
             return file_id
 
+    def _download_view(
+        self, dataset_id: int, view_id: int, file_path: str, *, session: Optional[Session] = None
+    ) -> None:
+        """
+        Downloads an existing view of a dataset from S3 to a local file
+        """
+
+        with self.root_socket.optional_session(session, True) as session:
+            attachment = session.get(DatasetAttachmentORM, view_id)
+            if (
+                attachment is None
+                or attachment.dataset_id != dataset_id
+                or attachment.attachment_type != DatasetAttachmentType.view
+            ):
+                raise MissingDataError(f"Dataset {dataset_id} does not have a view with id {view_id}")
+
+            _, streamer = self.root_socket.external_files.get_file_streamer(view_id, session=session)
+
+            with open(file_path, "wb") as f:
+                for chunk in streamer():
+                    f.write(chunk)
+
     def create_view_attachment(
         self,
         dataset_id: int,
@@ -472,6 +494,7 @@ class DatasetSocket:
         exclude: Optional[Iterable[str]] = None,
         *,
         include_children: bool = True,
+        refresh_view_id: Optional[int] = None,
         job_progress: Optional[JobProgress] = None,
         session: Optional[Session] = None,
     ):
@@ -480,6 +503,9 @@ class DatasetSocket:
 
         Uses a temporary directory within the globally-configured `temporary_dir`
 
+        If `refresh_view_id` is given, that (existing) view is downloaded and only the records that have
+        changed since it was created are updated. The updated view is attached as a new view file.
+
         Parameters
         ----------
         dataset_id : int
@@ -500,6 +526,9 @@ class DatasetSocket:
         include_children
             Specifies whether child records associated with the main records should also be included (recursively)
             in the view file.
+        refresh_view_id
+            ID of an existing view of this dataset to update, rather than creating a view from scratch. The other
+            options should match those used to create that view.
         job_progress
             Object used to track progress if this function is being run in a background job
         session
@@ -517,6 +546,7 @@ class DatasetSocket:
                 "include": include,
                 "exclude": exclude,
                 "include_children": include_children,
+                "refresh_view_id": refresh_view_id,
             }
         }
 
@@ -526,6 +556,9 @@ class DatasetSocket:
             file_name = f"dataset_{dataset_id}_view.sqlite"
             tmp_file_path = os.path.join(tmpdir, file_name)
 
+            if refresh_view_id is not None:
+                self._download_view(dataset_id, refresh_view_id, tmp_file_path, session=session)
+
             create_view_file(
                 session,
                 self.root_socket,
@@ -536,6 +569,7 @@ class DatasetSocket:
                 include=include,
                 exclude=exclude,
                 include_children=include_children,
+                refresh=refresh_view_id is not None,
                 job_progress=job_progress,
             )
 
@@ -564,6 +598,7 @@ class DatasetSocket:
         exclude: Optional[Iterable[str]] = None,
         *,
         include_children: bool = True,
+        refresh_view_id: Optional[int] = None,
         session: Optional[Session] = None,
     ) -> int:
         """
@@ -594,6 +629,7 @@ class DatasetSocket:
                     "include": include,
                     "exclude": exclude,
                     "include_children": include_children,
+                    "refresh_view_id": refresh_view_id,
                 },
                 user_id=None,
                 unique_name=True,
@@ -609,6 +645,153 @@ class DatasetSocket:
             session.execute(stmt)
             return job_id
 
+    def create_properties_attachment(
+        self,
+        dataset_id: int,
+        dataset_type: str,
+        description: Optional[str],
+        provenance: Dict[str, Any],
+        properties: Sequence[str],
+        status: Optional[Iterable[RecordStatusEnum]] = None,
+        file_format: str = "parquet",
+        *,
+        job_progress: Optional[JobProgress] = None,
+        session: Optional[Session] = None,
+    ):
+        """
+        Creates a columnar file of record properties and attaches it to the dataset
+
+        Uses a temporary directory within the globally-configured `temporary_dir`
+
+        Parameters
+        ----------
+        dataset_id : int
+            ID of the dataset to create the properties file for
+        dataset_type
+            Type of dataset the ID is
+        description
+            Optional string describing the properties file
+        provenance
+            Dictionary with any metadata or other information about the file. Information regarding
+            the options used to create the file will be added.
+        properties
+            Keys of the record properties to include as columns
+        status
+            List of statuses to include. Default is to include records with any status
+        file_format
+            Format of the file. Either "parquet" or "arrow" (Arrow IPC file format)
+        job_progress
+            Object used to track progress if this function is being run in a background job
+        session
+            An existing SQLAlchemy session to use. If None, one will be created. If an existing session
+            is used, it will be flushed (but not committed) before returning from this function.
+        """
+
+        if not self.root_socket.qcf_config.s3.enabled:
+            raise UserReportableError("S3 storage is not enabled. Can not create properties file")
+
+        if file_format not in properties_file_formats:
+            raise UserReportableError(f"Unknown file format for properties file: {file_format}")
+
+        # Add the options for the file creation to the provenance
+        provenance = provenance | {
+            "options": {
+                "properties": list(properties),
+                "status": status,
+                "file_format": file_format,
+            }
+        }
+
+        with tempfile.TemporaryDirectory(dir=self.root_socket.qcf_config.temporary_dir) as tmpdir:
+            self._logger.info(f"Using temporary directory {tmpdir} for properties file creation")
+
+            file_name = f"dataset_{dataset_id}_properties.{properties_file_formats[file_format]}"
+            tmp_file_path = os.path.join(tmpdir, file_name)
+
+            with self.root_socket.optional_session(session) as session:
+                create_properties_file(
+                    session,
+                    self.root_socket,
+                    dataset_id,
+                    dataset_type,
+                    tmp_file_path,
+                    properties,
+                    status=status,
+                    file_format=file_format,
+                    job_progress=job_progress,
+                )
+
+            self._logger.info(f"Properties file created. File size is {os.path.getsize(tmp_file_path)/1048576} MiB.")
+
+            if job_progress is not None:
+                job_progress.update_progress(90, "Uploading properties file to S3")
+
+            file_id = self.attach_file(
+                dataset_id, DatasetAttachmentType.properties, tmp_file_path, file_name, description, provenance
+            )
+
+            if job_progress is not None:
+                job_progress.update_progress(100)
+
+            return file_id
+
+    def add_create_properties_attachment_job(
+        self,
+        dataset_id: int,
+        dataset_type: str,
+        description: str,
+        provenance: Dict[str, Any],
+        properties: Sequence[str],
+        status: Optional[Iterable[RecordStatusEnum]] = None,
+        file_format: str = "parquet",
+        *,
+        session: Optional[Session] = None,
+    ) -> int:
+        """
+        Creates an internal job for creating and attaching a properties file to a dataset
+
+        See :meth:`create_properties_attachment` for a description of the parameters
+
+        Returns
+        -------
+        :
+            ID of the created internal job
+        """
+
+        if not self.root_socket.qcf_config.s3.enabled:
+            raise UserReportableError("S3 storage is not enabled. Can not create properties file")
+
+        if file_format not in properties_file_formats:
+            raise UserReportableError(f"Unknown file format for properties file: {file_format}")
+
+        with self.root_socket.optional_session(session) as session:
+            job_id = self.root_socket.internal_jobs.add(
+                f"create_attach_properties_ds_{dataset_id}",
+                now_at_utc(),
+                f"datasets.create_properties_attachment",
+                {
+                    "dataset_id": dataset_id,
+                    "dataset_type": dataset_type,
+                    "description": description,
+                    "provenance": provenance,
+                    "properties": list(properties),
+                    "status": status,
+                    "file_format": file_format,
+                },
+                user_id=None,
+                unique_name=True,
+                serial_group="ds_create_properties",
+                session=session,
+            )
+
+            stmt = (
+                insert(DatasetInternalJobORM)
+                .values(dataset_id=dataset_id, internal_job_id=job_id)
+                .on_conflict_do_nothing()
+            )
+            session.execute(stmt)
+            return job_id
+
     def submit(
         self,
         dataset_id: int,
@@ -116,3 +116,49 @@ event.listen(
     InternalJobORM.__table__, "after_create", _insert_internal_job_triggerfunc.execute_if(dialect=("postgresql"))
 )
 event.listen(InternalJobORM.__table__, "after_create", _insert_internal_job_trigger.execute_if(dialect=("postgresql")))
+
+
+# Function that sends a postgres NOTIFY (with the job id) to internal job runners when a running job
+# is cancelled, deleted, or taken over by another runner
+_cancel_internal_job_triggerfunc = DDL(
+    """
+    CREATE OR REPLACE FUNCTION public.qca_internal_jobs_cancel_notify()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        BEGIN
+          PERFORM pg_notify('internal_job_cancelled', OLD.id::text);
+          RETURN NULL;
+        END
+        $_$
+    ;
+"""
+)
+
+_update_internal_job_trigger = DDL(
+    """
+    CREATE TRIGGER qca_internal_jobs_update_tr
+    AFTER UPDATE OF status, runner_uuid ON internal_jobs
+    FOR EACH ROW WHEN (
+        OLD.status = 'running' AND (
+            NEW.status = 'cancelled' OR (NEW.status = 'running' AND OLD.runner_uuid IS DISTINCT FROM NEW.runner_uuid)
+        )
+    )
+    EXECUTE PROCEDURE qca_internal_jobs_cancel_notify();
+    """
+)
+
+_delete_internal_job_trigger = DDL(
+    """
+    CREATE TRIGGER qca_internal_jobs_delete_tr
+    AFTER DELETE ON internal_jobs
+    FOR EACH ROW WHEN (OLD.status = 'running')
+    EXECUTE PROCEDURE qca_internal_jobs_cancel_notify();
+    """
+)
+
+event.listen(
+    InternalJobORM.__table__, "after_create", _cancel_internal_job_triggerfunc.execute_if(dialect=("postgresql"))
+)
+event.listen(InternalJobORM.__table__, "after_create", _update_internal_job_trigger.execute_if(dialect=("postgresql")))
+event.listen(InternalJobORM.__table__, "after_create", _delete_internal_job_trigger.execute_if(dialect=("postgresql")))
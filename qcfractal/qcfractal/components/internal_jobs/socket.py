@@ -3,8 +3,10 @@ from __future__ import annotations
 import inspect
 import logging
 import select as io_select
+import threading
 import traceback
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 from operator import attrgetter
 from socket import gethostname
@@ -12,7 +14,7 @@ from typing import TYPE_CHECKING
 
 import psycopg2.extensions
 import pydantic_core
-from sqlalchemy import select, delete, update, and_, or_
+from sqlalchemy import select, delete, update, and_, or_, func, case
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 
@@ -22,17 +24,20 @@ from qcportal.exceptions import MissingDataError
 from qcportal.internal_jobs.models import InternalJobStatusEnum, InternalJobQueryFilters
 from qcportal.utils import now_at_utc
 from .db_models import InternalJobORM
-from .status import JobProgress, CancelledJobException, JobRunnerStoppingException
+from .status import JobProgress, JobHeartbeat, CancelledJobException, JobRunnerStoppingException
 
 if TYPE_CHECKING:
     from qcfractal.db_socket.socket import SQLAlchemySocket
     from typing import Optional, Dict, Any
     from sqlalchemy.orm.session import Session
     from qcfractal.db_socket.socket import SQLAlchemySocket
-    from typing import Dict, Optional, Any, List
+    from typing import Dict, Optional, Any, List, Tuple
 
 _default_error = {"error_type": "not_supplied", "error_message": "No error message found on task."}
 
+# Held while claiming jobs if there are concurrency limits, so that runners don't exceed them
+internal_job_claim_lock_id = 15000
+
 
 class InternalJobSocket:
     def __init__(self, root_socket: SQLAlchemySocket):
@@ -49,6 +54,12 @@ class InternalJobSocket:
         self._delete_internal_job_frequency = 60 * 60 * 24  # one day
         self._internal_job_keep = root_socket.qcf_config.internal_job_keep
 
+        # Running multiple jobs per runner
+        self._runner_threads = root_socket.qcf_config.internal_job_threads
+        self._priority_threads = root_socket.qcf_config.internal_job_priority_threads
+        self._priority_functions = list(root_socket.qcf_config.internal_job_priority_functions)
+        self._concurrency_limits = dict(root_socket.qcf_config.internal_job_concurrency_limits)
+
         if self._internal_job_keep > 0:
             with self.root_socket.session_scope() as session:
                 self.add(
@@ -336,6 +347,7 @@ class InternalJobSocket:
 
         # For logging (ORM may end up detached or somthing)
         job_id = job_orm.id
+        job_function = job_orm.function
 
         try:
             func_attr = attrgetter(job_orm.function)
@@ -444,10 +456,18 @@ class InternalJobSocket:
 
         session.commit()
 
+        # Runners may be waiting for a job with this function to finish before running another one
+        if job_function in self._concurrency_limits:
+            session.execute(select(func.pg_notify("check_internal_jobs", "")))
+            session.commit()
+
     @staticmethod
-    def _wait_for_job(session: Session, logger, conn, end_event):
+    def _wait_for_job(session: Session, logger, conn, end_event, job_filter=None, wake_event=None):
         """
         Blocks until a job is possibly available to run
+
+        Only jobs matching job_filter (if given) are considered. If wake_event is given, waiting also
+        stops when it is set.
         """
 
         serial_cte = select(InternalJobORM.serial_group).distinct()
@@ -460,6 +480,8 @@ class InternalJobSocket:
         next_job_stmt = next_job_stmt.where(
             or_(InternalJobORM.serial_group.is_(None), InternalJobORM.serial_group.not_in(select(serial_cte)))
         )
+        if job_filter is not None:
+            next_job_stmt = next_job_stmt.where(job_filter)
         next_job_stmt = next_job_stmt.order_by(InternalJobORM.scheduled_date.asc())
 
         # Skip any that are being claimed for running right now
@@ -500,8 +522,13 @@ class InternalJobSocket:
             total_waited = 0.0
 
             # Wait in 2 second intervals (to check for end_event)
+            # Shorter intervals if another thread may wake us up
+            interval = 2.0 if wake_event is None else 0.5
             while total_waited < total_to_wait:
-                to_wait = min(total_to_wait - total_waited, 2.0)
+                if wake_event is not None and wake_event.is_set():
+                    break
+
+                to_wait = min(total_to_wait - total_waited, interval)
                 if to_wait <= 0.0:
                     break
 
@@ -526,17 +553,155 @@ class InternalJobSocket:
                 except KeyboardInterrupt:
                     break
 
-            if end_event.is_set():
+            if end_event.is_set() or (wake_event is not None and wake_event.is_set()):
                 break
 
         # Stop listening for insertions on internal_jobs
         cursor.execute("UNLISTEN check_internal_jobs;")
         cursor.close()
 
+    def _claim_jobs(
+        self, session: Session, runner_uuid: str, logger, max_jobs: int, max_other_jobs: int
+    ) -> Tuple[List[Tuple[int, str]], List[str]]:
+        """
+        Claims jobs that are ready to be run, marking them as running by this runner
+
+        At most max_jobs are claimed, of which at most max_other_jobs may have a function that
+        is not one of the priority functions. If running jobs on multiple threads, jobs with priority
+        functions are claimed first. Otherwise, jobs are claimed in the order they were scheduled.
+        Concurrency limits on functions (across all runners) are respected.
+
+        Returns
+        -------
+        :
+            The ids and functions of the claimed jobs, and the functions that are at their concurrency limit
+        """
+
+        # Pick up anything waiting, or anything that hasn't been updated in a while (12 update periods)
+        now = now_at_utc()
+        dead = now - timedelta(seconds=(self._update_frequency * 12))
+        logger.debug(f"checking for jobs before date {now}")
+
+        running_count = {}
+        if self._concurrency_limits:
+            # Only one runner may claim at a time, otherwise limits could be exceeded
+            session.execute(select(func.pg_advisory_xact_lock(internal_job_claim_lock_id))).scalar()
+
+            count_stmt = select(InternalJobORM.function, func.count())
+            count_stmt = count_stmt.where(InternalJobORM.status == InternalJobStatusEnum.running)
+            count_stmt = count_stmt.where(InternalJobORM.last_updated >= dead)
+            count_stmt = count_stmt.where(InternalJobORM.function.in_(list(self._concurrency_limits)))
+            count_stmt = count_stmt.group_by(InternalJobORM.function)
+            running_count = dict(session.execute(count_stmt).all())
+
+        at_limit = [f for f, n in self._concurrency_limits.items() if running_count.get(f, 0) >= n]
+
+        serial_cte = select(InternalJobORM.serial_group).distinct()
+        serial_cte = serial_cte.where(InternalJobORM.status == InternalJobStatusEnum.running)
+        serial_cte = serial_cte.where(InternalJobORM.serial_group.is_not(None))
+        serial_cte = serial_cte.cte()
+
+        # Job is waiting, schedule to be run now or in the past,
+        # Serial group does not have any running or is not set
+        cond1 = and_(
+            InternalJobORM.status == InternalJobStatusEnum.waiting,
+            InternalJobORM.scheduled_date <= now,
+            or_(InternalJobORM.serial_group.is_(None), InternalJobORM.serial_group.not_in(select(serial_cte))),
+        )
+
+        # Job is running but runner is determined to be dead. Serial group doesn't matter
+        cond2 = and_(InternalJobORM.status == InternalJobStatusEnum.running, InternalJobORM.last_updated < dead)
+
+        is_priority = InternalJobORM.function.in_(self._priority_functions)
+
+        stmt = select(InternalJobORM).where(or_(cond1, cond2))
+        if at_limit:
+            stmt = stmt.where(InternalJobORM.function.not_in(at_limit))
+        if max_other_jobs <= 0:
+            stmt = stmt.where(is_priority)
+
+        if self._runner_threads > 1:
+            stmt = stmt.order_by(case((is_priority, 0), else_=1), InternalJobORM.scheduled_date.asc())
+        else:
+            stmt = stmt.order_by(InternalJobORM.scheduled_date.asc())
+
+        # Some rows may be skipped below (same serial group or function limits). These are picked up
+        # next time. Don't lock any extra rows - other runners would skip them
+        stmt = stmt.limit(max_jobs)
+        stmt = stmt.with_for_update(skip_locked=True)
+
+        claimed = []
+        serial_groups = set()
+        n_other = 0
+
+        for job_orm in session.execute(stmt).scalars():
+            if len(claimed) >= max_jobs:
+                break
+
+            function = job_orm.function
+            priority = function in self._priority_functions
+            if not priority and n_other >= max_other_jobs:
+                continue
+            limit = self._concurrency_limits.get(function)
+            if limit is not None and running_count.get(function, 0) >= limit:
+                continue
+            if job_orm.serial_group is not None:
+                if job_orm.serial_group in serial_groups:
+                    continue
+                serial_groups.add(job_orm.serial_group)
+
+            logger.info(f"running job {job_orm.name} id={job_orm.id} scheduled_date={job_orm.scheduled_date}")
+            job_orm.started_date = now_at_utc()
+            job_orm.last_updated = now_at_utc()
+            job_orm.runner_hostname = self._hostname
+            job_orm.runner_uuid = runner_uuid
+            job_orm.status = InternalJobStatusEnum.running
+
+            running_count[function] = running_count.get(function, 0) + 1
+            if not priority:
+                n_other += 1
+
+            claimed.append((job_orm.id, function))
+
+        if not claimed:
+            session.rollback()  # release the transaction
+            return [], at_limit
+
+        # Violation of the unique constraint may occur - two runners attempting to take
+        # different jobs of the same serial group at the same time
+        try:
+            # Releases the row-level locks (from the with_for_update() in the original query)
+            session.commit()
+        except IntegrityError:
+            logger.info(
+                f"Attempting to run jobs from serial groups {serial_groups}, but seems like another runner got to another job from the same group first"
+            )
+            session.rollback()
+            return [], at_limit
+
+        return claimed, at_limit
+
+    def _job_filter(self, at_limit: List[str], priority_only: bool):
+        """
+        Creates a filter for jobs that could be claimed, given functions at their limit and whether only
+        priority functions may be run
+        """
+
+        conds = []
+        if at_limit:
+            conds.append(InternalJobORM.function.not_in(at_limit))
+        if priority_only:
+            conds.append(InternalJobORM.function.in_(self._priority_functions))
+
+        return and_(True, *conds) if conds else None
+
     def run_loop(self, end_event):
         """
         Runs in a infinite loop, checking for jobs and running them
 
+        If the internal_job_threads configuration is greater than one, multiple jobs are run
+        at once on a thread pool.
+
         Parameters
         ----------
         end_event
@@ -544,15 +709,19 @@ class InternalJobSocket:
             stop this loop
         """
 
+        if self._runner_threads > 1:
+            return self._run_loop_threaded(end_event)
+
         # give this loop a unique uuid
         runner_uuid = str(uuid.uuid4())
 
         # Get a uuid-specific logger
         logger = logging.getLogger(f"internal_job_runner:{runner_uuid}")
 
-        # Two sessions - one for the object, and one for the job status object
         session_main = self.root_socket.Session()
-        session_status = self.root_socket.Session()
+
+        # Writes the progress of the running job, and receives cancellations
+        heartbeat = JobHeartbeat(self.root_socket, runner_uuid, self._update_frequency, end_event)
 
         # Set up the listener for postgres. This will be notified when something is
         # added to the internal job queue
@@ -560,48 +729,18 @@ class InternalJobSocket:
         conn = self.root_socket.engine.raw_connection()
         conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
 
-        # Prepare a statement for finding jobs. Filters will be added in the loop
-        serial_cte = select(InternalJobORM.serial_group).distinct()
-        serial_cte = serial_cte.where(InternalJobORM.status == InternalJobStatusEnum.running)
-        serial_cte = serial_cte.where(InternalJobORM.serial_group.is_not(None))
-        serial_cte = serial_cte.cte()
-
-        stmt = select(InternalJobORM)
-        stmt = stmt.order_by(InternalJobORM.scheduled_date.asc()).limit(1)
-        stmt = stmt.with_for_update(skip_locked=True)
-
         while True:
             if end_event.is_set():
                 logger.info("shutting down")
                 break
 
             logger.debug("checking for jobs")
-
-            # Pick up anything waiting, or anything that hasn't been updated in a while (12 update periods)
-
-            now = now_at_utc()
-            dead = now - timedelta(seconds=(self._update_frequency * 12))
-            logger.debug(f"checking for jobs before date {now}")
-
-            # Job is waiting, schedule to be run now or in the past,
-            # Serial group does not have any running or is not set
-            cond1 = and_(
-                InternalJobORM.status == InternalJobStatusEnum.waiting,
-                InternalJobORM.scheduled_date <= now,
-                or_(InternalJobORM.serial_group.is_(None), InternalJobORM.serial_group.not_in(select(serial_cte))),
-            )
-
-            # Job is running but runner is determined to be dead. Serial group doesn't matter
-            cond2 = and_(InternalJobORM.status == InternalJobStatusEnum.running, InternalJobORM.last_updated < dead)
-
-            stmt_now = stmt.where(or_(cond1, cond2))
-            job_orm = session_main.execute(stmt_now).scalar_one_or_none()
+            claimed, at_limit = self._claim_jobs(session_main, runner_uuid, logger, 1, 1)
 
             # If no job was found, wait for one
-            if job_orm is None:
-                session_main.rollback()  # release the transaction
+            if not claimed:
                 logger.debug("no jobs found")
-                self._wait_for_job(session_main, logger, conn, end_event)
+                self._wait_for_job(session_main, logger, conn, end_event, self._job_filter(at_limit, False))
 
                 if end_event.is_set():
                     logger.info("shutting down")
@@ -609,39 +748,111 @@ class InternalJobSocket:
                 else:
                     continue
 
-            if end_event.is_set():
-                logger.info("shutting down")
-                break
+            job_id = claimed[0][0]
+            job_orm = session_main.get(InternalJobORM, job_id)
 
-            logger.info(f"running job {job_orm.name} id={job_orm.id} scheduled_date={job_orm.scheduled_date}")
-            job_orm.started_date = now_at_utc()
-            job_orm.last_updated = now_at_utc()
-            job_orm.runner_hostname = self._hostname
-            job_orm.runner_uuid = runner_uuid
-            job_orm.status = InternalJobStatusEnum.running
+            job_progress = JobProgress(job_id, heartbeat)
+            self._run_single(session_main, job_orm, logger, job_progress=job_progress)
+
+            # Stop updating the progress of this job
+            job_progress.stop()
+
+        heartbeat.stop()
+        session_main.close()
+        conn.close()
+
+    def _run_job(self, job_id: int, heartbeat: JobHeartbeat, logger, wake_event: threading.Event):
+        """
+        Runs a single, already-claimed job in a thread of the pool, with its own session
+        """
+
+        session = self.root_socket.Session()
 
-            # For logging below - the object might be in an odd state after the exception, where accessing
-            # it results in further exceptions
-            serial_group = job_orm.serial_group
+        try:
+            job_orm = session.get(InternalJobORM, job_id)
+            if job_orm is None:
+                logger.info(f"Job {job_id} was deleted before it could be run")
+                return
 
-            # Violation of the unique constraint may occur - two runners attempting to take
-            # different jobs of the same serial group at the same time
+            job_progress = JobProgress(job_id, heartbeat)
             try:
-                # Releases the row-level lock (from the with_for_update() in the original query)
-                session_main.commit()
-            except IntegrityError:
-                logger.info(
-                    f"Attempting to run job from serial group '{serial_group}, but seems like another runner got to another job from the same group first"
-                )
-                session_main.rollback()
-                continue
+                self._run_single(session, job_orm, logger, job_progress=job_progress)
+            finally:
+                # Stop updating the progress of this job
+                job_progress.stop()
+        except Exception:
+            logger.error(f"Error running job {job_id}:\n{traceback.format_exc()}")
+        finally:
+            session.close()
+
+            # A thread is now free
+            wake_event.set()
+
+    def _run_loop_threaded(self, end_event):
+        """
+        Runs in a infinite loop, claiming jobs and running several at once on a thread pool
 
-            job_progress = JobProgress(job_orm.id, runner_uuid, session_status, self._update_frequency, end_event)
-            self._run_single(session_main, job_orm, logger, job_progress=job_progress)
+        Some threads may be reserved for jobs with priority functions (such as iterating services), so that
+        these are not delayed by long-running jobs.
+        """
 
-            # Stop the updating thread and cleanup
-            job_progress.stop()
+        # give this loop a unique uuid
+        runner_uuid = str(uuid.uuid4())
+
+        # Get a uuid-specific logger
+        logger = logging.getLogger(f"internal_job_runner:{runner_uuid}")
+
+        # Session for claiming jobs. Jobs get their own sessions
+        session_main = self.root_socket.Session()
+
+        # Writes the progress of all running jobs, and receives cancellations
+        heartbeat = JobHeartbeat(self.root_socket, runner_uuid, self._update_frequency, end_event)
+
+        # Set up the listener for postgres (see run_loop)
+        conn = self.root_socket.engine.raw_connection()
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+
+        # Set by a thread when its job is done
+        wake_event = threading.Event()
+
+        n_threads = self._runner_threads
+        n_other_threads = n_threads - self._priority_threads
+
+        # future -> whether it is running a job with a priority function
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=n_threads, thread_name_prefix="internal_job") as executor:
+            while not end_event.is_set():
+                # Jobs finishing after this point will wake us up
+                wake_event.clear()
+
+                running = {f: p for f, p in running.items() if not f.done()}
+
+                n_free = n_threads - len(running)
+                if n_free <= 0:
+                    wait(running, timeout=2.0, return_when=FIRST_COMPLETED)
+                    continue
+
+                max_other = n_other_threads - sum(1 for p in running.values() if not p)
+
+                logger.debug(f"checking for up to {n_free} jobs")
+                claimed, at_limit = self._claim_jobs(session_main, runner_uuid, logger, n_free, max_other)
+
+                for job_id, function in claimed:
+                    future = executor.submit(self._run_job, job_id, heartbeat, logger, wake_event)
+                    running[future] = function in self._priority_functions
+
+                # If no job was found, wait for one (or for a thread to become free)
+                if not claimed:
+                    logger.debug("no jobs found")
+                    job_filter = self._job_filter(at_limit, max_other <= 0)
+                    self._wait_for_job(session_main, logger, conn, end_event, job_filter, wake_event)
+
+            logger.info("shutting down")
+
+            # Leaving the context waits for the running jobs. They will notice the end_event
+            # and stop (putting the job back into the waiting state)
 
+        heartbeat.stop()
         session_main.close()
-        session_status.close()
         conn.close()
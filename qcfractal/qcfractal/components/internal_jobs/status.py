@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import logging
+import select as io_select
 import threading
+import time
 import weakref
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from sqlalchemy import update
-from sqlalchemy.orm import Session
+import psycopg2.extensions
+from sqlalchemy import update, select, values, column, Integer, String
 
 from qcfractal.components.internal_jobs.db_models import InternalJobORM
 from qcportal.internal_jobs.models import InternalJobStatusEnum
 from qcportal.utils import now_at_utc
 
+if TYPE_CHECKING:
+    from typing import Dict, Iterable
+    from sqlalchemy.orm import Session
+    from qcfractal.db_socket.socket import SQLAlchemySocket
+
+# Channel used in the postgres NOTIFY sent when a running job is cancelled, deleted, or taken by another runner
+_job_cancelled_channel = "internal_job_cancelled"
+
 
 class CancelledJobException(Exception):
     pass
@@ -20,76 +31,201 @@ class JobRunnerStoppingException(Exception):
     pass
 
 
-class JobProgress:
-    """
-    Functor for updating progress and cancelling internal jobs
+class JobHeartbeat:
     """
+    Updates the progress and liveness of all the jobs running in a job runner
 
-    def __init__(self, job_id: int, runner_uuid: str, session: Session, update_frequency: int, end_event):
-        self._update_frequency = update_frequency
-        self._job_id = job_id
-        self._runner_uuid = runner_uuid
-        self._stmt = (
-            update(InternalJobORM)
-            .where(InternalJobORM.id == self._job_id)
-            .returning(InternalJobORM.status, InternalJobORM.runner_uuid)
-        )
-        self._progress = 0
-        self._description = None
+    A single thread (per runner) writes the progress of all running jobs in one statement every update period.
+    Jobs whose progress has not changed are only written every few periods, so that other runners know this
+    runner is still alive. Postgres sends a notification when a running job is cancelled, deleted,
+    or taken by another runner, so these are noticed without polling.
+    """
 
-        self._cancelled = False
-        self._runner_ending = False
-        self._deleted = False
+    # How many update periods to go without writing an unchanged job. Runners consider a job dead
+    # after 12 update periods without an update
+    liveness_periods = 4
 
+    def __init__(self, root_socket: SQLAlchemySocket, runner_uuid: str, update_frequency: int, end_event):
+        self._root_socket = root_socket
+        self._runner_uuid = runner_uuid
+        self._update_frequency = update_frequency
         self._end_event = end_event
+        self._logger = logging.getLogger(__name__)
 
-        # A thread for periodically updating
-        # _th_cancel is set when we want the updating thread to end
-        self._th_cancel = threading.Event()
-        self._th = threading.Thread(target=self._update_thread, args=(session, self._th_cancel))
+        # job id -> JobProgress of running jobs
+        self._jobs: Dict[int, JobProgress] = {}
+        self._lock = threading.Lock()
 
-        # Start the updating thread
+        # _th_cancel is set when we want the heartbeat thread to end
+        self._th_cancel = threading.Event()
+        self._th = threading.Thread(target=self._heartbeat_thread, name="JobHeartbeat", daemon=True)
         self._th.start()
 
-        # Create the finalizer that will close the updating thread
+        # Create the finalizer that will close the heartbeat thread
         self._finalizer = weakref.finalize(self, self._stop_thread, self._th_cancel, self._th)
 
-    def _update_thread(self, session: Session, end_thread: threading.Event):
-        while True:
-            # Update progress
-            stmt = self._stmt.values(
-                progress=self._progress, progress_description=self._description, last_updated=now_at_utc()
-            )
-            ret = session.execute(stmt).one_or_none()
-            session.commit()
+    @staticmethod
+    def _stop_thread(cancel_event: threading.Event, thread: threading.Thread):
+        ####################################################################################
+        # This is written as a class method so that it can be called by a weakref finalizer
+        ####################################################################################
+
+        cancel_event.set()
+        thread.join()
+
+    def stop(self):
+        self._finalizer()
+
+    def register(self, job_progress: JobProgress):
+        if self._end_event.is_set():
+            job_progress._runner_ending = True
 
+        with self._lock:
+            self._jobs[job_progress.job_id] = job_progress
+
+    def unregister(self, job_id: int):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _check_jobs(self, session: Session, jobs: Iterable[JobProgress]):
+        # Determine why jobs are no longer running with this runner
+        jobs = {x.job_id: x for x in jobs}
+        stmt = select(InternalJobORM.id, InternalJobORM.status, InternalJobORM.runner_uuid)
+        stmt = stmt.where(InternalJobORM.id.in_(list(jobs)))
+        found = {r[0]: r for r in session.execute(stmt).all()}
+        session.commit()
+
+        for job_id, job_progress in jobs.items():
+            ret = found.get(job_id)
             if ret is None:
                 # Job was deleted
-                self._cancelled = True
-                self._deleted = True
-            elif ret[0] != InternalJobStatusEnum.running:
+                job_progress._cancelled = True
+                job_progress._deleted = True
+            elif ret[1] != InternalJobStatusEnum.running:
                 # Job was cancelled or something
-                self._cancelled = True
-            elif ret[1] != self._runner_uuid:
+                job_progress._cancelled = True
+            elif ret[2] != self._runner_uuid:
                 # Job was stolen from us?
-                self._cancelled = True
+                job_progress._cancelled = True
+
+    def _write_jobs(self, session: Session, jobs: Iterable[JobProgress]):
+        # Progress is read once, since the job may change it at any time
+        jobs = {x.job_id: (x, x.progress, x.description) for x in jobs}
+
+        progress_values = values(
+            column("id", Integer), column("progress", Integer), column("progress_description", String), name="p"
+        ).data([(job_id, progress, description) for job_id, (_, progress, description) in jobs.items()])
+
+        # Only update jobs that are still running with this runner, so that the status
+        # of finished jobs isn't overwritten
+        stmt = update(InternalJobORM)
+        stmt = stmt.where(InternalJobORM.id == progress_values.c.id)
+        stmt = stmt.where(InternalJobORM.status == InternalJobStatusEnum.running)
+        stmt = stmt.where(InternalJobORM.runner_uuid == self._runner_uuid)
+        stmt = stmt.values(
+            progress=progress_values.c.progress,
+            progress_description=progress_values.c.progress_description,
+            last_updated=now_at_utc(),
+        )
+        stmt = stmt.returning(InternalJobORM.id)
+        stmt = stmt.execution_options(synchronize_session=False)
+
+        updated = set(session.execute(stmt).scalars().all())
+        session.commit()
+
+        written_time = time.monotonic()
+        for job_id, (job_progress, progress, description) in jobs.items():
+            job_progress._written = (progress, description, written_time)
+
+        not_updated = [job_progress for job_id, (job_progress, _, _) in jobs.items() if job_id not in updated]
+        if not_updated:
+            self._check_jobs(session, not_updated)
+
+    def _heartbeat_thread(self):
+        while not self._th_cancel.is_set():
+            session = self._root_socket.Session()
+            conn = None
+
+            try:
+                # We use a raw psycopg2 connection; sqlalchemy doesn't directly support LISTEN/NOTIFY
+                # This connection is detached from the pool, since its isolation level is changed
+                conn = self._root_socket.engine.raw_connection()
+                conn.detach()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {_job_cancelled_channel};")
+
+                self._heartbeat_loop(session, conn)
+
+            except Exception:
+                self._logger.exception("Error in internal job heartbeat. Will retry")
+                self._th_cancel.wait(5.0)
+
+            finally:
+                session.close()
+                if conn is not None:
+                    conn.close()
+
+    def _heartbeat_loop(self, session: Session, conn):
+        # Notifications may have been missed while we weren't listening, so check everything first
+        with self._lock:
+            notified = set(self._jobs)
+
+        next_update = time.monotonic()
+        while not self._th_cancel.is_set():
+            with self._lock:
+                jobs = list(self._jobs.values())
 
             # Are we ending/cancelling because the runner is stopping/closing?
             if self._end_event.is_set():
-                self._runner_ending = True
+                for job_progress in jobs:
+                    job_progress._runner_ending = True
 
-            cancel = end_thread.wait(self._update_frequency)
-            if cancel is True:
-                break
+            to_check = [x for x in jobs if x.job_id in notified]
+            notified.clear()
+            if to_check:
+                self._check_jobs(session, to_check)
 
-    @staticmethod
-    def _stop_thread(cancel_event: threading.Event, thread: threading.Thread):
-        ####################################################################################
-        # This is written as a class method so that it can be called by a weakref finalizer
-        ####################################################################################
+            now = time.monotonic()
+            if now >= next_update:
+                liveness_time = now - self._update_frequency * self.liveness_periods
+                to_write = [x for x in jobs if x.changed or x._written[2] <= liveness_time]
+                if to_write:
+                    self._write_jobs(session, to_write)
+                next_update = now + self._update_frequency
 
-        cancel_event.set()
-        thread.join()
+            # Wait for notifications, in 1 second intervals (to check for stopping and end_event)
+            to_wait = min(max(next_update - time.monotonic(), 0.0), 1.0)
+            if io_select.select([conn], [], [], to_wait) != ([], [], []):
+                conn.poll()
+                notified.update(int(n.payload) for n in conn.notifies)
+                conn.notifies.clear()
+
+
+class JobProgress:
+    """
+    Functor for updating progress and cancelling internal jobs
+
+    The progress is written to the database by the JobHeartbeat of the runner
+    """
+
+    def __init__(self, job_id: int, heartbeat: JobHeartbeat):
+        self._job_id = job_id
+        self._progress = 0
+        self._description = None
+
+        # Last progress written to the database, and when (time.monotonic)
+        # The job was marked as running (and updated) when it was claimed
+        self._written = (0, None, time.monotonic())
+
+        self._cancelled = False
+        self._runner_ending = False
+        self._deleted = False
+
+        heartbeat.register(self)
+
+        # Create the finalizer that will remove this job from the heartbeat
+        self._finalizer = weakref.finalize(self, heartbeat.unregister, job_id)
 
     def stop(self):
         self._finalizer()
@@ -98,6 +234,22 @@ class JobProgress:
         self._progress = progress
         self._description = description
 
+    @property
+    def job_id(self) -> int:
+        return self._job_id
+
+    @property
+    def progress(self) -> int:
+        return self._progress
+
+    @property
+    def description(self) -> Optional[str]:
+        return self._description
+
+    @property
+    def changed(self) -> bool:
+        return (self._progress, self._description) != self._written[:2]
+
     @property
     def cancelled(self) -> bool:
         return self._cancelled or self._deleted
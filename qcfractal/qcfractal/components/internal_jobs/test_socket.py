@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import logging
 import threading
 import time
 import uuid
 from datetime import timedelta
 from typing import TYPE_CHECKING
 
+import psycopg2
 import pytest
+from sqlalchemy import update
 
 from qcfractal.components.internal_jobs.db_models import InternalJobORM
 from qcfractal.components.internal_jobs.socket import InternalJobSocket
@@ -247,3 +250,280 @@ def test_internal_jobs_socket_recover(storage_socket: SQLAlchemySocket, session:
     finally:
         end_event.set()
         th.join()
+
+
+def test_internal_jobs_socket_claim_serial(storage_socket: SQLAlchemySocket, session: Session):
+    # The later job is added first
+    id_later = storage_socket.internal_jobs.add(
+        "dummy_job", now_at_utc(), "internal_jobs.dummy_job", {"iterations": 1}, None, False, serial_group="test"
+    )
+    id_earlier = storage_socket.internal_jobs.add(
+        "dummy_job",
+        now_at_utc() - timedelta(minutes=10),
+        "internal_jobs.dummy_job",
+        {"iterations": 1},
+        None,
+        False,
+        serial_group="test",
+    )
+
+    logger = logging.getLogger(__name__)
+    claimed, _ = storage_socket.internal_jobs._claim_jobs(session, str(uuid.uuid4()), logger, 2, 2)
+
+    # Only one job of the serial group is claimed, and it is the one scheduled first
+    # (other jobs, such as service iteration, may be claimed too)
+    assert [x for x in claimed if x[1] == "internal_jobs.dummy_job"] == [(id_earlier, "internal_jobs.dummy_job")]
+    assert session.get(InternalJobORM, id_earlier).status == InternalJobStatusEnum.running
+    assert session.get(InternalJobORM, id_later).status == InternalJobStatusEnum.waiting
+
+
+def test_internal_jobs_socket_claim_order(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    id_other = storage_socket.internal_jobs.add(
+        "dummy_job", now_at_utc() - timedelta(minutes=10), "internal_jobs.dummy_job", {"iterations": 1}, None, False
+    )
+    id_priority = storage_socket.internal_jobs.add(
+        "dummy_job_2", now_at_utc(), "internal_jobs.dummy_job_2", {"iterations": 1}, None, False
+    )
+
+    monkeypatch.setattr(storage_socket.internal_jobs, "_priority_functions", ["internal_jobs.dummy_job_2"])
+    logger = logging.getLogger(__name__)
+
+    # With a single thread, jobs are claimed in the order they were scheduled
+    claimed, _ = storage_socket.internal_jobs._claim_jobs(session, str(uuid.uuid4()), logger, 1, 1)
+    assert claimed == [(id_other, "internal_jobs.dummy_job")]
+
+    # With multiple threads, priority jobs are claimed first
+    storage_socket.internal_jobs.add(
+        "dummy_job", now_at_utc() - timedelta(minutes=10), "internal_jobs.dummy_job", {"iterations": 1}, None, False
+    )
+    monkeypatch.setattr(storage_socket.internal_jobs, "_runner_threads", 2)
+    claimed, _ = storage_socket.internal_jobs._claim_jobs(session, str(uuid.uuid4()), logger, 1, 1)
+    assert claimed == [(id_priority, "internal_jobs.dummy_job_2")]
+
+
+def test_internal_jobs_socket_run_threaded(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    job_ids = [
+        storage_socket.internal_jobs.add(
+            f"dummy_job_{i}", now_at_utc(), "internal_jobs.dummy_job", {"iterations": 4}, None, unique_name=False
+        )
+        for i in range(4)
+    ]
+
+    # Faster updates for testing
+    storage_socket.internal_jobs._update_frequency = 1
+    monkeypatch.setattr(storage_socket.internal_jobs, "_runner_threads", 3)
+
+    end_event = threading.Event()
+    th = threading.Thread(target=storage_socket.internal_jobs.run_loop, args=(end_event,))
+    th.start()
+    time.sleep(2)
+
+    try:
+        jobs = [session.get(InternalJobORM, x) for x in job_ids]
+        statuses = [x.status for x in jobs]
+        assert statuses.count(InternalJobStatusEnum.running) == 3
+        assert statuses.count(InternalJobStatusEnum.waiting) == 1
+        assert len({x.runner_uuid for x in jobs if x.runner_uuid is not None}) == 1
+
+        time.sleep(10)
+
+        for job in jobs:
+            session.expire(job)
+            job = session.get(InternalJobORM, job.id)
+            assert job.status == InternalJobStatusEnum.complete
+            assert job.result == "Internal job finished"
+
+    finally:
+        end_event.set()
+        th.join()
+
+
+def test_internal_jobs_socket_run_concurrency_limit(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    job_ids = [
+        storage_socket.internal_jobs.add(
+            f"dummy_job_{i}", now_at_utc(), "internal_jobs.dummy_job", {"iterations": 4}, None, unique_name=False
+        )
+        for i in range(3)
+    ]
+    id_other = storage_socket.internal_jobs.add(
+        "dummy_job_2", now_at_utc(), "internal_jobs.dummy_job_2", {"iterations": 4}, None, unique_name=False
+    )
+
+    # Faster updates for testing
+    storage_socket.internal_jobs._update_frequency = 1
+    monkeypatch.setattr(storage_socket.internal_jobs, "_runner_threads", 3)
+    monkeypatch.setattr(storage_socket.internal_jobs, "_concurrency_limits", {"internal_jobs.dummy_job": 1})
+
+    # Limits apply across runners
+    end_event = threading.Event()
+    th1 = threading.Thread(target=storage_socket.internal_jobs.run_loop, args=(end_event,))
+    th2 = threading.Thread(target=storage_socket.internal_jobs.run_loop, args=(end_event,))
+    th1.start()
+    th2.start()
+    time.sleep(2)
+
+    try:
+        jobs = [session.get(InternalJobORM, x) for x in job_ids]
+        statuses = [x.status for x in jobs]
+        assert statuses.count(InternalJobStatusEnum.running) == 1
+        assert statuses.count(InternalJobStatusEnum.waiting) == 2
+        assert session.get(InternalJobORM, id_other).status == InternalJobStatusEnum.running
+
+        # Jobs run one after another, without waiting for a new job to be added
+        time.sleep(13)
+
+        for job in jobs:
+            session.expire(job)
+            job = session.get(InternalJobORM, job.id)
+            assert job.status == InternalJobStatusEnum.complete
+
+    finally:
+        end_event.set()
+        th1.join()
+        th2.join()
+
+
+def test_internal_jobs_socket_run_priority_threads(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    job_ids = [
+        storage_socket.internal_jobs.add(
+            f"dummy_job_{i}", now_at_utc(), "internal_jobs.dummy_job", {"iterations": 10}, None, unique_name=False
+        )
+        for i in range(3)
+    ]
+
+    # Faster updates for testing
+    storage_socket.internal_jobs._update_frequency = 1
+    monkeypatch.setattr(storage_socket.internal_jobs, "_runner_threads", 3)
+    monkeypatch.setattr(storage_socket.internal_jobs, "_priority_threads", 1)
+    monkeypatch.setattr(storage_socket.internal_jobs, "_priority_functions", ["internal_jobs.dummy_job_2"])
+
+    end_event = threading.Event()
+    th = threading.Thread(target=storage_socket.internal_jobs.run_loop, args=(end_event,))
+    th.start()
+    time.sleep(2)
+
+    try:
+        # One thread is reserved for priority jobs
+        jobs = [session.get(InternalJobORM, x) for x in job_ids]
+        statuses = [x.status for x in jobs]
+        assert statuses.count(InternalJobStatusEnum.running) == 2
+        assert statuses.count(InternalJobStatusEnum.waiting) == 1
+
+        # Priority jobs run right away, ahead of the waiting job
+        id_priority = storage_socket.internal_jobs.add(
+            "dummy_job_2", now_at_utc(), "internal_jobs.dummy_job_2", {"iterations": 1}, None, unique_name=False
+        )
+        time.sleep(2)
+
+        job_priority = session.get(InternalJobORM, id_priority)
+        assert job_priority.status in (InternalJobStatusEnum.running, InternalJobStatusEnum.complete)
+
+        for job in jobs:
+            session.expire(job)
+        statuses = [session.get(InternalJobORM, x).status for x in job_ids]
+        assert statuses.count(InternalJobStatusEnum.waiting) == 1
+
+    finally:
+        end_event.set()
+        th.join()
+
+
+def test_internal_jobs_socket_cancel_running(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    id_1 = storage_socket.internal_jobs.add(
+        "dummy_job", now_at_utc(), "internal_jobs.dummy_job", {"iterations": 20}, None, unique_name=False
+    )
+
+    # Slow updates - cancellation should be noticed (via notification) well before the next update
+    monkeypatch.setattr(storage_socket.internal_jobs, "_update_frequency", 30)
+
+    end_event = threading.Event()
+    th = threading.Thread(target=storage_socket.internal_jobs.run_loop, args=(end_event,))
+    th.start()
+    time.sleep(3)
+
+    try:
+        job_1 = session.get(InternalJobORM, id_1)
+        assert job_1.status == InternalJobStatusEnum.running
+        session.commit()
+
+        storage_socket.internal_jobs.cancel(id_1)
+        time.sleep(3)
+
+        session.expire(job_1)
+        job_1 = session.get(InternalJobORM, id_1)
+        assert job_1.status == InternalJobStatusEnum.cancelled
+        assert job_1.ended_date is not None
+        assert job_1.progress < 100
+
+    finally:
+        end_event.set()
+        th.join()
+
+
+def test_internal_jobs_socket_cancel_notify(storage_socket: SQLAlchemySocket, session: Session):
+    job_ids = [
+        storage_socket.internal_jobs.add(
+            f"dummy_job_{i}", now_at_utc(), "internal_jobs.dummy_job", {"iterations": 1}, None, unique_name=False
+        )
+        for i in range(3)
+    ]
+
+    stmt = update(InternalJobORM).where(InternalJobORM.id.in_(job_ids))
+    session.execute(stmt.values(status=InternalJobStatusEnum.running, runner_uuid="runner_1"))
+    session.commit()
+
+    conn = storage_socket.engine.raw_connection()
+    conn.detach()
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    conn.cursor().execute("LISTEN internal_job_cancelled;")
+
+    def _set(job_id, **values):
+        session.execute(update(InternalJobORM).where(InternalJobORM.id == job_id).values(**values))
+        session.commit()
+        time.sleep(0.5)
+        conn.poll()
+        notified = [int(n.payload) for n in conn.notifies]
+        conn.notifies.clear()
+        return notified
+
+    try:
+        # Finishing normally does not notify runners
+        assert _set(job_ids[0], status=InternalJobStatusEnum.complete) == []
+
+        # Cancelling, or being taken over by another runner, does
+        assert _set(job_ids[1], status=InternalJobStatusEnum.cancelled) == [job_ids[1]]
+        assert _set(job_ids[2], runner_uuid="runner_2") == [job_ids[2]]
+    finally:
+        conn.close()
+
+
+def test_internal_jobs_socket_heartbeat_unchanged(storage_socket: SQLAlchemySocket, session: Session):
+    id_1 = storage_socket.internal_jobs.add(
+        "dummy_job", now_at_utc(), "internal_jobs.dummy_job_2", {"iterations": 8}, None, unique_name=False
+    )
+
+    # Faster updates for testing
+    storage_socket.internal_jobs._update_frequency = 1
+
+    end_event = threading.Event()
+    th = threading.Thread(target=storage_socket.internal_jobs.run_loop, args=(end_event,))
+    th.start()
+    time.sleep(2.5)
+
+    try:
+        # Progress has not changed, so nothing has been written since the job started
+        job_1 = session.get(InternalJobORM, id_1)
+        assert job_1.status == InternalJobStatusEnum.running
+        assert job_1.last_updated - job_1.started_date < timedelta(seconds=0.5)
+        session.commit()
+
+        # But the job is still kept alive
+        time.sleep(3)
+        session.expire(job_1)
+        job_1 = session.get(InternalJobORM, id_1)
+        assert job_1.status == InternalJobStatusEnum.running
+        assert job_1.last_updated - job_1.started_date > timedelta(seconds=2)
+
+    finally:
+        end_event.set()
+        th.join()
@@ -40,6 +40,7 @@ class ComputeManagerORM(BaseORM):
 
     # Latest count
     claimed = Column(Integer, nullable=False, default=0)
+    claimed_generated_inline = Column(Integer, nullable=False, default=0)
     successes = Column(Integer, nullable=False, default=0)
     failures = Column(Integer, nullable=False, default=0)
     rejected = Column(Integer, nullable=False, default=0)
@@ -2,17 +2,28 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
+import numpy as np
 from sqlalchemy import Column, Integer, String, JSON, Float, Index, CHAR, UniqueConstraint
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import column_property
 
-from qcfractal.db_socket.base_orm import BaseORM
+from qcfractal.db_socket.base_orm import BaseORM, ndarray_model_dict_enabled
 from qcfractal.db_socket.column_types import MsgpackExt
 from qcportal.molecules import Molecule
 
 if TYPE_CHECKING:
     from typing import Dict, Any, Optional, Iterable
 
+# Numeric per-atom fields. These are stored as lists, but are sent as raw arrays to clients that accept them
+_molecule_array_fields = ("geometry", "masses", "real", "atomic_numbers", "mass_numbers")
+
+
+def _molecule_fields_to_ndarray(d: Dict[str, Any]) -> Dict[str, Any]:
+    for k in _molecule_array_fields:
+        if k in d:
+            d[k] = np.asarray(d[k])
+    return d
+
 
 class MoleculeORM(BaseORM):
     """
@@ -76,7 +87,12 @@ class MoleculeORM(BaseORM):
         d = BaseORM.model_dict(self, exclude)
 
         # TODO - this is because the pydantic models are goofy
-        return {k: v for k, v in d.items() if v is not None}
+        d = {k: v for k, v in d.items() if v is not None}
+
+        if ndarray_model_dict_enabled():
+            return _molecule_fields_to_ndarray(d)
+
+        return d
 
     @classmethod
     def from_model(cls, model_data: dict | Molecule):
@@ -84,6 +100,16 @@ class MoleculeORM(BaseORM):
         Convert a pydantic (QCElemental) Molecule to an ORM
         """
 
+        return cls(**cls.insert_dict_from_model(model_data))
+
+    @classmethod
+    def insert_dict_from_model(cls, model_data: dict | Molecule) -> Dict[str, Any]:
+        """
+        Convert a pydantic (QCElemental) Molecule to a dictionary of column values
+
+        This is the data that would be stored in the ORM from from_model, but without constructing the ORM
+        """
+
         # Validate the molecule if it hasn't been validated already
         if isinstance(model_data, dict):
             if not model_data["validated"]:
@@ -111,4 +137,4 @@ class MoleculeORM(BaseORM):
         mol_dict["identifiers"]["molecule_hash"] = mol_dict["molecule_hash"]
         mol_dict["identifiers"]["molecular_formula"] = molecule.get_molecular_formula()
 
-        return cls(**mol_dict)
+        return mol_dict
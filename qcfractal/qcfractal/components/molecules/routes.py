@@ -14,14 +14,14 @@ from qcportal.utils import calculate_limit
 
 @api_v1.route("/molecules/<int:molecule_id>", methods=["GET"])
 @check_permissions("records", "read")
-@serialization()
+@serialization(ndarray_results=True)
 def get_molecules_v1(molecule_id: int, url_params: ProjURLParameters) -> dict[str, Any] | None:
     return storage_socket.molecules.get([molecule_id], url_params.include, url_params.exclude)[0]
 
 
 @api_v1.route("/molecules/bulkGet", methods=["POST"])
 @check_permissions("records", "read")
-@serialization()
+@serialization(ndarray_results=True)
 def bulk_get_molecules_v1(body_data: CommonBulkGetBody) -> list[dict[str, Any] | None]:
     limit = current_app.config["QCFRACTAL_CONFIG"].api_limits.get_molecules
     if len(body_data.ids) > limit:
@@ -10,6 +10,7 @@ from sqlalchemy.sql import select, and_, or_
 
 from qcfractal.db_socket.helpers import (
     insert_general,
+    insert_general_copy,
     delete_general,
     insert_mixed_general,
     get_general,
@@ -29,6 +30,10 @@ if TYPE_CHECKING:
     from qcfractal.db_socket.socket import SQLAlchemySocket
     from typing import List, Union, Tuple, Optional, Sequence, Dict, Any
 
+# Adding at least this many molecules at once will use COPY rather than INSERT
+# (COPY is faster from about 5-10 molecules. Services such as manybody add molecules in batches of 400)
+_copy_threshold = 20
+
 
 class MoleculeSocket:
     """
@@ -68,6 +73,22 @@ class MoleculeSocket:
         # valid Molecule object should be insertable into the database
         ###############################################################################
 
+        # Large numbers of molecules are streamed into the database with COPY. This skips
+        # constructing the ORMs, as well as the large queries for existing molecules
+        if len(molecules) >= _copy_threshold:
+            molecule_data = [MoleculeORM.insert_dict_from_model(x) for x in molecules]
+
+            with self.root_socket.optional_session(session) as session:
+                meta, added_ids = insert_general_copy(
+                    session,
+                    MoleculeORM.__table__,
+                    molecule_data,
+                    MoleculeORM.molecule_hash,
+                    (MoleculeORM.id,),
+                )
+
+            return meta, [x[0] for x in added_ids]
+
         molecule_orm = [MoleculeORM.from_model(x) for x in molecules]
 
         with self.root_socket.optional_session(session) as session:
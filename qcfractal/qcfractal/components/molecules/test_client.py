@@ -3,6 +3,7 @@ from __future__ import annotations
 import os
 from typing import TYPE_CHECKING
 
+import numpy as np
 import pytest
 from qcarchivetesting import load_molecule_data
 from qcportal import PortalRequestError
@@ -37,6 +38,30 @@ def test_molecules_client_basic(snowflake_client: PortalClient):
     assert mols[0].validated
 
 
+@pytest.mark.parametrize("encoding", ["application/json", "application/msgpack", "application/msgpack-ndarray"])
+def test_molecules_client_get_encoding(snowflake_client: PortalClient, encoding: str):
+    # Small molecule and a large molecule (with a large geometry array)
+    water = load_molecule_data("water_dimer_minima")
+    benzene = load_molecule_data("benzene_dimer")
+    large_mol = Molecule(
+        symbols=list(benzene.symbols) * 4,
+        geometry=np.concatenate([benzene.geometry + [20.0 * i, 0.0, 0.0] for i in range(4)]),
+    )
+
+    meta, ids = snowflake_client.add_molecules([water, large_mol])
+    assert meta.success
+
+    snowflake_client.encoding = encoding
+    mols = snowflake_client.get_molecules(ids)
+    assert mols[0] == water
+    assert mols[1] == large_mol
+    assert mols[1].get_hash() == large_mol.get_hash()
+
+    # Single molecule uses a different route
+    mol = snowflake_client.get_molecules(ids[1])
+    assert mol == large_mol
+
+
 def test_molecules_client_get_nonexist(snowflake_client: PortalClient):
     water = load_molecule_data("water_dimer_minima")
     meta, ids = snowflake_client.add_molecules([water])
@@ -2,7 +2,13 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
+import msgpack
+import numpy as np
+from sqlalchemy import text
+
 from qcarchivetesting import load_molecule_data
+from qcfractal.components.molecules.socket import _copy_threshold
+from qcfractal.db_socket.base_orm import ndarray_model_dict
 from qcportal.molecules import Molecule, MoleculeQueryFilters
 
 if TYPE_CHECKING:
@@ -50,6 +56,91 @@ def test_molecules_socket_get_proj(storage_socket: SQLAlchemySocket):
     assert mols[1]["validated"] is True
 
 
+def test_molecules_socket_get_ndarray(storage_socket: SQLAlchemySocket):
+    benzene = load_molecule_data("benzene_dimer")
+    large_mol = Molecule(
+        symbols=list(benzene.symbols) * 8,
+        geometry=np.concatenate([benzene.geometry + [20.0 * i, 0.0, 0.0] for i in range(8)]),
+    )
+
+    meta, ids = storage_socket.molecules.add([large_mol])
+
+    # Always stored as plain lists
+    with storage_socket.session_scope() as session:
+        raw = session.execute(text("SELECT geometry FROM molecule WHERE id = :id"), {"id": ids[0]}).scalar_one()
+        assert isinstance(msgpack.loads(raw), list)
+
+    mol = storage_socket.molecules.get(ids)[0]
+    assert isinstance(mol["geometry"], list)
+
+    # Only converted to arrays when asked for
+    with ndarray_model_dict():
+        mol = storage_socket.molecules.get(ids)[0]
+
+    assert isinstance(mol["geometry"], np.ndarray)
+    assert Molecule(**mol) == large_mol
+
+
+def test_molecules_socket_add_copy(storage_socket: SQLAlchemySocket):
+    # Adding many molecules at once uses COPY
+    water = load_molecule_data("water_dimer_minima")
+    hooh = load_molecule_data("hooh")
+    ne4 = load_molecule_data("neon_tetramer")
+
+    meta, ids = storage_socket.molecules.add([water])
+    assert meta.success
+
+    # Already validated, so shouldn't be validated again
+    many_hooh = [hooh.model_copy(update={"geometry": hooh.geometry + i * 0.001}) for i in range(_copy_threshold)]
+
+    to_add = [ne4, water] + many_hooh + [water, many_hooh[0], ne4]
+    n_add = len(to_add)
+
+    meta, new_ids = storage_socket.molecules.add(to_add)
+    assert meta.success
+    assert meta.n_inserted == _copy_threshold + 1
+    assert meta.inserted_idx == [0] + list(range(2, n_add - 3))
+    assert meta.existing_idx == [1, n_add - 3, n_add - 2, n_add - 1]
+
+    assert new_ids[1] == ids[0]
+    assert new_ids[-3] == ids[0]
+    assert new_ids[-2] == new_ids[2]
+    assert new_ids[-1] == new_ids[0]
+    assert len(set(new_ids)) == _copy_threshold + 2
+
+    # ids are assigned in the order given
+    assert new_ids[2 : n_add - 3] == sorted(new_ids[2 : n_add - 3])
+
+    mols = storage_socket.molecules.get(new_ids)
+    assert all(x["validated"] is True for x in mols)
+    mols = [Molecule(**x) for x in mols]
+    assert mols == to_add
+
+    # Now all exist
+    meta, new_ids_2 = storage_socket.molecules.add(to_add)
+    assert meta.success
+    assert meta.n_inserted == 0
+    assert meta.n_existing == n_add
+    assert new_ids_2 == new_ids
+
+
+def test_molecules_socket_add_copy_multiplicity(storage_socket: SQLAlchemySocket):
+    # Fractional multiplicities are stored the same way with and without COPY
+    hooh = load_molecule_data("hooh")
+    hooh = hooh.model_copy(update={"molecular_multiplicity": 1.6})
+
+    meta, ids = storage_socket.molecules.add([hooh])
+    assert meta.success
+
+    many_hooh = [hooh.model_copy(update={"geometry": hooh.geometry + i * 0.001}) for i in range(1, _copy_threshold + 1)]
+    meta, many_ids = storage_socket.molecules.add(many_hooh)
+    assert meta.n_inserted == _copy_threshold
+
+    mols = storage_socket.molecules.get(ids + many_ids)
+    assert mols[0]["molecular_multiplicity"] == 2
+    assert all(x["molecular_multiplicity"] == mols[0]["molecular_multiplicity"] for x in mols)
+
+
 def test_molecules_socket_add_mixed_1(storage_socket: SQLAlchemySocket):
     # Tests a simple add_mixed
     water = load_molecule_data("water_dimer_minima")
@@ -31,7 +31,7 @@ from qcportal.optimization import OptimizationSpecification
 from qcportal.record_models import PriorityEnum, RecordStatusEnum, OutputTypeEnum
 from qcportal.serialization import convert_numpy_recursive
 from qcportal.singlepoint import QCSpecification
-from qcportal.utils import capture_all_output, hash_dict, is_included, reshape_molecule
+from qcportal.utils import capture_all_output, hash_dict, is_included
 from .record_db_models import (
     NEBOptimizationsORM,
     NEBSpecificationORM,
@@ -228,16 +228,18 @@ class NEBRecordSocket(BaseRecordSocket):
                         service_state.iteration += 1
 
                 else:
-                    complete_tasks = sorted(service_orm.dependencies, key=lambda x: x.extras["position"])
+                    # Load all the singlepoints (and their molecules) at once
+                    complete_tasks = self.load_service_dependencies(
+                        session,
+                        service_orm,
+                        SinglepointRecordORM,
+                        [joinedload(SinglepointRecordORM.molecule).load_only(MoleculeORM.geometry)],
+                    )
                     geometries = []
                     energies = []
                     gradients = []
-                    for task in complete_tasks:
-                        sp_record = task.record
-                        mol_data = self.root_socket.molecules.get(
-                            molecule_id=[sp_record.molecule_id], include=["geometry"], session=session
-                        )
-                        geometries.append(reshape_molecule(mol_data[0]["geometry"]))
+                    for _, sp_record in complete_tasks:
+                        geometries.append(np.asarray(sp_record.molecule.geometry).reshape(-1, 3))
                         energies.append(sp_record.properties["return_energy"])
                         gradients.append(convert_numpy_recursive(sp_record.properties["return_result"], flatten=True))
                     service_state.nebinfo["geometry"] = convert_numpy_recursive(geometries, flatten=False)
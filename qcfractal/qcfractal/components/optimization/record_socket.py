@@ -116,33 +116,52 @@ class OptimizationRecordSocket(BaseRecordSocket):
         return [task_specs[rid] for rid in record_ids]
 
     def update_completed_schema_v1(self, session: Session, record_id: int, result: QCEl_OptimizationResult) -> None:
+        self.update_completed_schema_v1_multi(session, [(record_id, result)])
 
-        # Add the final molecule
-        meta, final_mol_id = self.root_socket.molecules.add([result.final_molecule], session=session)
-        if not meta.success:
-            raise RuntimeError("Unable to add final molecule: " + meta.error_string)
-
-        # Insert the trajectory
-        # Get the ID of the parent_record
-        stmt = select(OptimizationRecordORM.creator_user_id).where(OptimizationRecordORM.id == record_id)
-        creator_user_id = session.execute(stmt).scalar_one()
+    def update_completed_schema_v1_multi(
+        self, session: Session, results: Sequence[Tuple[int, QCEl_OptimizationResult]]
+    ) -> None:
 
-        traj_ids = self.root_socket.records.insert_full_schema_v1(session, result.trajectory, creator_user_id)
+        record_ids = [record_id for record_id, _ in results]
 
-        for position, traj_id in enumerate(traj_ids):
-            assoc_orm = OptimizationTrajectoryORM(singlepoint_id=traj_id)
-            assoc_orm.optimization_id = record_id
-            assoc_orm.position = position
-            session.add(assoc_orm)
+        # Add all the final molecules
+        meta, final_mol_ids = self.root_socket.molecules.add([r.final_molecule for _, r in results], session=session)
+        if not meta.success:
+            raise RuntimeError("Unable to add final molecule: " + meta.error_string)
 
-        # Update the fields themselves
-        record_updates = {
-            "final_molecule_id": final_mol_id[0],
-            "energies": result.energies,
-        }
+        # Insert the trajectories
+        # Get the creator of the parent records. Trajectory records are inserted all together
+        # for all records that have the same creator
+        stmt = select(OptimizationRecordORM.id, OptimizationRecordORM.creator_user_id)
+        stmt = stmt.where(OptimizationRecordORM.id.in_(record_ids))
+        creator_map = {x[0]: x[1] for x in session.execute(stmt).all()}
+
+        by_creator: Dict[Optional[int], List[Tuple[int, QCEl_OptimizationResult]]] = {}
+        for record_id, result in results:
+            by_creator.setdefault(creator_map[record_id], []).append((record_id, result))
+
+        for creator_user_id, creator_results in by_creator.items():
+            all_traj = [t for _, r in creator_results for t in r.trajectory]
+            all_traj_ids = self.root_socket.records.insert_full_schema_v1(session, all_traj, creator_user_id)
+
+            traj_idx = 0
+            for record_id, result in creator_results:
+                traj_ids = all_traj_ids[traj_idx : traj_idx + len(result.trajectory)]
+                traj_idx += len(result.trajectory)
+
+                for position, traj_id in enumerate(traj_ids):
+                    assoc_orm = OptimizationTrajectoryORM(singlepoint_id=traj_id)
+                    assoc_orm.optimization_id = record_id
+                    assoc_orm.position = position
+                    session.add(assoc_orm)
+
+        # Update the fields themselves (bulk update by primary key)
+        record_updates = [
+            {"id": record_id, "final_molecule_id": final_mol_id, "energies": result.energies}
+            for (record_id, result), final_mol_id in zip(results, final_mol_ids)
+        ]
 
-        stmt = update(OptimizationRecordORM).where(OptimizationRecordORM.id == record_id).values(record_updates)
-        session.execute(stmt)
+        session.execute(update(OptimizationRecordORM), record_updates)
 
     def insert_full_qcportal_records_v1(
         self,
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Any
 
-from qcfractal.components.record_db_models import OutputStoreORM
+from qcfractal.components.record_db_models import OutputStoreORM, OutputStoreChunkORM
 from qcportal.compression import compress, CompressionEnum
 from qcportal.record_models import OutputTypeEnum
 
@@ -16,3 +16,16 @@ def create_output_orm(output_type: OutputTypeEnum, output: Any) -> OutputStoreOR
         data=compressed_out,
     )
     return out_orm
+
+
+def create_output_chunk_orm(history_id: int, output_type: OutputTypeEnum, seq: int, output: str) -> OutputStoreChunkORM:
+    compressed_out, compression_type, compression_level = compress(output, CompressionEnum.zstd)
+    chunk_orm = OutputStoreChunkORM(
+        history_id=history_id,
+        output_type=output_type,
+        seq=seq,
+        compression_type=compression_type,
+        compression_level=compression_level,
+        data=compressed_out,
+    )
+    return chunk_orm
@@ -1,12 +1,16 @@
 from __future__ import annotations
 
+import threading
+from collections import OrderedDict
 from typing import TYPE_CHECKING
 
 from sqlalchemy import (
     Column,
     String,
     Integer,
+    BigInteger,
     ForeignKey,
+    ForeignKeyConstraint,
     Enum,
     TIMESTAMP,
     JSON,
@@ -23,12 +27,12 @@ from sqlalchemy.orm.collections import attribute_keyed_dict
 
 from qcfractal.components.auth.db_models import UserORM, UserIDMapSubquery
 from qcfractal.db_socket import BaseORM
-from qcportal.compression import CompressionEnum, decompress
+from qcportal.compression import CompressionEnum, compress, decompress
 from qcportal.record_models import RecordStatusEnum, OutputTypeEnum
 from qcportal.utils import now_at_utc
 
 if TYPE_CHECKING:
-    from typing import Dict, Any, Optional, Iterable
+    from typing import Dict, Any, Optional, Iterable, Tuple
 
 
 class RecordCommentORM(BaseORM):
@@ -84,6 +88,73 @@ class RecordInfoBackupORM(BaseORM):
     _qcportal_model_excludes = ["id", "record_id"]
 
 
+# Outputs merged with their appended chunks, so that outputs of running services are not decompressed and
+# recompressed every time they are read. Keyed by (output id, size of the stored data, chunk sequence numbers),
+# since a new chunk or compaction changes the key. Limited by the total size of the merged data
+_merged_output_cache: OrderedDict[tuple, Tuple[bytes, CompressionEnum, int]] = OrderedDict()
+_merged_output_cache_size = 0
+_merged_output_cache_max_size = 64 * 1024 * 1024
+_merged_output_cache_lock = threading.Lock()
+
+
+def _get_cached_merged_output(key: tuple) -> Optional[Tuple[bytes, CompressionEnum, int]]:
+    with _merged_output_cache_lock:
+        merged = _merged_output_cache.get(key)
+        if merged is not None:
+            _merged_output_cache.move_to_end(key)
+        return merged
+
+
+def _store_merged_output(key: tuple, merged: Tuple[bytes, CompressionEnum, int]) -> None:
+    global _merged_output_cache_size
+
+    if len(merged[0]) > _merged_output_cache_max_size:
+        return
+
+    with _merged_output_cache_lock:
+        old = _merged_output_cache.pop(key, None)
+        if old is not None:
+            _merged_output_cache_size -= len(old[0])
+
+        _merged_output_cache[key] = merged
+        _merged_output_cache_size += len(merged[0])
+
+        while _merged_output_cache_size > _merged_output_cache_max_size:
+            _, evicted = _merged_output_cache.popitem(last=False)
+            _merged_output_cache_size -= len(evicted[0])
+
+
+class OutputStoreChunkORM(BaseORM):
+    """
+    Table for storing text that has been appended to an output
+
+    Services append to their outputs every iteration. Rather than recompressing the entire
+    output each time, the appended text is stored as independently-compressed chunks. These are
+    merged with the output when it is read, and compacted into it once the record is finished.
+    """
+
+    __tablename__ = "output_store_chunk"
+
+    history_id = Column(Integer, primary_key=True)
+    output_type = Column(Enum(OutputTypeEnum), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+
+    compression_type = Column(Enum(CompressionEnum), nullable=False)
+    compression_level = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["history_id", "output_type"],
+            ["output_store.history_id", "output_store.output_type"],
+            ondelete="cascade",
+        ),
+    )
+
+    def get_output(self) -> Any:
+        return decompress(self.data, self.compression_type)
+
+
 class OutputStoreORM(BaseORM):
     """
     Table for storing raw computation outputs (text) and errors (json)
@@ -99,12 +170,51 @@ class OutputStoreORM(BaseORM):
     compression_level = Column(Integer, nullable=False)
     data = deferred(Column(LargeBinary, nullable=False))
 
+    # Text appended to this output that has not been compacted yet
+    chunks = relationship(
+        OutputStoreChunkORM,
+        order_by=OutputStoreChunkORM.seq,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
     __table_args__ = (UniqueConstraint("history_id", "output_type", name="ux_output_store_id_type"),)
 
-    _qcportal_model_excludes = ["id", "history_id", "compression_level"]
+    _qcportal_model_excludes = ["id", "history_id", "compression_level", "chunks"]
 
     def get_output(self) -> Any:
-        return decompress(self.data, self.compression_type)
+        output = decompress(self.data, self.compression_type)
+        for chunk in self.chunks:
+            output += chunk.get_output()
+        return output
+
+    def get_merged_data(self) -> Tuple[bytes, CompressionEnum, int]:
+        """
+        Returns the compressed data of this output, with any appended chunks merged in
+        """
+
+        if not self.chunks:
+            return self.data, self.compression_type, self.compression_level
+
+        if self.id is None:
+            return compress(self.get_output(), self.compression_type)
+
+        key = (self.id, len(self.data), tuple(c.seq for c in self.chunks))
+        merged = _get_cached_merged_output(key)
+        if merged is None:
+            merged = compress(self.get_output(), self.compression_type)
+            _store_merged_output(key, merged)
+
+        return merged
+
+    def model_dict(self, exclude: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        d = BaseORM.model_dict(self, exclude)
+
+        # Only merge if the data was requested (ie, undeferred)
+        if "data" in d:
+            d["data"], d["compression_type"], _ = self.get_merged_data()
+
+        return d
 
 
 # Mark the storage of the data column as external
@@ -114,6 +224,12 @@ event.listen(
     DDL("ALTER TABLE output_store ALTER COLUMN data SET STORAGE EXTERNAL").execute_if(dialect=("postgresql")),
 )
 
+event.listen(
+    OutputStoreChunkORM.__table__,
+    "after_create",
+    DDL("ALTER TABLE output_store_chunk ALTER COLUMN data SET STORAGE EXTERNAL").execute_if(dialect=("postgresql")),
+)
+
 
 class NativeFileORM(BaseORM):
     """
@@ -205,6 +321,10 @@ class BaseRecordORM(BaseORM):
     created_on = Column(TIMESTAMP(timezone=True), default=now_at_utc, nullable=False)
     modified_on = Column(TIMESTAMP(timezone=True), default=now_at_utc, nullable=False)
 
+    # ID of the transaction that last changed this record (set by a trigger). Unlike modified_on,
+    # this can be compared against the transactions that have committed (for the dataset record change feed)
+    change_xid = Column(BigInteger, nullable=True)
+
     # Who created this record
     creator_user_id = Column(Integer, ForeignKey(UserORM.id), nullable=True)
 
@@ -267,7 +387,7 @@ class BaseRecordORM(BaseORM):
 
     # strip user/group ids
     # info_backup is also never part of models
-    _qcportal_model_excludes = ["creator_user_id", "info_backup"]
+    _qcportal_model_excludes = ["creator_user_id", "info_backup", "change_xid"]
 
     def model_dict(self, exclude: Optional[Iterable[str]] = None) -> Dict[str, Any]:
         d = BaseORM.model_dict(self, exclude)
@@ -305,3 +425,79 @@ _del_baserecord_triggerfunc = DDL(
 )
 
 event.listen(BaseRecordORM.__table__, "after_create", _del_baserecord_triggerfunc.execute_if(dialect=("postgresql")))
+
+# Function that sends a postgres NOTIFY (with comma-separated record ids) when the status of records change.
+# Used for clients watching records. This runs once per statement (rather than per row), with the ids split
+# over several notifications to keep under the payload size limit (8000 bytes)
+_record_status_notify_triggerfunc = DDL(
+    """
+    CREATE OR REPLACE FUNCTION public.qca_record_status_notify()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        DECLARE
+          changed_ids text;
+        BEGIN
+          FOR changed_ids IN
+            SELECT string_agg(c.id::text, ',')
+            FROM (
+              SELECT n.id, (row_number() OVER (ORDER BY n.id) - 1) / 500 AS grp
+              FROM new_records n INNER JOIN old_records o ON o.id = n.id
+              WHERE o.status IS DISTINCT FROM n.status
+            ) c
+            GROUP BY c.grp
+          LOOP
+            PERFORM pg_notify('record_status', changed_ids);
+          END LOOP;
+          RETURN NULL;
+        END
+        $_$
+    ;
+"""
+)
+
+# Transition tables can't be used with a column list (UPDATE OF status), so this runs on every update
+_record_status_notify_trigger = DDL(
+    """
+    CREATE TRIGGER qca_base_record_status_tr
+    AFTER UPDATE ON base_record
+    REFERENCING OLD TABLE AS old_records NEW TABLE AS new_records
+    FOR EACH STATEMENT
+    EXECUTE PROCEDURE qca_record_status_notify();
+    """
+)
+
+event.listen(
+    BaseRecordORM.__table__, "after_create", _record_status_notify_triggerfunc.execute_if(dialect=("postgresql"))
+)
+event.listen(BaseRecordORM.__table__, "after_create", _record_status_notify_trigger.execute_if(dialect=("postgresql")))
+
+# Function that stores the id of the transaction that is changing a record
+_record_change_xid_triggerfunc = DDL(
+    """
+    CREATE OR REPLACE FUNCTION public.qca_record_change_xid()
+    RETURNS trigger
+    LANGUAGE plpgsql
+    AS $_$
+        BEGIN
+          NEW.change_xid := txid_current();
+          RETURN NEW;
+        END
+        $_$
+    ;
+"""
+)
+
+_record_change_xid_trigger = DDL(
+    """
+    CREATE TRIGGER qca_base_record_change_xid_tr
+    BEFORE INSERT OR UPDATE ON base_record
+    FOR EACH ROW
+    EXECUTE PROCEDURE qca_record_change_xid();
+    """
+)
+
+event.listen(
+    BaseRecordORM.__table__, "after_create", _record_change_xid_triggerfunc.execute_if(dialect=("postgresql"))
+)
+event.listen(BaseRecordORM.__table__, "after_create", _record_change_xid_trigger.execute_if(dialect=("postgresql")))
@@ -15,6 +15,8 @@ from qcportal.record_models import (
     RecordDeleteBody,
     RecordRevertBody,
     RecordStatusEnum,
+    RecordWatchBody,
+    RecordFetchDescendantsBody,
 )
 
 
@@ -76,6 +78,31 @@ def get_record_waiting_reason_v1(record_id: int) -> dict[str, Any]:
     return storage_socket.records.get_waiting_reason(record_id)
 
 
+@api_v1.route("/records/watch", methods=["POST"])
+@check_permissions("records", "read")
+@serialization()
+def watch_records_v1(body_data: RecordWatchBody) -> dict[int, RecordStatusEnum]:
+    api_limits = current_app.config["QCFRACTAL_CONFIG"].api_limits
+
+    if body_data.record_ids is not None and len(body_data.record_ids) > api_limits.watch_records:
+        raise LimitExceededError(
+            f"Cannot watch {len(body_data.record_ids)} records - limit is {api_limits.watch_records}"
+        )
+
+    # Don't allow requests to tie up the server forever
+    timeout = min(max(body_data.timeout, 0.0), api_limits.watch_timeout)
+
+    # Records of a dataset are returned in pages (by record id)
+    return storage_socket.records.watch(
+        body_data.record_ids,
+        body_data.dataset_id,
+        body_data.known_status,
+        timeout,
+        dataset_cursor=body_data.dataset_cursor,
+        dataset_limit=api_limits.watch_records,
+    )
+
+
 #################################################################
 # Routes for individual record types
 # These can also be accessed through /records
@@ -85,7 +112,7 @@ def get_record_waiting_reason_v1(record_id: int) -> dict[str, Any]:
 @api_v1.route("/records/<string:record_type>/<int:record_id>", methods=["GET"])
 @api_v1.route("/records/<int:record_id>", methods=["GET"])
 @check_permissions("records", "read")
-@serialization()
+@serialization(ndarray_results=True)
 def get_records_v1(record_id: int, url_params: ProjURLParameters, record_type: str | None = None) -> dict[str, Any]:
     if record_type is None:
         return storage_socket.records.get([record_id], url_params.include, url_params.exclude)[0]
@@ -97,7 +124,7 @@ def get_records_v1(record_id: int, url_params: ProjURLParameters, record_type: s
 @api_v1.route("/records/<string:record_type>/bulkGet", methods=["POST"])
 @api_v1.route("/records/bulkGet", methods=["POST"])
 @check_permissions("records", "read")
-@serialization()
+@serialization(ndarray_results=True)
 def bulk_get_records_v1(body_data: CommonBulkGetBody, record_type: str | None = None) -> list[dict[str, Any] | None]:
     limit = current_app.config["QCFRACTAL_CONFIG"].api_limits.get_records
     if len(body_data.ids) > limit:
@@ -112,6 +139,27 @@ def bulk_get_records_v1(body_data: CommonBulkGetBody, record_type: str | None =
         return record_socket.get(body_data.ids, body_data.include, body_data.exclude, body_data.missing_ok)
 
 
+@api_v1.route("/records/descendants", methods=["POST"])
+@check_permissions("records", "read")
+@serialization(ndarray_results=True)
+def fetch_record_descendants_v1(body_data: RecordFetchDescendantsBody) -> list[dict[str, Any]]:
+    max_limit = current_app.config["QCFRACTAL_CONFIG"].api_limits.get_records
+    if len(body_data.record_ids) > max_limit:
+        raise LimitExceededError(
+            f"Cannot get descendants of {len(body_data.record_ids)} records - limit is {max_limit}"
+        )
+
+    limit = max_limit if body_data.limit is None else min(body_data.limit, max_limit)
+
+    return storage_socket.records.get_descendants(
+        body_data.record_ids,
+        body_data.include,
+        body_data.exclude,
+        after_record_id=body_data.after_record_id,
+        limit=limit,
+    )
+
+
 @api_v1.route("/records/<string:record_type>/<int:record_id>", methods=["GET"])
 @api_v1.route("/records/<int:record_id>", methods=["GET"])
 @check_permissions("records", "read")
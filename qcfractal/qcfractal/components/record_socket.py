@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import logging
+import threading
+import time
 from collections import defaultdict
 from typing import TYPE_CHECKING
 
@@ -44,6 +46,7 @@ from .record_db_models import (
     OutputStoreORM,
     NativeFileORM,
 )
+from .record_status_listener import RecordStatusListener
 from .record_utils import (
     build_extras_properties,
     upsert_output,
@@ -51,6 +54,8 @@ from .record_utils import (
     compute_history_orm_from_schema_v1,
     native_files_orms_from_qcportal_record,
     native_files_orms_from_schema_v1,
+    compute_history_orms_from_schema_v1_multi,
+    native_files_orms_from_schema_v1_multi,
 )
 
 if TYPE_CHECKING:
@@ -76,6 +81,12 @@ class RecordSocket:
         self.root_socket = root_socket
         self._logger = logging.getLogger(__name__)
 
+        # Shared by everything in this process that is waiting for records to change status
+        self._status_listener = RecordStatusListener(root_socket.engine)
+
+        # Waiting requests each tie up an API thread, so only some may wait at once
+        self._watch_slots = threading.BoundedSemaphore(root_socket.qcf_config.api_limits.watch_max_waiting)
+
         # All the subsockets
         from .services.socket import ServiceSubtaskRecordSocket
         from .singlepoint.record_socket import SinglepointRecordSocket
@@ -389,6 +400,9 @@ class RecordSocket:
                 options.append(
                     selectinload(orm_type.compute_history, RecordComputeHistoryORM.outputs).undefer(OutputStoreORM.data)
                 )
+                options.append(
+                    selectinload(orm_type.compute_history, RecordComputeHistoryORM.outputs, OutputStoreORM.chunks)
+                )
             if is_included("task", include, exclude, False):
                 options.append(joinedload(orm_type.task))
             if is_included("service", include, exclude, False):
@@ -447,6 +461,74 @@ class RecordSocket:
 
         return self.get_base(wp, record_ids, include, exclude, missing_ok, session=session)
 
+    def get_descendants(
+        self,
+        record_ids: Sequence[int],
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        after_record_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        *,
+        session: Optional[Session] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtain all the descendants (children, children of children, etc) of the given records
+
+        Descendants of any type are returned together, ordered by id, with each record only returned once (even if
+        it is a descendant of several of the given records). To get the next batch of results, pass in the id of the
+        last result as `after_record_id`.
+
+        Parameters
+        ----------
+        record_ids
+            A list or other sequence of record IDs
+        include
+            Which fields of the result to return. Default is to return all fields.
+        exclude
+            Remove these fields from the return. Default is to return all fields.
+        after_record_id
+            Only return records with an id greater than this
+        limit
+            Maximum number of records to return
+        session
+            An existing SQLAlchemy session to use. If None, one will be created. If an existing session
+            is used, it will be flushed (but not committed) before returning from this function.
+
+        Returns
+        -------
+        :
+            Records (as dictionaries) ordered by id
+        """
+
+        stmt = select(BaseRecordORM.id, BaseRecordORM.record_type).distinct()
+        stmt = stmt.join(RecordChildrenView, RecordChildrenView.c.child_id == BaseRecordORM.id)
+        stmt = stmt.where(RecordChildrenView.c.parent_id.in_(record_ids))
+
+        if after_record_id is not None:
+            stmt = stmt.where(BaseRecordORM.id > after_record_id)
+
+        stmt = stmt.order_by(BaseRecordORM.id.asc())
+
+        if limit is not None:
+            stmt = stmt.limit(limit)
+
+        with self.root_socket.optional_session(session, True) as session:
+            descendant_info = session.execute(stmt).all()
+
+            # Records of each type are obtained through the socket for that type, which handles
+            # all the fields specific to that type
+            type_ids = defaultdict(list)
+            for record_id, record_type in descendant_info:
+                type_ids[record_type].append(record_id)
+
+            record_map = {}
+            for record_type, type_record_ids in type_ids.items():
+                record_socket = self._handler_map[record_type]
+                records = record_socket.get(type_record_ids, include, exclude, session=session)
+                record_map.update(zip(type_record_ids, records))
+
+            return [record_map[record_id] for record_id, _ in descendant_info]
+
     def initialize_service(self, session: Session, service_orm: ServiceQueueORM) -> None:
         """
         Initialize a service
@@ -537,6 +619,52 @@ class RecordSocket:
         record_orm.status = RecordStatusEnum.error
         record_orm.modified_on = now_at_utc()
 
+    def compact_outputs(self, session: Session, record_ids: Optional[Sequence[int]] = None) -> int:
+        """
+        Merges appended chunks of output into the outputs themselves
+
+        Services append to their outputs in chunks (see :func:`append_output`). This is meant to be run
+        as an internal job once a record is finished, so that the output is stored as a single blob again.
+        It is also run periodically without any record ids, to catch records that stopped running some
+        other way (cancelled, reset, deleted, etc).
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session to use
+        record_ids
+            IDs of the records whose outputs should be compacted. If None, compact the outputs of all
+            records that are not running
+
+        Returns
+        -------
+        :
+            Number of outputs that were compacted
+        """
+
+        stmt = select(OutputStoreORM)
+        stmt = stmt.join(RecordComputeHistoryORM, RecordComputeHistoryORM.id == OutputStoreORM.history_id)
+        if record_ids is None:
+            stmt = stmt.join(BaseRecordORM, BaseRecordORM.id == RecordComputeHistoryORM.record_id)
+            stmt = stmt.where(BaseRecordORM.status != RecordStatusEnum.running)
+        else:
+            stmt = stmt.where(RecordComputeHistoryORM.record_id.in_(record_ids))
+        stmt = stmt.where(OutputStoreORM.chunks.any())
+        stmt = stmt.options(undefer(OutputStoreORM.data), selectinload(OutputStoreORM.chunks))
+        stmt = stmt.with_for_update(of=OutputStoreORM)
+
+        output_orms = session.execute(stmt).scalars().all()
+
+        for out_orm in output_orms:
+            out_orm.data, out_orm.compression_type, out_orm.compression_level = out_orm.get_merged_data()
+
+            # Only the chunks that were merged are removed (by primary key), so anything
+            # appended in the meantime is kept
+            out_orm.chunks = []
+
+        session.flush()
+        return len(output_orms)
+
     ######################
     # Non-service records
     ######################
@@ -622,6 +750,15 @@ class RecordSocket:
     ):
         return self.update_completed_schema_v1(session, record_id, record_type, result, manager_name)
 
+    def update_completed_multi(
+        self,
+        session: Session,
+        record_type: str,
+        results: Sequence[Tuple[int, AllResultTypes]],
+        manager_name: str,
+    ):
+        return self.update_completed_schema_v1_multi(session, record_type, results, manager_name)
+
     def insert_full_record(
         self, session: Session, results: Sequence[AllResultTypes], creator_user: Optional[Union[int, str]]
     ) -> List[int]:
@@ -701,40 +838,73 @@ class RecordSocket:
             The manager that produced the result
         """
 
+        self.update_completed_schema_v1_multi(session, record_type, [(record_id, result)], manager_name)
+
+    def update_completed_schema_v1_multi(
+        self,
+        session: Session,
+        record_type: str,
+        results: Sequence[Tuple[int, AllSchemaV1ResultTypes]],
+        manager_name: str,
+    ):
+        """
+        Update multiple record ORMs of the same type based on the results of successfully-completed computations
+
+        Compute history, outputs, and native files for all the records are inserted together,
+        and the records themselves are updated with a single executemany UPDATE. If anything fails,
+        an exception is raised and nothing should be considered as updated - it is up to the caller
+        to roll back (to a savepoint, for example).
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session
+        record_type
+            Type of all the records to update
+        results
+            Tuples of (record id, result) to mark as completed. These should be successful results
+        manager_name
+            The manager that produced the results
+        """
+
+        if not results:
+            return
+
         # Do these before calling the record-specific handler
         # (these may pull stuff out of extras)
-        history_orm = compute_history_orm_from_schema_v1(result)
-        history_orm.record_id = record_id
-        history_orm.manager_name = manager_name
-        session.add(history_orm)
+        history_orms = compute_history_orms_from_schema_v1_multi(results, manager_name)
+        session.add_all(history_orms)
+        session.add_all(native_files_orms_from_schema_v1_multi(results))
 
-        native_files_orms = native_files_orms_from_schema_v1(result)
-        for v in native_files_orms.values():
-            v.record_id = record_id
-            session.add(v)
+        # Flush all at once, so these end up as multi-row INSERTs
+        session.flush()
 
         # Now update fields specific to each record
         record_socket = self._handler_map[record_type]
-        record_socket.update_completed_schema_v1(session, record_id, result)
+        record_socket.update_completed_schema_v1_multi(session, results)
 
         # Now extras and properties
-        extras, properties = build_extras_properties(result)
-
-        # What updates we have for this record
-        record_updates = {
-            "extras": extras,
-            "properties": properties,
-            "status": RecordStatusEnum.complete,
-            "manager_name": manager_name,
-            "modified_on": history_orm.modified_on,
-        }
+        record_updates = []
+        for (record_id, result), history_orm in zip(results, history_orms):
+            extras, properties = build_extras_properties(result)
+
+            record_updates.append(
+                {
+                    "id": record_id,
+                    "extras": extras,
+                    "properties": properties,
+                    "status": RecordStatusEnum.complete,
+                    "manager_name": manager_name,
+                    "modified_on": history_orm.modified_on,
+                }
+            )
 
-        # Actually update the record
-        stmt = update(BaseRecordORM).where(BaseRecordORM.id == record_id).values(record_updates)
-        session.execute(stmt)
+        # Actually update the records (bulk update by primary key)
+        session.execute(update(BaseRecordORM), record_updates)
 
-        # Delete the task from the task queue since it is completed
-        stmt = delete(TaskQueueORM).where(TaskQueueORM.record_id == record_id)
+        # Delete the tasks from the task queue since they are completed
+        record_ids = [x[0] for x in results]
+        stmt = delete(TaskQueueORM).where(TaskQueueORM.record_id.in_(record_ids))
         session.execute(stmt)
 
     def insert_full_qcportal_records(
@@ -967,6 +1137,7 @@ class RecordSocket:
             for r in record_orms:
                 r.status = RecordStatusEnum.waiting
                 r.modified_on = now_at_utc()
+                r.task.former_manager_name = r.manager_name
                 r.manager_name = None
                 r.task.available = True
 
@@ -1057,6 +1228,7 @@ class RecordSocket:
 
                         if not r_orm.is_service:
                             r_orm.task.available = True
+                            r_orm.task.former_manager_name = None
 
                     else:
                         if r_orm.info_backup:
@@ -1571,6 +1743,112 @@ class RecordSocket:
 
         raise RuntimeError(f"Unknown status to revert: ", revert_status)
 
+    def stop_status_listener(self) -> None:
+        """
+        Stops the background thread that listens for changes to the status of records
+        """
+
+        self._status_listener.stop()
+
+    def watch(
+        self,
+        record_ids: Optional[Iterable[int]],
+        dataset_id: Optional[int],
+        known_status: Dict[int, RecordStatusEnum],
+        timeout: float,
+        dataset_cursor: Optional[int] = None,
+        dataset_limit: Optional[int] = None,
+    ) -> Dict[int, RecordStatusEnum]:
+        """
+        Waits for the status of records to differ from what the caller already knows
+
+        The watched records are the given record ids, plus the records of the given dataset. The status of
+        any watched record whose status is different from what is given in `known_status` (or is not given in
+        `known_status` at all) is returned. If there are no such records, this waits up to `timeout` seconds
+        for one to change status. If nothing changes within that time, an empty dictionary is returned.
+
+        The records of a dataset are paged by record id - only dataset records with an id greater than
+        `dataset_cursor` are watched, up to `dataset_limit` records.
+
+        Only a limited number of requests may wait at once (see the watch_max_waiting API limit). If that
+        limit is reached, this returns right away without waiting.
+
+        Records that do not exist are not returned.
+
+        Parameters
+        ----------
+        record_ids
+            IDs of the records to watch
+        dataset_id
+            ID of a dataset whose records are watched
+        known_status
+            The status of records, as already known by the caller
+        timeout
+            Maximum amount of time (in seconds) to wait for a status change
+        dataset_cursor
+            Only watch records of the dataset with an id greater than this
+        dataset_limit
+            Maximum number of records of the dataset to watch
+
+        Returns
+        -------
+        :
+            Dictionary of record id to status, for all watched records whose status differs from `known_status`
+        """
+
+        record_ids = set() if record_ids is None else set(record_ids)
+
+        if dataset_id is not None:
+            stmt = select(DatasetDirectRecordsView.c.record_id)
+            stmt = stmt.where(DatasetDirectRecordsView.c.dataset_id == dataset_id)
+            if dataset_cursor is not None:
+                stmt = stmt.where(DatasetDirectRecordsView.c.record_id > dataset_cursor)
+            stmt = stmt.order_by(DatasetDirectRecordsView.c.record_id)
+            stmt = stmt.limit(dataset_limit)
+
+            with self.root_socket.session_scope(True) as session:
+                record_ids.update(session.execute(stmt).scalars().all())
+
+        if not record_ids:
+            return {}
+
+        def _changed_status(to_check: Iterable[int]) -> Dict[int, RecordStatusEnum]:
+            # A new session each time, so that we aren't holding a connection (or a transaction) while waiting
+            ret = {}
+            with self.root_socket.session_scope(True) as session:
+                for id_chunk in chunk_iterable(to_check, 1000):
+                    stmt = select(BaseRecordORM.id, BaseRecordORM.status).where(BaseRecordORM.id.in_(id_chunk))
+                    for rid, status in session.execute(stmt).all():
+                        if known_status.get(rid) != status:
+                            ret[rid] = status
+            return ret
+
+        deadline = time.monotonic() + timeout
+
+        with self._status_listener.watch(record_ids) as watcher:
+            # Check everything once. After that, only the records that were notified as changed
+            ret = _changed_status(record_ids)
+            if ret or timeout <= 0.0:
+                return ret
+
+            if not self._watch_slots.acquire(blocking=False):
+                return ret
+
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0.0:
+                        return {}
+
+                    watcher.wait(remaining)
+                    changed_ids = watcher.pop_changed()
+                    if changed_ids:
+                        ret = _changed_status(changed_ids)
+                        if ret:
+                            return ret
+            finally:
+                self._watch_slots.release()
+
     def get_waiting_reason(self, record_id: int, *, session: Optional[Session] = None) -> Dict[str, Any]:
         """
         Determines why a record/task is waiting
@@ -0,0 +1,192 @@
+"""
+Listening for changes to the status of records
+"""
+
+from __future__ import annotations
+
+import logging
+import select as io_select
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+import psycopg2.extensions
+
+if TYPE_CHECKING:
+    from sqlalchemy.engine import Engine
+    from typing import List, Set, Iterable, Iterator, Optional
+
+# Channel used in the postgres NOTIFY sent by the base_record status trigger
+_record_status_channel = "record_status"
+
+
+class RecordWatcher:
+    """
+    Something waiting for the status of a set of records to change (see :meth:`RecordStatusListener.watch`)
+    """
+
+    def __init__(self, record_ids: Set[int], lock: threading.Lock):
+        self.record_ids = record_ids
+        self._lock = lock
+        self._event = threading.Event()
+
+        # Watched records whose status changed since the last call to pop_changed
+        self._changed: Set[int] = set()
+
+    def _notify(self, record_ids: Optional[Set[int]]) -> None:
+        # If record_ids is None, all watched records may have changed
+        # (lock should be held by the caller)
+        if record_ids is None:
+            changed = self.record_ids
+        elif len(record_ids) < len(self.record_ids):
+            changed = {x for x in record_ids if x in self.record_ids}
+        else:
+            changed = {x for x in self.record_ids if x in record_ids}
+
+        if changed:
+            self._changed.update(changed)
+            self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Waits up to timeout seconds for a watched record to change status. Returns True if one did
+        """
+
+        return self._event.wait(timeout)
+
+    def pop_changed(self) -> Set[int]:
+        """
+        Returns the watched records whose status has changed since the last time this was called
+        """
+
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            self._event.clear()
+            return changed
+
+
+class RecordStatusListener:
+    """
+    Listens for changes to the status of records, and wakes up anything waiting on those records
+
+    Postgres sends a notification (with the record ids) whenever the status of records changes. A single
+    background thread (per process) listens for these notifications, so that a connection isn't needed
+    for each waiting request. The thread is started the first time something waits on records.
+    """
+
+    def __init__(self, engine: Engine):
+        self._engine = engine
+        self._logger = logging.getLogger(__name__)
+
+        # Everything waiting for records to change
+        self._waiters: List[RecordWatcher] = []
+        self._lock = threading.Lock()
+
+        self._end_event = threading.Event()
+        self._thread = None
+        self._finalizer = None
+
+    # Classmethod because finalizer can't handle bound methods
+    @classmethod
+    def _stop(cls, end_event: threading.Event, thread: threading.Thread):
+        end_event.set()
+        thread.join()
+
+    def stop(self) -> None:
+        if self._finalizer is not None:
+            self._finalizer()
+
+        self._thread = None
+
+    def _start(self) -> None:
+        # Lock should be held by the caller
+        if self._thread is not None:
+            return
+
+        self._end_event.clear()
+        self._thread = threading.Thread(
+            target=self._listen_loop,
+            args=(self._engine, self._waiters, self._lock, self._end_event, self._logger),
+            name="RecordStatusListener",
+            daemon=True,
+        )
+        self._thread.start()
+        self._finalizer = weakref.finalize(self, self._stop, self._end_event, self._thread)
+
+    @staticmethod
+    def _wake(waiters: List[RecordWatcher], record_ids: Iterable[int] | None) -> None:
+        # If record_ids is None, wake up everything
+        # (lock should be held by the caller)
+        if record_ids is not None:
+            record_ids = set(record_ids)
+
+        for waiter in waiters:
+            waiter._notify(record_ids)
+
+    @classmethod
+    def _listen_loop(cls, engine, waiters, lock, end_event, logger):
+        # Classmethod so that the thread doesn't hold a reference to the listener object
+        while not end_event.is_set():
+            conn = None
+
+            try:
+                # We use a raw psycopg2 connection; sqlalchemy doesn't directly support LISTEN/NOTIFY
+                # This connection is detached from the pool, since its isolation level is changed
+                conn = engine.raw_connection()
+                conn.detach()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {_record_status_channel};")
+
+                # Anything waiting may have missed notifications while we weren't listening
+                with lock:
+                    cls._wake(waiters, None)
+
+                while not end_event.is_set():
+                    # Wait in 2 second intervals (to check for end_event)
+                    if io_select.select([conn], [], [], 2.0) == ([], [], []):
+                        continue
+
+                    conn.poll()
+                    # Each notification is a comma-separated list of record ids
+                    record_ids = [int(x) for n in conn.notifies for x in n.payload.split(",")]
+                    conn.notifies.clear()
+
+                    with lock:
+                        cls._wake(waiters, record_ids)
+
+            except Exception:
+                logger.exception("Error listening for record status notifications. Will retry")
+                end_event.wait(5.0)
+
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    @contextmanager
+    def watch(self, record_ids: Iterable[int]) -> Iterator[RecordWatcher]:
+        """
+        Watch for changes to the status of the given records
+
+        The returned watcher keeps track of which of the records have changed status. To not miss any
+        changes, the current status should be checked after entering this context. Then, wait on the watcher,
+        and only check the status of the records returned by its pop_changed.
+
+        Parameters
+        ----------
+        record_ids
+            IDs of the records to watch
+        """
+
+        waiter = RecordWatcher(set(record_ids), self._lock)
+
+        with self._lock:
+            self._start()
+            self._waiters.append(waiter)
+
+        try:
+            yield waiter
+        finally:
+            with self._lock:
+                self._waiters.remove(waiter)
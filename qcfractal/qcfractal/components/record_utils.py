@@ -3,24 +3,29 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 from pydantic import TypeAdapter
+from sqlalchemy import select, func
 
 from qcportal.common_types import QCPortalBytes
-from qcportal.compression import CompressionEnum, compress, decompress
+from qcportal.compression import CompressionEnum, compress
 from qcportal.exceptions import MissingDataError
 from qcportal.record_models import RecordStatusEnum, OutputTypeEnum
 from qcportal.utils import now_at_utc
-from .outputstore.utils import create_output_orm
+from .outputstore.utils import create_output_orm, create_output_chunk_orm
 from .record_db_models import (
     RecordComputeHistoryORM,
     BaseRecordORM,
     OutputStoreORM,
+    OutputStoreChunkORM,
     NativeFileORM,
 )
 
 if TYPE_CHECKING:
     from sqlalchemy.orm.session import Session
     from qcportal.all_results import AllResultTypes, AllQCPortalRecordTypes, AllSchemaV1ResultTypes
-    from typing import Dict, Tuple, List, Any
+    from typing import Dict, Tuple, List, Any, Sequence
+
+# Building a TypeAdapter is expensive, so only do it once
+_bytes_type_adapter = TypeAdapter(QCPortalBytes)
 
 
 def build_extras_properties(result: AllResultTypes) -> Tuple[Dict[str, Any], Dict[str, Any]]:
@@ -71,6 +76,14 @@ def upsert_output(session, record_orm: BaseRecordORM, new_output_orm: OutputStor
 
 
 def append_output(session: Session, record_orm: BaseRecordORM, output_type: OutputTypeEnum, to_append: str):
+    """
+    Appends text to an output of the latest compute history entry of a record
+
+    If the output already exists, the text is stored as a new chunk rather than recompressing the
+    whole output. Chunks are merged in when the output is read, and are compacted into the output
+    once the record is finished.
+    """
+
     if not to_append:
         return
 
@@ -79,14 +92,15 @@ def append_output(session: Session, record_orm: BaseRecordORM, output_type: Outp
 
     compute_history = record_orm.compute_history[-1]
     if output_type in compute_history.outputs:
-        out_orm = compute_history.outputs[output_type]
-        out_str = decompress(out_orm.data, out_orm.compression_type)
-        out_str += to_append
-
-        new_data, new_ctype, new_clevel = compress(out_str, CompressionEnum.zstd)
-        out_orm.data = new_data
-        out_orm.compression_type = new_ctype
-        out_orm.compression_level = new_clevel
+        # Make sure the history (and output) have been written, so we have an id
+        session.flush()
+
+        stmt = select(func.coalesce(func.max(OutputStoreChunkORM.seq), 0))
+        stmt = stmt.where(OutputStoreChunkORM.history_id == compute_history.id)
+        stmt = stmt.where(OutputStoreChunkORM.output_type == output_type)
+        seq = session.execute(stmt).scalar_one() + 1
+
+        session.add(create_output_chunk_orm(compute_history.id, output_type, seq, to_append))
     else:
         compute_history.outputs[output_type] = create_output_orm(output_type, to_append)
 
@@ -149,7 +163,7 @@ def compute_history_orm_from_schema_v1(result: AllSchemaV1ResultTypes) -> Record
     if compressed_output is not None:
         for output_type, data_dict in compressed_output.items():
             # Handle various ways we send raw bytes over the wire
-            output_bytes = TypeAdapter(QCPortalBytes).validate_python(data_dict["data"])
+            output_bytes = _bytes_type_adapter.validate_python(data_dict["data"])
             out_orm = OutputStoreORM(
                 output_type=output_type,
                 compression_type=data_dict["compression_type"],
@@ -207,7 +221,7 @@ def native_files_orms_from_schema_v1(result: AllSchemaV1ResultTypes) -> Dict[str
         for name, nf_data in compressed_nf.items():
             # nf_data is a dictionary with keys 'data', 'compression_type', "compression_level"
             # Handle various ways we send raw bytes over the wire
-            nf_bytes = TypeAdapter(QCPortalBytes).validate_python(nf_data["data"])
+            nf_bytes = _bytes_type_adapter.validate_python(nf_data["data"])
             nf_orm = NativeFileORM(
                 name=name,
                 compression_type=nf_data["compression_type"],
@@ -234,3 +248,53 @@ def native_files_orms_from_schema_v1(result: AllSchemaV1ResultTypes) -> Dict[str
         return native_files
     else:
         return {}
+
+
+def compute_history_orms_from_schema_v1_multi(
+    results: Sequence[Tuple[int, AllSchemaV1ResultTypes]], manager_name: str
+) -> List[RecordComputeHistoryORM]:
+    """
+    Creates record computation history entries for multiple results at once
+
+    The returned ORMs have their record id and manager name filled in. When they are all added to a session
+    together, SQLAlchemy will insert them (and their outputs) with multi-row INSERT statements.
+
+    Parameters
+    ----------
+    results
+        Tuples of (record id, result)
+    manager_name
+        The manager that produced the results
+    """
+
+    history_orms = []
+    for record_id, result in results:
+        history_orm = compute_history_orm_from_schema_v1(result)
+        history_orm.record_id = record_id
+        history_orm.manager_name = manager_name
+        history_orms.append(history_orm)
+
+    return history_orms
+
+
+def native_files_orms_from_schema_v1_multi(
+    results: Sequence[Tuple[int, AllSchemaV1ResultTypes]],
+) -> List[NativeFileORM]:
+    """
+    Convert the native files stored in multiple QCElemental results to ORMs
+
+    The returned ORMs have their record id filled in.
+
+    Parameters
+    ----------
+    results
+        Tuples of (record id, result)
+    """
+
+    native_file_orms = []
+    for record_id, result in results:
+        for nf_orm in native_files_orms_from_schema_v1(result).values():
+            nf_orm.record_id = record_id
+            native_file_orms.append(nf_orm)
+
+    return native_file_orms
@@ -5,14 +5,17 @@ import io
 import json
 import logging
 import os
+import queue
 import re
 import tarfile
+import threading
+import weakref
 from collections import defaultdict
 from datetime import datetime, timedelta
 from typing import TYPE_CHECKING
 
 import requests
-from sqlalchemy import and_, or_, func, select, delete, text
+from sqlalchemy import and_, or_, func, select, delete, insert, text
 from sqlalchemy.orm import load_only
 
 import qcfractal
@@ -23,7 +26,7 @@ from qcportal.serverinfo import (
     AccessLogSummaryFilters,
     ErrorLogQueryFilters,
 )
-from qcportal.utils import now_at_utc
+from qcportal.utils import now_at_utc, chunk_iterable
 from .db_models import AccessLogORM, InternalErrorLogORM, MessageOfTheDayORM, ServerStatsMetadataORM, ServerStatsORM
 
 if TYPE_CHECKING:
@@ -31,6 +34,10 @@ if TYPE_CHECKING:
     from qcfractal.db_socket.socket import SQLAlchemySocket
     from typing import Dict, Any, List, Optional
 
+# Maximum number of access log entries to write at once. Also, if this many are
+# waiting to be written, they are written immediately
+_access_log_batch_size = 500
+
 # GeoIP2 package is optional
 try:
     import geoip2.database
@@ -63,6 +70,16 @@ class ServerInfoSocket:
         self._access_log_keep = root_socket.qcf_config.access_log_keep
         self._geoip2_enabled = geoip2_found and self._access_log_enabled
 
+        # Access log entries are buffered and written in batches by a background thread
+        # (started when the first entry is saved)
+        self._access_log_flush_interval = root_socket.qcf_config.access_log_flush_interval
+        self._access_log_buffer = queue.Queue(maxsize=root_socket.qcf_config.access_log_buffer_size)
+        self._access_log_dropped = 0
+        self._access_log_lock = threading.Lock()
+        self._access_log_wake = threading.Event()
+        self._access_log_thread: Optional[threading.Thread] = None
+        self._access_log_finalizer = None
+
         # MOTD contents
         self._load_motd()
 
@@ -221,6 +238,8 @@ class ServerInfoSocket:
         if not self._geoip2_enabled:
             return
 
+        self.flush_access_log()
+
         if not os.path.exists(self._geoip2_file_path):
             self._logger.warning(
                 "GeoIP2 database file not found. Cannot add location data to accesses. "
@@ -336,6 +355,9 @@ class ServerInfoSocket:
         """
         Saves information about a request/access to the database
 
+        Unless a session is given (or access_log_flush_interval is 0), the entry is added to a buffer that
+        is written to the database by a background thread. If the buffer is full, the entry is dropped.
+
         Parameters
         ----------
         log_data
@@ -345,9 +367,103 @@ class ServerInfoSocket:
             is used, it will be flushed (but not committed) before returning from this function.
         """
 
-        with self.root_socket.optional_session(session) as session:
-            log = AccessLogORM(**log_data)
-            session.add(log)
+        if session is not None or self._access_log_flush_interval <= 0:
+            with self.root_socket.optional_session(session) as session:
+                log = AccessLogORM(**log_data)
+                session.add(log)
+            return
+
+        # Timestamp is when the access happened, not when it is written
+        log_data = {"timestamp": now_at_utc(), **log_data}
+
+        try:
+            self._access_log_buffer.put_nowait(log_data)
+        except queue.Full:
+            with self._access_log_lock:
+                self._access_log_dropped += 1
+            return
+
+        if self._access_log_thread is None:
+            self._start_access_log_writer()
+
+        if self._access_log_buffer.qsize() >= _access_log_batch_size:
+            self._access_log_wake.set()
+
+    def _start_access_log_writer(self) -> None:
+        with self._access_log_lock:
+            if self._access_log_thread is not None:
+                return
+
+            self._access_log_thread = threading.Thread(target=self._access_log_writer, daemon=True)
+            self._access_log_thread.start()
+
+            # Write whatever is left when the interpreter exits, if not stopped before then
+            self._access_log_finalizer = weakref.finalize(
+                self, self._stop_access_log_writer, weakref.WeakMethod(self.flush_access_log), self._access_log_wake
+            )
+
+    # Classmethod because finalizer can't handle bound methods
+    @classmethod
+    def _stop_access_log_writer(cls, flush_ref, wake_event: threading.Event) -> None:
+        wake_event.set()
+        flush = flush_ref()
+        if flush is not None:
+            flush()
+
+    def _access_log_writer(self) -> None:
+        while self._access_log_finalizer is None or self._access_log_finalizer.alive:
+            self._access_log_wake.wait(self._access_log_flush_interval)
+            self._access_log_wake.clear()
+            self.flush_access_log()
+
+    def flush_access_log(self) -> int:
+        """
+        Writes all buffered access log entries to the database
+
+        Returns
+        -------
+        :
+            The number of entries written
+        """
+
+        with self._access_log_lock:
+            entries = []
+            while True:
+                try:
+                    entries.append(self._access_log_buffer.get_nowait())
+                except queue.Empty:
+                    break
+
+            dropped = self._access_log_dropped
+            self._access_log_dropped = 0
+
+            if dropped:
+                self._logger.warning(f"Dropped {dropped} access log entries because the buffer was full")
+
+            if not entries:
+                return 0
+
+            try:
+                with self.root_socket.session_scope() as session:
+                    for batch in chunk_iterable(entries, _access_log_batch_size):
+                        session.execute(insert(AccessLogORM), batch)
+            except Exception:
+                self._logger.exception(f"Error writing {len(entries)} access log entries to the database")
+                return 0
+
+            return len(entries)
+
+    def stop_access_log(self) -> None:
+        """
+        Stops the background thread that writes access log entries, writing any remaining entries
+        """
+
+        if self._access_log_finalizer is not None:
+            self._access_log_finalizer()
+
+        if self._access_log_thread is not None:
+            self._access_log_thread.join()
+            self._access_log_thread = None
 
     def save_error(self, error_data: Dict[str, Any], *, session: Optional[Session] = None) -> int:
         """
@@ -402,6 +518,9 @@ class ServerInfoSocket:
             A list of access log dictionaries
         """
 
+        # Include any accesses that haven't been written yet
+        self.flush_access_log()
+
         proj_options = get_query_proj_options(AccessLogORM, query_data.include, query_data.exclude)
 
         stmt = select(AccessLogORM)
@@ -466,6 +585,8 @@ class ServerInfoSocket:
             A dictionary containing summary data
         """
 
+        self.flush_access_log()
+
         and_query = []
         if query_data.before:
             and_query.append(AccessLogORM.timestamp <= query_data.before)
@@ -615,6 +736,8 @@ class ServerInfoSocket:
             The number of deleted entries
         """
 
+        self.flush_access_log()
+
         with self.root_socket.optional_session(session, False) as session:
             stmt = delete(AccessLogORM).where(AccessLogORM.timestamp < before)
             r = session.execute(stmt)
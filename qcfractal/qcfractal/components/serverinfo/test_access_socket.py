@@ -6,6 +6,7 @@ import pytest
 
 from qcarchivetesting import load_ip_test_data, ip_tests_enabled
 from qcarchivetesting.testing_classes import QCATestingSnowflake
+from qcfractal.components.serverinfo.db_models import AccessLogORM
 from qcportal.serverinfo.models import AccessLogQueryFilters
 from qcportal.utils import now_at_utc
 
@@ -165,3 +166,51 @@ def test_serverinfo_socket_save_access(secure_snowflake: QCATestingSnowflake):
                 assert ac_db["ip_lat"] == ip_ref_data["location"]["latitude"]
             if ac_db.get("ip_long") is not None:
                 assert ac_db["ip_long"] == ip_ref_data["location"]["longitude"]
+
+
+def test_serverinfo_socket_save_access_buffered(postgres_server, pytestconfig):
+    pg_harness = postgres_server.get_new_harness("serverinfo_save_access_buffered")
+    encoding = pytestconfig.getoption("--client-encoding")
+
+    # Large flush interval, so only explicit flushes write to the database
+    extra_config = {"access_log_buffer_size": 5, "access_log_flush_interval": 3600}
+
+    with QCATestingSnowflake(pg_harness, encoding=encoding, extra_config=extra_config) as snowflake:
+        storage_socket = snowflake.get_storage_socket()
+
+        time_0 = now_at_utc()
+
+        for i in range(8):
+            access = {
+                "module": "api",
+                "method": "GET",
+                "full_uri": f"/api/v1/records/{i}",
+                "ip_address": "10.0.0.1",
+                "user_agent": "Fake user agent",
+                "request_duration": 0.01 * i,
+                "request_bytes": i,
+                "response_bytes": 100 * i,
+            }
+            storage_socket.serverinfo.save_access(access)
+
+        time_1 = now_at_utc()
+
+        # Nothing written yet
+        with storage_socket.session_scope() as session:
+            assert session.query(AccessLogORM).count() == 0
+
+        # Buffer holds 5 entries, so the rest were dropped
+        assert storage_socket.serverinfo.flush_access_log() == 5
+        assert storage_socket.serverinfo.flush_access_log() == 0
+
+        # Timestamp is when the access was saved, not when it was written
+        accesses = storage_socket.serverinfo.query_access_log(AccessLogQueryFilters(before=time_1, after=time_0))
+        assert len(accesses) == 5
+        assert [x["full_uri"] for x in reversed(accesses)] == [f"/api/v1/records/{i}" for i in range(5)]
+
+        # Remaining entries are written when stopping
+        storage_socket.serverinfo.save_access(access)
+        storage_socket.serverinfo.stop_access_log()
+
+        with storage_socket.session_scope() as session:
+            assert session.query(AccessLogORM).count() == 6
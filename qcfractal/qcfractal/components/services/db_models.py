@@ -43,7 +43,10 @@ class ServiceDependencyORM(BaseORM):
 
     # We make extras part of the unique constraint because rarely the same dependency will be
     # submitted but with different extras (position, etc)
-    __table_args__ = (UniqueConstraint("service_id", "record_id", "extras", name="ux_service_dependency"),)
+    __table_args__ = (
+        UniqueConstraint("service_id", "record_id", "extras", name="ux_service_dependency"),
+        Index("ix_service_dependency_record_id", "record_id"),
+    )
 
     _qcportal_model_excludes = ["id", "service_id"]
 
@@ -8,7 +8,7 @@ from sqlalchemy import select, update, or_
 from sqlalchemy.dialects.postgresql import array_agg
 from sqlalchemy.orm import contains_eager, aliased, defer, selectinload, joinedload, load_only, lazyload
 
-from qcfractal.components.record_db_models import BaseRecordORM, RecordComputeHistoryORM
+from qcfractal.components.record_db_models import BaseRecordORM, RecordComputeHistoryORM, OutputStoreChunkORM
 from qcfractal.db_socket.helpers import (
     get_count,
 )
@@ -37,6 +37,7 @@ class ServiceSocket:
         self._logger = logging.getLogger(__name__)
         self._max_active_services = root_socket.qcf_config.max_active_services
         self._service_frequency = root_socket.qcf_config.service_frequency
+        self._service_sweep_frequency = root_socket.qcf_config.service_sweep_frequency
 
         with self.root_socket.session_scope() as session:
             self.root_socket.internal_jobs.add(
@@ -50,6 +51,32 @@ class ServiceSocket:
                 session=session,
             )
 
+            # Services are normally iterated when their dependencies finish. This is a fallback
+            # that checks all running services (ie, for dependencies that were finished some other way)
+            self.root_socket.internal_jobs.add(
+                "sweep_service_dependencies",
+                now_at_utc(),
+                "services.check_dependencies",
+                {},
+                user_id=None,
+                unique_name=True,
+                repeat_delay=self._service_sweep_frequency,
+                session=session,
+            )
+
+            # Outputs of services are compacted when they finish. This catches services that
+            # stopped some other way (cancelled, reset, deleted, etc)
+            self.root_socket.internal_jobs.add(
+                "sweep_output_compaction",
+                now_at_utc(),
+                "records.compact_outputs",
+                {},
+                user_id=None,
+                unique_name=True,
+                repeat_delay=self._service_sweep_frequency,
+                session=session,
+            )
+
     def mark_service_complete(self, session: Session, service_orm: ServiceQueueORM):
         # If the service has successfully completed, delete the entry from the Service Queue
         self._logger.info(f"Record {service_orm.record_id} (service {service_orm.id}) has successfully completed!")
@@ -58,10 +85,69 @@ class ServiceSocket:
         service_orm.record.status = RecordStatusEnum.complete
         service_orm.record.modified_on = now_at_utc()
         session.delete(service_orm)
+        self._queue_output_compaction(session, service_orm.record_id)
 
         session.commit()
         self.root_socket.notify_finished_watch(service_orm.record_id, RecordStatusEnum.complete)
 
+        # This service may have been a dependency of another service
+        self.dependencies_finished(session, [service_orm.record_id])
+
+    def _mark_service_errored(self, session: Session, service_orm: ServiceQueueORM, error: Dict[str, Any]):
+        self.root_socket.records.update_failed_service(session, service_orm.record, error)
+        self._queue_output_compaction(session, service_orm.record_id)
+        session.commit()
+
+        self.root_socket.notify_finished_watch(service_orm.record_id, RecordStatusEnum.error)
+
+        # This service may have been a dependency of another service
+        self.dependencies_finished(session, [service_orm.record_id])
+
+    def _queue_iteration(self, session: Session, service_id: int) -> int:
+        """
+        Adds an internal job to iterate a service, if one is not already queued
+
+        Once the job is done, the dependencies of the service are checked again, in case they
+        were already finished (or finished while the job was running).
+        """
+
+        return self.root_socket.internal_jobs.add(
+            name=f"iterate_service_{service_id}",
+            scheduled_date=now_at_utc(),
+            unique_name=True,
+            function="services._iterate_service",
+            kwargs={"service_id": service_id},
+            user_id=None,
+            after_function="services.check_dependencies",
+            after_function_kwargs={"service_ids": [service_id]},
+            session=session,
+        )
+
+    def _queue_output_compaction(self, session: Session, record_id: int) -> Optional[int]:
+        """
+        Adds an internal job to compact the outputs of a finished service
+
+        The job is only added if the service has appended chunks to any of its outputs
+        """
+
+        stmt = select(OutputStoreChunkORM.history_id)
+        stmt = stmt.join(RecordComputeHistoryORM, RecordComputeHistoryORM.id == OutputStoreChunkORM.history_id)
+        stmt = stmt.where(RecordComputeHistoryORM.record_id == record_id)
+        stmt = stmt.limit(1)
+
+        if session.execute(stmt).scalar_one_or_none() is None:
+            return None
+
+        return self.root_socket.internal_jobs.add(
+            name=f"compact_outputs_{record_id}",
+            scheduled_date=now_at_utc(),
+            unique_name=True,
+            function="records.compact_outputs",
+            kwargs={"record_ids": [record_id]},
+            user_id=None,
+            session=session,
+        )
+
     def _iterate_service(self, session: Session, service_id: int) -> bool:
         """
         Iterate a single service given its service id
@@ -81,7 +167,7 @@ class ServiceSocket:
 
         stmt = select(ServiceQueueORM)
         stmt = stmt.options(selectinload(ServiceQueueORM.record))
-        stmt = stmt.options(selectinload(ServiceQueueORM.dependencies))
+        stmt = stmt.options(selectinload(ServiceQueueORM.dependencies).selectinload(ServiceDependencyORM.record))
         stmt = stmt.where(ServiceQueueORM.id == service_id)
         stmt = stmt.with_for_update()
 
@@ -118,10 +204,7 @@ class ServiceSocket:
                 "error_message": "Error iterating service: " + str(err) + "\n" + traceback.format_exc(),
             }
 
-            self.root_socket.records.update_failed_service(session, service_orm.record, error)
-            session.commit()
-            self.root_socket.notify_finished_watch(service_orm.record_id, RecordStatusEnum.error)
-
+            self._mark_service_errored(session, service_orm, error)
             return True
 
         if completed:
@@ -133,30 +216,22 @@ class ServiceSocket:
             session.commit()
             return False
 
-    def iterate_services(self, session: Session) -> int:
+    def check_dependencies(self, session: Session, service_ids: Optional[Sequence[int]] = None) -> None:
         """
-        Check for services that have their dependencies finished, and then either queue them for iteration
+        Check running services for finished dependencies, and then either queue them for iteration
         or mark them as errored
 
-        This function will search for services that have all their dependencies finished. If any of the
-        dependencies is errored, it will mark the service as errored. Otherwise, it will submit a job
-        to the internal job queue to iterate the service.
-
-        After that, this function will start new services if needed.
+        If all dependencies of a service are finished and any of them are errored, the service is marked
+        as errored. If all are complete, a job is submitted to the internal job queue to iterate the service.
 
         Parameters
         ----------
         session
             An existing SQLAlchemy session to use. This session will be periodically committed
-
-        Returns
-        -------
-        :
-            Number of services currently running after this function is done
+        service_ids
+            IDs of the services to check (not record IDs). If None, all running services are checked
         """
 
-        self._logger.info("Iterating on services")
-
         #
         # A CTE that contains just service id and all the statuses as an array
         #
@@ -174,9 +249,13 @@ class ServiceSocket:
             .join(a_br_svc, a_br_svc.id == ServiceQueueORM.record_id)
             .where(a_br_svc.status == RecordStatusEnum.running)
             .group_by(ServiceDependencyORM.service_id)
-            .cte()
         )
 
+        if service_ids is not None:
+            status_cte = status_cte.where(ServiceDependencyORM.service_id.in_(service_ids))
+
+        status_cte = status_cte.cte()
+
         #########################
         # First, errored services
         #########################
@@ -198,6 +277,13 @@ class ServiceSocket:
             self._logger.info(f"Found {len(err_services)} running services with task failures")
 
         for service_orm in err_services:
+            # Lock the record and make sure it is still running. The same failure may be handled
+            # at the same time elsewhere (ie, two managers returning the last dependencies of a service)
+            stmt = select(BaseRecordORM.status).where(BaseRecordORM.id == service_orm.record_id).with_for_update()
+            if session.execute(stmt).scalar_one() != RecordStatusEnum.running:
+                session.commit()
+                continue
+
             error = {
                 "error_type": "service_iteration_error",
                 "error_message": "Some task(s) did not complete successfully",
@@ -207,10 +293,7 @@ class ServiceSocket:
                 f"Record {service_orm.record_id} (service {service_orm.id}) has task failures. Marking as errored"
             )
 
-            self.root_socket.records.update_failed_service(session, service_orm.record, error)
-            session.commit()
-
-            self.root_socket.notify_finished_watch(service_orm.record_id, RecordStatusEnum.error)
+            self._mark_service_errored(session, service_orm, error)
 
         ###########################
         # Now successful services
@@ -224,25 +307,62 @@ class ServiceSocket:
             .where(or_(status_cte.c.task_statuses.contained_by(["complete"]), status_cte.c.task_statuses == []))
         )
 
-        service_ids = session.execute(stmt).scalars().all()
+        ready_ids = session.execute(stmt).scalars().all()
 
         # Add an internal job for each completed service, calling the internal function
-        for service_id in service_ids:
-            jobname = f"iterate_service_{service_id}"
-            job_id = self.root_socket.internal_jobs.add(
-                name=jobname,
-                scheduled_date=now_at_utc(),
-                unique_name=True,
-                function="services._iterate_service",
-                kwargs={"service_id": service_id},
-                user_id=None,
-                session=session,
-            )
+        for service_id in ready_ids:
+            job_id = self._queue_iteration(session, service_id)
             self._logger.debug(f"Internal job {job_id} for service {service_id} queued")
 
             # Commit after each one to allow it to be picked up by an internal job worker
             session.commit()
 
+    def dependencies_finished(self, session: Session, record_ids: Sequence[int]) -> None:
+        """
+        Handle records that have finished (completed or errored) and may be dependencies of services
+
+        Any running services that depend on these records are checked, and are iterated or
+        marked as errored if all their dependencies are now finished.
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session to use. This session will be periodically committed. Changes
+            to the given records must already be committed.
+        record_ids
+            IDs of the records that have finished
+        """
+
+        if not record_ids:
+            return
+
+        stmt = select(ServiceDependencyORM.service_id).distinct()
+        stmt = stmt.where(ServiceDependencyORM.record_id.in_(record_ids))
+        service_ids = session.execute(stmt).scalars().all()
+
+        if service_ids:
+            self.check_dependencies(session, service_ids)
+
+    def iterate_services(self, session: Session) -> int:
+        """
+        Start new services if there is room for them
+
+        Services are iterated when their dependencies finish (see :meth:`dependencies_finished`), so
+        this function only starts services that are waiting, up to the maximum number of active services.
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session to use. This session will be periodically committed
+
+        Returns
+        -------
+        :
+            Number of services currently running after this function is done
+        """
+
+        self._logger.info("Iterating on services")
+
         #
         # How many services are currently running
         #
@@ -319,20 +439,14 @@ class ServiceSocket:
                     if fresh_start:
                         self.root_socket.records.initialize_service(session, service_orm)
 
-                        jobname = f"iterate_service_{service_orm.id}"
-                        job_id = self.root_socket.internal_jobs.add(
-                            name=jobname,
-                            scheduled_date=now_at_utc(),
-                            unique_name=True,
-                            function="services._iterate_service",
-                            kwargs={"service_id": service_orm.id},
-                            user_id=None,
-                            session=session,
-                        )
+                        job_id = self._queue_iteration(session, service_orm.id)
                         self._logger.debug(
                             f"Internal job {job_id} for service {service_orm.id} queued - first iteration"
                         )
                         session.commit()
+                    else:
+                        # Dependencies may have finished while the service was not running
+                        self.check_dependencies(session, [service_orm.id])
 
                 except Exception as err:
                     session.rollback()
@@ -345,9 +459,7 @@ class ServiceSocket:
                         "error_message": "Error in initialization/iteration of service: " + str(err),
                     }
 
-                    self.root_socket.records.update_failed_service(session, service_orm.record, error)
-                    session.commit()
-                    self.root_socket.notify_finished_watch(service_orm.record_id, RecordStatusEnum.error)
+                    self._mark_service_errored(session, service_orm, error)
 
         return running_count
 
@@ -397,6 +509,13 @@ class ServiceSubtaskRecordSocket(BaseRecordSocket):
         stmt = update(ServiceSubtaskRecordORM).where(ServiceSubtaskRecordORM.id == record_id).values(record_updates)
         session.execute(stmt)
 
+    def update_completed_schema_v1_multi(
+        self, session: Session, results: Sequence[Tuple[int, GenericTaskResult]]
+    ) -> None:
+
+        record_updates = [{"id": record_id, "results": result.results} for record_id, result in results]
+        session.execute(update(ServiceSubtaskRecordORM), record_updates)
+
     def add(
         self,
         required_programs: Dict[str, Any],
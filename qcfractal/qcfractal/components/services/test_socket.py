@@ -1,20 +1,27 @@
 from __future__ import annotations
 
+import logging
 from typing import TYPE_CHECKING
 
+from sqlalchemy import select
+
 from qcfractal.components.gridoptimization.testing_helpers import (
     submit_procedure_data as submit_go_procedure_data,
+    generate_task_key as generate_go_task_key,
 )
-from qcfractal.components.record_db_models import BaseRecordORM
+from qcfractal.components.internal_jobs.db_models import InternalJobORM
+from qcfractal.components.record_db_models import BaseRecordORM, OutputStoreChunkORM, RecordComputeHistoryORM
 from qcfractal.components.torsiondrive.record_db_models import TorsiondriveRecordORM
 from qcfractal.components.torsiondrive.testing_helpers import (
     submit_procedure_data as submit_td_procedure_data,
     generate_task_key as generate_td_task_key,
 )
-from qcfractal.testing_helpers import run_service
+from qcfractal.testing_helpers import run_service, DummyJobProgress
+from qcfractalcompute.compress import compress_result
 from qcportal.managers import ManagerName
 from qcportal.qcschema_v1 import FailedOperation
-from qcportal.record_models import RecordStatusEnum, PriorityEnum
+from qcportal.compression import decompress
+from qcportal.record_models import RecordStatusEnum, PriorityEnum, RecordTask, OutputTypeEnum
 from qcportal.utils import now_at_utc
 
 if TYPE_CHECKING:
@@ -80,3 +87,149 @@ def test_service_socket_iterate_order(storage_socket: SQLAlchemySocket, session:
         assert session.get(BaseRecordORM, id_2).status == RecordStatusEnum.running
     finally:
         storage_socket.services._max_active_services = max_active_services
+
+
+def test_service_socket_iterate_on_finish(
+    storage_socket: SQLAlchemySocket, session: Session, activated_manager_name: ManagerName
+):
+    id_1, result_data_1 = submit_td_procedure_data(storage_socket, "td_H2O2_mopac_pm6", "test_tag", PriorityEnum.low)
+
+    with storage_socket.session_scope() as s:
+        storage_socket.services.iterate_services(s)
+
+    rec = session.get(BaseRecordORM, id_1)
+    service_id = rec.service.id
+    jobname = f"iterate_service_{service_id}"
+    manager_programs = storage_socket.managers.get([activated_manager_name.fullname])[0]["programs"]
+
+    def _get_job(s):
+        stmt = select(InternalJobORM).where(InternalJobORM.unique_name == jobname)
+        return s.execute(stmt).scalar_one_or_none()
+
+    # iterate_services is not called again. Iterations are queued as the dependencies are returned
+    for i in range(20):
+        with storage_socket.session_scope() as s:
+            job_orm = _get_job(s)
+            assert job_orm is not None
+            assert job_orm.kwargs == {"service_id": service_id}
+
+            storage_socket.internal_jobs._run_single(s, job_orm, logging.getLogger("internal_job"), DummyJobProgress())
+            if job_orm.result is True:
+                break
+
+        with storage_socket.session_scope() as s:
+            assert _get_job(s) is None
+
+        manager_tasks = storage_socket.tasks.claim_tasks(activated_manager_name.fullname, manager_programs, ["*"])
+        manager_tasks = [RecordTask(**x) for x in manager_tasks]
+        manager_ret = {
+            t.id: compress_result(result_data_1[generate_td_task_key(t)].model_dump()) for t in manager_tasks
+        }
+
+        # Returning all but the last dependency does not queue an iteration
+        last_task_id = manager_tasks[-1].id
+        storage_socket.tasks.update_finished(
+            activated_manager_name.fullname, {k: v for k, v in manager_ret.items() if k != last_task_id}
+        )
+
+        with storage_socket.session_scope() as s:
+            assert _get_job(s) is None
+
+        storage_socket.tasks.update_finished(activated_manager_name.fullname, {last_task_id: manager_ret[last_task_id]})
+
+    session.expire_all()
+    rec = session.get(BaseRecordORM, id_1)
+    assert rec.status == RecordStatusEnum.complete
+
+
+def test_service_socket_output_chunks(
+    storage_socket: SQLAlchemySocket, session: Session, activated_manager_name: ManagerName
+):
+    id_1, result_data_1 = submit_td_procedure_data(storage_socket, "td_H2O2_mopac_pm6", "test_tag", PriorityEnum.low)
+
+    finished, _ = run_service(storage_socket, activated_manager_name, id_1, generate_td_task_key, result_data_1, 20)
+    assert finished is True
+
+    def _get_chunks(s):
+        return s.execute(select(OutputStoreChunkORM)).scalars().all()
+
+    # Each iteration appended to stdout as a separate chunk
+    with storage_socket.session_scope() as s:
+        n_chunks = len(_get_chunks(s))
+        assert n_chunks > 1
+
+    # Outputs are returned with the chunks merged in
+    rec = storage_socket.records.get([id_1], include=["compute_history", "outputs"])[0]
+    stdout_dict = rec["compute_history"][-1]["outputs"]["stdout"]
+    stdout = decompress(stdout_dict["data"], stdout_dict["compression_type"])
+    assert stdout.startswith("Starting service")
+
+    rec_orm = session.get(BaseRecordORM, id_1)
+    history_id = rec_orm.compute_history[-1].id
+    assert rec_orm.compute_history[-1].outputs["stdout"].get_output() == stdout
+
+    td_socket = storage_socket.records.torsiondrive
+    raw, ctype = td_socket.get_single_output_rawdata(id_1, history_id, OutputTypeEnum.stdout)
+    assert decompress(raw, ctype) == stdout
+
+    # The merged output is cached, rather than merged again on every read
+    raw_2, _ = td_socket.get_single_output_rawdata(id_1, history_id, OutputTypeEnum.stdout)
+    assert raw_2 is raw
+
+    # Finishing the service queued a job to compact the output
+    with storage_socket.session_scope() as s:
+        stmt = select(InternalJobORM).where(InternalJobORM.unique_name == f"compact_outputs_{id_1}")
+        job_orm = s.execute(stmt).scalar_one()
+        assert job_orm.kwargs == {"record_ids": [id_1]}
+
+        storage_socket.internal_jobs._run_single(s, job_orm, logging.getLogger("internal_job"), DummyJobProgress())
+        assert job_orm.result == 1
+
+    with storage_socket.session_scope() as s:
+        assert _get_chunks(s) == []
+
+        # Nothing to compact now
+        assert storage_socket.services._queue_output_compaction(s, id_1) is None
+
+    raw, ctype = td_socket.get_single_output_rawdata(id_1, history_id, OutputTypeEnum.stdout)
+    assert decompress(raw, ctype) == stdout
+
+
+def test_service_socket_output_chunks_sweep(
+    storage_socket: SQLAlchemySocket, session: Session, activated_manager_name: ManagerName
+):
+    id_1, result_data_1 = submit_td_procedure_data(storage_socket, "td_H2O2_mopac_pm6", "test_tag", PriorityEnum.low)
+    id_2, result_data_2 = submit_go_procedure_data(storage_socket, "go_H3NS_psi4_pbe", "test_tag", PriorityEnum.low)
+
+    # Services that have appended output, but are not finished
+    finished, _ = run_service(storage_socket, activated_manager_name, id_1, generate_td_task_key, result_data_1, 2)
+    assert finished is False
+    finished, _ = run_service(storage_socket, activated_manager_name, id_2, generate_go_task_key, result_data_2, 2)
+    assert finished is False
+
+    def _get_chunk_records(s):
+        stmt = select(RecordComputeHistoryORM.record_id).distinct()
+        stmt = stmt.join(OutputStoreChunkORM, OutputStoreChunkORM.history_id == RecordComputeHistoryORM.id)
+        return set(s.execute(stmt).scalars().all())
+
+    with storage_socket.session_scope() as s:
+        assert _get_chunk_records(s) == {id_1, id_2}
+
+    # Cancelling doesn't compact right away, but the periodic sweep does
+    storage_socket.records.cancel([id_1])
+
+    with storage_socket.session_scope() as s:
+        stmt = select(InternalJobORM).where(InternalJobORM.unique_name == "sweep_output_compaction")
+        job_orm = s.execute(stmt).scalar_one()
+        assert job_orm.repeat_delay is not None
+
+        storage_socket.internal_jobs._run_single(s, job_orm, logging.getLogger("internal_job"), DummyJobProgress())
+        assert job_orm.result == 1
+
+    # Running services are left alone
+    with storage_socket.session_scope() as s:
+        assert _get_chunk_records(s) == {id_2}
+
+    rec = storage_socket.records.get([id_1], include=["compute_history", "outputs"])[0]
+    stdout_dict = rec["compute_history"][-1]["outputs"]["stdout"]
+    assert decompress(stdout_dict["data"], stdout_dict["compression_type"]).startswith("Starting service")
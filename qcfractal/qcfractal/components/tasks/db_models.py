@@ -45,6 +45,9 @@ class TaskQueueORM(BaseORM):
     compute_priority = Column(Integer, nullable=False)
     available = Column(Boolean, nullable=False)
 
+    # Manager that was running this task when it was reset to waiting because that manager went away
+    former_manager_name = Column(String, nullable=True)
+
     record_id = Column(Integer, ForeignKey(BaseRecordORM.id, ondelete="cascade"), nullable=False)
     record = relationship(BaseRecordORM, back_populates="task", uselist=False)
 
@@ -63,6 +66,14 @@ class TaskQueueORM(BaseORM):
             compute_tag,
             postgresql_where=(available == True),
         ),
+        Index(
+            "ix_task_queue_tag_sort",
+            compute_tag,
+            compute_priority.desc(),
+            sort_date.asc(),
+            id.asc(),
+            postgresql_where=(available == True),
+        ),
         UniqueConstraint("record_id", name="ux_task_queue_record_id"),
         # WARNING - these are not autodetected by alembic
         CheckConstraint(
@@ -73,7 +84,8 @@ class TaskQueueORM(BaseORM):
 
     # Remove sort_date from the model. For backwards compatibility (and because it's only used for sorting)
     # Also remove the "available" column - is somewhat redundant with the record status
-    _qcportal_model_excludes = ["sort_date", "available"]
+    # former_manager_name is only used internally, when accepting results of orphaned tasks
+    _qcportal_model_excludes = ["sort_date", "available", "former_manager_name"]
 
     def model_dict(self, exclude: Optional[Iterable[str]] = None) -> Dict[str, Any]:
         d = BaseORM.model_dict(self, exclude)
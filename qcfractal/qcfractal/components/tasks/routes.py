@@ -40,5 +40,7 @@ def return_tasks_v1(body_data: TaskReturnBody) -> TaskReturnMetadata:
         raise LimitExceededError(f"Attempted to return too many results - limit is {max_limit}")
 
     return storage_socket.tasks.update_finished(
-        manager_name=body_data.name_data.fullname, results_compressed=body_data.results_compressed
+        manager_name=body_data.name_data.fullname,
+        results_compressed=body_data.results_compressed,
+        claimed_by=body_data.claimed_by,
     )
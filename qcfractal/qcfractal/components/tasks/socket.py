@@ -6,29 +6,34 @@ from collections import defaultdict
 from typing import TYPE_CHECKING
 
 import pydantic
-from sqlalchemy import select, update
-from sqlalchemy.dialects.postgresql import array
-from sqlalchemy.orm import selectinload, load_only, lazyload, undefer
+from sqlalchemy import select, update, text, bindparam, column, func, String, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, TEXT
+from sqlalchemy.orm import selectinload, undefer
 
+from qcfractal.components.internal_jobs.status import CancelledJobException
 from qcfractal.components.managers.db_models import ComputeManagerORM
 from qcfractal.components.record_db_models import BaseRecordORM, RecordComputeHistoryORM, OutputStoreORM
 from qcportal.all_results import AllResultTypes
 from qcportal.compression import CompressionEnum, compress
-from qcportal.compression import decompress
+from qcportal.compression import decompress, load_zstd_dictionary
 from qcportal.exceptions import ComputeManagerError
 from qcportal.managers import ManagerStatusEnum
 from qcportal.metadata_models import TaskReturnMetadata
 from qcportal.qcschema_v1 import FailedOperation
 from qcportal.record_models import RecordStatusEnum
-from qcportal.utils import calculate_limit, now_at_utc
+from qcportal.utils import calculate_limit, chunk_iterable, now_at_utc
 from .db_models import TaskQueueORM
 from .reset_logic import should_reset
 
 if TYPE_CHECKING:
     from sqlalchemy.orm.session import Session
     from qcfractal.db_socket.socket import SQLAlchemySocket
+    from qcfractal.components.internal_jobs.status import JobProgress
     from typing import List, Dict, Tuple, Optional, Any
 
+# Building a TypeAdapter is expensive, so only do it once
+_result_type_adapter = pydantic.TypeAdapter(AllResultTypes)
+
 
 class TaskSocket:
     """
@@ -42,18 +47,320 @@ class TaskSocket:
         self._tasks_claim_limit = root_socket.qcf_config.api_limits.manager_tasks_claim
         self._strict_compute_tags = root_socket.qcf_config.strict_compute_tags
 
+        # Dictionaries managers may have used when compressing results
+        for dict_path in root_socket.qcf_config.compression_dictionaries:
+            load_zstd_dictionary(dict_path)
+
+        self._materializer_depth = root_socket.qcf_config.task_materializer_depth
+        self._materializer_frequency = root_socket.qcf_config.task_materializer_frequency
+        self._materializer_batch_size = 100
+
+        # If the materializer has been disabled, a job left over from when it was enabled
+        # cancels itself the next time it is run (see materialize_tasks)
+        if self._materializer_depth > 0:
+            with self.root_socket.session_scope() as session:
+                self.root_socket.internal_jobs.add(
+                    "materialize_tasks",
+                    now_at_utc(),
+                    "tasks.materialize_tasks",
+                    {},
+                    user_id=None,
+                    unique_name=True,
+                    repeat_delay=self._materializer_frequency,
+                    session=session,
+                )
+
+    def _generate_task_functions(
+        self, session: Session, tasks: Dict[str, List[Tuple[int, int]]]
+    ) -> Dict[int, Tuple[str, bytes]]:
+        """
+        Generates the function and (compressed) function kwargs for tasks
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session to use
+        tasks
+            Task ids and record ids (as tuples), keyed by record type
+
+        Returns
+        -------
+        :
+            Function and compressed kwargs, keyed by task id
+        """
+
+        generated: Dict[int, Tuple[str, bytes]] = {}
+
+        for record_type, task_info in tasks.items():
+            record_socket = self.root_socket.records.get_socket(record_type)
+
+            record_ids = [record_id for _, record_id in task_info]
+            task_specs = record_socket.generate_task_specifications(session, record_ids)
+
+            for (task_id, _), task_spec in zip(task_info, task_specs):
+                kwargs_compressed, _, _ = compress(task_spec["function_kwargs"], CompressionEnum.zstd)
+                generated[task_id] = (task_spec["function"], kwargs_compressed)
+
+        return generated
+
+    def get_claim_statistics(self, *, session: Optional[Session] = None) -> Dict[str, Any]:
+        """
+        Obtain statistics about tasks claimed by all managers
+
+        This includes how often the function and kwargs of a task had to be generated while it was being
+        claimed (rather than ahead of time by the task materializer). The counts for individual managers
+        are available in the manager information.
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session to use. If None, one will be created. If an existing session
+            is used, it will be flushed (but not committed) before returning from this function.
+        """
+
+        stmt = select(
+            func.coalesce(func.sum(ComputeManagerORM.claimed), 0),
+            func.coalesce(func.sum(ComputeManagerORM.claimed_generated_inline), 0),
+        )
+
+        with self.root_socket.optional_session(session, True) as session:
+            n_claimed, n_generated_inline = session.execute(stmt).one()
+
+        stats = {"tasks_claimed": n_claimed, "tasks_generated_inline": n_generated_inline}
+        stats["inline_generation_rate"] = stats["tasks_generated_inline"] / n_claimed if n_claimed > 0 else 0.0
+        return stats
+
+    def _materialize_batch(self, session: Session, task_ids: List[int]) -> Dict[int, Tuple[str, bytes]]:
+        """
+        Generates and stores the function and kwargs for a batch of waiting tasks
+
+        The tasks are locked, but the changes are not committed.
+        """
+
+        # Lock the tasks. Skip any being claimed by a manager right now, and re-check that they
+        # still need to be generated
+        stmt = select(TaskQueueORM.id, TaskQueueORM.record_id, BaseRecordORM.record_type)
+        stmt = stmt.join(BaseRecordORM, BaseRecordORM.id == TaskQueueORM.record_id)
+        stmt = stmt.where(TaskQueueORM.id.in_(task_ids))
+        stmt = stmt.where(TaskQueueORM.available == True)
+        stmt = stmt.where(TaskQueueORM.function.is_(None))
+        stmt = stmt.with_for_update(of=TaskQueueORM, skip_locked=True)
+
+        tasks_to_generate = defaultdict(list)
+        for task_id, record_id, record_type in session.execute(stmt).all():
+            tasks_to_generate[record_type].append((task_id, record_id))
+
+        # Any errors are left to be handled when claiming. A savepoint keeps
+        # a database error from affecting the other record types
+        generated = {}
+        for record_type, task_info in tasks_to_generate.items():
+            try:
+                with session.begin_nested():
+                    generated |= self._generate_task_functions(session, {record_type: task_info})
+            except Exception:
+                self._logger.error(
+                    f"Error generating task functions for {record_type} records:\n" + traceback.format_exc()
+                )
+
+        if generated:
+            task_updates = [
+                {"id": task_id, "function": function, "function_kwargs_compressed": kwargs_compressed}
+                for task_id, (function, kwargs_compressed) in generated.items()
+            ]
+            session.execute(update(TaskQueueORM), task_updates)
+
+        return generated
+
+    def materialize_tasks(self, session: Session, job_progress: JobProgress) -> int:
+        """
+        Generates the function and kwargs of the waiting tasks that are next in line to be claimed
+
+        This is meant to be run periodically as an internal job, so that managers rarely have to wait
+        for task specifications to be generated while claiming. Only the highest-priority tasks
+        (up to the configured look-ahead depth) are examined.
+
+        Parameters
+        ----------
+        session
+            An existing SQLAlchemy session to use
+        job_progress
+            Object used to track the progress of the job
+
+        Returns
+        -------
+        :
+            The number of tasks that had their function and kwargs generated
+        """
+
+        # Job may be left over from when the materializer was enabled. Cancelling it prevents it from repeating
+        if self._materializer_depth <= 0:
+            raise CancelledJobException("Task materializer is disabled")
+
+        # Tasks next in line to be claimed, in the same order as claiming (ignoring tags)
+        next_tasks = select(TaskQueueORM.id).where(TaskQueueORM.available == True)
+        next_tasks = next_tasks.order_by(
+            TaskQueueORM.compute_priority.desc(), TaskQueueORM.sort_date.asc(), TaskQueueORM.id.asc()
+        )
+        next_tasks = next_tasks.limit(self._materializer_depth).subquery()
+
+        stmt = select(next_tasks.c.id).join(TaskQueueORM, TaskQueueORM.id == next_tasks.c.id)
+        stmt = stmt.where(TaskQueueORM.function.is_(None))
+        task_ids = session.execute(stmt).scalars().all()
+
+        self._logger.debug(f"Found {len(task_ids)} tasks that need their function generated")
+
+        n_processed = 0
+        n_generated = 0
+        for task_id_batch in chunk_iterable(task_ids, self._materializer_batch_size):
+            job_progress.raise_if_cancelled()
+
+            try:
+                generated = self._materialize_batch(session, task_id_batch)
+
+                # Release the row locks
+                session.commit()
+            except Exception:
+                # Leave these to be generated when claiming, and continue with the next batch
+                session.rollback()
+                self._logger.error("Error generating task functions:\n" + traceback.format_exc())
+                generated = {}
+
+            n_processed += len(task_id_batch)
+            n_generated += len(generated)
+            job_progress.update_progress(100 * n_processed // len(task_ids))
+
+        self._logger.info(f"Generated functions for {n_generated} waiting tasks")
+        return n_generated
+
+    def _update_finished_single(
+        self,
+        session: Session,
+        manager_name: str,
+        task_id: int,
+        record_id: int,
+        record_type: str,
+        result_compressed: bytes,
+        tasks_success: List[int],
+        tasks_failures: List[int],
+        tasks_rejected: List[Tuple[int, str]],
+        to_be_reset: List[int],
+    ) -> None:
+        """
+        Handle a single returned task, isolated within its own savepoint
+
+        Any errors are stored as a failure of the record. The ID of the task is appended to the appropriate
+        list (success, failure, rejected), and the record ID is appended to to_be_reset if
+        the record should be automatically reset.
+        """
+
+        notify_status = None
+
+        ##################################################################
+        # The rest of the checks are done in a try/except block because
+        # they are much more complicated and can result in exceptions
+        # which should be handled
+        ##################################################################
+
+        try:
+            savepoint = session.begin_nested()
+
+            # Always start from the compressed result. Results may be modified
+            # when being processed (ie, in a failed batch)
+            result_dict = decompress(result_compressed, CompressionEnum.zstd)
+            result = _result_type_adapter.validate_python(result_dict)
+
+            # Failed task returning FailedOperation
+            if result.success is False and isinstance(result, FailedOperation):
+                self.root_socket.records.update_failed_task(session, record_id, result, manager_name)
+
+                notify_status = RecordStatusEnum.error
+                tasks_failures.append(task_id)
+
+                # Should we automatically reset?
+                if self.root_socket.qcf_config.auto_reset.enabled:
+                    # TODO - Move to update_failed_task?
+                    stmt = select(BaseRecordORM)
+
+                    # We will need to load the compute history and outputs to determine if we should reset
+                    stmt = stmt.options(
+                        selectinload(BaseRecordORM.compute_history).options(
+                            selectinload(RecordComputeHistoryORM.outputs).options(undefer(OutputStoreORM.data))
+                        )
+                    )
+                    stmt = stmt.where(BaseRecordORM.id == record_id)
+                    record_orm = session.execute(stmt).scalar_one()
+                    if should_reset(record_orm, self.root_socket.qcf_config.auto_reset):
+                        to_be_reset.append(record_id)
+
+            elif result.success is not True:
+                # QCEngine should always return either FailedOperation, or some result with success == True
+                msg = f"Unexpected return from manager for task {task_id}/base result {record_id}: Returned success != True, but not a FailedOperation"
+                error = {"error_type": "internal_fractal_error", "error_message": msg}
+                failed_op = FailedOperation(error=error, success=False)
+
+                self.root_socket.records.update_failed_task(session, record_id, failed_op, manager_name)
+                notify_status = RecordStatusEnum.error
+
+                self._logger.error(msg)
+                tasks_rejected.append((task_id, "Returned success=False, but not a FailedOperation"))
+
+            # Manager returned a full, successful result
+            else:
+                self.root_socket.records.update_completed(session, record_id, record_type, result, manager_name)
+
+                notify_status = RecordStatusEnum.complete
+                tasks_success.append(task_id)
+
+            savepoint.commit()  # Release the savepoint (doesn't actually fully commit)
+
+        except Exception:
+            # We have no idea what was added or is pending for removal
+            # So rollback the transaction to the most recent commit
+            savepoint.rollback()
+            savepoint = session.begin_nested()
+
+            msg = "Internal FractalServer Error:\n" + traceback.format_exc()
+            error = {"error_type": "internal_fractal_error", "error_message": msg}
+            failed_op = FailedOperation(error=error, success=False)
+
+            self.root_socket.records.update_failed_task(session, record_id, failed_op, manager_name)
+            notify_status = RecordStatusEnum.error
+
+            self._logger.error(msg)
+            tasks_rejected.append((task_id, "Internal server error"))
+
+            savepoint.commit()
+
+        finally:
+            # Send notifications that tasks were completed
+            # Notifications are sent after the transaction is committed
+            if notify_status is not None:
+                self.root_socket.notify_finished_watch(record_id, notify_status)
+
     def update_finished(
-        self, manager_name: str, results_compressed: Dict[int, bytes], *, session: Optional[Session] = None
+        self,
+        manager_name: str,
+        results_compressed: Dict[int, bytes],
+        claimed_by: Optional[Dict[int, str]] = None,
+        *,
+        session: Optional[Session] = None,
     ) -> TaskReturnMetadata:
         """
         Insert data from finished calculations into the database
 
+        Successful results are also accepted for tasks that were reset to waiting because the manager running
+        them went away, but only if they are returned by that manager, or by another manager of the same
+        user on its behalf (see `claimed_by`).
+
         Parameters
         ----------
         manager_name
             The name of the manager submitting the results
         results_compressed
             Results (in QCSchema format), with the task_id as the key
+        claimed_by
+            For results being returned on behalf of a previous manager (such as results stored in
+            a manager's outbox), the name of the manager that claimed the task, with the task_id as the key
         session
             An existing SQLAlchemy session to use. If None, one will be created. If an existing session
             is used, it will be flushed (but not committed) before returning from this function.
@@ -92,6 +399,7 @@ class TaskSocket:
                 BaseRecordORM.record_type,
                 BaseRecordORM.status,
                 BaseRecordORM.manager_name,
+                TaskQueueORM.former_manager_name,
             )
             stmt = stmt.join(TaskQueueORM, TaskQueueORM.record_id == BaseRecordORM.id)
             stmt = stmt.where(TaskQueueORM.id.in_(all_task_ids))
@@ -100,6 +408,24 @@ class TaskSocket:
             all_record_info = session.execute(stmt).all()
             all_record_info = {x[0]: x[1:] for x in all_record_info}
 
+            # Results may only be returned on behalf of managers belonging to the same user
+            if claimed_by is None:
+                claimed_by = {}
+
+            allowed_claimers = {manager_name}
+            if claimed_by:
+                stmt = select(ComputeManagerORM.name)
+                stmt = stmt.where(ComputeManagerORM.name.in_(set(claimed_by.values())))
+                stmt = stmt.where(ComputeManagerORM.username.is_not_distinct_from(manager.username))
+                allowed_claimers.update(session.execute(stmt).scalars().all())
+
+            # Successful results, grouped by record type
+            # Values are (task_id, record_id, compressed result, result)
+            completed: Dict[str, List[Tuple[int, int, bytes, AllResultTypes]]] = defaultdict(list)
+
+            # Records that were updated (completed or errored). These may be dependencies of services
+            finished_record_ids: List[int] = []
+
             for task_id, result_compressed in results_compressed.items():
 
                 record_info = all_record_info.get(task_id, None)
@@ -114,105 +440,103 @@ class TaskSocket:
                     tasks_rejected.append((task_id, "Task does not exist in the task queue"))
                     continue
 
-                record_id, record_type, record_status, record_manager_name = record_info
+                record_id, record_type, record_status, record_manager_name, former_manager_name = record_info
+
+                # The manager that claimed this task went away, and the task was reset to waiting.
+                # The result may still be returned by that manager, or on its behalf (from the compute manager's outbox)
+                task_claimer = claimed_by.get(task_id, manager_name)
+                is_orphaned = (
+                    record_status == RecordStatusEnum.waiting
+                    and record_manager_name is None
+                    and former_manager_name is not None
+                    and former_manager_name == task_claimer
+                    and task_claimer in allowed_claimers
+                )
 
                 # Is the task in the running state
                 # If so, do not attempt to modify the task queue. Just move on
-                if record_status != RecordStatusEnum.running:
+                if record_status != RecordStatusEnum.running and not is_orphaned:
                     self._logger.warning(f"Record {record_id} (task {task_id}) is not in a running state")
                     tasks_rejected.append((task_id, "Task is not in a running state"))
                     continue
 
                 # Was the manager that sent the data the one that was assigned?
                 # If so, do not attempt to modify the task queue. Just move on
-                if record_manager_name != manager_name:
+                if record_manager_name != manager_name and not is_orphaned:
                     self._logger.warning(
                         f"Record {record_id} (task {task_id}) claimed by {record_manager_name}, not {manager_name}"
                     )
                     tasks_rejected.append((task_id, "Task is claimed by another manager"))
                     continue
 
-                result_dict = decompress(result_compressed, CompressionEnum.zstd)
-                result = pydantic.TypeAdapter(AllResultTypes).validate_python(result_dict)
+                # Successful results are handled in bulk below. Everything else is handled one at a time
+                try:
+                    result = _result_type_adapter.validate_python(decompress(result_compressed, CompressionEnum.zstd))
+                except Exception:
+                    result = None
 
-                notify_status = None
+                is_success = result is not None and result.success is True and not isinstance(result, FailedOperation)
 
-                ##################################################################
-                # The rest of the checks are done in a try/except block because
-                # they are much more complicated and can result in exceptions
-                # which should be handled
-                ##################################################################
+                if is_success:
+                    completed[record_type].append((task_id, record_id, result_compressed, result))
+                    finished_record_ids.append(record_id)
+                elif is_orphaned:
+                    # Only successful results are accepted for orphaned tasks. Others will just be computed again
+                    self._logger.warning(
+                        f"Record {record_id} (task {task_id}) is not in a running state (orphaned), "
+                        "and the result is not successful"
+                    )
+                    tasks_rejected.append((task_id, "Task is not in a running state"))
+                else:
+                    finished_record_ids.append(record_id)
+                    self._update_finished_single(
+                        session,
+                        manager_name,
+                        task_id,
+                        record_id,
+                        record_type,
+                        result_compressed,
+                        tasks_success,
+                        tasks_failures,
+                        tasks_rejected,
+                        to_be_reset,
+                    )
 
+            # Now all the successful results, all at once for each type of record
+            for record_type, type_completed in completed.items():
                 try:
                     savepoint = session.begin_nested()
-
-                    # Failed task returning FailedOperation
-                    if result.success is False and isinstance(result, FailedOperation):
-                        self.root_socket.records.update_failed_task(session, record_id, result, manager_name)
-
-                        notify_status = RecordStatusEnum.error
-                        tasks_failures.append(task_id)
-
-                        # Should we automatically reset?
-                        if self.root_socket.qcf_config.auto_reset.enabled:
-                            # TODO - Move to update_failed_task?
-                            stmt = select(BaseRecordORM)
-
-                            # We will need to load the compute history and outputs to determine if we should reset
-                            stmt = stmt.options(
-                                selectinload(BaseRecordORM.compute_history).options(
-                                    selectinload(RecordComputeHistoryORM.outputs).options(undefer(OutputStoreORM.data))
-                                )
-                            )
-                            stmt = stmt.where(BaseRecordORM.id == record_id)
-                            record_orm = session.execute(stmt).scalar_one()
-                            if should_reset(record_orm, self.root_socket.qcf_config.auto_reset):
-                                to_be_reset.append(record_id)
-
-                    elif result.success is not True:
-                        # QCEngine should always return either FailedOperation, or some result with success == True
-                        msg = f"Unexpected return from manager for task {task_id}/base result {record_id}: Returned success != True, but not a FailedOperation"
-                        error = {"error_type": "internal_fractal_error", "error_message": msg}
-                        failed_op = FailedOperation(error=error, success=False)
-
-                        self.root_socket.records.update_failed_task(session, record_id, failed_op, manager_name)
-                        notify_status = RecordStatusEnum.error
-
-                        self._logger.error(msg)
-                        tasks_rejected.append((task_id, "Returned success=False, but not a FailedOperation"))
-
-                    # Manager returned a full, successful result
-                    else:
-                        self.root_socket.records.update_completed(session, record_id, record_type, result, manager_name)
-
-                        notify_status = RecordStatusEnum.complete
-                        tasks_success.append(task_id)
-
-                    savepoint.commit()  # Release the savepoint (doesn't actually fully commit)
-
+                    self.root_socket.records.update_completed_multi(
+                        session, record_type, [(x[1], x[3]) for x in type_completed], manager_name
+                    )
+                    savepoint.commit()
                 except Exception:
-                    # We have no idea what was added or is pending for removal
-                    # So rollback the transaction to the most recent commit
+                    # Something in this batch failed. We don't know what, so fall back to handling
+                    # each task individually. That way only the offending task(s) are marked as errored
                     savepoint.rollback()
-                    savepoint = session.begin_nested()
 
-                    msg = "Internal FractalServer Error:\n" + traceback.format_exc()
-                    error = {"error_type": "internal_fractal_error", "error_message": msg}
-                    failed_op = FailedOperation(error=error, success=False)
-
-                    self.root_socket.records.update_failed_task(session, record_id, failed_op, manager_name)
-                    notify_status = RecordStatusEnum.error
-
-                    self._logger.error(msg)
-                    tasks_rejected.append((task_id, "Internal server error"))
-
-                    savepoint.commit()
+                    self._logger.warning(
+                        f"Error updating a batch of {len(type_completed)} completed {record_type} records. "
+                        "Retrying individually:\n" + traceback.format_exc()
+                    )
 
-                finally:
-                    # Send notifications that tasks were completed
-                    # Notifications are sent after the transaction is committed
-                    if notify_status is not None:
-                        self.root_socket.notify_finished_watch(record_id, notify_status)
+                    for task_id, record_id, result_compressed, _ in type_completed:
+                        self._update_finished_single(
+                            session,
+                            manager_name,
+                            task_id,
+                            record_id,
+                            record_type,
+                            result_compressed,
+                            tasks_success,
+                            tasks_failures,
+                            tasks_rejected,
+                            to_be_reset,
+                        )
+                else:
+                    for task_id, record_id, _, _ in type_completed:
+                        tasks_success.append(task_id)
+                        self.root_socket.notify_finished_watch(record_id, RecordStatusEnum.complete)
 
             session.commit()
 
@@ -232,6 +556,12 @@ class TaskSocket:
 
                 self.root_socket.records.reset(to_be_reset, session=session)
 
+            # Iterate services whose last dependencies just finished, rather than waiting for the periodic check.
+            # Changes must be committed first, otherwise two managers returning the last two dependencies
+            # of a service at the same time would not see each other's results
+            session.commit()
+            self.root_socket.services.dependencies_finished(session, finished_record_ids)
+
         self._logger.info(
             "Processed {} returned tasks ({} successful, {} failed, {} rejected).".format(
                 len(results_compressed), len(tasks_success), len(tasks_failures), len(tasks_rejected)
@@ -289,7 +619,7 @@ class TaskSocket:
 
             # Remove tags & programs that we didn't say we handled
             # (order is important for tags)
-            search_programs = array(p for p in programs.keys() if p in manager.programs.keys())
+            search_programs = [p for p in programs.keys() if p in manager.programs.keys()]
             search_tags = [x for x in compute_tags if x in manager.compute_tags]
 
             if len(search_programs) == 0:
@@ -300,122 +630,159 @@ class TaskSocket:
                 self._logger.warning(f"Manager {manager_name} did not send any valid queue tags to claim")
                 raise ComputeManagerError(f"Manager {manager_name} did not send any valid queue tags to claim")
 
-            found: Dict[int, Dict[str, Any]] = {}
-            return_order: List[int] = []  # Order of task ids
-
-            for tag in search_tags:
-                new_limit = limit - len(found)
-
-                # Have we found all we needed to find
-                # (should always be >= 0, but can never be too careful. If it wasn't this could be an infinite loop)
-                if new_limit <= 0:
-                    break
-
-                # Find tasks/base result:
-                #   1. Status is waiting
-                #   2. Whose required programs I am able to match
-                #   3. Whose tags I am able to compute
-                # with_for_update locks the rows. skip_locked=True makes it skip already-locked rows
-                # (possibly from another process)
-                # Also, load the base_result object so we can update stuff there (status)
-                # TODO - we only test for the presence of the available_programs in the requirements. Eventually
-                #        we want to then verify the versions
-
-                # This is a very tricky query. We only want to load two columns of BaseRecord, but we need to join.
-                # Sqlalchemy likes to load more columns if there is a relationship. So we join outside of the
-                # relationship (ie, NOT TaskQueueORM.record) and then load the columns we want.
-                stmt = select(TaskQueueORM, BaseRecordORM).join(
-                    BaseRecordORM, BaseRecordORM.id == TaskQueueORM.record_id
+            # Find tasks/base result:
+            #   1. Status is waiting
+            #   2. Whose required programs I am able to match
+            #   3. Whose tags I am able to compute
+            #
+            # This is all done in a single statement, rather than a few queries per tag. The recursive CTE
+            # walks through the tags in order (the order is important - it is the tag priority), finding
+            # up to the remaining number of tasks for each tag. It stops as soon as the limit is reached.
+            #
+            # Within a tag, tasks are ordered by priority, then date (earliest first). This matches the
+            # ix_task_queue_tag_sort index (or ix_task_queue_sort for the wildcard tag), so only the first
+            # few rows of the index need to be read. The sort_date usually comes from the created_on of the record,
+            # or the created_on of the record's parent service.
+            #
+            # FOR UPDATE locks the rows. SKIP LOCKED makes it skip already-locked rows
+            # (possibly from another process). The claimed tasks and records are then updated in the same statement.
+            #
+            # TODO - we only test for the presence of the available_programs in the requirements. Eventually
+            #        we want to then verify the versions
+            tag_subquery = """
+                SELECT tq.id, tq.record_id, br.record_type, ROW(-tq.compute_priority, tq.sort_date, tq.id) AS sort_key
+                FROM task_queue tq
+                INNER JOIN base_record br ON br.id = tq.record_id
+                WHERE tq.available = true
+                  AND (:programs)::text[] @> tq.required_programs
+                  AND tq.id <> ALL(tc.claimed_ids)
+                  AND {tag_filter}
+                ORDER BY tq.compute_priority DESC, tq.sort_date ASC, tq.id ASC
+                LIMIT tc.remaining
+                FOR UPDATE OF tq, br SKIP LOCKED
+            """
+
+            # If tag is "*" (and strict_compute_tags is False), then the manager can pull anything
+            # If tag is "*" and strict_compute_tags is enabled, only pull tasks with tag == '*'
+            # These are separate subqueries so that each one can use the appropriate index
+            if self._strict_compute_tags:
+                tag_tasks = tag_subquery.format(tag_filter="tq.compute_tag = (:compute_tags)[tc.tag_rank + 1]")
+            else:
+                tag_tasks = f"""
+                    SELECT * FROM ({tag_subquery.format(
+                        tag_filter="tq.compute_tag = (:compute_tags)[tc.tag_rank + 1] AND (:compute_tags)[tc.tag_rank + 1] <> '*'"
+                    )}) tag_match
+                    UNION ALL
+                    SELECT * FROM ({tag_subquery.format(
+                        tag_filter="(:compute_tags)[tc.tag_rank + 1] = '*'"
+                    )}) wildcard_match
+                """
+
+            stmt = text(f"""
+                WITH RECURSIVE tag_claims(tag_rank, remaining, claimed_ids, task_ids, record_ids, record_types) AS (
+                    SELECT 0, :limit, ARRAY[]::integer[], ARRAY[]::integer[], ARRAY[]::integer[], ARRAY[]::varchar[]
+                  UNION ALL
+                    SELECT tc.tag_rank + 1,
+                           tc.remaining - cardinality(found.task_ids),
+                           tc.claimed_ids || found.task_ids,
+                           found.task_ids,
+                           found.record_ids,
+                           found.record_types
+                    FROM tag_claims tc
+                    CROSS JOIN LATERAL (
+                        SELECT COALESCE(array_agg(t.id ORDER BY t.sort_key), ARRAY[]::integer[]) AS task_ids,
+                               COALESCE(array_agg(t.record_id ORDER BY t.sort_key), ARRAY[]::integer[]) AS record_ids,
+                               COALESCE(array_agg(t.record_type ORDER BY t.sort_key), ARRAY[]::varchar[]) AS record_types
+                        FROM ({tag_tasks}) t
+                    ) found
+                    WHERE tc.tag_rank < cardinality(:compute_tags) AND tc.remaining > 0
+                ),
+                claimed AS (
+                    SELECT c.task_id, c.record_id, c.record_type, tc.tag_rank, c.n
+                    FROM tag_claims tc
+                    CROSS JOIN LATERAL unnest(tc.task_ids, tc.record_ids, tc.record_types)
+                        WITH ORDINALITY AS c(task_id, record_id, record_type, n)
+                ),
+                claimed_records AS (
+                    UPDATE base_record
+                    SET status = 'running', manager_name = :manager_name, modified_on = :modified_on
+                    FROM claimed
+                    WHERE base_record.id = claimed.record_id
                 )
+                UPDATE task_queue
+                SET available = false, former_manager_name = NULL
+                FROM claimed
+                WHERE task_queue.id = claimed.task_id
+                RETURNING task_queue.*, claimed.record_type, claimed.tag_rank, claimed.n
+            """)
+
+            stmt = stmt.bindparams(
+                bindparam("compute_tags", search_tags, type_=ARRAY(TEXT)),
+                bindparam("programs", search_programs, type_=ARRAY(TEXT)),
+                limit=limit,
+                manager_name=manager_name,
+                modified_on=now_at_utc(),
+            )
 
-                stmt = stmt.filter(TaskQueueORM.available == True)
-                stmt = stmt.filter(search_programs.contains(TaskQueueORM.required_programs))
-                stmt = stmt.options(load_only(BaseRecordORM.id, BaseRecordORM.record_type))
-                stmt = stmt.options(lazyload(BaseRecordORM.creator_user))
-
-                # Order by priority, then date (earliest first)
-                # The sort_date usually comes from the created_on of the record, or the created_on of the record's parent service
-                stmt = stmt.order_by(
-                    TaskQueueORM.compute_priority.desc(), TaskQueueORM.sort_date.asc(), TaskQueueORM.id.asc()
-                )
+            stmt = stmt.columns(
+                *TaskQueueORM.__table__.columns,
+                column("record_type", String),
+                column("tag_rank", Integer),
+                column("n", Integer),
+            )
 
-                # If tag is "*" (and strict_compute_tags is False), then the manager can pull anything
-                # If tag is "*" and strict_compute_tags is enabled, only pull tasks with tag == '*'
-                if tag != "*" or self._strict_compute_tags:
-                    stmt = stmt.filter(TaskQueueORM.compute_tag == tag)
+            orm_stmt = select(
+                TaskQueueORM,
+                stmt.selected_columns.record_type,
+                stmt.selected_columns.tag_rank,
+                stmt.selected_columns.n,
+            ).from_statement(stmt)
 
-                # Skip locked rows - They may be in the process of being claimed by someone else
-                stmt = stmt.limit(new_limit).with_for_update(of=[BaseRecordORM, TaskQueueORM], skip_locked=True)
+            new_items = session.execute(orm_stmt).all()
 
-                new_items = session.execute(stmt).all()
+            # RETURNING does not guarantee any order, so restore the claim order
+            # (by tag, then order within a tag)
+            new_items = sorted(new_items, key=lambda x: (x[2], x[3]))
 
-                # Update all the task records to reflect this manager claiming them
-                task_ids = [x[0].id for x in new_items]
-                record_ids = [x[1].id for x in new_items]
+            # Store in dict form for returning, but no need to store the info from the base record
+            # Also, retrieve the actual function kwargs. Eventually we may want the managers
+            # to retrieve the kwargs themselves
+            found: Dict[int, Dict[str, Any]] = {}
+            return_order: List[int] = [task_orm.id for task_orm, _, _, _ in new_items]
+            tasks_to_generate = defaultdict(list)
 
-                return_order.extend(task_ids)  # Keep the order as returned from the db
-                stmt = update(TaskQueueORM).where(TaskQueueORM.id.in_(task_ids)).values(available=False)
-                session.execute(stmt)
+            # Find what tasks need their function and kwargs generated
+            # (this is normally done ahead of time by the task materializer)
+            for task_orm, record_type, _, _ in new_items:
+                found[task_orm.id] = task_orm.model_dict(exclude=["record"])
+                if task_orm.function is None:
+                    tasks_to_generate[record_type].append((task_orm.id, task_orm.record_id))
 
-                stmt = (
-                    update(BaseRecordORM)
-                    .where(BaseRecordORM.id.in_(record_ids))
-                    .values(status=RecordStatusEnum.running, manager_name=manager_name, modified_on=now_at_utc())
-                )
-                session.execute(stmt)
-
-                # Store in dict form for returning, but no need to store the info from the base record
-                # Also, retrieve the actual function kwargs. Eventually we may want the managers
-                # to retrieve the kwargs themselves
-                tasks_to_generate = defaultdict(list)
-                task_updates = []
-
-                # Find what tasks need their function and kwargs generated
-                # Otherwise, just add them to the returned list
-                for task_orm, record_orm in new_items:
-                    if task_orm.function is None:
-                        tasks_to_generate[record_orm.record_type].append(task_orm)
-                    else:
-                        found[task_orm.id] = task_orm.model_dict(exclude=["record"])
-
-                # Create the task data on the fly if it doesn't exist
-                for record_type, tasks_orm in tasks_to_generate.items():
-                    record_socket = self.root_socket.records.get_socket(record_type)
-
-                    record_ids = [task_orm.record_id for task_orm in tasks_orm]
-                    task_specs = record_socket.generate_task_specifications(session, record_ids)
-
-                    for task_orm, task_spec in zip(tasks_orm, task_specs):
-                        task_dict = task_orm.model_dict(exclude=["record"])
-
-                        kwargs = task_spec["function_kwargs"]
-                        kwargs_compressed, _, _ = compress(kwargs, CompressionEnum.zstd)
-
-                        # Add this to the orm for any future managers claiming this task
-                        task_updates.append(
-                            {
-                                "id": task_orm.id,
-                                "function": task_spec["function"],
-                                "function_kwargs_compressed": kwargs_compressed,
-                            }
-                        )
+            # Create the task data on the fly if it doesn't exist
+            generated = self._generate_task_functions(session, tasks_to_generate)
 
-                        # But just use what we created when returning to this manager
-                        task_dict["function"] = task_spec["function"]
-                        task_dict["function_kwargs_compressed"] = kwargs_compressed
-                        found[task_orm.id] = task_dict
+            for task_id, (function, kwargs_compressed) in generated.items():
+                found[task_id]["function"] = function
+                found[task_id]["function_kwargs_compressed"] = kwargs_compressed
 
-                # Update the task records with the function and kwargs
-                if task_updates:
-                    session.execute(update(TaskQueueORM), task_updates)
+            # Update the task records with the function and kwargs for any future managers claiming this task
+            if generated:
+                task_updates = [
+                    {"id": task_id, "function": function, "function_kwargs_compressed": kwargs_compressed}
+                    for task_id, (function, kwargs_compressed) in generated.items()
+                ]
+                session.execute(update(TaskQueueORM), task_updates)
 
-                session.flush()
+            session.flush()
 
             manager.claimed += len(found)
+            manager.claimed_generated_inline += len(generated)
 
             # Mark that we have heard from the manager
             manager.modified_on = now_at_utc()
 
-            self._logger.info(f"Manager {manager_name} has claimed {len(found)} new tasks")
+            self._logger.info(
+                f"Manager {manager_name} has claimed {len(found)} new tasks ({len(generated)} generated while claiming)"
+            )
 
         return [found[i] for i in return_order]
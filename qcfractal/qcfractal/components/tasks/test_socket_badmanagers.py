@@ -233,6 +233,125 @@ def test_task_socket_return_manager_badstatus_1(storage_socket: SQLAlchemySocket
     assert manager.rejected == 1
 
 
+def test_task_socket_return_manager_badstatus_orphaned(storage_socket: SQLAlchemySocket, session: Session, caplog):
+    # Manager returns data for a task that was reset because its manager went away,
+    # but that it never claimed
+
+    mname1 = ManagerName(cluster="test_cluster", hostname="a_host", uuid="1234-5678-1234-5678")
+    mname2 = ManagerName(cluster="test_cluster", hostname="a_host", uuid="2234-5678-1234-5678")
+    mname3 = ManagerName(cluster="test_cluster", hostname="a_host", uuid="3234-5678-1234-5678")
+
+    for mname, username in [(mname1, "bill"), (mname2, "ted"), (mname3, "bill")]:
+        storage_socket.managers.activate(
+            name_data=mname,
+            manager_version="v2.0",
+            username=username,
+            programs=_manager_programs,
+            compute_tags=["tag1"],
+        )
+
+    record_id_1, result_data_1 = submit_procedure_data(storage_socket, "sp_psi4_benzene_energy_1", "tag1")
+    record_id_2, result_data_2 = submit_procedure_data(storage_socket, "sp_psi4_benzene_energy_2", "tag1")
+    result_data_compressed_1 = compress_result(result_data_1.model_dump())
+    result_data_compressed_2 = compress_result(result_data_2.model_dump())
+
+    tasks = storage_socket.tasks.claim_tasks(mname1.fullname, _manager_programs, ["tag1"])
+    task_map = {t["record_id"]: t["id"] for t in tasks}
+    assert len(task_map) == 2
+
+    # Original manager goes away
+    storage_socket.records.reset_assigned([mname1.fullname])
+
+    # Manager 3 never claimed these. It can only return them on behalf of manager 1
+    with caplog_handler_at_level(caplog, logging.WARNING):
+        rmeta = storage_socket.tasks.update_finished(mname3.fullname, {task_map[record_id_1]: result_data_compressed_1})
+        assert "not in a running state" in caplog.text
+
+    # Manager 2 belongs to a different user, so it can't return them on behalf of manager 1
+    rmeta2 = storage_socket.tasks.update_finished(
+        mname2.fullname,
+        {task_map[record_id_2]: result_data_compressed_2},
+        claimed_by={task_map[record_id_2]: mname1.fullname},
+    )
+
+    # Claiming the task on behalf of a manager that didn't claim it doesn't work either
+    rmeta3 = storage_socket.tasks.update_finished(
+        mname3.fullname,
+        {task_map[record_id_2]: result_data_compressed_2},
+        claimed_by={task_map[record_id_2]: mname2.fullname},
+    )
+
+    for rm, task_id in [
+        (rmeta, task_map[record_id_1]),
+        (rmeta2, task_map[record_id_2]),
+        (rmeta3, task_map[record_id_2]),
+    ]:
+        assert rm.n_accepted == 0
+        assert rm.rejected_info == [(task_id, "Task is not in a running state")]
+
+    # Records should still be waiting
+    for record_id in [record_id_1, record_id_2]:
+        sp_rec = session.get(BaseRecordORM, record_id)
+        assert sp_rec.status == RecordStatusEnum.waiting
+        assert sp_rec.manager_name is None
+        assert sp_rec.task is not None
+        assert sp_rec.compute_history == []
+
+
+def test_task_socket_return_manager_badstatus_orphaned_stale(storage_socket: SQLAlchemySocket, session: Session):
+    # Manager returns data for a task that was orphaned, but that has since moved on
+    # (claimed by another manager, and then reset)
+
+    mname1 = ManagerName(cluster="test_cluster", hostname="a_host", uuid="1234-5678-1234-5678")
+    mname2 = ManagerName(cluster="test_cluster", hostname="a_host", uuid="2234-5678-1234-5678")
+
+    for mname in [mname1, mname2]:
+        storage_socket.managers.activate(
+            name_data=mname,
+            manager_version="v2.0",
+            username="bill",
+            programs=_manager_programs,
+            compute_tags=["tag1"],
+        )
+
+    record_id, result_data = submit_procedure_data(storage_socket, "sp_psi4_benzene_energy_1", "tag1")
+    result_data_compressed = compress_result(result_data.model_dump())
+
+    tasks = storage_socket.tasks.claim_tasks(mname1.fullname, _manager_programs, ["tag1"])
+    assert len(tasks) == 1
+    task_id = tasks[0]["id"]
+
+    # Original manager goes away
+    storage_socket.records.reset_assigned([mname1.fullname])
+    sp_rec = session.get(BaseRecordORM, record_id)
+    assert sp_rec.task.former_manager_name == mname1.fullname
+
+    # Claimed again by another manager
+    tasks = storage_socket.tasks.claim_tasks(mname2.fullname, _manager_programs, ["tag1"])
+    assert [t["id"] for t in tasks] == [task_id]
+    session.expire_all()
+    assert sp_rec.task.former_manager_name is None
+
+    # Reset by the user. The original manager is not the former owner
+    storage_socket.records.reset_running([record_id])
+    session.expire_all()
+    assert sp_rec.status == RecordStatusEnum.waiting
+    assert sp_rec.task.former_manager_name is None
+
+    rmeta = storage_socket.tasks.update_finished(mname1.fullname, {task_id: result_data_compressed})
+    assert rmeta.n_accepted == 0
+    assert rmeta.rejected_info == [(task_id, "Task is not in a running state")]
+
+    # Resetting also clears a former owner
+    tasks = storage_socket.tasks.claim_tasks(mname2.fullname, _manager_programs, ["tag1"])
+    sp_rec.task.former_manager_name = mname1.fullname
+    session.commit()
+
+    storage_socket.records.reset_running([record_id])
+    session.expire_all()
+    assert sp_rec.task.former_manager_name is None
+
+
 def test_task_socket_return_manager_badstatus_2(storage_socket: SQLAlchemySocket, session: Session, caplog):
     # Manager returns data for a record that completed (and therefore not in the task queue)
 
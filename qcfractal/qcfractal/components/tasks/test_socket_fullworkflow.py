@@ -8,8 +8,10 @@ from typing import TYPE_CHECKING
 
 from qcfractal.components.managers.db_models import ComputeManagerORM
 from qcfractal.components.record_db_models import BaseRecordORM
+from qcfractal.components.optimization.testing_helpers import submit_procedure_data as submit_opt_procedure_data
 from qcfractal.components.singlepoint.testing_helpers import load_procedure_data, submit_procedure_data
 from qcfractalcompute.compress import compress_result
+from qcportal.managers import ManagerName
 from qcportal.qcschema_v1 import ComputeError, FailedOperation
 from qcportal.record_models import PriorityEnum, RecordStatusEnum, OutputTypeEnum
 from qcportal.utils import now_at_utc
@@ -259,3 +261,114 @@ def test_task_socket_fullworkflow_error_autoreset(snowflake: QCATestingSnowflake
         session.expire(rec)
         assert rec.status == RecordStatusEnum.error
         assert len(rec.compute_history) == 3
+
+
+def test_task_socket_fullworkflow_mixed_batch(snowflake: QCATestingSnowflake):
+    # Successful results are stored in bulk. Make sure a bad result does not affect the others
+    storage_socket = snowflake.get_storage_socket()
+    mname, mid = snowflake.activate_manager()
+    activated_manager_programs = snowflake.activated_manager_programs()
+
+    id1, result_data1 = submit_procedure_data(storage_socket, "sp_psi4_benzene_energy_1")
+    id2, result_data2 = submit_procedure_data(storage_socket, "sp_psi4_fluoroethane_wfn")
+    id3, result_data3 = submit_procedure_data(storage_socket, "sp_psi4_water_energy")
+    id4, result_data4 = submit_procedure_data(storage_socket, "sp_psi4_water_gradient")
+    id5, result_data5 = submit_opt_procedure_data(storage_socket, "opt_psi4_methane")
+
+    tasks = storage_socket.tasks.claim_tasks(mname.fullname, activated_manager_programs, ["*"])
+    task_map = {t["record_id"]: t["id"] for t in tasks}
+    assert len(task_map) == 5
+
+    fop = FailedOperation(error=ComputeError(error_type="test_error", error_message="this is a test error"))
+
+    rmeta = storage_socket.tasks.update_finished(
+        mname.fullname,
+        {
+            task_map[id1]: compress_result(result_data1.model_dump()),
+            task_map[id2]: compress_result(fop.model_dump()),
+            # Optimization result returned for a singlepoint. This causes the bulk insertion to fail
+            task_map[id3]: compress_result(result_data5.model_dump()),
+            # Not even a valid result
+            task_map[id4]: compress_result({"not": "a result"}),
+            task_map[id5]: compress_result(result_data5.model_dump()),
+        },
+    )
+
+    assert rmeta.n_accepted == 3
+    assert rmeta.n_rejected == 2
+    assert rmeta.accepted_ids == sorted([task_map[id1], task_map[id2], task_map[id5]])
+    assert sorted(x[0] for x in rmeta.rejected_info) == sorted([task_map[id3], task_map[id4]])
+    assert all(x[1] == "Internal server error" for x in rmeta.rejected_info)
+
+    with storage_socket.session_scope() as session:
+        for rec_id in [id1, id5]:
+            rec = session.get(BaseRecordORM, rec_id)
+            assert rec.status == RecordStatusEnum.complete
+            assert rec.task is None
+            assert len(rec.compute_history) == 1
+            assert rec.compute_history[0].status == RecordStatusEnum.complete
+
+        for rec_id in [id2, id3, id4]:
+            rec = session.get(BaseRecordORM, rec_id)
+            assert rec.status == RecordStatusEnum.error
+            assert rec.task is not None
+            assert len(rec.compute_history) == 1
+            assert rec.compute_history[0].status == RecordStatusEnum.error
+
+        manager = session.get(ComputeManagerORM, mid)
+        assert manager.successes == 2
+        assert manager.failures == 1
+        assert manager.rejected == 2
+
+
+def test_task_socket_fullworkflow_orphaned(snowflake: QCATestingSnowflake):
+    # Results for tasks whose manager went away can be returned by a different manager of the same user
+    # on its behalf (such as results stored in a compute manager's outbox). Only successful results are accepted
+    storage_socket = snowflake.get_storage_socket()
+    mname, mid = snowflake.activate_manager()
+    activated_manager_programs = snowflake.activated_manager_programs()
+
+    id1, result_data1 = submit_procedure_data(storage_socket, "sp_psi4_benzene_energy_1")
+    id2, result_data2 = submit_procedure_data(storage_socket, "sp_psi4_fluoroethane_wfn")
+
+    tasks = storage_socket.tasks.claim_tasks(mname.fullname, activated_manager_programs, ["*"])
+    task_map = {t["record_id"]: t["id"] for t in tasks}
+    assert len(task_map) == 2
+
+    # Original manager goes away
+    storage_socket.records.reset_assigned([mname.fullname])
+
+    mname2 = ManagerName(cluster="test_cluster", hostname="a_host", uuid="8765-4321-8765-4321")
+    storage_socket.managers.activate(
+        name_data=mname2,
+        manager_version="v2.0",
+        username="bill",
+        programs=activated_manager_programs,
+        compute_tags=["*"],
+    )
+
+    fop = FailedOperation(error=ComputeError(error_type="test_error", error_message="this is a test error"))
+
+    rmeta = storage_socket.tasks.update_finished(
+        mname2.fullname,
+        {
+            task_map[id1]: compress_result(result_data1.model_dump()),
+            task_map[id2]: compress_result(fop.model_dump()),
+        },
+        claimed_by={task_map[id1]: mname.fullname, task_map[id2]: mname.fullname},
+    )
+
+    assert rmeta.accepted_ids == [task_map[id1]]
+    assert rmeta.rejected_info == [(task_map[id2], "Task is not in a running state")]
+
+    with storage_socket.session_scope() as session:
+        rec = session.get(BaseRecordORM, id1)
+        assert rec.status == RecordStatusEnum.complete
+        assert rec.manager_name == mname2.fullname
+        assert rec.task is None
+
+        rec = session.get(BaseRecordORM, id2)
+        assert rec.status == RecordStatusEnum.waiting
+        assert rec.manager_name is None
+        assert rec.task is not None
+        assert rec.compute_history == []
@@ -0,0 +1,144 @@
+"""
+Tests generating task functions/kwargs ahead of time (the task materializer)
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+import pytest
+
+from qcfractal.components.internal_jobs.db_models import InternalJobORM
+from qcfractal.components.internal_jobs.status import CancelledJobException
+from qcfractal.components.tasks.socket import TaskSocket
+from qcfractal.components.record_db_models import BaseRecordORM
+from qcfractal.components.singlepoint.testing_helpers import load_procedure_data as load_sp_procedure_data
+from qcfractal.testing_helpers import DummyJobProgress
+from qcportal.compression import decompress, CompressionEnum
+from qcportal.internal_jobs import InternalJobStatusEnum, InternalJobQueryFilters
+from qcportal.managers import ManagerName
+from qcportal.record_models import PriorityEnum
+from qcportal.utils import now_at_utc
+
+if TYPE_CHECKING:
+    from qcfractal.db_socket import SQLAlchemySocket
+    from sqlalchemy.orm.session import Session
+
+input_spec_1, molecule_1, result_data_1 = load_sp_procedure_data("sp_psi4_water_energy")
+input_spec_2, molecule_2, result_data_2 = load_sp_procedure_data("sp_psi4_water_gradient")
+input_spec_3, molecule_3, result_data_3 = load_sp_procedure_data("sp_psi4_water_hessian")
+
+mname1 = ManagerName(cluster="test_cluster", hostname="a_host1", uuid="1234-5678-1234-5678")
+mprog1 = {"qcengine": ["unknown"], "psi4": ["unknown"], "geometric": ["v3.0"]}
+
+
+def test_task_socket_materialize(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    storage_socket.managers.activate(
+        name_data=mname1,
+        manager_version="v2.0",
+        username="bill",
+        programs=mprog1,
+        compute_tags=["tag1", "tag2"],
+    )
+
+    _, id_1 = storage_socket.records.singlepoint.add([molecule_1], input_spec_1, "tag1", PriorityEnum.low, None, True)
+    _, id_2 = storage_socket.records.singlepoint.add([molecule_2], input_spec_2, "tag2", PriorityEnum.high, None, True)
+    _, id_3 = storage_socket.records.singlepoint.add(
+        [molecule_3], input_spec_3, "tag1", PriorityEnum.normal, None, True
+    )
+
+    # Only the two highest-priority tasks are examined
+    monkeypatch.setattr(storage_socket.tasks, "_materializer_depth", 2)
+    n_generated = storage_socket.tasks.materialize_tasks(session, DummyJobProgress())
+    assert n_generated == 2
+
+    rec_1 = session.get(BaseRecordORM, id_1[0])
+    rec_2 = session.get(BaseRecordORM, id_2[0])
+    rec_3 = session.get(BaseRecordORM, id_3[0])
+    assert rec_1.task.function is None
+    assert rec_2.task.function == "qcengine.compute"
+    assert rec_3.task.function == "qcengine.compute"
+
+    kwargs = decompress(rec_2.task.function_kwargs_compressed, CompressionEnum.zstd)
+    assert kwargs["input_data"]["id"] == str(id_2[0])
+    assert kwargs["program"] == "psi4"
+
+    # Nothing left to do for these two
+    assert storage_socket.tasks.materialize_tasks(session, DummyJobProgress()) == 0
+
+    # Claim the materialized tasks. None should have to be generated
+    tasks = storage_socket.tasks.claim_tasks(mname1.fullname, mprog1, ["tag2", "tag1"], 2)
+    assert [t["id"] for t in tasks] == [rec_2.task.id, rec_3.task.id]
+
+    stats = storage_socket.tasks.get_claim_statistics()
+    assert stats["tasks_claimed"] == 2
+    assert stats["tasks_generated_inline"] == 0
+
+    # Remaining task is generated while claiming
+    tasks = storage_socket.tasks.claim_tasks(mname1.fullname, mprog1, ["tag2", "tag1"], 2)
+    assert [t["id"] for t in tasks] == [rec_1.task.id]
+    assert tasks[0]["function"] == "qcengine.compute"
+    assert tasks[0]["function_kwargs_compressed"] is not None
+
+    stats = storage_socket.tasks.get_claim_statistics()
+    assert stats["tasks_claimed"] == 3
+    assert stats["tasks_generated_inline"] == 1
+    assert stats["inline_generation_rate"] == 1 / 3
+
+    # Also available per manager
+    manager = storage_socket.managers.get([mname1.fullname])[0]
+    assert manager["claimed"] == 3
+    assert manager["claimed_generated_inline"] == 1
+
+
+def test_task_socket_materialize_skip_claimed(storage_socket: SQLAlchemySocket, session: Session, monkeypatch):
+    storage_socket.managers.activate(
+        name_data=mname1,
+        manager_version="v2.0",
+        username="bill",
+        programs=mprog1,
+        compute_tags=["tag1"],
+    )
+
+    _, id_1 = storage_socket.records.singlepoint.add([molecule_1], input_spec_1, "tag1", PriorityEnum.high, None, True)
+    _, id_2 = storage_socket.records.singlepoint.add([molecule_2], input_spec_2, "tag1", PriorityEnum.low, None, True)
+
+    tasks = storage_socket.tasks.claim_tasks(mname1.fullname, mprog1, ["tag1"], 1)
+    assert len(tasks) == 1
+
+    # Claimed tasks are not available, so only the remaining waiting task is examined
+    monkeypatch.setattr(storage_socket.tasks, "_materializer_depth", 10)
+    assert storage_socket.tasks.materialize_tasks(session, DummyJobProgress()) == 1
+
+    rec_2 = session.get(BaseRecordORM, id_2[0])
+    assert rec_2.task.function == "qcengine.compute"
+
+
+def test_task_socket_materialize_disabled(storage_socket: SQLAlchemySocket, session: Session):
+    # Job left over from when the materializer was enabled
+    job_id = storage_socket.internal_jobs.add(
+        "materialize_tasks",
+        now_at_utc(),
+        "tasks.materialize_tasks",
+        {},
+        user_id=None,
+        unique_name=True,
+        repeat_delay=10,
+    )
+
+    # Creating a socket does not touch the job (materializer is disabled by default)
+    assert storage_socket.tasks._materializer_depth == 0
+    TaskSocket(storage_socket)
+    assert storage_socket.internal_jobs.get(job_id)["status"] == InternalJobStatusEnum.waiting
+
+    with pytest.raises(CancelledJobException):
+        storage_socket.tasks.materialize_tasks(session, DummyJobProgress())
+
+    # Running it cancels it, so that it doesn't repeat
+    job_orm = session.get(InternalJobORM, job_id)
+    storage_socket.internal_jobs._run_single(session, job_orm, logging.getLogger("internal_job"), DummyJobProgress())
+
+    assert storage_socket.internal_jobs.get(job_id)["status"] == InternalJobStatusEnum.cancelled
+    jobs = storage_socket.internal_jobs.query(InternalJobQueryFilters(name=["materialize_tasks"]))
+    assert [j["id"] for j in jobs] == [job_id]
@@ -0,0 +1,214 @@
+"""
+Tests the asynchronous client
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from qcarchivetesting.testing_classes import QCATestingSnowflake
+from qcfractal.components.optimization.testing_helpers import run_procedure_data as run_opt_procedure_data
+from qcfractal.components.singlepoint.testing_helpers import load_procedure_data as load_sp_procedure_data
+from qcfractal.components.testing_helpers import populate_records_status
+from qcportal import PortalRequestError, AsyncPortalClient
+from qcportal.exceptions import AuthenticationFailure
+from qcportal.molecules import Molecule
+from qcportal.record_models import RecordStatusEnum
+from qcportal.singlepoint import SinglepointDatasetNewEntry
+
+pytest.importorskip("httpx")
+
+
+def test_async_client_get_records(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    all_id = populate_records_status(storage_socket)
+    snowflake_client = snowflake.client()
+
+    # Small limit so that records are fetched in several concurrent batches
+    snowflake_client.api_limits["get_records"] = 10
+
+    async def _run():
+        async with AsyncPortalClient.from_client(snowflake_client, max_concurrency=3) as client:
+            records = await client.get_records(all_id)
+            assert [r.id for r in records] == all_id
+
+            sync_records = snowflake_client.get_records(all_id)
+            assert [r.status for r in records] == [r.status for r in sync_records]
+            assert [r.record_type for r in records] == [r.record_type for r in sync_records]
+
+            # Records can use the (synchronous) client to fetch additional data
+            assert records[0].initial_molecule.id == sync_records[0].initial_molecule.id
+
+            r = await client.get_records(all_id[3])
+            assert r.id == all_id[3]
+
+            r = await client.get_records([all_id[0], 9999, all_id[1]], missing_ok=True)
+            assert r[1] is None
+            assert r[0].id == all_id[0]
+            assert r[2].id == all_id[1]
+
+            with pytest.raises(PortalRequestError, match=r"Could not find all requested"):
+                await client.get_records([all_id[0], 9999])
+
+            assert await client.get_records([]) == []
+
+            # Many requests at once
+            results = await asyncio.gather(*[client.get_records(all_id) for _ in range(10)])
+            assert all([r.id for r in x] == all_id for x in results)
+
+    asyncio.run(_run())
+
+
+def test_async_client_get_records_include(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    activated_manager_name, _ = snowflake.activate_manager()
+    snowflake_client = snowflake.client()
+
+    opt_id = run_opt_procedure_data(storage_socket, activated_manager_name, "opt_psi4_benzene")
+
+    async def _run():
+        async with AsyncPortalClient.from_client(snowflake_client) as client:
+            r = await client.get_records(opt_id, include=["compute_history"])
+            assert r.compute_history_ is not None
+
+            # Children are fetched with the synchronous client
+            sync_r = snowflake_client.get_optimizations(opt_id, include=["trajectory"])
+            r = (await client.get_records([opt_id], include=["compute_history"]))[0]
+            assert [x.id for x in r.trajectory] == [x.id for x in sync_r.trajectory]
+
+    asyncio.run(_run())
+
+
+@pytest.mark.parametrize("limit", [None, 3])
+def test_async_client_query_records(snowflake: QCATestingSnowflake, limit):
+    storage_socket = snowflake.get_storage_socket()
+    all_id = populate_records_status(storage_socket)
+    snowflake_client = snowflake.client()
+
+    # Small limit so that the query is paginated (batches of 5)
+    snowflake_client.api_limits["get_records"] = 20
+
+    async def _run():
+        async with AsyncPortalClient.from_client(snowflake_client) as client:
+            records = [r async for r in client.query_records(limit=limit)]
+            sync_records = list(snowflake_client.query_records(limit=limit))
+            assert [r.id for r in records] == [r.id for r in sync_records]
+
+            if limit is None:
+                assert {r.id for r in records} == set(all_id)
+            else:
+                assert len(records) == limit
+
+            records = [r async for r in client.query_records(status=RecordStatusEnum.complete, limit=limit)]
+            assert records
+            assert all(r.status == RecordStatusEnum.complete for r in records)
+
+            records = [r async for r in client.query_records(record_type="optimization", limit=limit)]
+            assert records
+            assert all(r.record_type == "optimization" for r in records)
+
+            records = [r async for r in client.query_records(record_id=9999)]
+            assert records == []
+
+    asyncio.run(_run())
+
+
+def test_async_client_dataset_iterate_records(snowflake: QCATestingSnowflake):
+    snowflake_client = snowflake.client()
+
+    input_spec, molecule, _ = load_sp_procedure_data("sp_psi4_peroxide_energy_wfn")
+
+    ds = snowflake_client.add_dataset("singlepoint", "Test dataset")
+    ds.add_specification("spec_1", input_spec)
+    ds.add_specification("spec_2", input_spec.model_copy(update={"basis": "def2-tzvp"}))
+    ds.add_entries(
+        [
+            SinglepointDatasetNewEntry(
+                name=f"entry_{i}", molecule=Molecule(symbols=["h", "h"], geometry=[0, 0, 0, 0, 0, 1.0 + i / 10])
+            )
+            for i in range(25)
+        ]
+    )
+    ds.submit()
+
+    rec_ids = ds.get_record("entry_2", "spec_1").id, ds.get_record("entry_3", "spec_2").id
+    snowflake_client.cancel_records(rec_ids)
+
+    # Small limit so that several batches are fetched concurrently
+    snowflake_client.api_limits["get_records"] = 10
+    ds = snowflake_client.get_dataset_by_id(ds.id)
+
+    async def _run():
+        async with AsyncPortalClient.from_client(snowflake_client, max_concurrency=2) as client:
+            records = [x async for x in client.iterate_dataset_records(ds)]
+            sync_records = list(ds.iterate_records(force_refetch=True))
+
+            assert len(records) == 50
+            assert [(e, s, r.id) for e, s, r in records] == [(e, s, r.id) for e, s, r in sync_records]
+            assert all(r.record_type == "singlepoint" for _, _, r in records)
+
+            records = [x async for x in client.iterate_dataset_records(ds, status=RecordStatusEnum.cancelled)]
+            assert {r.id for _, _, r in records} == set(rec_ids)
+
+            records = [
+                x
+                async for x in client.iterate_dataset_records(
+                    ds, entry_names=["entry_1", "entry_2"], specification_names="spec_1"
+                )
+            ]
+            assert [(e, s) for e, s, _ in records] == [("entry_1", "spec_1"), ("entry_2", "spec_1")]
+
+    asyncio.run(_run())
+
+
+def test_async_client_download_file(snowflake: QCATestingSnowflake, tmp_path):
+    snowflake_client = snowflake.client()
+
+    async def _run():
+        async with AsyncPortalClient.from_client(snowflake_client) as client:
+            path = tmp_path / "info_async.json"
+            size, sha256 = await client.download_file("api/v1/information", str(path))
+
+            sync_path = tmp_path / "info_sync.json"
+            sync_size, sync_sha256 = snowflake_client.download_file("api/v1/information", str(sync_path))
+
+            assert size == sync_size == path.stat().st_size
+            assert sha256 == sync_sha256
+
+            with pytest.raises(RuntimeError, match=r"already exists"):
+                await client.download_file("api/v1/information", str(path))
+
+            size, _ = await client.download_file("api/v1/information", str(path), overwrite=True)
+            assert size == sync_size
+
+    asyncio.run(_run())
+
+
+def test_async_client_auth(secure_snowflake: QCATestingSnowflake):
+    async def _run():
+        async with AsyncPortalClient(
+            secure_snowflake.get_uri(), "admin_user", secure_snowflake.get_test_user_password("admin_user")
+        ) as client:
+            [r async for r in client.query_records()]
+
+            # Force a refresh of the access token
+            client.client._jwt_access_exp = 1
+            [r async for r in client.query_records()]
+            assert client.client._jwt_access_exp > 1
+
+            # Force logging in again
+            client.client._jwt_access_exp = 1
+            client.client._jwt_refresh_exp = 1
+            [r async for r in client.query_records()]
+            assert client.client._jwt_refresh_exp > 1
+
+            # Logging in again with a bad password
+            client.client._password = "not_the_password"
+            client.client._jwt_access_exp = 1
+            client.client._jwt_refresh_exp = 1
+            with pytest.raises(AuthenticationFailure):
+                [r async for r in client.query_records()]
+
+    asyncio.run(_run())
@@ -288,3 +288,40 @@ def test_dataset_client_copy_from_incompatible(snowflake_client: PortalClient):
 
     with pytest.raises(PortalRequestError, match="does not match destination type"):
         ds_2.copy_records_from(ds_1.id)
+
+
+@pytest.mark.parametrize("prefetch", [0, 1, 3])
+def test_dataset_client_iterate_records_prefetch(snowflake: QCATestingSnowflake, prefetch: int):
+    snowflake_client = snowflake.client()
+
+    ds: SinglepointDataset = snowflake_client.add_dataset("singlepoint", "Test dataset")
+
+    input_spec, _, _ = load_procedure_data("sp_psi4_peroxide_energy_wfn")
+    ds.add_specification("spec_1", input_spec)
+    ds.add_specification("spec_2", input_spec.model_copy(update={"basis": "def2-tzvp"}))
+
+    for i in range(35):
+        ds.add_entry(name=f"entry_{i}", molecule=Molecule(symbols=["h", "h"], geometry=[0, 0, 0, 0, 0, 1.0 + i / 10]))
+    ds.submit()
+
+    # Small limit so that records are fetched in many batches
+    snowflake_client.api_limits["get_records"] = 10
+    ds = snowflake_client.get_dataset_by_id(ds.id)
+
+    all_records = list(ds.iterate_records(prefetch=prefetch))
+    assert len(all_records) == 70
+    assert [(e, s) for e, s, _ in all_records] == [(e, s) for s in ds.specification_names for e in ds.entry_names]
+    assert all(r.id == ds.get_record(e, s).id for e, s, r in all_records)
+
+    # Records were stored in the cache
+    assert len(ds._cache_data.get_dataset_records(ds.entry_names, ds.specification_names)) == 70
+
+    # Stopping early
+    it = ds.iterate_records(prefetch=prefetch)
+    first_records = [next(it) for _ in range(5)]
+    it.close()
+    assert [r.id for _, _, r in first_records] == [r.id for _, _, r in all_records[:5]]
+
+    # Same records when (re)fetching everything from the server
+    all_records_2 = list(ds.iterate_records(force_refetch=True, prefetch=prefetch))
+    assert [(e, s, r.id) for e, s, r in all_records_2] == [(e, s, r.id) for e, s, r in all_records]
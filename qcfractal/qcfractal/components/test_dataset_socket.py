@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+from datetime import timedelta
 from typing import TYPE_CHECKING, Optional
 
 import pytest
 
-from qcportal.record_models import PriorityEnum
+from qcfractal.components.dataset_processing import create_properties_file, create_view_file
+from qcfractal.components.record_db_models import BaseRecordORM
+from qcfractal.components.singlepoint.testing_helpers import load_procedure_data, run_procedure_data
+from qcportal import load_dataset_view
+from qcportal.cache import DatasetCache
+from qcportal.molecules import Molecule
+from qcportal.record_models import PriorityEnum, RecordStatusEnum
 
 if TYPE_CHECKING:
+    from qcportal.singlepoint import SinglepointDataset
     from qcarchivetesting.testing_classes import QCATestingSnowflake
 
 
@@ -90,3 +98,223 @@ def test_dataset_socket_submit_defaults(
     assert tag == "different_tag"
     assert priority == PriorityEnum.normal
     assert user_id == default_user_id
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_dataset_socket_create_properties_file(snowflake: QCATestingSnowflake, tmp_path, file_format: str):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    snowflake_client = snowflake.client()
+    storage_socket = snowflake.get_storage_socket()
+
+    ds: SinglepointDataset = snowflake_client.add_dataset("singlepoint", "Test dataset")
+    input_spec, molecule, _ = load_procedure_data("sp_psi4_peroxide_energy_wfn")
+
+    ds.add_specification("spec_1", input_spec)
+    ds.add_entry(name="test_molecule", molecule=molecule)
+    ds.add_entry(name="test_molecule_2", molecule=Molecule(symbols=["b"], geometry=[0, 0, 0]))
+    ds.submit()
+
+    rec_1 = ds.get_record("test_molecule", "spec_1")
+    rec_2 = ds.get_record("test_molecule_2", "spec_1")
+
+    with storage_socket.session_scope() as session:
+        r1 = session.get(BaseRecordORM, rec_1.id)
+        r1.properties = {"energy": -1.5, "method": "b3lyp", "converged": True, "gradient": [1.0, 2.0], "mixed": 1}
+        r1.status = RecordStatusEnum.complete
+        r2 = session.get(BaseRecordORM, rec_2.id)
+        r2.properties = {"energy": 2, "method": None, "mixed": "a"}
+
+    file_path = str(tmp_path / f"props.{file_format}")
+    properties = ["energy", "method", "converged", "gradient", "mixed", "missing"]
+
+    with storage_socket.session_scope() as session:
+        create_properties_file(
+            session, storage_socket, ds.id, "singlepoint", file_path, properties, file_format=file_format
+        )
+
+    if file_format == "parquet":
+        table = pq.read_table(file_path)
+    else:
+        table = pa.ipc.open_file(file_path).read_all()
+
+    assert table.schema.metadata[b"dataset_id"] == str(ds.id).encode()
+    assert table.schema.field("energy").type == pa.float64()
+    assert table.schema.field("method").type == pa.string()
+    assert table.schema.field("converged").type == pa.bool_()
+    assert table.schema.field("gradient").metadata == {b"encoding": b"json"}
+    assert table.schema.field("mixed").metadata == {b"encoding": b"json"}
+    assert table.schema.field("missing").type == pa.null()
+
+    assert table.to_pylist() == [
+        {
+            "entry_name": "test_molecule",
+            "specification_name": "spec_1",
+            "record_id": rec_1.id,
+            "status": "complete",
+            "energy": -1.5,
+            "method": "b3lyp",
+            "converged": True,
+            "gradient": "[1.0, 2.0]",
+            "mixed": "1",
+            "missing": None,
+        },
+        {
+            "entry_name": "test_molecule_2",
+            "specification_name": "spec_1",
+            "record_id": rec_2.id,
+            "status": "waiting",
+            "energy": 2.0,
+            "method": None,
+            "converged": None,
+            "gradient": None,
+            "mixed": '"a"',
+            "missing": None,
+        },
+    ]
+
+    # Only some statuses
+    file_path = str(tmp_path / f"props_complete.{file_format}")
+    with storage_socket.session_scope() as session:
+        create_properties_file(
+            session,
+            storage_socket,
+            ds.id,
+            "singlepoint",
+            file_path,
+            ["energy"],
+            status=[RecordStatusEnum.complete],
+            file_format=file_format,
+            row_group_size=1,
+        )
+
+    if file_format == "parquet":
+        table = pq.read_table(file_path)
+    else:
+        table = pa.ipc.open_file(file_path).read_all()
+
+    assert table.column("record_id").to_pylist() == [rec_1.id]
+
+
+def test_dataset_socket_create_view_file(snowflake: QCATestingSnowflake, tmp_path, monkeypatch):
+    snowflake_client = snowflake.client()
+    storage_socket = snowflake.get_storage_socket()
+    manager_name, _ = snowflake.activate_manager()
+
+    ds: SinglepointDataset = snowflake_client.add_dataset("singlepoint", "Test dataset")
+
+    input_spec, molecule, _ = load_procedure_data("sp_psi4_peroxide_energy_wfn")
+    run_procedure_data(storage_socket, manager_name, "sp_psi4_peroxide_energy_wfn")
+
+    ds.add_specification("spec_1", input_spec)
+    ds.add_entry(name="test_molecule", molecule=molecule)
+    ds.add_entry(name="test_molecule_2", molecule=Molecule(symbols=["b"], geometry=[0, 0, 0]))
+    ds.add_entry(name="test_molecule_3", molecule=Molecule(symbols=["c"], geometry=[0, 0, 0]))
+    ds.submit()
+
+    def _check_view(view_path):
+        ds_view = load_dataset_view(view_path)
+        assert set(ds_view.entry_names) == set(ds.entry_names)
+        assert ds_view.specification_names == ds.specification_names
+
+        records = list(ds.iterate_records())
+        assert set(ds_view._cache_data.get_records_modified_on()) == {r.id for _, _, r in records}
+
+        for entry_name, spec_name, record in records:
+            view_record = ds_view.get_record(entry_name, spec_name)
+            assert view_record.id == record.id
+            assert view_record.status == record.status
+            assert view_record.modified_on == record.modified_on
+            assert view_record.creator_user == record.creator_user
+            assert view_record.properties == record.properties
+            assert view_record.specification == record.specification
+
+    view_path = str(tmp_path / "view.sqlite")
+    with storage_socket.session_scope() as session:
+        create_view_file(session, storage_socket, ds.id, "singlepoint", view_path, record_batch_size=1, n_workers=2)
+
+    _check_view(view_path)
+
+    with pytest.raises(RuntimeError, match="exists"):
+        with storage_socket.session_scope() as session:
+            create_view_file(session, storage_socket, ds.id, "singlepoint", view_path)
+
+    # Change the dataset, then refresh the view
+    rec_2 = ds.get_record("test_molecule_2", "spec_1")
+    snowflake_client.cancel_records([rec_2.id])
+    ds.delete_entries(["test_molecule_3"], delete_records=True)
+    ds.add_entry(name="test_molecule_4", molecule=Molecule(symbols=["n"], geometry=[0, 0, 0]))
+    ds.submit()
+    ds = snowflake_client.get_dataset_by_id(ds.id)
+
+    # Refreshing keeps the journal, since a crash would corrupt the existing file
+    bulk_write_calls = []
+    monkeypatch.setattr(DatasetCache, "set_bulk_write_mode", lambda self: bulk_write_calls.append(self))
+
+    with storage_socket.session_scope() as session:
+        create_view_file(session, storage_socket, ds.id, "singlepoint", view_path, refresh=True)
+
+    assert bulk_write_calls == []
+
+    _check_view(view_path)
+    assert load_dataset_view(view_path).get_record("test_molecule_2", "spec_1").status == RecordStatusEnum.cancelled
+
+
+def test_dataset_socket_fetch_record_changes(snowflake: QCATestingSnowflake):
+    snowflake_client = snowflake.client()
+    storage_socket = snowflake.get_storage_socket()
+
+    ds: SinglepointDataset = snowflake_client.add_dataset("singlepoint", "Test dataset")
+    input_spec, molecule, _ = load_procedure_data("sp_psi4_peroxide_energy_wfn")
+
+    ds.add_specification("spec_1", input_spec)
+    for i in range(5):
+        ds.add_entry(name=f"test_molecule_{i}", molecule=Molecule(symbols=["b"], geometry=[0, 0, i]))
+    ds.submit()
+
+    ds_socket = storage_socket.datasets.singlepoint
+    all_changes = ds_socket.fetch_record_changes(ds.id, None)
+    assert len(all_changes.changes) == 5
+    assert all_changes.changes == sorted(all_changes.changes, key=lambda x: (x[5], x[2]))
+
+    # Paging through
+    paged_changes = ds_socket.fetch_record_changes(ds.id, None, limit=2).changes
+    while True:
+        _, _, last_id, _, _, last_xid = paged_changes[-1]
+        page = ds_socket.fetch_record_changes(ds.id, None, (last_xid, last_id), limit=2).changes
+        if not page:
+            break
+        paged_changes.extend(page)
+
+    assert paged_changes == all_changes.changes
+
+    # Only changes since the last fetch
+    as_of = all_changes.as_of
+    assert ds_socket.fetch_record_changes(ds.id, as_of).changes == []
+
+    rec = ds.get_record("test_molecule_3", "spec_1")
+    snowflake_client.cancel_records([rec.id])
+
+    changes = ds_socket.fetch_record_changes(ds.id, as_of)
+    assert len(changes.changes) == 1
+    assert changes.changes[0][:4] == ("test_molecule_3", "spec_1", rec.id, RecordStatusEnum.cancelled)
+    assert changes.as_of > as_of
+
+    # A change that is committed long after it was made (and after the changes were fetched)
+    # is still returned the next time
+    rec = ds.get_record("test_molecule_4", "spec_1")
+    as_of = changes.as_of
+
+    with storage_socket.session_scope() as session:
+        rec_orm = session.get(BaseRecordORM, rec.id)
+        rec_orm.status = RecordStatusEnum.cancelled
+        rec_orm.modified_on = rec_orm.modified_on - timedelta(days=1)
+        session.flush()
+
+        # Not committed yet, so not visible
+        changes = ds_socket.fetch_record_changes(ds.id, as_of)
+        assert changes.changes == []
+
+    changes = ds_socket.fetch_record_changes(ds.id, changes.as_of)
+    assert [x[2] for x in changes.changes] == [rec.id]
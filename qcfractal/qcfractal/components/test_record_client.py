@@ -4,13 +4,19 @@ Tests the general record socket
 
 from __future__ import annotations
 
+import threading
+import time
+
+import psycopg2.extensions
 import pytest
+from sqlalchemy import update
 
 from qcarchivetesting.testing_classes import QCATestingSnowflake
 from qcfractal.components.optimization.testing_helpers import (
     run_procedure_data as run_opt_procedure_data,
     submit_procedure_data as submit_opt_procedure_data,
 )
+from qcfractal.components.reaction.testing_helpers import load_record_data as load_rxn_record_data
 from qcfractal.components.record_db_models import BaseRecordORM
 from qcfractal.components.singlepoint.testing_helpers import (
     run_procedure_data as run_sp_procedure_data,
@@ -19,8 +25,12 @@ from qcfractal.components.singlepoint.testing_helpers import (
 from qcfractal.components.testing_helpers import populate_records_status
 from qcfractal.components.torsiondrive.testing_helpers import submit_procedure_data as submit_td_procedure_data
 from qcportal import PortalRequestError
+from qcportal.cache import RecordCache, get_records_with_cache
 from qcportal.molecules import Molecule
+from qcportal.reaction import ReactionRecord
 from qcportal.record_models import PriorityEnum, RecordStatusEnum
+from qcportal.singlepoint import SinglepointDataset
+from qcportal.singlepoint.test_dataset_models import test_specs, test_entries
 from qcportal.utils import now_at_utc
 
 
@@ -321,3 +331,262 @@ def test_record_client_query_owner(secure_snowflake: QCATestingSnowflake):
     query_res = admin_client.query_records(creator_user=[submit_uid])
     query_res_l = list(query_res)
     assert len(query_res_l) == 2
+
+
+def test_record_client_watch(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    activated_manager_name, _ = snowflake.activate_manager()
+    snowflake_client = snowflake.client()
+
+    id1 = run_sp_procedure_data(storage_socket, activated_manager_name, "sp_psi4_benzene_energy_1")
+    id2, _ = submit_sp_procedure_data(storage_socket, "sp_psi4_water_energy")
+    id3, _ = submit_sp_procedure_data(storage_socket, "sp_psi4_peroxide_energy_wfn")
+
+    # Nothing known - returns everything (except missing records) without waiting
+    status = snowflake_client._watch_records([id1, id2, id3, 9999], None, {}, 0.0)
+    assert status == {id1: RecordStatusEnum.complete, id2: RecordStatusEnum.waiting, id3: RecordStatusEnum.waiting}
+
+    # Nothing changed - waits for the timeout and returns nothing
+    time_0 = time.time()
+    status = snowflake_client._watch_records([id2, id3], None, {id2: "waiting", id3: "waiting"}, 2.0)
+    assert status == {}
+    assert time.time() - time_0 >= 2.0
+
+    # Cancel the records while waiting. Cancelling them separately, so one at a time is finished
+    def _cancel_records():
+        time.sleep(1.0)
+        snowflake_client.cancel_records([id3])
+        time.sleep(1.0)
+        snowflake_client.cancel_records([id2])
+
+    th = threading.Thread(target=_cancel_records)
+    th.start()
+
+    try:
+        completed = list(snowflake_client.iterate_completed([id1, id2, id3], timeout=20.0))
+    finally:
+        th.join()
+
+    assert completed == [
+        (id1, RecordStatusEnum.complete),
+        (id3, RecordStatusEnum.cancelled),
+        (id2, RecordStatusEnum.cancelled),
+    ]
+
+    status = snowflake_client.wait_for_records([id1, id2, id3])
+    assert status == {id1: RecordStatusEnum.complete, id2: RecordStatusEnum.cancelled, id3: RecordStatusEnum.cancelled}
+
+
+def test_record_client_watch_notify_per_statement(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+
+    record_ids = [
+        submit_sp_procedure_data(storage_socket, name)[0]
+        for name in ["sp_psi4_water_energy", "sp_psi4_peroxide_energy_wfn", "sp_psi4_benzene_energy_1"]
+    ]
+
+    conn = storage_socket.engine.raw_connection()
+    conn.detach()
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    conn.cursor().execute("LISTEN record_status;")
+
+    def _update(**values):
+        with storage_socket.session_scope() as session:
+            session.execute(update(BaseRecordORM).where(BaseRecordORM.id.in_(record_ids)).values(**values))
+        time.sleep(0.5)
+        conn.poll()
+        payloads = [n.payload for n in conn.notifies]
+        conn.notifies.clear()
+        return payloads
+
+    try:
+        # A single notification for all the records changed by a statement
+        payloads = _update(status=RecordStatusEnum.cancelled)
+        assert len(payloads) == 1
+        assert sorted(int(x) for x in payloads[0].split(",")) == sorted(record_ids)
+
+        # Nothing if the status didn't change
+        assert _update(status=RecordStatusEnum.cancelled) == []
+        assert _update(modified_on=now_at_utc()) == []
+    finally:
+        conn.close()
+
+
+def test_record_client_watch_timeout(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    activated_manager_name, _ = snowflake.activate_manager()
+    snowflake_client = snowflake.client()
+
+    id1 = run_sp_procedure_data(storage_socket, activated_manager_name, "sp_psi4_benzene_energy_1")
+    id2, _ = submit_sp_procedure_data(storage_socket, "sp_psi4_water_energy")
+
+    status = snowflake_client.wait_for_records([id1, id2], timeout=1.0)
+    assert status == {id1: RecordStatusEnum.complete, id2: RecordStatusEnum.waiting}
+
+    completed = []
+    with pytest.raises(TimeoutError):
+        for x in snowflake_client.iterate_completed([id1, id2], timeout=1.0):
+            completed.append(x)
+
+    assert completed == [(id1, RecordStatusEnum.complete)]
+
+
+def test_record_client_watch_max_waiting(snowflake: QCATestingSnowflake, monkeypatch):
+    storage_socket = snowflake.get_storage_socket()
+    snowflake_client = snowflake.client()
+
+    id1, _ = submit_sp_procedure_data(storage_socket, "sp_psi4_water_energy")
+
+    # Another request is already waiting, so this one returns right away
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(storage_socket.records, "_watch_slots", slots)
+
+    time_0 = time.time()
+    status = storage_socket.records.watch([id1], None, {id1: RecordStatusEnum.waiting}, 5.0)
+    assert status == {}
+    assert time.time() - time_0 < 2.0
+
+    # Changes are still returned
+    status = storage_socket.records.watch([id1], None, {}, 5.0)
+    assert status == {id1: RecordStatusEnum.waiting}
+
+    # The listener keeps a database connection open
+    storage_socket.records._status_listener.stop()
+
+    # The client doesn't poll in a tight loop, and backs off
+    # (the server always returns without waiting here)
+    request_times = []
+    original_watch = snowflake_client._watch_records
+
+    def _watch_records(record_ids, dataset_id, known_status, timeout, *args):
+        request_times.append(time.time())
+        return original_watch(record_ids, dataset_id, known_status, 0.0, *args)
+
+    monkeypatch.setattr(snowflake_client, "_watch_records", _watch_records)
+    status = snowflake_client.wait_for_records([id1], timeout=5.0)
+    assert status == {id1: RecordStatusEnum.waiting}
+    assert len(request_times) <= 5
+
+    # The first request is the initial status check. After that, the time between polls increases
+    # (the wait before the last one may be cut short by the timeout)
+    intervals = [t2 - t1 for t1, t2 in zip(request_times[1:], request_times[2:])]
+    assert len(intervals) >= 2
+    assert intervals[1] > intervals[0] * 1.5
+
+
+def test_record_client_watch_dataset(snowflake: QCATestingSnowflake, monkeypatch):
+    storage_socket = snowflake.get_storage_socket()
+    snowflake_client = snowflake.client()
+
+    ds: SinglepointDataset = snowflake_client.add_dataset("singlepoint", "Test dataset")
+    ds.add_specification("spec_1", test_specs[0])
+    ds.add_entries(test_entries)
+    ds.submit()
+
+    record_ids = sorted(r.id for _, _, r in ds.iterate_records())
+    assert len(record_ids) > 2
+
+    # Records of a dataset are paged by record id
+    status = storage_socket.records.watch(None, ds.id, {}, 0.0, dataset_limit=2)
+    assert list(status) == record_ids[:2]
+    status = storage_socket.records.watch(None, ds.id, {}, 0.0, dataset_cursor=record_ids[1], dataset_limit=2)
+    assert list(status) == record_ids[2:4]
+    storage_socket.records._status_listener.stop()
+
+    # The client fetches all the pages
+    snowflake_client.cancel_records(record_ids)
+    monkeypatch.setitem(snowflake_client.api_limits, "watch_records", 2)
+    status = snowflake_client.wait_for_records(dataset_id=ds.id, timeout=5.0)
+    assert status == {rid: RecordStatusEnum.cancelled for rid in record_ids}
+
+
+def test_record_client_fetch_descendants(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    activated_manager_name, _ = snowflake.activate_manager()
+    snowflake_client = snowflake.client()
+
+    sp_id = run_sp_procedure_data(storage_socket, activated_manager_name, "sp_psi4_benzene_energy_1")
+
+    # Full record with optimizations (with trajectories) and singlepoints
+    with storage_socket.session_scope() as session:
+        rxn_id = storage_socket.records.insert_full_qcportal_records(
+            session, [load_rxn_record_data("rxn_H2O_psi4_mp2_optsp")], None
+        )[0]
+        children_ids = storage_socket.records.get_children_ids(session, [rxn_id])
+
+    # Small limit so that the descendants are fetched in several batches
+    snowflake_client.api_limits["get_records"] = 10
+    assert len(children_ids) > 10
+
+    batches = list(snowflake_client._fetch_record_descendants("api/v1", [rxn_id, sp_id, rxn_id], include=["**"]))
+    assert len(batches) > 1
+
+    descendants = [r for batch in batches for r in batch]
+    assert [r.id for r in descendants] == sorted(children_ids)
+    assert {r.record_type for r in descendants} == {"optimization", "singlepoint"}
+
+    # Fields specific to each type are returned
+    assert all(r.trajectory_ids_ is not None for r in descendants if r.record_type == "optimization")
+
+    assert list(snowflake_client._fetch_record_descendants("api/v1", [sp_id])) == []
+
+
+def test_record_client_get_with_cache_descendants(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    snowflake_client = snowflake.client()
+
+    with storage_socket.session_scope() as session:
+        rxn_id = storage_socket.records.insert_full_qcportal_records(
+            session, [load_rxn_record_data("rxn_H2O_psi4_mp2_optsp")], None
+        )[0]
+        children_ids = storage_socket.records.get_children_ids(session, [rxn_id])
+
+    # Keep track of what is requested from the server
+    endpoints = []
+    make_request = snowflake_client.make_request
+
+    def _make_request(method, endpoint, *args, **kwargs):
+        endpoints.append(endpoint)
+        return make_request(method, endpoint, *args, **kwargs)
+
+    snowflake_client.make_request = _make_request
+
+    record_cache = RecordCache(":memory:", read_only=False)
+
+    for force_fetch in (False, True):
+        endpoints.clear()
+        rxn = get_records_with_cache(
+            snowflake_client, "api/v1", record_cache, ReactionRecord, [rxn_id], ["**"], force_fetch
+        )[0]
+
+        # All the descendants were fetched at once, not level-by-level
+        assert "api/v1/records/descendants" in endpoints
+        assert not any("optimization" in x or "singlepoint" in x for x in endpoints)
+        assert len(record_cache.get_existing_records([rxn_id, *children_ids])) == len(children_ids) + 1
+
+        # The entire tree is available
+        rxn.propagate_client(None, None)
+        n_traj = 0
+        for component in rxn.components:
+            if component.optimization_record is not None:
+                opt = component.optimization_record
+                assert [x.id for x in opt.trajectory] == opt.trajectory_ids_
+                n_traj += len(opt.trajectory_ids_)
+        assert n_traj > 0
+
+    # Everything comes from the cache
+    endpoints.clear()
+    get_records_with_cache(snowflake_client, "api/v1", record_cache, ReactionRecord, [rxn_id], ["**"])
+    assert endpoints == []
+
+    # Compare with fetching level-by-level
+    rxn = get_records_with_cache(snowflake_client, "api/v1", record_cache, ReactionRecord, [rxn_id], ["**"])[0]
+    rxn_2 = snowflake_client.get_reactions(rxn_id, include=["**"])
+    for c1, c2 in zip(rxn.components, rxn_2.components):
+        assert c1.singlepoint_id == c2.singlepoint_id
+        assert c1.optimization_id == c2.optimization_id
+        if c1.optimization_record is not None:
+            assert [x.id for x in c1.optimization_record.trajectory] == [
+                x.id for x in c2.optimization_record.trajectory
+            ]
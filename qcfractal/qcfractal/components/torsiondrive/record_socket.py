@@ -7,14 +7,18 @@ import io
 import json
 import logging
 from typing import TYPE_CHECKING, Any
+
+import numpy as np
 import sqlalchemy.orm.attributes
 from pydantic import BaseModel, ConfigDict
 from sqlalchemy import select, func
 from sqlalchemy.dialects.postgresql import array_agg, aggregate_order_by
 from sqlalchemy.orm import lazyload, selectinload, joinedload, defer, undefer
 
+from qcfractal.components.molecules.db_models import MoleculeORM
 from qcfractal.components.optimization.record_db_models import (
     OptimizationSpecificationORM,
+    OptimizationRecordORM,
 )
 from qcfractal.components.services.db_models import ServiceQueueORM, ServiceDependencyORM
 from qcfractal.components.singlepoint.record_db_models import QCSpecificationORM
@@ -31,7 +35,7 @@ from qcportal.torsiondrive import (
     TorsiondriveMultiInput,
     TorsiondriveRecord,
 )
-from qcportal.utils import hash_dict, is_included, reshape_molecule
+from qcportal.utils import hash_dict, is_included
 from .record_db_models import (
     TorsiondriveSpecificationORM,
     TorsiondriveInitialMoleculeORM,
@@ -166,29 +170,28 @@ class TorsiondriveRecordSocket(BaseRecordSocket):
         # Load the state from the service_state column
         service_state = TorsiondriveServiceState(**service_orm.service_state)
 
-        # Sort by position
+        # Load all the optimizations (and their molecules) at once, sorted by position
         # Fully sorting by the key is not important since that ends up being a key in the dict
         # All that matters is that position 1 for a particular key comes before position 2, etc
-        complete_tasks = sorted(service_orm.dependencies, key=lambda x: x.extras["position"])
+        complete_tasks = self.load_service_dependencies(
+            session,
+            service_orm,
+            OptimizationRecordORM,
+            [
+                joinedload(OptimizationRecordORM.initial_molecule).load_only(MoleculeORM.geometry),
+                joinedload(OptimizationRecordORM.final_molecule).load_only(MoleculeORM.geometry),
+            ],
+        )
 
         # Populate task results needed by the torsiondrive package
         task_results = {}
-        for task in complete_tasks:
+        for task, opt_record in complete_tasks:
             td_api_key = task.extras["td_api_key"]
             task_results.setdefault(td_api_key, [])
 
-            # This is an ORM for an optimization
-            opt_record = task.record
-
-            # Lookup molecules
-            initial_id = opt_record.initial_molecule_id
-            final_id = opt_record.final_molecule_id
-            mol_ids = [initial_id, final_id]
-            mol_data = self.root_socket.molecules.get(molecule_id=mol_ids, include=["geometry"], session=session)
-
-            # Use plain lists rather than numpy arrays
-            initial_mol_geom = reshape_molecule(mol_data[0]["geometry"])
-            final_mol_geom = reshape_molecule(mol_data[1]["geometry"])
+            # Use plain lists rather than numpy arrays, since the torsiondrive state is stored in the service state
+            initial_mol_geom = np.asarray(opt_record.initial_molecule.geometry).reshape(-1, 3).tolist()
+            final_mol_geom = np.asarray(opt_record.final_molecule.geometry).reshape(-1, 3).tolist()
 
             task_results[td_api_key].append((initial_mol_geom, final_mol_geom, opt_record.energies[-1]))
 
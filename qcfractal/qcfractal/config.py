@@ -207,7 +207,22 @@ class APILimitConfig(QCFConfigBase):
     get_records: int = Field(1000, description="Number of calculation records that can be retrieved")
     add_records: int = Field(500, description="Number of calculation records that can be added")
 
+    watch_records: int = Field(10000, description="Number of records that can be watched at once")
+    watch_timeout: int = Field(
+        30, description="Maximum time (in seconds) a request watching records will wait for a status change"
+    )
+    watch_max_waiting: int | None = Field(
+        None,
+        description="Maximum number of requests (per API process) that may wait for records to change status at "
+        "once. Each waiting request ties up an API thread. Further requests return right away, without waiting. "
+        "If not given, this is three quarters of the API threads (api.num_threads_per_worker)",
+        ge=0,
+    )
+
     get_dataset_entries: int = Field(2000, description="Number of dataset entries that can be retrieved")
+    get_dataset_record_changes: int = Field(
+        10000, description="Number of dataset record changes that can be retrieved at once"
+    )
 
     get_molecules: int = Field(1000, description="Number of molecules that can be retrieved")
     add_molecules: int = Field(1000, description="Number of molecules that can be added")
@@ -265,6 +280,18 @@ class WebAPIConfig(QCFConfigBase):
     user_session_cookie_httponly: bool = Field(
         False, description="Use Secure flag for the user-session cookie (for browser-based sessions)"
     )
+    user_session_access_interval: int = Field(
+        60,
+        description="Minimum time (in seconds) between writes of the last-accessed time of a user session "
+        "(for browser-based sessions). User sessions are also cached for this long in each API process",
+        ge=0,
+    )
+    user_cache_size: int = Field(
+        1024,
+        description="Number of users and user sessions to cache in each API process. Changes to users and "
+        "sessions are broadcast through the database. 0 disables caching",
+        ge=0,
+    )
 
     extra_flask_options: dict[str, Any] | None = Field(
         None, description="Any additional options to pass directly to flask"
@@ -277,6 +304,7 @@ class WebAPIConfig(QCFConfigBase):
         "jwt_access_token_expires",
         "jwt_refresh_token_expires",
         "user_session_max_age",
+        "user_session_access_interval",
         mode="before",
     )
     @classmethod
@@ -379,6 +407,13 @@ class FractalConfig(BaseSettings):
 
     # Periodics
     service_frequency: int = Field(60, description="The frequency at which to update services (in seconds)")
+    service_sweep_frequency: int = Field(
+        600,
+        description="The frequency (in seconds) at which to check all running services for finished dependencies, "
+        "and to compact the outputs of services that are no longer running. Services are normally iterated as soon "
+        "as their dependencies finish (and compacted when they finish), so this is only a fallback",
+        gt=0,
+    )
     max_active_services: int = Field(20, description="The maximum number of concurrent active services")
     heartbeat_frequency: int = Field(
         1800,
@@ -394,11 +429,39 @@ class FractalConfig(BaseSettings):
         ge=0,
     )
 
+    task_materializer_depth: int = Field(
+        0,
+        description="Number of the highest-priority waiting tasks to have their function and arguments generated ahead of time "
+        "(by an internal job), rather than when they are claimed by a manager. 0 disables this",
+        ge=0,
+    )
+    task_materializer_frequency: int = Field(
+        30, description="The frequency at which to generate functions and arguments of waiting tasks (in seconds)", gt=0
+    )
+
+    compression_dictionaries: list[str] = Field(
+        [],
+        description="Paths to trained zstd dictionaries that compute managers may use to compress results. "
+        "If relative, they are relative to the base folder",
+    )
+
     # Access logging
     log_access: bool = Field(False, description="Store API access in the database")
     access_log_keep: int = Field(
         0, description="How far back to keep access logs (in days or as a duration string). 0 means keep all"
     )
+    access_log_buffer_size: int = Field(
+        10000,
+        description="Maximum number of access log entries held in memory while waiting to be written to the database. "
+        "If the buffer is full, new entries are dropped",
+        gt=0,
+    )
+    access_log_flush_interval: float = Field(
+        5.0,
+        description="How often (in seconds) buffered access log entries are written to the database. "
+        "If 0, entries are written to the database during each request",
+        ge=0,
+    )
 
     # maxmind_account_id: int | None = Field(None, description="Account ID for MaxMind GeoIP2 service")
     maxmind_license_key: str | None = Field(
@@ -422,6 +485,28 @@ class FractalConfig(BaseSettings):
     internal_job_keep: int = Field(
         0, description="How far back to keep finished internal jobs (in days or as a duration string). 0 means keep all"
     )
+    internal_job_threads: int = Field(
+        1,
+        description="Number of jobs each internal job process runs at once (on a thread pool). Each running job uses "
+        "its own database connection, so the database pool_size should be larger than this value",
+        ge=1,
+    )
+    internal_job_priority_threads: int = Field(
+        0,
+        description="Number of the threads of each internal job process reserved for running jobs with priority "
+        "functions (see internal_job_priority_functions). Must be less than internal_job_threads",
+        ge=0,
+    )
+    internal_job_priority_functions: list[str] = Field(
+        ["services.iterate_services", "services._iterate_service", "services.check_dependencies"],
+        description="Functions of internal jobs that may run on the reserved priority threads. If "
+        "internal_job_threads is greater than one, these are also run before any other waiting jobs",
+    )
+    internal_job_concurrency_limits: dict[str, int] = Field(
+        {},
+        description="Maximum number of jobs with a given function (for example, datasets.create_view_attachment) "
+        "that may be running at once, across all internal job processes",
+    )
 
     # Homepage settings
     homepage_redirect_url: str | None = Field(None, description="Redirect to this URL when going to the root path")
@@ -452,7 +537,13 @@ class FractalConfig(BaseSettings):
             raise ValidationError(f"{v} is not a valid loglevel. Must be DEBUG, INFO, WARNING, ERROR, or CRITICAL")
         return v
 
-    @field_validator("service_frequency", "heartbeat_frequency", mode="before")
+    @field_validator(
+        "service_frequency",
+        "service_sweep_frequency",
+        "heartbeat_frequency",
+        "task_materializer_frequency",
+        mode="before",
+    )
     @classmethod
     def _convert_durations(cls, v):
         return duration_to_seconds(v)
@@ -486,6 +577,9 @@ class FractalConfig(BaseSettings):
         self.upload_directory = _make_abs_path(self.upload_directory, self.base_folder, None)
         self.logfile = _make_abs_path(self.logfile, self.base_folder, None)
         self.geoip2_dir = _make_abs_path(self.geoip2_dir, self.base_folder, "geoip2")
+        self.compression_dictionaries = [
+            _make_abs_path(x, self.base_folder, None) for x in self.compression_dictionaries
+        ]
 
         if self.temporary_dir is None:
             self.temporary_dir = tempfile.gettempdir()
@@ -496,6 +590,21 @@ class FractalConfig(BaseSettings):
         os.makedirs(self.temporary_dir, exist_ok=True)
         return self
 
+    @model_validator(mode="after")
+    def _check_watch_max_waiting(self):
+        # Leave some API threads free for other requests
+        if self.api_limits.watch_max_waiting is None:
+            self.api_limits.watch_max_waiting = (self.api.num_threads_per_worker * 3) // 4
+        return self
+
+    @model_validator(mode="after")
+    def _check_internal_job_threads(self):
+        if self.internal_job_priority_threads >= self.internal_job_threads:
+            raise ValueError("internal_job_priority_threads must be less than internal_job_threads")
+        if any(x < 1 for x in self.internal_job_concurrency_limits.values()):
+            raise ValueError("internal_job_concurrency_limits must be at least 1")
+        return self
+
     model_config = SettingsConfigDict(
         extra="forbid", case_sensitive=False, env_prefix="QCF_", env_nested_delimiter="__"
     )
@@ -4,6 +4,8 @@ Base declarative class for all ORM
 
 from __future__ import annotations
 
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import TYPE_CHECKING
 
 from sqlalchemy import inspect
@@ -15,6 +17,29 @@ if TYPE_CHECKING:
 
     _T = TypeVar("_T")
 
+# If True, model_dict may return numeric data as numpy arrays rather than lists
+_ndarray_model_dict: ContextVar[bool] = ContextVar("_ndarray_model_dict", default=False)
+
+
+@contextmanager
+def ndarray_model_dict():
+    """
+    Context manager within which model_dict may return numeric data (ie, molecule geometry) as numpy arrays
+
+    This is meant for data that is only being read and sent to a client that accepts raw arrays.
+    Other code may expect lists, so this should not be used more widely than needed.
+    """
+
+    token = _ndarray_model_dict.set(True)
+    try:
+        yield
+    finally:
+        _ndarray_model_dict.reset(token)
+
+
+def ndarray_model_dict_enabled() -> bool:
+    return _ndarray_model_dict.get()
+
 
 @as_declarative()
 class BaseORM:
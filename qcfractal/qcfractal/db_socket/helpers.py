@@ -1,10 +1,11 @@
 from __future__ import annotations
 
 import dataclasses
+import json
 import logging
 from typing import TYPE_CHECKING
 
-from sqlalchemy import tuple_, and_, or_, func, select, inspect
+from sqlalchemy import tuple_, and_, or_, func, select, inspect, text, Integer, JSON, TypeDecorator
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import load_only, lazyload, defer
@@ -32,6 +33,7 @@ if TYPE_CHECKING:
         Iterable,
         Optional,
         Set,
+        Callable,
     )
 
     _ORM_T = TypeVar("_ORM_T", bound=BaseORM)
@@ -487,6 +489,143 @@ def insert_mixed_general(
     return InsertMetadata(inserted_idx=inserted_idx, existing_idx=existing_idx, errors=errors), all_ret
 
 
+def insert_general_copy(
+    session: sqlalchemy.orm.session.Session,
+    table: Table,
+    data: Sequence[Dict[str, Any]],
+    search_col: InstrumentedAttribute,
+    returning: Sequence[InstrumentedAttribute],
+) -> Tuple[InsertMetadata, List[Tuple]]:
+    """
+    Insert many rows into a table using COPY, taking into account existing data
+
+    This is similar to insert_general with use_unique=True, but is meant for inserting large numbers of rows.
+    Rows are streamed into a temporary staging table with COPY, then moved into the table with a single
+    ``INSERT ... ON CONFLICT DO NOTHING``. Existing rows are then found by joining against the staging table.
+
+    The search column must have a unique constraint.
+
+    Unlike insert_general, the data is given as dictionaries of column values (as returned by
+    ``to_insert_dict``) rather than ORM objects. Missing columns are filled with their (scalar) default.
+
+    WARNING: This does not commit the additions to the database.
+
+    Parameters
+    ----------
+    session
+        An existing SQLAlchemy session to use for querying/adding/updating/deleting
+    table
+        The table to insert the data into
+    data
+        List of dictionaries of column values to be added to the database
+    search_col
+        Column to use to determine if data already exists in the database. Must have a unique constraint
+    returning
+        What columns to return. This is usually in the form of [TableORM.id, TableORM.col2, etc]
+
+    Returns
+    -------
+    :
+        Metadata showing what was added/updated, and a list of returned results. The results list
+        will contain tuples with whatever data was requested in the returning parameter. This will
+        be in the same order as the input data.
+    """
+
+    n_data = len(data)
+
+    # Return early if not given anything
+    if n_data == 0:
+        return InsertMetadata(), []
+
+    search_name = search_col.name
+    returning_names = [x.name for x in returning]
+
+    # Only copy the first of any duplicates in the input
+    # (map_duplicates is quadratic, so this is done here instead)
+    search_values_unique_map: Dict[Any, List[int]] = {}
+    for idx, d in enumerate(data):
+        search_values_unique_map.setdefault(d[search_name], []).append(idx)
+
+    # Columns to copy - any column that appears in the data
+    present_cols = set().union(*(d.keys() for d in data))
+    columns = [c for c in table.columns if c.name in present_cols]
+    col_names = ", ".join(c.name for c in columns)
+
+    # Convert values to what would be sent to the database (msgpack, json, etc)
+    dialect = session.get_bind().dialect
+    col_info = []
+    for c in columns:
+        default = c.default.arg if (c.default is not None and c.default.is_scalar) else None
+        col_info.append((c.name, default, _copy_converter(c.type, dialect)))
+
+    def _copy_lines():
+        for idxs in search_values_unique_map.values():
+            d = data[idxs[0]]
+            values = [str(idxs[0])]
+            for name, default, converter in col_info:
+                v = d.get(name, default)
+                if v is not None and converter is not None:
+                    v = converter(v)
+                values.append(_copy_text_value(v))
+            yield "\t".join(values) + "\n"
+
+    staging = f"_copy_staging_{table.name}"
+
+    session.flush()
+    session.execute(
+        text(f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {col_names} FROM {table.name} WITH NO DATA")
+    )
+    session.execute(text(f"ALTER TABLE {staging} ADD COLUMN _idx integer"))
+
+    # Some integer fields are floats in the models (ie, molecular multiplicity). These are kept as given
+    # in the staging table, and converted by the database when inserting (the same as with a plain INSERT)
+    for c in columns:
+        if isinstance(c.type, Integer):
+            session.execute(text(f"ALTER TABLE {staging} ALTER COLUMN {c.name} TYPE numeric"))
+
+    # Stream the rows in using the underlying psycopg2 connection
+    dbapi_conn = session.connection().connection.dbapi_connection
+    with dbapi_conn.cursor() as cursor:
+        cursor.copy_expert(f"COPY {staging} (_idx, {col_names}) FROM STDIN", _CopyStream(_copy_lines()), size=1048576)
+
+    # Insert in the order given, so ids increase in the same order as the input data
+    inserted = session.execute(
+        text(
+            f"INSERT INTO {table.name} ({col_names}) SELECT {col_names} FROM {staging} ORDER BY _idx "
+            f"ON CONFLICT ({search_name}) DO NOTHING RETURNING {search_name}"
+        )
+    ).all()
+
+    # Now we can get the requested data for all rows, whether they were just inserted or already existed
+    ret_cols = ", ".join(f"t.{x}" for x in returning_names)
+    all_rows = session.execute(
+        text(f"SELECT s._idx, {ret_cols} FROM {staging} s JOIN {table.name} t ON t.{search_name} = s.{search_name}")
+    ).all()
+
+    session.execute(text(f"DROP TABLE {staging}"))
+
+    inserted_values = set(x[0] for x in inserted)
+    inserted_idx: List[int] = []
+    existing_idx: List[int] = []
+    for v, idxs in search_values_unique_map.items():
+        if v in inserted_values:
+            inserted_idx.append(idxs[0])
+            existing_idx.extend(idxs[1:])
+        else:
+            existing_idx.extend(idxs)
+
+    # Map the results from the first of any duplicates to all of them
+    ret: List[Optional[Tuple]] = [None] * n_data
+    for row in all_rows:
+        for idx in search_values_unique_map[data[row[0]][search_name]]:
+            ret[idx] = tuple(row[1:])
+
+    if any(x is None for x in ret):
+        raise RuntimeError(f"Could not find all rows after inserting into {table.name}")
+
+    return InsertMetadata(inserted_idx=sorted(inserted_idx), existing_idx=sorted(existing_idx)), ret
+
+
 def get_general(
     session: sqlalchemy.orm.session.Session,
     orm_type: Type[_ORM_T],
@@ -641,6 +780,68 @@ def delete_general(
     return DeleteMetadata(deleted_idx=deleted_idx, errors=errors)
 
 
+# Escapes for the COPY text format
+_copy_escapes = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_converter(col_type: Any, dialect: Any) -> Optional[Callable[[Any], Any]]:
+    """
+    Returns a function that converts a python value to what is sent to the database for a column type
+
+    Returns None if no conversion is needed
+    """
+
+    if isinstance(col_type, TypeDecorator):
+        return lambda v: col_type.process_bind_param(v, dialect)
+    if isinstance(col_type, JSON):
+        return json.dumps
+    return None
+
+
+def _copy_text_value(value: Any) -> str:
+    """
+    Formats a (bound) value for use with the text format of COPY
+    """
+
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea in hex format. The backslash must be escaped for COPY
+        return "\\\\x" + bytes(value).hex()
+    return str(value).translate(_copy_escapes)
+
+
+class _CopyStream:
+    """
+    A minimal file-like object that reads lines from an iterable, for streaming data to COPY
+    """
+
+    def __init__(self, lines: Iterable[str]):
+        self._lines = iter(lines)
+        self._leftover = ""
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self._leftover]
+        n = len(self._leftover)
+
+        while size < 0 or n < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            chunks.append(line)
+            n += len(line)
+
+        data = "".join(chunks)
+        if size < 0:
+            self._leftover = ""
+            return data
+
+        self._leftover = data[size:]
+        return data[:size]
+
+
 def _insert_general_batch(
     session: sqlalchemy.orm.session.Session,
     data: Sequence[_ORM_T],
@@ -9,6 +9,7 @@ from werkzeug.exceptions import BadRequest
 
 from qcfractal.components.auth import AuthorizedEnum
 from qcfractal.db_socket import SQLAlchemySocket
+from qcfractal.db_socket.base_orm import ndarray_model_dict
 from qcfractal.flask_app import storage_socket
 from qcportal.exceptions import AuthorizationFailure
 from qcportal.serialization import deserialize, serialize
@@ -270,6 +271,7 @@ def handle_session(
 
 
 def serialization(
+    ndarray_results: bool = False,
 ) -> Callable:
     """
     Route decorator that deserializes request data and serializes return values.
@@ -289,8 +291,13 @@ def serialization(
     Request body is decoded from the request ``Content-Type``.
     Response format is chosen from ``Accept`` best match among:
     - ``application/msgpack``
+    - ``application/msgpack-ndarray`` (msgpack, with numpy arrays sent as raw data)
     - ``application/json`` (default and browser fallback)
 
+    If ``ndarray_results`` is True and the response is ``application/msgpack-ndarray``, then
+    numeric molecule data (ie, geometry) is converted to numpy arrays and sent to the client as
+    raw data. This should only be used on routes that only read data.
+
     Return handling
     ---------------
     - If the route returns a Flask ``Response``, it is passed through unchanged.
@@ -314,7 +321,7 @@ def serialization(
             # Find an appropriate return type (from the "Accept" header)
             # Flask helpfully parses this for us
             # By default, use plain json
-            possible_types = ["text/html", "application/msgpack", "application/json"]
+            possible_types = ["text/html", "application/msgpack", "application/msgpack-ndarray", "application/json"]
             accept_type = request.accept_mimetypes.best_match(possible_types, "application/json")
 
             # If text/html is first, then this is probably a browser. Send json, as most browsers
@@ -357,7 +364,11 @@ def serialization(
                 except Exception as e:
                     raise BadRequest("Invalid request arguments: " + str(e))
 
-            ret = fn(*args, **kwargs)
+            if ndarray_results and accept_type == "application/msgpack-ndarray":
+                with ndarray_model_dict():
+                    ret = fn(*args, **kwargs)
+            else:
+                ret = fn(*args, **kwargs)
 
             # Serialize the output if it's not a normal flask response
             if isinstance(ret, Response):
@@ -7,12 +7,6 @@ from werkzeug.exceptions import InternalServerError
 
 from qcfractal.flask_app import storage_socket
 from qcportal.exceptions import AuthorizationFailure, AuthenticationFailure
-from qcportal.utils import time_based_cache
-
-
-@time_based_cache(seconds=3, maxsize=256)
-def _cached_verify(user_id: int):
-    return storage_socket.auth.verify(user_id=user_id)
 
 
 def load_logged_in_user():
@@ -31,7 +25,8 @@ def load_logged_in_user():
         if session and "user_id" in session:
             user_id = int(session["user_id"])  # may be a string? Just to make sure
 
-            user_info = _cached_verify(user_id=user_id)
+            # User info is cached by the auth socket
+            user_info = storage_socket.auth.verify(user_id=user_id)
             username = user_info.username
             role = user_info.role
             groups = user_info.groups
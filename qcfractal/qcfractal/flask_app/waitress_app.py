@@ -26,10 +26,16 @@ class FractalWaitressApp:
         if waitress_opts is None:
             waitress_opts = {}
 
-        serve(
-            self.application,
-            host=self.qcfractal_config.api.host,
-            port=self.qcfractal_config.api.port,
-            threads=self.qcfractal_config.api.num_threads_per_worker,
-            **waitress_opts,
-        )
+        try:
+            serve(
+                self.application,
+                host=self.qcfractal_config.api.host,
+                port=self.qcfractal_config.api.port,
+                threads=self.qcfractal_config.api.num_threads_per_worker,
+                **waitress_opts,
+            )
+        finally:
+            # Write out any buffered access log entries, and stop listening for record/user changes
+            self.application.extensions["storage_socket"].serverinfo.stop_access_log()
+            self.application.extensions["storage_socket"].records.stop_status_listener()
+            self.application.extensions["storage_socket"].auth.stop_cache_listener()
@@ -79,7 +79,8 @@ class QCFAPIThread:
     ):
         self._qcf_config = qcf_config
         self._flask_app = create_flask_app(qcf_config, finished_queue=finished_queue)
-        self._server = make_server(self._qcf_config.api.host, self._qcf_config.api.port, self._flask_app)
+        # Threaded, so that requests waiting on records (see records/watch) don't block other requests
+        self._server = make_server(self._qcf_config.api.host, self._qcf_config.api.port, self._flask_app, threaded=True)
         self._api_thread = None
         self._finalizer = None
 
@@ -119,6 +120,20 @@ class QCFAPIThread:
 
         self._api_thread = None
 
+        # Write out any buffered access log entries, and stop listening for record changes
+        self._flask_app.extensions["storage_socket"].serverinfo.stop_access_log()
+        self.stop_status_listener()
+
+    def stop_status_listener(self) -> None:
+        """
+        Stops listening for changes to record status and users, closing the database connections used for that
+
+        This also clears the cache of users and sessions. The listeners will be started again if needed.
+        """
+
+        self._flask_app.extensions["storage_socket"].records.stop_status_listener()
+        self._flask_app.extensions["storage_socket"].auth.stop_cache_listener()
+
     def is_alive(self) -> bool:
         if self._api_thread is None:
             return False
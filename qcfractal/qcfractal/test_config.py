@@ -80,3 +80,16 @@ def test_config_tmpdir_create(tmp_path):
 
     assert cfg.temporary_dir == str(tmp_path / "qcatmpdir")
     assert os.path.exists(cfg.temporary_dir)
+
+
+def test_config_watch_max_waiting(tmp_path):
+    base_folder = str(tmp_path)
+
+    base_config = copy.deepcopy(_base_config)
+    base_config["api"]["num_threads_per_worker"] = 16
+    cfg = FractalConfig(base_folder=base_folder, **base_config)
+    assert cfg.api_limits.watch_max_waiting == 12
+
+    base_config["api_limits"] = {"watch_max_waiting": 3}
+    cfg = FractalConfig(base_folder=base_folder, **base_config)
+    assert cfg.api_limits.watch_max_waiting == 3
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import logging
-from typing import Dict, Any, Tuple, Callable
+from typing import Dict, Any, Tuple, Callable, Optional
 
 from sqlalchemy import select
 
@@ -28,15 +28,20 @@ class DummyJobProgress:
     def __init__(self):
         self._runner_uuid = "1234-5678-9101-1213"
 
-    def update_progress(self, progress: int):
+    def update_progress(self, progress: int, description: Optional[str] = None):
         pass
 
+    @property
     def cancelled(self) -> bool:
         return False
 
+    @property
     def deleted(self) -> bool:
         return False
 
+    def raise_if_cancelled(self):
+        pass
+
 
 def run_service(
     storage_socket: SQLAlchemySocket,
@@ -1,17 +1,35 @@
 from __future__ import annotations
 
+import atexit
 import json
 import os
 import shutil
+import signal
 import subprocess
+import tempfile
+import threading
 import time
-from typing import Optional, Dict, Tuple, List
+from typing import TYPE_CHECKING, Optional, Dict, Tuple, List
 
 from qcfractalcompute.compress import compress_result
 from .models import AppTaskResult
 
+if TYPE_CHECKING:
+    from qcfractalcompute.config import ResultCompressionSettings
+
 _apptainer_cmd = None
 
+# Persistent workers, keyed by (thread id, command, working directory)
+# Parsl workers may be threads or processes, and each gets its own persistent worker
+_persistent_workers: Dict[Tuple[int, Tuple[str, ...], Optional[str]], PersistentWorker] = {}
+
+
+def _compress_app_result(ret: Dict, compression: Optional[ResultCompressionSettings]) -> bytes:
+    if compression is None:
+        return compress_result(ret)
+
+    return compress_result(ret, compression.level, compression.threads, compression.dictionary)
+
 
 def get_apptainer_cmd() -> str:
     global _apptainer_cmd
@@ -28,7 +46,12 @@ def get_apptainer_cmd() -> str:
     return _apptainer_cmd
 
 
-def run_apptainer(sif_path: str, command: List[str], volumes: List[Tuple[str, str]]) -> AppTaskResult:
+def run_apptainer(
+    sif_path: str,
+    command: List[str],
+    volumes: List[Tuple[str, str]],
+    compression: Optional[ResultCompressionSettings] = None,
+) -> AppTaskResult:
     cmd = [get_apptainer_cmd()]
 
     volumes_tmp = [f"{v[0]}:{v[1]}" for v in volumes]
@@ -53,12 +76,16 @@ def run_apptainer(sif_path: str, command: List[str], volumes: List[Tuple[str, st
     return AppTaskResult(
         success=ret["success"],
         walltime=time_1 - time_0,
-        result_compressed=compress_result(ret),
+        result_compressed=_compress_app_result(ret, compression),
     )
 
 
 def run_conda_subprocess(
-    conda_env_name: Optional[str], cmd: List[str], cwd: Optional[str], env: Dict[str, str]
+    conda_env_name: Optional[str],
+    cmd: List[str],
+    cwd: Optional[str],
+    env: Dict[str, str],
+    compression: Optional[ResultCompressionSettings] = None,
 ) -> AppTaskResult:
     if cwd:
         cwd = os.path.expandvars(cwd)
@@ -93,5 +120,229 @@ def run_conda_subprocess(
     return AppTaskResult(
         success=ret["success"],
         walltime=time_1 - time_0,
-        result_compressed=compress_result(ret),
+        result_compressed=_compress_app_result(ret, compression),
     )
+
+
+class PersistentWorker:
+    """
+    A long-lived subprocess that runs tasks sent to it over a pipe
+
+    This avoids the cost of starting a new interpreter (and importing qcengine, etc) for every task.
+    Each task is sent to the worker's stdin as a single line of json, and the result is read back as a single
+    line of json from its stdout. The worker exits when its stdin is closed.
+
+    If a task takes longer than task_timeout seconds, the worker (and anything it started) is killed.
+    """
+
+    def __init__(
+        self,
+        cmd: List[str],
+        cwd: Optional[str],
+        env: Dict[str, str],
+        max_tasks: int,
+        task_timeout: Optional[float] = None,
+    ):
+        self.cmd = cmd
+        self.max_tasks = max_tasks
+        self.task_timeout = task_timeout
+        self.n_tasks = 0
+        self._timed_out = False
+
+        # stderr goes to a file rather than a pipe, so that the worker can't block on writing to it.
+        # It is opened in append mode so it can be truncated between tasks
+        self._stderr = tempfile.TemporaryFile("a+")
+
+        self._proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr,
+            text=True,
+            cwd=cwd,
+            env=env,
+            start_new_session=True,
+        )
+
+    @property
+    def is_alive(self) -> bool:
+        return self._proc.poll() is None
+
+    @property
+    def is_exhausted(self) -> bool:
+        return self.n_tasks >= self.max_tasks
+
+    def _read_stderr(self) -> str:
+        self._stderr.seek(0)
+        return self._stderr.read()
+
+    def _kill(self) -> None:
+        # The worker may be a wrapper (conda run, apptainer) around the actual python process,
+        # so kill the whole process group
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _on_timeout(self) -> None:
+        self._timed_out = True
+        self._kill()
+
+    def run(self, payload: Dict, compression: Optional[ResultCompressionSettings] = None) -> AppTaskResult:
+        """
+        Runs a single task in the worker
+
+        If the worker dies or times out while running the task, a failed result is returned and the worker
+        should not be used again.
+        """
+
+        self.n_tasks += 1
+        self._stderr.truncate(0)
+
+        timer = None
+        if self.task_timeout is not None:
+            timer = threading.Timer(self.task_timeout, self._on_timeout)
+            timer.daemon = True
+
+        time_0 = time.time()
+        try:
+            self._proc.stdin.write(json.dumps(payload) + "\n")
+            self._proc.stdin.flush()
+            if timer is not None:
+                timer.start()
+            line = self._proc.stdout.readline()
+        except BrokenPipeError:
+            line = ""
+        finally:
+            if timer is not None:
+                timer.cancel()
+        time_1 = time.time()
+
+        if line:
+            ret = json.loads(line)
+        elif self._timed_out:
+            stderr = self._read_stderr()
+            self.close()
+
+            msg = (
+                f"Task did not complete within {self.task_timeout} seconds, and the persistent worker was killed\n"
+                f"command: {' '.join(self.cmd)}\n"
+                f"stderr: {stderr}"
+            )
+
+            ret = {"success": False, "error": {"error_type": "TimeoutError", "error_message": msg}}
+        else:
+            # Worker died. Don't leave it half-running
+            stderr = self._read_stderr()
+            self.close()
+
+            msg = (
+                f"Persistent worker died with error code {self._proc.returncode}\n"
+                f"command: {' '.join(self.cmd)}\n"
+                f"stderr: {stderr}"
+            )
+
+            ret = {"success": False, "error": {"error_type": "RuntimeError", "error_message": msg}}
+
+        return AppTaskResult(
+            success=ret["success"],
+            walltime=time_1 - time_0,
+            result_compressed=_compress_app_result(ret, compression),
+        )
+
+    def close(self) -> None:
+        if self.is_alive:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(timeout=10)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self._kill()
+                self._proc.wait()
+        else:
+            # Make sure nothing the worker started is left behind
+            self._kill()
+
+        self._stderr.close()
+
+
+def _close_persistent_workers():
+    for worker in _persistent_workers.values():
+        worker.close()
+    _persistent_workers.clear()
+
+
+atexit.register(_close_persistent_workers)
+
+
+def run_persistent_worker(
+    cmd: List[str],
+    cwd: Optional[str],
+    env: Dict[str, str],
+    max_tasks: int,
+    payload: Dict,
+    compression: Optional[ResultCompressionSettings] = None,
+    task_timeout: Optional[float] = None,
+) -> AppTaskResult:
+    """
+    Runs a task in a persistent worker started with the given command, starting a new worker if needed
+
+    Workers are recycled after running max_tasks tasks, or if they die or time out.
+    """
+
+    if cwd:
+        cwd = os.path.expandvars(cwd)
+
+    key = (threading.get_ident(), tuple(cmd), cwd)
+    worker = _persistent_workers.get(key)
+
+    if worker is None or not worker.is_alive or worker.is_exhausted:
+        if worker is not None:
+            worker.close()
+
+        sub_env = os.environ.copy()
+        sub_env.update(env)
+
+        worker = PersistentWorker(cmd, cwd, sub_env, max_tasks, task_timeout)
+        _persistent_workers[key] = worker
+
+    result = worker.run(payload, compression)
+
+    if not worker.is_alive:
+        del _persistent_workers[key]
+
+    return result
+
+
+def run_conda_persistent_worker(
+    conda_env_name: Optional[str],
+    cmd: List[str],
+    cwd: Optional[str],
+    env: Dict[str, str],
+    max_tasks: int,
+    payload: Dict,
+    compression: Optional[ResultCompressionSettings] = None,
+    task_timeout: Optional[float] = None,
+) -> AppTaskResult:
+    if conda_env_name:
+        # Without --no-capture-output, conda run would hold all output until the process exits
+        cmd = ["conda", "run", "--no-capture-output", "-n", conda_env_name] + cmd
+
+    return run_persistent_worker(cmd, cwd, env, max_tasks, payload, compression, task_timeout)
+
+
+def run_apptainer_persistent_worker(
+    sif_path: str,
+    command: List[str],
+    volumes: List[Tuple[str, str]],
+    max_tasks: int,
+    payload: Dict,
+    compression: Optional[ResultCompressionSettings] = None,
+    task_timeout: Optional[float] = None,
+) -> AppTaskResult:
+    cmd = [get_apptainer_cmd()]
+
+    volumes_tmp = [f"{v[0]}:{v[1]}" for v in volumes]
+    cmd.extend(["run", "--bind", ",".join(volumes_tmp), sif_path])
+    cmd.extend(command)
+
+    return run_persistent_worker(cmd, None, {}, max_tasks, payload, compression, task_timeout)
@@ -16,7 +16,7 @@ def qcengine_conda_app(
 ) -> AppTaskResult:
     import json
     from qcportal.compression import decompress, CompressionEnum
-    from qcfractalcompute.apps.helpers import run_conda_subprocess
+    from qcfractalcompute.apps.helpers import run_conda_subprocess, run_conda_persistent_worker
     from qcfractalcompute.run_scripts import get_script_path
 
     script_path = get_script_path("qcengine_compute.py")
@@ -38,12 +38,27 @@ def qcengine_conda_app(
     function_kwargs = decompress(function_kwargs_compressed, CompressionEnum.zstd)
     function_kwargs = {**function_kwargs, "task_config": qcengine_options}
 
+    if executor_config.persistent_workers:
+        cmd = ["python3", script_path, "--worker"]
+        return run_conda_persistent_worker(
+            conda_env_name,
+            cmd,
+            executor_config.scratch_directory,
+            {},
+            executor_config.persistent_worker_max_tasks,
+            function_kwargs,
+            executor_config.compression,
+            executor_config.persistent_worker_task_timeout,
+        )
+
     with tempfile.NamedTemporaryFile("w") as f:
         json.dump(function_kwargs, f)
         f.flush()
 
         cmd = ["python3", script_path, f.name]
-        return run_conda_subprocess(conda_env_name, cmd, executor_config.scratch_directory, {})
+        return run_conda_subprocess(
+            conda_env_name, cmd, executor_config.scratch_directory, {}, executor_config.compression
+        )
 
 
 def qcengine_apptainer_app(
@@ -54,7 +69,7 @@ def qcengine_apptainer_app(
 ) -> AppTaskResult:
     import json
     from qcportal.compression import decompress, CompressionEnum
-    from qcfractalcompute.apps.helpers import run_apptainer
+    from qcfractalcompute.apps.helpers import run_apptainer, run_apptainer_persistent_worker
     from qcfractalcompute.run_scripts import get_script_path
 
     script_path = get_script_path("qcengine_compute.py")
@@ -76,11 +91,27 @@ def qcengine_apptainer_app(
     function_kwargs = decompress(function_kwargs_compressed, CompressionEnum.zstd)
     function_kwargs = {**function_kwargs, "task_config": qcengine_options}
 
+    # The scratch directory is passed to qcengine, so it must exist inside the container
+    scratch_volumes = [(scratch_directory, scratch_directory)] if scratch_directory else []
+
+    if executor_config.persistent_workers:
+        volumes = [(script_path, "/qcengine_compute.py")] + scratch_volumes
+        cmd = ["python3", "/qcengine_compute.py", "--worker"]
+        return run_apptainer_persistent_worker(
+            sif_path,
+            cmd,
+            volumes,
+            executor_config.persistent_worker_max_tasks,
+            function_kwargs,
+            executor_config.compression,
+            executor_config.persistent_worker_task_timeout,
+        )
+
     with tempfile.NamedTemporaryFile("w") as f:
         json.dump(function_kwargs, f)
         f.flush()
 
-        volumes = [(script_path, "/qcengine_compute.py"), (f.name, "/input.json")]
+        volumes = [(script_path, "/qcengine_compute.py"), (f.name, "/input.json")] + scratch_volumes
         cmd = ["python3", "/qcengine_compute.py", "/input.json"]
 
-        return run_apptainer(sif_path, command=cmd, volumes=volumes)
+        return run_apptainer(sif_path, command=cmd, volumes=volumes, compression=executor_config.compression)
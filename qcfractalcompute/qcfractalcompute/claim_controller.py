@@ -0,0 +1,128 @@
+"""
+Determining how many tasks an executor should claim from the server
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from typing import Iterable, Optional
+
+
+class ClaimController:
+    """
+    Adaptively determines how many tasks an executor should have claimed (running + queued)
+
+    The target is enough tasks to fill all the workers, plus the number of tasks we expect to finish
+    before the manager gets another chance to claim tasks. The expected number of finished tasks
+    comes from the observed completion rate and walltimes of finished tasks. Short tasks result in a larger
+    target (so workers don't sit idle waiting for the next update), while long tasks result in a target
+    close to the number of workers (so tasks aren't hoarded when other managers could be running them).
+
+    The target is always kept between min_factor and max_factor times the number of workers. Until
+    some tasks have finished, the target is the maximum.
+    """
+
+    def __init__(self, max_workers: int, horizon: float, min_factor: float, max_factor: float, smoothing: float = 0.3):
+        """
+        Parameters
+        ----------
+        max_workers
+            Maximum number of tasks the executor can run at once
+        horizon
+            Expected time (in seconds) until the next opportunity to claim tasks
+        min_factor
+            Minimum target, as a multiple of max_workers
+        max_factor
+            Maximum target, as a multiple of max_workers
+        smoothing
+            Weight of new observations in the exponential moving averages (between 0 and 1)
+        """
+
+        self.max_workers = max_workers
+        self.horizon = horizon
+        self.min_tasks = max(1, math.ceil(min_factor * max_workers))
+        self.max_tasks = max(self.min_tasks, math.ceil(max_factor * max_workers))
+        self.smoothing = smoothing
+
+        # Exponential moving averages. None if we have not observed anything yet
+        self.mean_walltime: Optional[float] = None
+        self.completion_rate: Optional[float] = None
+
+        self._last_observed: Optional[float] = None
+
+    def _update_average(self, old: Optional[float], new: float) -> float:
+        if old is None:
+            return new
+        return self.smoothing * new + (1.0 - self.smoothing) * old
+
+    def observe(self, walltimes: Iterable[float], now: Optional[float] = None) -> None:
+        """
+        Records the tasks that finished since the last observation
+
+        This should be called every update, even if no tasks have finished.
+
+        Parameters
+        ----------
+        walltimes
+            Walltimes (in seconds) of the tasks that have finished since the last call
+        now
+            Current time. If None, the current time is used
+        """
+
+        if now is None:
+            now = time.time()
+
+        walltimes = list(walltimes)
+
+        # Failed tasks may have a walltime of zero (ie, lost workers). Those don't tell us anything
+        valid_walltimes = [w for w in walltimes if w > 0.0]
+        if valid_walltimes:
+            batch_mean = sum(valid_walltimes) / len(valid_walltimes)
+            self.mean_walltime = self._update_average(self.mean_walltime, batch_mean)
+
+        if self._last_observed is not None and now > self._last_observed:
+            rate = len(walltimes) / (now - self._last_observed)
+
+            # Don't start tracking the rate until something has actually finished
+            if self.completion_rate is not None or walltimes:
+                self.completion_rate = self._update_average(self.completion_rate, rate)
+
+        self._last_observed = now
+
+    @property
+    def expected_completions(self) -> Optional[float]:
+        """
+        Number of tasks expected to finish within the horizon, or None if there is no information yet
+        """
+
+        estimates = []
+        if self.mean_walltime is not None:
+            estimates.append(self.max_workers * self.horizon / self.mean_walltime)
+        if self.completion_rate is not None:
+            estimates.append(self.completion_rate * self.horizon)
+
+        if not estimates:
+            return None
+
+        return max(estimates)
+
+    @property
+    def target_tasks(self) -> int:
+        """
+        Total number of tasks (running + queued) the executor should have
+        """
+
+        expected = self.expected_completions
+        if expected is None:
+            return self.max_tasks
+
+        target = self.max_workers + math.ceil(expected)
+        return min(max(target, self.min_tasks), self.max_tasks)
+
+    def open_slots(self, n_active: int) -> int:
+        """
+        Number of tasks to claim, given the number of tasks the executor currently has
+        """
+
+        return max(0, self.target_tasks - n_active)
@@ -2,14 +2,33 @@
 Helpers for compressing data to send back to the server
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, List
 
+import msgpack
 import numpy
+import zstandard
 
-from qcportal.compression import CompressionEnum, compress
+from qcportal.compression import CompressionEnum, compress, load_zstd_dictionary
 
+# Outputs & native files larger than this are compressed using multiple threads (if enabled)
+_threaded_compression_min_size = 1048576
 
-def _compress_common(result: Dict[str, Any]):
+
+def _compress_field(data: Any, compression_level: Optional[int], n_threads: int) -> Tuple[bytes, CompressionEnum, int]:
+    """
+    Compresses a single output or native file
+
+    These are stored as-is in the database and decompressed by clients, so a dictionary is never used
+    """
+
+    # Only large data benefits from multiple threads (zstd splits the work into large chunks)
+    if n_threads != 0 and isinstance(data, (str, bytes)) and len(data) >= _threaded_compression_min_size:
+        return compress(data, CompressionEnum.zstd, compression_level, n_threads=n_threads)
+    else:
+        return compress(data, CompressionEnum.zstd, compression_level)
+
+
+def _compress_common(result: Dict[str, Any], compression_level: Optional[int] = None, n_threads: int = 0):
     """
     Compresses outputs of an AtomicResult or OptimizationResult, storing them in extras
     """
@@ -22,19 +41,19 @@ def _compress_common(result: Dict[str, Any]):
 
     if stdout is not None:
         result["extras"].setdefault("_qcfractal_compressed_outputs", {})
-        new_stdout, ctype, clevel = compress(stdout, CompressionEnum.zstd)
+        new_stdout, ctype, clevel = _compress_field(stdout, compression_level, n_threads)
         compressed_outputs["stdout"] = {"compression_type": ctype, "compression_level": clevel, "data": new_stdout}
         result["stdout"] = None
 
     if stderr is not None:
         result["extras"].setdefault("_qcfractal_compressed_outputs", {})
-        new_stderr, ctype, clevel = compress(stderr, CompressionEnum.zstd)
+        new_stderr, ctype, clevel = _compress_field(stderr, compression_level, n_threads)
         compressed_outputs["stderr"] = {"compression_type": ctype, "compression_level": clevel, "data": new_stderr}
         result["stderr"] = None
 
     if error is not None:
         result["extras"].setdefault("_qcfractal_compressed_outputs", {})
-        new_error, ctype, clevel = compress(error.model_dump(), CompressionEnum.zstd)
+        new_error, ctype, clevel = _compress_field(error.model_dump(), compression_level, n_threads)
         compressed_outputs["error"] = {"compression_type": ctype, "compression_level": clevel, "data": new_error}
         result["error"] = None
 
@@ -42,7 +61,7 @@ def _compress_common(result: Dict[str, Any]):
         result["extras"]["_qcfractal_compressed_outputs"] = compressed_outputs
 
 
-def _compress_native_files(result: Dict[str, Any]):
+def _compress_native_files(result: Dict[str, Any], compression_level: Optional[int] = None, n_threads: int = 0):
     """
     Compresses outputs and native files, storing them in extras
     """
@@ -53,14 +72,14 @@ def _compress_native_files(result: Dict[str, Any]):
 
     compressed_nf = {}
     for name, data in native_files.items():
-        nf, ctype, clevel = compress(data, CompressionEnum.zstd)
+        nf, ctype, clevel = _compress_field(data, compression_level, n_threads)
         compressed_nf[name] = {"compression_type": ctype, "compression_level": clevel, "data": nf}
 
     result["native_files"] = {}
     result["extras"]["_qcfractal_compressed_native_files"] = compressed_nf
 
 
-def _compress_optimizationresult(result: Dict[str, Any]):
+def _compress_optimizationresult(result: Dict[str, Any], compression_level: Optional[int] = None, n_threads: int = 0):
     """
     Compresses outputs inside an OptimizationResult, storing them in extras
 
@@ -70,10 +89,10 @@ def _compress_optimizationresult(result: Dict[str, Any]):
     # Handle the trajectory
     if result.get("trajectory", None):
         for x in result["trajectory"]:
-            _compress_common(x)
+            _compress_common(x, compression_level, n_threads)
 
     # Now handle the outputs of the optimization itself
-    _compress_common(result)
+    _compress_common(result, compression_level, n_threads)
 
 
 def _convert_numpy(obj):
@@ -90,31 +109,78 @@ def _convert_numpy(obj):
         return obj
 
 
-def compress_result(result: Dict[str, Any]) -> bytes:
+def _compress_fields(result: Dict[str, Any], compression_level: Optional[int], n_threads: int) -> Dict[str, Any]:
     """
-    Compress outputs and native files inside results, storing them in extras. Then compress the whole result
-
-    Outputs and native files are put into the database compressed, so no decompression is done
-    until someone requests them (and then decompression happens on the client)
-
-    The compressed outputs are stored in extras. For OptimizationResult, the outputs for the optimization
-    are stored in the extras field of the OptimizationResult, while the outputs for the trajectory
-    are stored in the extras field for the AtomicResults within the trajectory
+    Converts numpy arrays and compresses the outputs and native files of a result
     """
 
     result = _convert_numpy(result)
     schema_type = result.get("schema_name", None)
 
     if schema_type == "qcschema_output":
-        _compress_common(result)
-        _compress_native_files(result)
+        _compress_common(result, compression_level, n_threads)
+        _compress_native_files(result, compression_level, n_threads)
     elif schema_type == "qcschema_optimization_output":
-        _compress_optimizationresult(result)
+        _compress_optimizationresult(result, compression_level, n_threads)
     elif schema_type == "qca_generic_task_result":
-        _compress_common(result)
+        _compress_common(result, compression_level, n_threads)
     else:
         pass
 
+    return result
+
+
+def compress_result(
+    result: Dict[str, Any],
+    compression_level: Optional[int] = None,
+    n_threads: int = 0,
+    dictionary_path: Optional[str] = None,
+) -> bytes:
+    """
+    Compress outputs and native files inside results, storing them in extras. Then compress the whole result
+
+    Outputs and native files are put into the database compressed, so no decompression is done
+    until someone requests them (and then decompression happens on the client)
+
+    The compressed outputs are stored in extras. For OptimizationResult, the outputs for the optimization
+    are stored in the extras field of the OptimizationResult, while the outputs for the trajectory
+    are stored in the extras field for the AtomicResults within the trajectory
+
+    Parameters
+    ----------
+    result
+        The result (as a dictionary) to compress
+    compression_level
+        The zstd compression level. If None, a default is chosen based on the size of the data
+    n_threads
+        Number of threads to use for compressing large outputs and native files (0 = no extra threads,
+        -1 = number of cpus)
+    dictionary_path
+        Path to a trained zstd dictionary to use when compressing the whole result. The server
+        must have the same dictionary registered.
+    """
+
+    result = _compress_fields(result, compression_level, n_threads)
+
     # Compress the whole thing
-    r, _, _ = compress(result, CompressionEnum.zstd)
+    zstd_dict = load_zstd_dictionary(dictionary_path) if dictionary_path else None
+    r, _, _ = compress(result, CompressionEnum.zstd, compression_level, zstd_dict=zstd_dict)
     return r
+
+
+def train_result_dictionary(results: List[Dict[str, Any]], dict_size: int = 65536) -> bytes:
+    """
+    Trains a zstd dictionary for compressing whole results (see :func:`compress_result`)
+
+    The results should be representative of the results being computed. The outputs and native files
+    are compressed first, as they are in compress_result.
+
+    Returns
+    -------
+    :
+        The dictionary data, which can be written to a file
+    """
+
+    samples = [msgpack.packb(_compress_fields(r, None, 0), use_bin_type=True) for r in results]
+
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+import queue
 import sched
 import socket
 import threading
@@ -28,9 +29,11 @@ from qcportal.record_models import RecordTask
 from qcportal.utils import seconds_to_hms, apply_jitter
 from . import __version__
 from .apps.models import AppTaskResult
+from .claim_controller import ClaimController
 from .compress import compress_result
 from .config import FractalComputeConfig
 from .executors import build_executor
+from .outbox import ResultOutbox
 
 if TYPE_CHECKING:
     from parsl.executors.base import ParslExecutor
@@ -70,6 +73,10 @@ class ManagerStatistics(BaseModel):
     total_successful_tasks: int = 0
     total_failed_tasks: int = 0
     total_rejected_tasks: int = 0
+    total_resurrected_tasks: int = 0
+
+    # Number of tasks (running + queued) each executor is aiming for
+    claim_targets: Dict[str, int] = Field(default_factory=dict)
 
     @property
     def total_finished_tasks(self) -> int:
@@ -119,12 +126,35 @@ class ComputeManager:
         # key = number of retries. value = dict of (task_id, compressed result)
         self._deferred_tasks: Dict[int, Dict[int, AppTaskResult]] = defaultdict(dict)
 
+        # Finished results that have not been returned yet are also stored on disk (if enabled)
+        self._outbox = None
+        if config.outbox is not None:
+            self._outbox = ResultOutbox(config.outbox.path, config.outbox.max_results, config.outbox.max_age)
+
         # key = executor label, value = (key = task_id, value = parsl future)
         self._task_futures: Dict[str, Dict[int, ParslFuture]] = {exl: {} for exl in config.executors.keys()}
 
+        # Determines how many tasks to claim for each executor. Set up in start(), once
+        # the executors are created
+        self._claim_controllers: Dict[str, ClaimController] = {}
+
         # Mapping of task_id to record_id
         self._record_id_map: Dict[int, int] = {}
 
+        # Mapping of task_id to the name of the manager that claimed the task, for results
+        # loaded from the outbox of a previous manager
+        self._claimed_by: Dict[int, str] = {}
+
+        # For event-driven mode. Parsl callbacks put the time a task finished into the queue,
+        # and the sender thread sets the claim event after returning results. The lock
+        # protects the manager state from being updated from multiple threads at once
+        self._update_lock = threading.RLock()
+        self._finished_queue: queue.Queue = queue.Queue()
+        self._claim_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._last_claim_time = 0.0
+        self._event_threads: List[threading.Thread] = []
+
         self.all_compute_tags = []
         for ex_label, ex_config in config.executors.items():
             if len(ex_config.compute_tags) == 0:
@@ -162,6 +192,8 @@ class ComputeManager:
         self.logger.info("    Cluster:     {}".format(self.name_data.cluster))
         self.logger.info("    Hostname:    {}".format(self.name_data.hostname))
         self.logger.info("    UUID:        {}".format(self.name_data.uuid))
+        if self._outbox is not None:
+            self.logger.info("    Outbox:      {}".format(self._outbox.path))
 
         self.logger.info("\n")
 
@@ -258,6 +290,26 @@ class ComputeManager:
     def n_deferred_tasks(self) -> int:
         return sum(len(x) for x in self._deferred_tasks.values())
 
+    def _resurrect_outbox_tasks(self) -> None:
+        """
+        Loads results left in the outbox by a previous manager, so that they are returned on the next update
+        """
+
+        if self._outbox is None:
+            return
+
+        outbox_results = self._outbox.load()
+        if not outbox_results:
+            return
+
+        for task_id, (record_id, manager_name, app_result) in outbox_results.items():
+            self._record_id_map[task_id] = record_id
+            self._claimed_by[task_id] = manager_name
+            self._deferred_tasks[0][task_id] = app_result
+
+        self.statistics.total_resurrected_tasks += len(outbox_results)
+        self.logger.info(f"Loaded {len(outbox_results)} unreturned results from the outbox")
+
     def start(self, manual_updates: bool = False):
         """
         Starts the manager
@@ -280,6 +332,21 @@ class ComputeManager:
             ex = build_executor(ex_label, ex_config)
             self.dflow_kernel.add_executors([ex])
 
+        # Claim enough tasks to last until the next update (or heartbeat, in case the server
+        # is temporarily unreachable). In event-driven mode, new tasks are claimed much sooner
+        if self.manager_config.event_driven:
+            claim_horizon = self.manager_config.return_max_age + self.manager_config.claim_min_interval
+        else:
+            claim_horizon = max(self.manager_config.update_frequency, self.heartbeat_frequency)
+
+        for ex_label in self.manager_config.executors.keys():
+            self._claim_controllers[ex_label] = ClaimController(
+                self._get_max_workers(self.dflow_kernel.executors[ex_label]),
+                claim_horizon,
+                self.manager_config.claim_min_factor,
+                self.manager_config.claim_max_factor,
+            )
+
         def scheduler_update():
             if not manual_updates:
                 self.update(new_tasks=True)
@@ -298,15 +365,35 @@ class ComputeManager:
 
         self._failed_heartbeats = 0
 
+        # Results from a previous manager are returned on the first update, before claiming new tasks
+        self._resurrect_outbox_tasks()
+
         # Start the idle timer to be right now, since we aren't doing anything
         self._idle_start_time = time.time()
 
         self.scheduler.enter(0, 1, scheduler_update)
         self.scheduler.enter(0, 2, scheduler_heartbeat)
 
+        # Results are returned and new tasks claimed in separate threads, as tasks finish.
+        # The regular updates still happen (for retrying deferred results, idle checks, etc)
+        if self.manager_config.event_driven and not manual_updates:
+            self._event_threads = [
+                threading.Thread(target=self._event_sender, name="ComputeManagerSender", daemon=True),
+                threading.Thread(target=self._event_claimer, name="ComputeManagerClaimer", daemon=True),
+            ]
+            for t in self._event_threads:
+                t.start()
+
         # Blocks until the ComputeManager.stop() method is called
         self.scheduler.run(blocking=True)
 
+        # Wake up and wait for the event-driven threads
+        self._finished_queue.put(None)
+        self._claim_event.set()
+        for t in self._event_threads:
+            t.join()
+        self._event_threads = []
+
         #############################################
         # If we got here, the scheduler has stopped
         # Now handle the shutdown
@@ -339,6 +426,9 @@ class ComputeManager:
         self.dflow_kernel = None
         self.parsl_config = None
 
+        if self._outbox is not None:
+            self._outbox.close()
+
         self.logger.info("Compute manager stopping gracefully.")
 
     def stop(self) -> None:
@@ -348,6 +438,7 @@ class ComputeManager:
         self.logger.info("Manager stopping")
 
         self._is_stopping = True
+        self._stop_event.set()
 
         # This interrupts the scheduler, which will cause the rest of the start() method to run
         self.scheduler.interrupt()
@@ -447,6 +538,17 @@ class ComputeManager:
 
         self.logger.info(log_str)
 
+        # Store on disk until they are returned to the server
+        if self._outbox is not None:
+            self._outbox.add(
+                {
+                    task_id: (self._record_id_map[task_id], task_result)
+                    for executor_results in ret.values()
+                    for task_id, task_result in executor_results.items()
+                },
+                self.name,
+            )
+
         return ret
 
     def _submit_tasks(self, executor_label: str, tasks: List[RecordTask]):
@@ -464,10 +566,21 @@ class ComputeManager:
             self._task_futures[executor_label][task.id] = task_future
             self._record_id_map[task.id] = task.record_id
 
+            if self.manager_config.event_driven:
+                task_future.add_done_callback(self._task_done_callback)
+
     def _return_finished(self, results: Dict[int, AppTaskResult]) -> TaskReturnMetadata:
         # Handling of exceptions is expected to be done in the calling function
         to_send = {k: v.result_compressed for k, v in results.items()}
-        return_meta = self.client.return_finished(to_send)
+        claimed_by = {k: self._claimed_by[k] for k in results.keys() if k in self._claimed_by}
+        return_meta = self.client.return_finished(to_send, claimed_by)
+
+        # The server has seen these results (even if it rejected them), so they don't need to be kept
+        if self._outbox is not None:
+            self._outbox.remove(results.keys())
+
+        for k in claimed_by:
+            del self._claimed_by[k]
 
         if return_meta.success:
             self.logger.info(f"Successfully returned {return_meta.n_accepted} tasks to the fractal server")
@@ -507,34 +620,23 @@ class ComputeManager:
         self._deferred_tasks = new_deferred_tasks
         return ret
 
-    def _update(self, new_tasks) -> None:
-        # First, try pushing back any stale results
-        deferred_return_info = self._update_deferred_tasks()
+    def _return_results(self, results: Dict[str, Dict[int, AppTaskResult]]) -> Tuple[List[Tuple[int, str, str]], bool]:
+        """
+        Returns finished results to the server, deferring them if the server can't be reached
 
-        results = self._acquire_complete_tasks()
+        Returns
+        -------
+        :
+            Rows of the status table (task_id, status, reason), and whether the server is reachable
+        """
 
         server_up = True
-
-        # Stores rows of the status table printed at the end
-        # Columns: task_id, status, reason
-        # record_id will be added later
         status_rows: List[Tuple[int, str, str]] = []
 
-        # Add the info from updating deferred tasks to the table
-        for attempts, return_meta in deferred_return_info.items():
-            status_rows.extend(
-                [(task_id, f"sent (was deferred {attempts})", "") for task_id in return_meta.accepted_ids]
-            )
-            status_rows.extend(
-                [
-                    (task_id, f"rejected (was deferred {attempts})", reason)
-                    for task_id, reason in return_meta.rejected_info
-                ]
-            )
-            self.statistics.total_rejected_tasks += return_meta.n_rejected
-
         # Return results to the server (per executor)
         for executor_label, executor_results in results.items():
+            self._claim_controllers[executor_label].observe(r.walltime for r in executor_results.values())
+
             # Any post-processing tasks
             # Sometimes used for saving data for later
             self.postprocess_results(executor_results)
@@ -581,10 +683,12 @@ class ComputeManager:
                 self.statistics.total_successful_tasks += n_success
                 self.statistics.total_failed_tasks += n_fail
 
-        ########################################################################
-        # Update a few more statistics
-        # total_successful_tasks/n_failed_tasks are updated above, per executor
-        ########################################################################
+        return status_rows, server_up
+
+    def _update_active_statistics(self) -> None:
+        """
+        Updates the statistics about currently-running tasks
+        """
 
         self.statistics.active_tasks = self.n_total_active_tasks
         n_active_tasks = self.n_active_tasks
@@ -601,6 +705,7 @@ class ComputeManager:
             for ex_label, ex_config in self.manager_config.executors.items()
         )
 
+    def _log_return_status(self, status_rows: List[Tuple[int, str, str]]) -> None:
         if status_rows:
             log_str = "Task return status:\n"
 
@@ -612,6 +717,97 @@ class ComputeManager:
             log_str += tabulate.tabulate(new_status_rows, headers=["task id", "record id", "status", "reason"])
             self.logger.info(log_str)
 
+    def _claim_new_tasks(self) -> None:
+        """
+        Claims new tasks from the server to fill the open slots of all executors
+        """
+
+        self._last_claim_time = time.monotonic()
+
+        # What do we have for each executor?
+        active_tasks = self.n_active_tasks
+
+        # How many slots do we have?
+        # Columns: executor, workers, active, mean walltime, completion rate, target, open slots
+        open_slots: Dict[str, int] = {}
+        claim_rows: List[Tuple[str, int, int, str, str, int, int]] = []
+        for executor_label, controller in self._claim_controllers.items():
+            open_slots[executor_label] = controller.open_slots(active_tasks[executor_label])
+            self.statistics.claim_targets[executor_label] = controller.target_tasks
+
+            mean_walltime = controller.mean_walltime
+            completion_rate = controller.completion_rate
+            claim_rows.append(
+                (
+                    executor_label,
+                    controller.max_workers,
+                    active_tasks[executor_label],
+                    "-" if mean_walltime is None else seconds_to_hms(mean_walltime),
+                    "-" if completion_rate is None else f"{completion_rate * 60:.2f}/min",
+                    controller.target_tasks,
+                    open_slots[executor_label],
+                )
+            )
+
+        self.logger.info(
+            "Task claim status:\n"
+            + tabulate.tabulate(
+                claim_rows,
+                headers=["executor", "workers", "active", "mean walltime", "finish rate", "target", "open slots"],
+            )
+        )
+
+        for executor_label, executor_config in self.manager_config.executors.items():
+            if open_slots[executor_label] > 0:
+                try:
+                    executor_programs = self.executor_programs[executor_label]
+                    new_task_info = self.client.claim(
+                        executor_programs, executor_config.compute_tags, open_slots[executor_label]
+                    )
+                except AllowedConnectionExceptions as ex:
+                    self.logger.warning(f"Acquisition of new tasks failed: {str(ex).strip()}")
+                    return
+
+                self.logger.info("Acquired {} new tasks.".format(len(new_task_info)))
+
+                # Add new tasks to queue
+                self.preprocess_new_tasks(new_task_info)
+                self._submit_tasks(executor_label, new_task_info)
+
+    def _update(self, new_tasks) -> None:
+        # First, try pushing back any stale results
+        deferred_return_info = self._update_deferred_tasks()
+
+        results = self._acquire_complete_tasks()
+
+        # Stores rows of the status table printed at the end
+        # Columns: task_id, status, reason
+        # record_id will be added later
+        status_rows: List[Tuple[int, str, str]] = []
+
+        # Add the info from updating deferred tasks to the table
+        for attempts, return_meta in deferred_return_info.items():
+            status_rows.extend(
+                [(task_id, f"sent (was deferred {attempts})", "") for task_id in return_meta.accepted_ids]
+            )
+            status_rows.extend(
+                [
+                    (task_id, f"rejected (was deferred {attempts})", reason)
+                    for task_id, reason in return_meta.rejected_info
+                ]
+            )
+            self.statistics.total_rejected_tasks += return_meta.n_rejected
+
+        return_rows, server_up = self._return_results(results)
+        status_rows.extend(return_rows)
+
+        ########################################################################
+        # Update a few more statistics
+        # total_successful_tasks/n_failed_tasks are updated above, per executor
+        ########################################################################
+        self._update_active_statistics()
+        self._log_return_status(status_rows)
+
         ###########################################
         # Write statistics to the log
         #######################################
@@ -619,7 +815,8 @@ class ComputeManager:
             f"Task Stats: Total finished={self.statistics.total_finished_tasks}, "
             f"Failed={self.statistics.total_failed_tasks}, "
             f"Success={self.statistics.total_successful_tasks}, "
-            f"Rejected={self.statistics.total_rejected_tasks}"
+            f"Rejected={self.statistics.total_rejected_tasks}, "
+            f"Resurrected={self.statistics.total_resurrected_tasks}"
         )
 
         worker_stats_str = f"Worker Stats (est.): Core Hours Used={self.statistics.total_cpu_hours:,.2f}"
@@ -629,33 +826,148 @@ class ComputeManager:
         self.statistics.last_update_time = time.time()
 
         if new_tasks and server_up:
-            # What do we have for each executor?
-            active_tasks = self.n_active_tasks
+            self._claim_new_tasks()
 
-            for executor_label, executor_config in self.manager_config.executors.items():
-                executor = self.dflow_kernel.executors[executor_label]
+    def _task_done_callback(self, future: ParslFuture) -> None:
+        """
+        Called (by parsl) when a task finishes, if the manager is running in event-driven mode
+        """
 
-                # How many slots do we have?
-                # TODO - intelligently figure out the number tasks to claim over the number of slots
-                open_slots = (3 * self._get_max_workers(executor)) - active_tasks[executor_label]
+        self._finished_queue.put(time.monotonic())
 
-                self.logger.info(
-                    f"Executor {executor_label} has {active_tasks[executor_label]} active tasks and {open_slots} open slots"
-                )
+    def _n_finished_tasks(self) -> int:
+        """
+        Number of tasks that have finished, but whose results have not been acquired yet
+
+        The update lock should be held by the caller
+        """
+
+        return sum(1 for task_futures in self._task_futures.values() for task in task_futures.values() if task.done())
+
+    @staticmethod
+    def _retry_delay(n_failures: int) -> float:
+        # Exponential backoff, up to one minute
+        return min(2.0 ** (n_failures - 1), 60.0)
+
+    def _event_sender(self) -> None:
+        """
+        Returns finished results as soon as a batch is full (or old enough), then wakes the claimer
+
+        Runs in its own thread when the manager is running in event-driven mode
+        """
+
+        batch_size = self.manager_config.return_batch_size
+        max_age = self.manager_config.return_max_age
+
+        # Time (monotonic) the first task of the current batch finished
+        batch_start = None
+
+        # Number of consecutive failures (for backing off)
+        n_failures = 0
+
+        while not self._is_stopping:
+            if batch_start is None:
+                timeout = None
+            else:
+                timeout = max(0.0, batch_start + max_age - time.monotonic())
+
+            try:
+                finished_time = self._finished_queue.get(timeout=timeout)
+                if finished_time is None:  # Sentinel - we are stopping
+                    break
+
+                if batch_start is None:
+                    batch_start = finished_time
+            except queue.Empty:
+                pass
+
+            if batch_start is None:
+                continue
+
+            # Regular updates also return results, so count what is actually left to return
+            with self._update_lock:
+                n_finished = self._n_finished_tasks()
+                n_deferred = self.n_deferred_tasks
+
+            if n_finished == 0 and n_deferred == 0:
+                batch_start = None
+                continue
+
+            if n_finished < batch_size and time.monotonic() - batch_start < max_age:
+                continue
+
+            batch_start = None
+
+            try:
+                with self._update_lock:
+                    # Results that could not be returned earlier
+                    for return_meta in self._update_deferred_tasks().values():
+                        self.statistics.total_rejected_tasks += return_meta.n_rejected
+
+                    results = self._acquire_complete_tasks()
 
-                if open_slots > 0:
                     try:
-                        executor_programs = self.executor_programs[executor_label]
-                        new_task_info = self.client.claim(executor_programs, executor_config.compute_tags, open_slots)
-                    except AllowedConnectionExceptions as ex:
-                        self.logger.warning(f"Acquisition of new tasks failed: {str(ex).strip()}")
-                        return
+                        status_rows, server_up = self._return_results(results)
+                    except Exception:
+                        # Keep the results. They will be returned with the other deferred results
+                        for executor_results in results.values():
+                            self._deferred_tasks[0].update(executor_results)
+                        raise
+
+                    self._update_active_statistics()
+                    self._log_return_status(status_rows)
+
+                n_failures = 0
+            except Exception:
+                n_failures += 1
+                delay = self._retry_delay(n_failures)
+                self.logger.exception(f"Error returning finished tasks. Will try again in {delay:.0f} seconds")
+                self._stop_event.wait(delay)
+
+                # Try again (with the deferred results) even if no more tasks finish
+                batch_start = time.monotonic() - max_age
+                continue
+
+            if server_up:
+                self._claim_event.set()
+
+    def _event_claimer(self) -> None:
+        """
+        Claims new tasks whenever the sender has freed up slots, but not more often than allowed
 
-                    self.logger.info("Acquired {} new tasks.".format(len(new_task_info)))
+        Runs in its own thread when the manager is running in event-driven mode
+        """
+
+        min_interval = self.manager_config.claim_min_interval
+
+        # Number of consecutive failures (for backing off)
+        n_failures = 0
+
+        while not self._is_stopping:
+            self._claim_event.wait()
+            if self._is_stopping:
+                break
 
-                    # Add new tasks to queue
-                    self.preprocess_new_tasks(new_task_info)
-                    self._submit_tasks(executor_label, new_task_info)
+            # Rate limit claims, to protect the server
+            wait_time = self._last_claim_time + min_interval - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+
+            self._claim_event.clear()
+
+            if self._is_stopping:
+                break
+
+            try:
+                with self._update_lock:
+                    self._claim_new_tasks()
+                n_failures = 0
+            except Exception:
+                n_failures += 1
+                delay = self._retry_delay(n_failures)
+                self.logger.exception(f"Error claiming new tasks. Will try again in {delay:.0f} seconds")
+                self._stop_event.wait(delay)
+                self._claim_event.set()
 
     def update(self, new_tasks) -> None:
         """Examines the queue for completed tasks and adds successful completions to the database
@@ -667,7 +979,8 @@ class ComputeManager:
             Try to get new tasks from the server
         """
 
-        self._update(new_tasks=new_tasks)
+        with self._update_lock:
+            self._update(new_tasks=new_tasks)
 
         if self.manager_config.max_idle_time is None:
             return
@@ -68,6 +68,27 @@ class PackageEnvironmentSettings(QCFComputeConfigBase):
     )
 
 
+class ResultCompressionSettings(QCFComputeConfigBase):
+    """
+    How results are compressed before being sent back to the server
+    """
+
+    level: int | None = Field(
+        None, description="zstd compression level. If not specified, a default based on the size of the data is used"
+    )
+    threads: int = Field(
+        0,
+        description="Number of threads to use when compressing large outputs and native files. "
+        "0 means no additional threads, -1 means the number of cpus",
+        ge=-1,
+    )
+    dictionary: str | None = Field(
+        None,
+        description="Path to a trained zstd dictionary to use when compressing results. The server must also "
+        "be configured with this dictionary. If relative, it is relative to the base folder",
+    )
+
+
 class ExecutorConfig(QCFComputeConfigBase):
     type: str
     compute_tags: list[str]
@@ -81,6 +102,17 @@ class ExecutorConfig(QCFComputeConfigBase):
 
     extra_executor_options: dict[str, Any] = {}
 
+    # Run qcengine tasks in long-lived worker processes (one per parsl worker and environment),
+    # rather than starting a new process for every task. Workers are restarted after this many tasks
+    persistent_workers: bool = False
+    persistent_worker_max_tasks: int = Field(100, gt=0)
+
+    # Tasks taking longer than this many seconds in a persistent worker fail, and the worker is killed and
+    # restarted. None means no limit
+    persistent_worker_task_timeout: float | None = Field(None, gt=0)
+
+    compression: ResultCompressionSettings = Field(default_factory=ResultCompressionSettings)
+
     environments: PackageEnvironmentSettings = Field(default_factory=PackageEnvironmentSettings)
 
 
@@ -166,6 +198,36 @@ class FractalServerSettings(QCFComputeConfigBase):
     verify: bool | None = Field(None, description="Use Server-side generated SSL certification or not.")
 
 
+class OutboxSettings(QCFComputeConfigBase):
+    """
+    Settings for storing finished results on disk until they are returned to the server
+
+    Results that could not be returned (for example, if the server is unreachable when the manager
+    shuts down) are returned by the next manager that starts with the same outbox file.
+    Only one running manager may use an outbox file - a second manager using the same file
+    will fail to start.
+    """
+
+    path: str = Field(
+        "outbox.sqlite",
+        description="Path to the file storing the results. If relative, it is relative to the base folder",
+    )
+    max_results: int = Field(
+        10000, description="Maximum number of results to store. If exceeded, the oldest results are removed", gt=0
+    )
+    max_age: int = Field(
+        7 * 86400,
+        description="Results older than this are removed from the outbox and not returned to the server. "
+        "Units of seconds (or a duration string)",
+        gt=0,
+    )
+
+    @field_validator("max_age", mode="before")
+    @classmethod
+    def _convert_durations(cls, v):
+        return duration_to_seconds(v)
+
+
 class FractalComputeConfig(BaseSettings):
     base_folder: str = Field(
         ...,
@@ -200,12 +262,55 @@ class FractalComputeConfig(BaseSettings):
         ge=0,
     )
 
+    event_driven: bool = Field(
+        False,
+        description="Return results and claim new tasks as tasks finish, rather than only every update_frequency "
+        "seconds. This keeps workers busier when tasks are short",
+    )
+    return_batch_size: int = Field(
+        50,
+        description="In event-driven mode, return finished results once this many have accumulated",
+        gt=0,
+    )
+    return_max_age: float = Field(
+        5.0,
+        description="In event-driven mode, return finished results once the oldest has been waiting this long "
+        "(in seconds), even if the batch is not full",
+        gt=0,
+    )
+    claim_min_interval: float = Field(
+        5.0,
+        description="In event-driven mode, the minimum time (in seconds) between claiming new tasks. "
+        "This limits the load on the server",
+        ge=0,
+    )
+
     max_idle_time: int | None = Field(
         None,
         description="Maximum consecutive time in seconds that the manager "
         "should be allowed to run. If this is reached, the manager will shutdown.",
     )
 
+    claim_min_factor: float = Field(
+        1.0,
+        description="Minimum number of tasks (running + queued) to keep for each executor, as a multiple of the "
+        "maximum number of workers of the executor. The number of tasks claimed is adjusted between this and "
+        "claim_max_factor based on how quickly tasks are finishing",
+        gt=0,
+    )
+    claim_max_factor: float = Field(
+        3.0,
+        description="Maximum number of tasks (running + queued) to keep for each executor, as a multiple of the "
+        "maximum number of workers of the executor",
+        gt=0,
+    )
+
+    outbox: OutboxSettings | None = Field(
+        None,
+        description="Store finished results on disk until they are returned to the server. If not specified, "
+        "results are only kept in memory",
+    )
+
     parsl_run_dir: str = "parsl_run_dir"
     parsl_usage_tracking: int = 0
 
@@ -234,6 +339,16 @@ class FractalComputeConfig(BaseSettings):
     def _check_paths(self):
         self.logfile = _make_abs_path(self.logfile, self.base_folder, None)
         self.parsl_run_dir = _make_abs_path(self.parsl_run_dir, self.base_folder, "parsl_run_dir")
+        if self.outbox is not None:
+            self.outbox.path = _make_abs_path(self.outbox.path, self.base_folder, "outbox.sqlite")
+        for ex_config in self.executors.values():
+            ex_config.compression.dictionary = _make_abs_path(ex_config.compression.dictionary, self.base_folder, None)
+        return self
+
+    @model_validator(mode="after")
+    def _check_claim_factors(self):
+        if self.claim_min_factor > self.claim_max_factor:
+            raise ValueError("claim_min_factor must not be larger than claim_max_factor")
         return self
 
     @field_validator("update_frequency", "max_idle_time", mode="before")
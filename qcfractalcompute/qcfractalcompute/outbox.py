@@ -0,0 +1,180 @@
+"""
+Durable storage of finished results that have not yet been returned to the server
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Dict, Iterable, Tuple
+
+import apsw
+
+from .apps.models import AppTaskResult
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class ResultOutbox:
+    """
+    An on-disk (sqlite) store of finished, but not yet returned, results
+
+    Results are stored as soon as they are acquired from the executors and removed once
+    the server has received them. If the manager stops before results could be returned
+    (for example, the server was down when the manager hit its walltime), they can be loaded
+    again when a new manager starts. The name of the manager that claimed each task is stored as well,
+    since the server only accepts these results on behalf of that manager.
+
+    Only one manager may use an outbox file at a time. A manager holds an exclusive lock on the
+    outbox for as long as it is open, so results are only loaded by a new manager once the
+    manager that stored them is no longer running.
+    """
+
+    def __init__(self, path: str, max_results: int, max_age: int):
+        """
+        Parameters
+        ----------
+        path
+            Path to the sqlite file. Will be created if it does not exist
+        max_results
+            Maximum number of results to keep. If exceeded, the oldest results are removed
+        max_age
+            Results older than this (in seconds) are removed
+        """
+
+        self._logger = logging.getLogger("ResultOutbox")
+
+        self.path = path
+        self.max_results = max_results
+        self.max_age = max_age
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        # Held (and locked) until the outbox is closed
+        self._lock_file = open(self.path + ".lock", "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"Outbox {self.path} is in use by another manager")
+
+        self._conn = apsw.Connection(self.path, flags=apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                task_id INTEGER PRIMARY KEY,
+                record_id INTEGER NOT NULL,
+                manager_name TEXT NOT NULL,
+                added_on DECIMAL NOT NULL,
+                success BOOLEAN NOT NULL,
+                walltime DECIMAL NOT NULL,
+                result_compressed BLOB NOT NULL
+            )
+            """)
+
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_added_on ON outbox (added_on)")
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} path={self.path}>"
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+        # Closing the file releases the lock
+        self._lock_file.close()
+
+    def add(self, results: Dict[int, Tuple[int, AppTaskResult]], manager_name: str) -> None:
+        """
+        Stores results in the outbox
+
+        Parameters
+        ----------
+        results
+            Key is the task id, value is (record id, result)
+        manager_name
+            Full name of the manager that claimed the tasks
+        """
+
+        if not results:
+            return
+
+        now = time.time()
+        stmt = """REPLACE INTO outbox (task_id, record_id, manager_name, added_on, success, walltime, result_compressed)
+                  VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+        with self._conn:
+            self._conn.executemany(
+                stmt,
+                [
+                    (task_id, record_id, manager_name, now, r.success, r.walltime, r.result_compressed)
+                    for task_id, (record_id, r) in results.items()
+                ],
+            )
+
+        self.expire()
+
+    def remove(self, task_ids: Iterable[int]) -> None:
+        """
+        Removes results from the outbox (typically, once they have been returned to the server)
+        """
+
+        with self._conn:
+            self._conn.executemany("DELETE FROM outbox WHERE task_id = ?", [(x,) for x in task_ids])
+
+    def expire(self) -> int:
+        """
+        Removes results that are too old, or that are over the maximum number of results
+
+        Returns
+        -------
+        :
+            The number of results that were removed
+        """
+
+        with self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE added_on < ?", (time.time() - self.max_age,))
+            n_expired = self._conn.changes()
+
+            self._conn.execute(
+                "DELETE FROM outbox WHERE task_id NOT IN (SELECT task_id FROM outbox ORDER BY added_on DESC LIMIT ?)",
+                (self.max_results,),
+            )
+            n_trimmed = self._conn.changes()
+
+        if n_expired:
+            self._logger.warning(f"Removed {n_expired} results from the outbox that were older than {self.max_age}s")
+        if n_trimmed:
+            self._logger.warning(f"Removed {n_trimmed} of the oldest results from the outbox (over the size limit)")
+
+        return n_expired + n_trimmed
+
+    def load(self) -> Dict[int, Tuple[int, str, AppTaskResult]]:
+        """
+        Loads all (unexpired) results from the outbox
+
+        Returns
+        -------
+        :
+            Key is the task id, value is (record id, name of the manager that claimed the task, result)
+        """
+
+        self.expire()
+
+        stmt = """SELECT task_id, record_id, manager_name, success, walltime, result_compressed
+                  FROM outbox ORDER BY added_on"""
+
+        ret = {}
+        for task_id, record_id, manager_name, success, walltime, result_compressed in self._conn.execute(stmt):
+            result = AppTaskResult(success=success, walltime=walltime, result_compressed=result_compressed)
+            ret[task_id] = (record_id, manager_name, result)
+
+        return ret
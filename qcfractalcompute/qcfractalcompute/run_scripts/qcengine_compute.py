@@ -1,5 +1,7 @@
 import json
+import os
 import sys
+import traceback
 from contextlib import redirect_stdout, redirect_stderr
 
 import qcengine
@@ -37,12 +39,8 @@ _qcvar_transitions = {
     "valiron-mayer function couterpoise interaction energy": "vmfc-corrected interaction energy",  # note misspelling
 }
 
-if __name__ == "__main__":
-    function_kwargs_file = sys.argv[1]
-
-    with open(function_kwargs_file, "r") as f:
-        function_kwargs = json.load(f)
 
+def compute(function_kwargs):
     # Redirect stdout/stderr to the string io objects. This can cause issues with how we return our json
     with redirect_stdout(None), redirect_stderr(None):
         if "procedure" in function_kwargs:
@@ -65,4 +63,46 @@ if __name__ == "__main__":
             ret.extras["qcvars"] = {_qcvar_transitions.get(k, k): v for k, v in ret.extras["qcvars"].items()}
 
     # Still the one place that uses pydantic v1 models
-    print(json.dumps(ret.convert_v(QCEL_V1V2_SHIM_CODE).model_dump(mode="json")))
+    return ret.convert_v(QCEL_V1V2_SHIM_CODE).model_dump(mode="json")
+
+
+def run_worker():
+    """
+    Runs tasks until stdin is closed
+
+    Each line of stdin is the json of the function kwargs of a task. The result of each task
+    is written as a single line of json to stdout.
+    """
+
+    # Results are written to the original stdout. Anything else that writes to stdout
+    # (including compiled code and subprocesses) goes to stderr instead
+    result_out = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+
+        try:
+            ret = compute(json.loads(line))
+        except Exception as e:
+            ret = {
+                "success": False,
+                "error": {"error_type": type(e).__name__, "error_message": traceback.format_exc()},
+            }
+
+        result_out.write(json.dumps(ret) + "\n")
+        result_out.flush()
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "--worker":
+        run_worker()
+    else:
+        function_kwargs_file = sys.argv[1]
+
+        with open(function_kwargs_file, "r") as f:
+            function_kwargs = json.load(f)
+
+        print(json.dumps(compute(function_kwargs)))
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import pytest
+
+from qcfractalcompute.apps import helpers
+from qcfractalcompute.apps.qcengine import qcengine_apptainer_app
+from qcfractalcompute.config import LocalExecutorConfig
+from qcportal.compression import compress, CompressionEnum
+
+
+@pytest.mark.parametrize("persistent_workers", [True, False])
+def test_apptainer_app_scratch_volume(tmp_path, monkeypatch, persistent_workers):
+    # Records the volumes that apptainer would have been run with
+    volumes_used = []
+
+    def _run_apptainer(sif_path, command, volumes, compression=None):
+        volumes_used.extend(volumes)
+
+    def _run_apptainer_persistent_worker(sif_path, command, volumes, *args):
+        volumes_used.extend(volumes)
+
+    monkeypatch.setattr(helpers, "run_apptainer", _run_apptainer)
+    monkeypatch.setattr(helpers, "run_apptainer_persistent_worker", _run_apptainer_persistent_worker)
+
+    scratch_dir = str(tmp_path / "scratch")
+    executor_config = LocalExecutorConfig(
+        cores_per_worker=1,
+        memory_per_worker=1,
+        max_workers=1,
+        compute_tags=["*"],
+        scratch_directory=scratch_dir,
+        persistent_workers=persistent_workers,
+    )
+
+    function_kwargs_compressed, _, _ = compress({"input_data": {}}, CompressionEnum.zstd)
+    qcengine_apptainer_app(1, function_kwargs_compressed, executor_config, "/path/to/image.sif")
+
+    # qcengine is told to use the scratch directory, so it must be bound into the container
+    assert (scratch_dir, scratch_dir) in volumes_used
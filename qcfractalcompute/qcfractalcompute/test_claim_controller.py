@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from qcfractalcompute.claim_controller import ClaimController
+
+
+def test_claim_controller_no_history():
+    # Without any information, claim the maximum
+    controller = ClaimController(max_workers=10, horizon=30.0, min_factor=1.0, max_factor=3.0)
+    assert controller.target_tasks == 30
+    assert controller.open_slots(0) == 30
+    assert controller.open_slots(25) == 5
+    assert controller.open_slots(40) == 0
+
+    # Nothing finished yet
+    controller.observe([], now=100.0)
+    controller.observe([], now=110.0)
+    assert controller.completion_rate is None
+    assert controller.target_tasks == 30
+
+
+def test_claim_controller_long_tasks():
+    # Tasks that take much longer than the horizon - don't hoard
+    controller = ClaimController(max_workers=10, horizon=30.0, min_factor=1.0, max_factor=3.0)
+    controller.observe([], now=0.0)
+    controller.observe([3600.0], now=30.0)
+
+    assert controller.mean_walltime == 3600.0
+    assert controller.target_tasks == 11
+
+
+def test_claim_controller_short_tasks():
+    # Many tasks finish within the horizon - claim up to the maximum
+    controller = ClaimController(max_workers=10, horizon=30.0, min_factor=1.0, max_factor=3.0)
+    controller.observe([], now=0.0)
+    controller.observe([2.0] * 100, now=30.0)
+
+    assert controller.completion_rate > 3.0
+    assert controller.target_tasks == 30
+
+
+def test_claim_controller_bounds():
+    controller = ClaimController(max_workers=4, horizon=60.0, min_factor=2.0, max_factor=2.5)
+    assert controller.min_tasks == 8
+    assert controller.max_tasks == 10
+
+    controller.observe([10000.0], now=0.0)
+    assert controller.target_tasks == 8
+
+    # Lost workers (zero walltime) don't affect the walltime estimate
+    controller.observe([0.0, 0.0], now=60.0)
+    assert controller.mean_walltime == 10000.0
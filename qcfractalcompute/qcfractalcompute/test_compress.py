@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import numpy
+import pytest
+import zstandard
+
+from qcfractalcompute import compress as compress_module
+from qcfractalcompute.compress import compress_result, train_result_dictionary
+from qcportal.compression import decompress, CompressionEnum
+
+
+def _make_result(i: int):
+    return {
+        "schema_name": "qcschema_output",
+        "id": i,
+        "success": True,
+        "driver": "energy",
+        "return_result": float(i) * 0.1,
+        "properties": {"calcinfo_nbasis": i, "scf_total_energy": -76.0 - i},
+        "provenance": {"creator": "Psi4", "version": "1.9", "routine": "psi4.schema_runner.run_qcschema"},
+        "molecule": {"symbols": ["O", "H", "H"], "geometry": numpy.arange(9.0) * i},
+        "stdout": f"Output for calculation {i}\n" * 20,
+        "extras": {},
+    }
+
+
+def test_compress_result_roundtrip():
+    r = compress_result(_make_result(1), compression_level=3)
+    d = decompress(r, CompressionEnum.zstd)
+
+    assert d["stdout"] is None
+    assert d["molecule"]["geometry"] == list(numpy.arange(9.0))
+
+    out = d["extras"]["_qcfractal_compressed_outputs"]["stdout"]
+    assert out["compression_level"] == 3
+    assert decompress(out["data"], CompressionEnum.zstd) == "Output for calculation 1\n" * 20
+
+
+def test_compress_result_threads(monkeypatch):
+    # Make sure outputs use the threaded path
+    monkeypatch.setattr(compress_module, "_threaded_compression_min_size", 16)
+
+    r = compress_result(_make_result(2), n_threads=2)
+    d = decompress(r, CompressionEnum.zstd)
+    out = d["extras"]["_qcfractal_compressed_outputs"]["stdout"]
+    assert decompress(out["data"], CompressionEnum.zstd) == "Output for calculation 2\n" * 20
+
+
+def test_compress_result_dictionary(tmp_path):
+    dict_data = train_result_dictionary([_make_result(i) for i in range(200)], 4096)
+    dict_path = tmp_path / "results.zdict"
+    dict_path.write_bytes(dict_data)
+
+    r = compress_result(_make_result(1000), dictionary_path=str(dict_path))
+    assert zstandard.get_frame_parameters(r).dict_id == zstandard.ZstdCompressionDict(dict_data).dict_id()
+
+    # Dictionary was registered when loaded, so this can be decompressed
+    d = decompress(r, CompressionEnum.zstd)
+    assert d["id"] == 1000
+
+    # Outputs are never compressed with the dictionary (clients need to be able to decompress them)
+    out = d["extras"]["_qcfractal_compressed_outputs"]["stdout"]
+    assert zstandard.get_frame_parameters(out["data"]).dict_id == 0
+
+
+def test_decompress_unknown_dictionary():
+    dict_data = zstandard.train_dictionary(
+        1024, [f"sample {i} abcdef {i*i}".encode() * 10 for i in range(1000)], dict_id=12345
+    )
+    cctx = zstandard.ZstdCompressor(dict_data=dict_data)
+    data = cctx.compress(b"\x80")  # empty msgpack map
+
+    with pytest.raises(RuntimeError, match="12345"):
+        decompress(data, CompressionEnum.zstd)
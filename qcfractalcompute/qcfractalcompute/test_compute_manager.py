@@ -9,6 +9,7 @@ import pytest
 from qcfractalcompute.compute_manager import ComputeManager
 from qcfractalcompute.config import FractalComputeConfig, FractalServerSettings, LocalExecutorConfig
 from qcfractalcompute.testing_helpers import QCATestingComputeThread, populate_db
+from qcportal.client_base import PortalRequestError
 from qcportal.managers import ManagerStatusEnum, ManagerQueryFilters
 from qcportal.utils import now_at_utc
 
@@ -176,6 +177,59 @@ def test_manager_claim_return(snowflake: QCATestingSnowflake):
     assert r is True
 
 
+def test_manager_claim_return_event_driven(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    all_id, result_data = populate_db(storage_socket)
+
+    # Long update frequency - results should still be returned as they finish
+    compute = QCATestingComputeThread(
+        snowflake._qcf_config,
+        result_data,
+        {"event_driven": True, "update_frequency": 120, "return_max_age": 0.5, "claim_min_interval": 0.5},
+    )
+    compute.start(manual_updates=False)
+
+    time.sleep(1)  # wait for manager to register
+    assert compute.is_alive() is True
+
+    r = snowflake.await_results(all_id, 30.0)
+    assert r is True
+
+
+def test_manager_claim_return_event_driven_error(snowflake: QCATestingSnowflake):
+    storage_socket = snowflake.get_storage_socket()
+    all_id, result_data = populate_db(storage_socket)
+
+    compute = QCATestingComputeThread(
+        snowflake._qcf_config,
+        result_data,
+        {"event_driven": True, "update_frequency": 120, "return_max_age": 0.5, "claim_min_interval": 0.5},
+    )
+    compute.start(manual_updates=False)
+
+    time.sleep(1)  # wait for manager to register
+    assert compute.is_alive() is True
+
+    # Returning fails once with a server error. The sender thread should keep going
+    client = compute._compute.client
+    original_return_finished = client.return_finished
+    n_calls = 0
+
+    def _return_finished(*args, **kwargs):
+        nonlocal n_calls
+        n_calls += 1
+        if n_calls == 1:
+            raise PortalRequestError("Internal server error", 500, {})
+        return original_return_finished(*args, **kwargs)
+
+    client.return_finished = _return_finished
+
+    r = snowflake.await_results(all_id, 30.0)
+    assert r is True
+    assert n_calls > 1
+    assert compute._compute.n_deferred_tasks == 0
+
+
 def test_manager_deferred_return(snowflake: QCATestingSnowflake):
     storage_socket = snowflake.get_storage_socket()
     all_id, result_data = populate_db(storage_socket)
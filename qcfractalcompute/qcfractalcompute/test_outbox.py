@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from qcfractalcompute.apps.models import AppTaskResult
+from qcfractalcompute.compress import compress_result
+from qcfractalcompute.outbox import ResultOutbox
+
+
+def _make_result(i: int) -> AppTaskResult:
+    return AppTaskResult(success=True, walltime=float(i), result_compressed=compress_result({"success": True, "i": i}))
+
+
+def test_outbox_persist(tmp_path):
+    path = str(tmp_path / "outbox.sqlite")
+
+    outbox = ResultOutbox(path, max_results=100, max_age=3600)
+    outbox.add({100 + i: (200 + i, _make_result(i)) for i in range(5)}, "cluster-host-1234")
+    outbox.remove([101, 103])
+    assert len(outbox) == 3
+    outbox.close()
+
+    # Results survive re-opening the file
+    outbox = ResultOutbox(path, max_results=100, max_age=3600)
+    loaded = outbox.load()
+    assert set(loaded.keys()) == {100, 102, 104}
+
+    for task_id, (record_id, manager_name, r) in loaded.items():
+        i = task_id - 100
+        assert record_id == 200 + i
+        assert manager_name == "cluster-host-1234"
+        assert r.success is True
+        assert r.walltime == float(i)
+        assert r.result == {"success": True, "i": i}
+
+
+def test_outbox_limits(tmp_path):
+    path = str(tmp_path / "outbox.sqlite")
+
+    outbox = ResultOutbox(path, max_results=3, max_age=3600)
+    for i in range(5):
+        outbox.add({i: (i, _make_result(i))}, "cluster-host-1234")
+        time.sleep(0.01)
+
+    # Only the newest are kept
+    assert set(outbox.load().keys()) == {2, 3, 4}
+
+    outbox.max_age = 0
+    time.sleep(0.01)
+    assert outbox.load() == {}
+
+
+def test_outbox_exclusive(tmp_path):
+    path = str(tmp_path / "outbox.sqlite")
+
+    outbox = ResultOutbox(path, max_results=100, max_age=3600)
+    outbox.add({100: (200, _make_result(0))}, "cluster-host-1234")
+
+    # Another manager can't use the outbox (and return its results) while it is open
+    with pytest.raises(RuntimeError, match=r"in use by another manager"):
+        ResultOutbox(path, max_results=100, max_age=3600)
+
+    outbox.close()
+
+    outbox = ResultOutbox(path, max_results=100, max_age=3600)
+    assert set(outbox.load().keys()) == {100}
+    outbox.close()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import sys
+
+from qcfractalcompute.apps.helpers import run_persistent_worker, _persistent_workers
+
+# Echos back the task, along with the pid of the worker. Exits if asked to
+_echo_worker = """
+import json, os, sys, time
+for line in sys.stdin:
+    payload = json.loads(line)
+    time.sleep(payload.get("sleep", 0))
+    if payload.get("crash"):
+        print("crashing!", file=sys.stderr, flush=True)
+        sys.exit(3)
+    print(json.dumps({"success": True, "pid": os.getpid(), "payload": payload}), flush=True)
+"""
+
+
+def test_persistent_worker_reuse(tmp_path):
+    cmd = [sys.executable, "-c", _echo_worker]
+
+    pids = []
+    for i in range(5):
+        r = run_persistent_worker(cmd, str(tmp_path), {}, 3, {"i": i})
+        assert r.success is True
+        assert r.result["payload"] == {"i": i}
+        pids.append(r.result["pid"])
+
+    # Recycled after 3 tasks
+    assert len(set(pids[:3])) == 1
+    assert len(set(pids[3:])) == 1
+    assert pids[0] != pids[3]
+
+
+def test_persistent_worker_crash(tmp_path):
+    cmd = [sys.executable, "-c", _echo_worker]
+
+    r = run_persistent_worker(cmd, str(tmp_path), {}, 100, {"i": 0})
+    pid = r.result["pid"]
+
+    r = run_persistent_worker(cmd, str(tmp_path), {}, 100, {"crash": True})
+    assert r.success is False
+    assert "error code 3" in r.result["error"]["error_message"]
+    assert "crashing!" in r.result["error"]["error_message"]
+
+    # A new worker is started for the next task
+    r = run_persistent_worker(cmd, str(tmp_path), {}, 100, {"i": 1})
+    assert r.success is True
+    assert r.result["pid"] != pid
+
+    for w in _persistent_workers.values():
+        w.close()
+    _persistent_workers.clear()
+
+
+def test_persistent_worker_timeout(tmp_path):
+    cmd = [sys.executable, "-c", _echo_worker]
+
+    r = run_persistent_worker(cmd, str(tmp_path), {}, 100, {"i": 0}, task_timeout=2.0)
+    assert r.success is True
+    pid = r.result["pid"]
+
+    r = run_persistent_worker(cmd, str(tmp_path), {}, 100, {"sleep": 30}, task_timeout=2.0)
+    assert r.success is False
+    assert r.walltime < 10.0
+    assert r.result["error"]["error_type"] == "TimeoutError"
+
+    # The worker was killed, and a new one is started for the next task
+    r = run_persistent_worker(cmd, str(tmp_path), {}, 100, {"i": 1}, task_timeout=2.0)
+    assert r.success is True
+    assert r.result["pid"] != pid
+
+    for w in _persistent_workers.values():
+        w.close()
+    _persistent_workers.clear()
@@ -115,6 +115,9 @@ class MockTestingComputeManager(ComputeManager):
 
             self._task_futures[executor_label][task.id] = task_future
 
+            if self.manager_config.event_driven:
+                task_future.add_done_callback(self._task_done_callback)
+
 
 class QCATestingComputeThread:
     """
@@ -8,6 +8,7 @@ __version__ = version("qcportal")
 
 # Add imports here
 from .client import PortalClient
+from .async_client import AsyncPortalClient
 from .client_base import PortalRequestError
 from .manager_client import ManagerClient
 
@@ -0,0 +1,754 @@
+"""
+Asynchronous client for interacting with a QCArchive server
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import math
+import os
+import ssl
+import time
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    Sequence,
+    Iterable,
+    TypeVar,
+    Type,
+    TYPE_CHECKING,
+)
+
+from tqdm import tqdm
+
+from . import __version__
+from .base_models import CommonBulkGetBody
+from .client import PortalClient
+from .client_base import _ssl_error_msg, _connection_error_msg
+from .dataset_models import DatasetFetchRecordsBody
+from .record_models import BaseRecord, RecordStatusEnum, RecordQueryFilters, records_from_dicts
+from .serialization import deserialize
+from .utils import make_list, chunk_iterable
+
+if TYPE_CHECKING:
+    import httpx
+    from .dataset_models import BaseDataset
+
+_T = TypeVar("_T")
+_U = TypeVar("_U")
+_V = TypeVar("_V")
+
+
+def _is_ssl_error(e: BaseException) -> bool:
+    # httpx wraps the underlying SSL error, so look through the chain of exceptions
+    while e is not None:
+        if isinstance(e, ssl.SSLError):
+            return True
+        e = e.__cause__ or e.__context__
+    return False
+
+
+def _response_json(r: httpx.Response) -> Optional[Dict[str, Any]]:
+    try:
+        return r.json()
+    except:
+        return None
+
+
+class AsyncPortalClient:
+    """
+    Asynchronous client for interacting with a QCArchive server
+
+    This client allows for many requests to be in flight at once (for example, when fetching records from
+    many datasets at the same time) without tying up a thread for each request. Requests are sent over a pool
+    of persistent (keep-alive) connections, and the number of requests in flight at any time is bounded by
+    ``max_concurrency``.
+
+    Only some functionality is available as coroutines. This client wraps a regular (synchronous)
+    :class:`PortalClient`, available as :attr:`client`, which can be used for everything else. The two clients
+    share the same login, encoding, and retry settings. Records returned by this client are attached to the
+    synchronous client, so data that is lazily loaded (such as molecules or compute history) is fetched
+    synchronously as usual.
+
+    This client requires the ``httpx`` package. HTTP/2 support additionally requires the ``h2`` package
+    (for example, ``pip install httpx[http2]``).
+
+    The client should be used from a single event loop, and closed when no longer needed::
+
+        async with AsyncPortalClient("https://ml.qcarchive.molssi.org") as client:
+            records = await client.get_records([1, 2, 3])
+    """
+
+    def __init__(
+        self,
+        address: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        verify: bool = True,
+        show_motd: bool = True,
+        *,
+        cache_dir: Optional[str] = None,
+        cache_max_size: int = 0,
+        max_concurrency: int = 8,
+        http2: bool = False,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        address
+            The host or IP address of the FractalServer instance, including protocol and port if necessary
+            ("https://ml.qcarchive.molssi.org", "http://192.168.1.10:8888")
+        username
+            The username to authenticate with.
+        password
+            The password to authenticate with.
+        verify
+            Verifies the SSL connection with a third party server. This may be False if a
+            FractalServer was not provided an SSL certificate and defaults back to self-signed
+            SSL keys.
+        show_motd
+            If a Message-of-the-Day is available, display it
+        cache_dir
+            Directory to store an internal cache of records and other data
+        cache_max_size
+            Maximum size of the cache directory (in bytes). Least-recently-used records are evicted
+            when the cache grows beyond this size. If 0, there is no limit
+        max_concurrency
+            Maximum number of requests to have in flight at once (and the maximum number of
+            connections to keep open to the server)
+        http2
+            Use HTTP/2 if the server supports it
+        """
+
+        # Connecting (logging in and getting the server information) is done synchronously
+        client = PortalClient(
+            address, username, password, verify, show_motd, cache_dir=cache_dir, cache_max_size=cache_max_size
+        )
+        self._setup(client, max_concurrency, http2)
+
+    @classmethod
+    def from_client(cls, client: PortalClient, *, max_concurrency: int = 8, http2: bool = False) -> AsyncPortalClient:
+        """
+        Creates an asynchronous client from an existing (synchronous) client
+
+        The new client shares the login and settings of the existing client.
+
+        Parameters
+        ----------
+        client
+            An existing client connected to a server
+        max_concurrency
+            Maximum number of requests to have in flight at once (and the maximum number of
+            connections to keep open to the server)
+        http2
+            Use HTTP/2 if the server supports it
+        """
+
+        ret = cls.__new__(cls)
+        ret._setup(client, max_concurrency, http2)
+        return ret
+
+    def _setup(self, client: PortalClient, max_concurrency: int, http2: bool) -> None:
+        import httpx
+
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be >= 1")
+
+        self._logger = logging.getLogger("AsyncPortalClient")
+
+        self.client = client
+        self.address = client.address
+        self.max_concurrency = max_concurrency
+
+        self._http_client = httpx.AsyncClient(
+            verify=client._verify,
+            http2=http2,
+            timeout=client.timeout,
+            follow_redirects=False,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            headers={"User-Agent": f"qcportal/{__version__}"},
+        )
+
+        self._allowed_connection_exceptions = (
+            ConnectionError,
+            httpx.TimeoutException,
+            httpx.NetworkError,
+            httpx.RemoteProtocolError,
+        )
+
+        # Bounds the number of requests in flight
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Only one coroutine should be logging in or refreshing tokens at a time
+        self._auth_lock = asyncio.Lock()
+
+    def __repr__(self) -> str:
+        return (
+            f"AsyncPortalClient(server_name='{self.client.server_name}', address='{self.address}', "
+            f"username='{self.client.username}')"
+        )
+
+    async def __aenter__(self) -> AsyncPortalClient:
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """
+        Closes all connections to the server
+        """
+
+        await self._http_client.aclose()
+
+    @property
+    def api_limits(self) -> Dict[str, int]:
+        return self.client.api_limits
+
+    @property
+    def encoding(self) -> str:
+        """
+        Encoding used for sending and receiving data (shared with the synchronous client)
+        """
+        return self.client.encoding
+
+    ##############################################################
+    # Low-level requests
+    ##############################################################
+
+    async def _send_request(
+        self,
+        method: str,
+        url: str,
+        *,
+        content: Optional[bytes] = None,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        allow_retries: bool = True,
+    ) -> httpx.Response:
+        """
+        Sends a request, optionally retrying on errors
+
+        Retries follow the same policy (and settings) as the synchronous client
+        """
+
+        if params is not None:
+            params = {k: v for k, v in params.items() if v is not None}
+
+        retry_count = 0
+
+        while True:
+            try:
+                async with self._semaphore:
+                    ret = await self._http_client.request(method, url, content=content, params=params, headers=headers)
+                break
+            except self._allowed_connection_exceptions as e:
+                if _is_ssl_error(e):
+                    raise ConnectionRefusedError(_ssl_error_msg) from None
+                if not allow_retries:
+                    raise
+                if retry_count >= self.client.retry_max:
+                    raise ConnectionRefusedError(_connection_error_msg.format(self.address)) from None
+
+                time_to_wait = self.client._retry_wait_time(retry_count)
+
+                retry_count += 1
+                self._logger.warning(
+                    f"Connection error for {url}: {str(e)} - retrying in {time_to_wait:.2f} seconds "
+                    f"[{retry_count}/{self.client.retry_max}]"
+                )
+                await asyncio.sleep(time_to_wait)
+
+        if ret.is_redirect:
+            raise RuntimeError("Redirection is not allowed")
+
+        return ret
+
+    async def _get_JWT_token(self) -> None:
+        login_data = {"username": self.client._username, "password": self.client._password}
+
+        r = await self._send_request(
+            "POST",
+            self.address + "auth/v1/login",
+            content=json.dumps(login_data).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+
+        self.client._handle_JWT_login_response(r.status_code, _response_json(r), r.reason_phrase)
+
+    async def _refresh_JWT_token(self) -> None:
+        r = await self._send_request(
+            "POST",
+            self.address + "auth/v1/refresh",
+            headers={"Authorization": f"Bearer {self.client._jwt_refresh_token}"},
+        )
+
+        if self.client._handle_JWT_refresh_response(r.status_code, _response_json(r)):
+            await self._get_JWT_token()
+
+    async def _check_JWT_token(self) -> None:
+        client = self.client
+
+        if not (client._jwt_refresh_exp or client._jwt_access_exp):
+            return
+
+        async with self._auth_lock:
+            # If refresh token has expired, log in again
+            if client._jwt_refresh_exp and client._jwt_refresh_exp < time.time():
+                await self._get_JWT_token()
+
+            # If only the JWT token is expired, automatically renew it
+            if client._jwt_access_exp and client._jwt_access_exp < time.time():
+                await self._refresh_JWT_token()
+
+    def _auth_headers(self) -> Dict[str, str]:
+        if self.client._jwt_access_token:
+            return {"Authorization": f"Bearer {self.client._jwt_access_token}"}
+        return {}
+
+    async def make_request(
+        self,
+        method: str,
+        endpoint: str,
+        response_model: Optional[Type[_V]],
+        *,
+        body_model: Optional[Type[_T]] = None,
+        url_params_model: Optional[Type[_U]] = None,
+        body: Optional[Union[_T, Dict[str, Any]]] = None,
+        url_params: Optional[Union[_U, Dict[str, Any]]] = None,
+        allow_retries: bool = True,
+        internal_retry: bool = True,
+    ) -> Optional[_V]:
+        """
+        Makes a request to the server, serializing the body and deserializing the response
+
+        This is the asynchronous version of :meth:`PortalClient.make_request`
+        """
+
+        serialized_body, parsed_url_params = self.client._prepare_request_data(
+            body_model, url_params_model, body, url_params
+        )
+
+        await self._check_JWT_token()
+
+        headers = {"Content-Type": self.encoding, "Accept": self.encoding}
+        headers.update(self._auth_headers())
+
+        r = await self._send_request(
+            method.upper(),
+            self.address + endpoint,
+            content=serialized_body,
+            params=parsed_url_params,
+            headers=headers,
+            allow_retries=allow_retries,
+        )
+
+        # If JWT token expired, automatically renew it and retry once. This can happen in rare instances
+        # where the token expires between the time we check it and the time we use it.
+        if internal_retry and r.status_code == 401 and "Token has expired" in r.text:
+            async with self._auth_lock:
+                await self._refresh_JWT_token()
+
+            return await self.make_request(
+                method,
+                endpoint,
+                response_model,
+                body_model=body_model,
+                url_params_model=url_params_model,
+                body=body,
+                url_params=url_params,
+                allow_retries=allow_retries,
+                internal_retry=False,
+            )
+
+        if r.status_code != 200:
+            self.client._raise_request_error(r.status_code, r.content, r.reason_phrase)
+
+        return deserialize(r.content, r.headers["Content-Type"], response_model)
+
+    async def download_file(
+        self,
+        endpoint: str,
+        destination_path: str,
+        overwrite: bool = False,
+        expected_size: Optional[int] = None,
+        show_progress: bool = False,
+    ) -> Tuple[int, str]:
+        """
+        Download a file with optional progress bar
+
+        This is the asynchronous version of :meth:`PortalClient.download_file`
+
+        Parameters
+        ----------
+        endpoint
+            API endpoint to download from
+        destination_path
+            Where to save the file
+        overwrite
+            Whether to overwrite existing files
+        expected_size
+            Expected size of the file in bytes (used for progress bar if enabled)
+        show_progress
+            Whether to show a progress bar during download
+
+        Returns
+        -------
+        :
+            The size of the file and its sha256 checksum
+        """
+
+        sha256 = hashlib.sha256()
+        file_size = 0
+
+        # Remove if overwrite=True. This allows for any processes still using the old file to keep using it
+        # (at least on linux)
+        if os.path.exists(destination_path):
+            if overwrite:
+                os.remove(destination_path)
+            else:
+                raise RuntimeError(f"File already exists at {destination_path}. To overwrite, use `overwrite=True`")
+
+        await self._check_JWT_token()
+
+        url = self.address + endpoint
+        headers = self._auth_headers()
+
+        async with self._semaphore:
+            for _ in range(2):
+                async with self._http_client.stream("GET", url, headers=headers) as response:
+                    if response.is_redirect:
+                        # Follow the redirect, but don't pass the JWT to someone else
+                        url = response.headers["Location"]
+                        headers = {}
+                        continue
+
+                    if response.status_code != 200:
+                        self.client._raise_request_error(
+                            response.status_code, await response.aread(), response.reason_phrase
+                        )
+
+                    with open(destination_path, "wb") as f, tqdm(
+                        total=expected_size,
+                        unit="B",
+                        unit_scale=True,
+                        unit_divisor=1024,
+                        desc=f"Downloading to {os.path.basename(destination_path)}",
+                        miniters=1,
+                        mininterval=0.1,
+                        disable=not show_progress,
+                    ) as pbar:
+                        async for chunk in response.aiter_bytes(chunk_size=4 * 1024 * 1024):
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            file_size += len(chunk)
+                            pbar.update(len(chunk))
+
+                    return file_size, sha256.hexdigest()
+
+        raise RuntimeError(f"Too many redirects when downloading {endpoint}")
+
+    ##############################################################
+    # Records
+    ##############################################################
+
+    async def _fetch_records(
+        self,
+        base_url_prefix: str,
+        record_type: Optional[Type[_T]],
+        record_ids: Sequence[int],
+        missing_ok: bool = False,
+        include: Optional[Iterable[str]] = None,
+    ) -> List[Optional[_T]]:
+        """
+        Fetches records of a particular type with the specified IDs from the remote server
+
+        This is the asynchronous version of :meth:`PortalClient._fetch_records`. The IDs are split into batches
+        that are fetched concurrently. Records will be returned in the same order as the record ids.
+
+        This function only fetches the top-level records - it does not fetch the children of the records.
+        """
+
+        if not record_ids:
+            return []
+
+        if include is not None:
+            # Always include the base stuff
+            include = list(include) + ["*"]
+
+        if record_type is None:
+            endpoint = f"{base_url_prefix}/records/bulkGet"
+        else:
+            record_type_str = record_type.model_fields["record_type"].default
+            endpoint = f"{base_url_prefix}/records/{record_type_str}/bulkGet"
+
+        # Split into enough batches to keep all the connections busy, but not so many
+        # that we are making lots of tiny requests
+        max_batch_size = self.api_limits["get_records"]
+        batch_size = math.ceil(len(record_ids) / self.max_concurrency)
+        batch_size = min(max(batch_size, max_batch_size // 10, 1), max_batch_size)
+
+        async def _download_batch(id_batch: List[int]):
+            body = CommonBulkGetBody(ids=id_batch, include=include, missing_ok=missing_ok)
+            return await self.make_request("post", endpoint, List[Optional[Dict[str, Any]]], body=body)
+
+        batch_results = await asyncio.gather(*[_download_batch(b) for b in chunk_iterable(record_ids, batch_size)])
+
+        all_records = []
+        for record_dicts in batch_results:
+            if record_type is None:
+                all_records.extend(records_from_dicts(record_dicts, self.client, base_url_prefix))
+            else:
+                all_records.extend(
+                    [record_type(self.client, base_url_prefix, **r) if r is not None else None for r in record_dicts]
+                )
+
+        return all_records
+
+    @staticmethod
+    async def _fetch_children(records: Iterable[Optional[BaseRecord]], include: Optional[Iterable[str]]) -> None:
+        # Fetching children is done by the record classes with the synchronous client,
+        # so that is done in a separate thread
+        record_groups = {}
+        for r in records:
+            if r is not None:
+                record_groups.setdefault(type(r), [])
+                record_groups[type(r)].append(r)
+
+        for record_type, v in record_groups.items():
+            await asyncio.to_thread(record_type.fetch_children_multi, v, include, True)
+
+    async def get_records(
+        self,
+        record_ids: Union[int, Sequence[int]],
+        missing_ok: bool = False,
+        *,
+        include: Optional[Iterable[str]] = None,
+    ) -> Union[List[Optional[BaseRecord]], Optional[BaseRecord]]:
+        """
+        Obtain records of all types with specified IDs
+
+        This is the asynchronous version of :meth:`PortalClient.get_records`.
+
+        Records will be returned in the same order as the record ids.
+
+        Parameters
+        ----------
+        record_ids
+            Single ID or sequence/list of records to obtain
+        missing_ok
+            If set to True, then missing records will be tolerated, and the returned
+            records will contain None for the corresponding IDs that were not found.
+        include
+            Additional fields to include in the returned record
+
+        Returns
+        -------
+        :
+            If a single ID was specified, returns just that record. Otherwise, returns
+            a list of records.  If missing_ok was specified, None will be substituted for a record
+            that was not found.
+        """
+
+        is_single = not isinstance(record_ids, Sequence)
+
+        record_ids = make_list(record_ids)
+        all_records = await self._fetch_records("api/v1", None, record_ids, missing_ok, include)
+        await self._fetch_children(all_records, include)
+
+        if is_single:
+            return all_records[0]
+        else:
+            return all_records
+
+    async def query_records(
+        self,
+        *,
+        record_id: Optional[Union[int, Iterable[int]]] = None,
+        record_type: Optional[Union[str, Iterable[str]]] = None,
+        manager_name: Optional[Union[str, Iterable[str]]] = None,
+        history_manager_name: Optional[Union[str, Iterable[str]]] = None,
+        status: Optional[Union[RecordStatusEnum, Iterable[RecordStatusEnum]]] = None,
+        dataset_id: Optional[Union[int, Iterable[int]]] = None,
+        project_id: Optional[Union[int, Iterable[int]]] = None,
+        parent_id: Optional[Union[int, Iterable[int]]] = None,
+        child_id: Optional[Union[int, Iterable[int]]] = None,
+        created_before: Optional[Union[datetime, str]] = None,
+        created_after: Optional[Union[datetime, str]] = None,
+        modified_before: Optional[Union[datetime, str]] = None,
+        modified_after: Optional[Union[datetime, str]] = None,
+        creator_user: Optional[Union[int, str, Iterable[Union[int, str]]]] = None,
+        limit: int = None,
+        include: Optional[Iterable[str]] = None,
+    ) -> AsyncIterator[BaseRecord]:
+        """
+        Query records of all types based on common fields
+
+        This is the asynchronous version of :meth:`PortalClient.query_records`, and takes the same arguments.
+        It returns an asynchronous iterator over the records (``async for record in client.query_records(...)``).
+        While the records of one batch are being fetched, the next batch of the query is requested.
+
+        Do not rely on the returned records being in any particular order.
+        """
+
+        filter_dict = {
+            "record_id": make_list(record_id),
+            "record_type": make_list(record_type),
+            "manager_name": make_list(manager_name),
+            "history_manager_name": make_list(history_manager_name),
+            "status": make_list(status),
+            "dataset_id": make_list(dataset_id),
+            "project_id": make_list(project_id),
+            "parent_id": make_list(parent_id),
+            "child_id": make_list(child_id),
+            "created_before": created_before,
+            "created_after": created_after,
+            "modified_before": modified_before,
+            "modified_after": modified_after,
+            "creator_user": make_list(creator_user),
+            "limit": limit,
+        }
+
+        query_filters = RecordQueryFilters(**filter_dict)
+        total_limit = query_filters.limit
+        batch_limit = self.api_limits["get_records"] // 4
+
+        async def _query_ids(cursor: Optional[int], n_fetched: int) -> List[int]:
+            if total_limit is not None and n_fetched >= total_limit:
+                return []
+
+            batch_filters = query_filters.model_copy(update={"cursor": cursor})
+            if total_limit is not None:
+                batch_filters.limit = min(total_limit - n_fetched, batch_limit)
+            else:
+                batch_filters.limit = batch_limit
+
+            return await self.make_request("post", "api/v1/records/query", List[int], body=batch_filters)
+
+        fetched = 0
+        next_ids = asyncio.ensure_future(_query_ids(None, fetched))
+
+        try:
+            while True:
+                record_ids = await next_ids
+                if not record_ids:
+                    break
+
+                fetched += len(record_ids)
+                next_ids = asyncio.ensure_future(_query_ids(record_ids[-1], fetched))
+
+                records = await self._fetch_records("api/v1", None, record_ids, include=include)
+                await self._fetch_children(records, include)
+
+                for r in records:
+                    yield r
+        finally:
+            next_ids.cancel()
+
+    ##############################################################
+    # Datasets
+    ##############################################################
+
+    async def _fetch_dataset_records_batch(
+        self,
+        dataset: BaseDataset,
+        entry_names: List[str],
+        specification_name: str,
+        status: Optional[List[RecordStatusEnum]],
+        include: Optional[Iterable[str]],
+    ) -> List[Tuple[str, str, BaseRecord]]:
+        body = DatasetFetchRecordsBody(entry_names=entry_names, specification_names=[specification_name], status=status)
+
+        record_info = await self.make_request(
+            "post",
+            f"{dataset._base_url}/records/bulkFetch",
+            List[Tuple[str, str, int]],  # (entry_name, spec_name, record_id)
+            body=body,
+        )
+
+        record_ids = [x[2] for x in record_info]
+        records = await self._fetch_records(dataset._base_url_prefix, dataset._record_type, record_ids, include=include)
+        await self._fetch_children(records, include)
+
+        return [(ename, sname, r) for (ename, sname, _), r in zip(record_info, records)]
+
+    async def iterate_dataset_records(
+        self,
+        dataset: BaseDataset,
+        entry_names: Optional[Union[str, Iterable[str]]] = None,
+        specification_names: Optional[Union[str, Iterable[str]]] = None,
+        status: Optional[Union[RecordStatusEnum, Iterable[RecordStatusEnum]]] = None,
+        include: Optional[Iterable[str]] = None,
+    ) -> AsyncIterator[Tuple[str, str, BaseRecord]]:
+        """
+        Iterate over the records of a dataset
+
+        This is the asynchronous version of :meth:`BaseDataset.iterate_records`. It returns an asynchronous
+        iterator over tuples of (entry name, specification name, record). Several batches of records are
+        fetched concurrently (up to ``max_concurrency``), and are returned in order.
+
+        Records are always fetched from the server, and are not stored in the cache of the dataset.
+
+        Parameters
+        ----------
+        dataset
+            A dataset obtained from the synchronous client (:attr:`client`)
+        entry_names
+            Names of the entries whose records to fetch. If None, fetch all entries
+        specification_names
+            Names of the specifications whose records to fetch. If None, fetch all specifications
+        status
+            Fetch only records with these statuses
+        include
+            Additional fields to include in the returned records
+        """
+
+        dataset.assert_is_not_view()
+        dataset.assert_online()
+
+        # Getting the names may require fetching them (synchronously) from the server
+        if entry_names is None:
+            entry_names = (await asyncio.to_thread(lambda: dataset.entry_names)).copy()
+        else:
+            entry_names = make_list(entry_names).copy()
+
+        if specification_names is None:
+            specification_names = (await asyncio.to_thread(lambda: dataset.specification_names)).copy()
+        else:
+            specification_names = make_list(specification_names).copy()
+
+        status = make_list(status)
+        batch_size = self.api_limits["get_records"]
+
+        # Keep a limited number of batches in flight
+        pending = collections.deque()
+
+        try:
+            for spec_name in specification_names:
+                for entry_names_batch in chunk_iterable(entry_names, batch_size):
+                    pending.append(
+                        asyncio.ensure_future(
+                            self._fetch_dataset_records_batch(dataset, entry_names_batch, spec_name, status, include)
+                        )
+                    )
+
+                    if len(pending) >= self.max_concurrency:
+                        for x in await pending.popleft():
+                            yield x
+
+            while pending:
+                for x in await pending.popleft():
+                    yield x
+        finally:
+            for p in pending:
+                p.cancel()
@@ -5,8 +5,12 @@ Caching for the PortalClient
 from __future__ import annotations
 
 import datetime
+import glob
+import heapq
 import os
+import time
 from collections.abc import Sequence, Iterable
+from contextlib import contextmanager
 from typing import TYPE_CHECKING, TypeVar, Type, Any
 from urllib.parse import urlparse
 
@@ -25,8 +29,23 @@ if TYPE_CHECKING:
 _DATASET_T = TypeVar("_DATASET_T")
 _RECORD_T = TypeVar("_RECORD_T")
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 _query_chunk_size = 125
 
+# How long (in milliseconds) to wait for another connection/process to release a lock on a cache file
+_busy_timeout = 10000
+
+# Eviction is skipped (and tried again later) if a file is busy, so it doesn't need to wait as long
+_eviction_busy_timeout = 1000
+
+# How often (in seconds) access times of records read from the cache are written to the file.
+# Eviction only needs approximate access times, and this avoids a write for every read
+_access_flush_interval = 60.0
+
 
 def _msgpack_encode_cache(obj: Any) -> Any:
     # Similar to msgpack_encode in serialization, however
@@ -50,11 +69,31 @@ def decompress_from_cache(data: bytes, value_type) -> Any:
     return deserialize(decompressed_data, "msgpack", value_type)
 
 
+class CacheStatistics(BaseModel):
+    """
+    Statistics about the use of a cache (by this process)
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evicted_records: int = 0
+    evicted_bytes: int = 0
+
+
 class RecordCache:
-    def __init__(self, cache_uri: str, read_only: bool):
+    def __init__(self, cache_uri: str, read_only: bool, *, portal_cache: PortalCache | None = None):
         self.cache_uri = cache_uri
         self.read_only = read_only
 
+        # The cache this belongs to (for tracking usage, and keeping its size under the limit)
+        self._portal_cache = portal_cache
+        self._track_access = not read_only and portal_cache is not None and portal_cache.is_disk
+        self.stats = portal_cache.stats if portal_cache is not None else CacheStatistics()
+
+        # Access times of records that have been read, but not yet written to the file
+        self._pending_access: dict[int, float] = {}
+        self._last_access_flush = time.time()
+
         if self.read_only:
             self._conn = apsw.Connection(self.cache_uri, flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI)
         else:
@@ -63,6 +102,7 @@ class RecordCache:
             )
 
         self._conn.pragma("foreign_keys", "ON")
+        self._conn.setbusytimeout(_busy_timeout)
 
         if not read_only:
             self._create_tables()
@@ -76,16 +116,61 @@ class RecordCache:
     def _create_tables(self):
         self._assert_writable()
 
+        # Allows for freeing space after records are evicted (only has an effect on new files)
+        self._conn.pragma("auto_vacuum", "INCREMENTAL")
+
         self._conn.execute("""
             CREATE TABLE IF NOT EXISTS records (
                 id INTEGER PRIMARY KEY,
                 status TEXT NOT NULL,
                 modified_on DECIMAL NOT NULL,
-                record BLOB NOT NULL
+                record BLOB NOT NULL,
+                last_accessed REAL NOT NULL DEFAULT 0
             )
             """)
 
+        # Files created by older versions do not have the last access time
+        columns = [x[1] for x in self._conn.execute("PRAGMA table_info(records)")]
+        if "last_accessed" not in columns:
+            self._conn.execute("ALTER TABLE records ADD COLUMN last_accessed REAL NOT NULL DEFAULT 0")
+
         self._conn.execute("CREATE INDEX IF NOT EXISTS records_status ON records (status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_last_accessed ON records (last_accessed)")
+
+    def _touch_records(self, record_ids: Sequence[int]):
+        # Update the last access time of records. These are only written to the file every so often
+        if not self._track_access or not record_ids:
+            return
+
+        now = time.time()
+        self._pending_access.update(dict.fromkeys(record_ids, now))
+
+        if now - self._last_access_flush >= _access_flush_interval:
+            self.flush_access_times()
+
+    def flush_access_times(self):
+        """
+        Writes the access times of records read since the last flush to the cache file
+        """
+
+        self._last_access_flush = time.time()
+
+        if not self._pending_access:
+            return
+
+        pending, self._pending_access = self._pending_access, {}
+        stmt = "UPDATE records SET last_accessed = ? WHERE id = ?"
+
+        with self._conn:
+            self._conn.executemany(stmt, [(t, rid) for rid, t in pending.items()])
+
+    def _records_written(self, n_bytes: int):
+        # Lets the parent cache know that data was written, so it can keep the total size under the limit.
+        # This is not done in the middle of a transaction, since eviction uses separate connections.
+        # Access times are written first, so that eviction sees them
+        if self._track_access and not self._conn.in_transaction:
+            self.flush_access_times()
+            self._portal_cache.record_bytes_written(n_bytes)
 
     def update_metadata(self, key: str, value: Any) -> None:
         self._assert_writable()
@@ -97,11 +182,14 @@ class RecordCache:
 
         record_data = self._conn.execute(stmt, (record_id,)).fetchone()
         if record_data is None:
+            self.stats.misses += 1
             return None
 
-        record = decompress_from_cache(record_data[1], record_type)
+        record = decompress_from_cache(record_data[0], record_type)
 
         record._record_cache = self
+        self.stats.hits += 1
+        self._touch_records([record_id])
 
         return record
 
@@ -110,17 +198,21 @@ class RecordCache:
 
         for record_id_batch in chunk_iterable(record_ids, _query_chunk_size):
             id_params = ",".join("?" * len(record_id_batch))
-            stmt = f"SELECT record FROM records WHERE id IN ({id_params})"
+            stmt = f"SELECT id, record FROM records WHERE id IN ({id_params})"
 
             rdata = self._conn.execute(stmt, record_id_batch).fetchall()
 
-            for compressed_record in rdata:
-                record = decompress_from_cache(compressed_record[0], record_type)
+            for _, compressed_record in rdata:
+                record = decompress_from_cache(compressed_record, record_type)
 
                 record._record_cache = self
 
                 all_records.append(record)
 
+            self.stats.hits += len(rdata)
+            self.stats.misses += len(record_id_batch) - len(rdata)
+            self._touch_records([x[0] for x in rdata])
+
         return all_records
 
     def get_existing_records(self, record_ids: Iterable[int]) -> list[int]:
@@ -138,17 +230,22 @@ class RecordCache:
     def update_records(self, records: Iterable[_RECORD_T]):
         self._assert_writable()
 
+        n_bytes = 0
+        now = time.time()
+
         with self._conn:
             for record_batch in chunk_iterable(records, 10):
                 n_batch = len(record_batch)
 
-                values_params = ",".join(["(?, ?, ?, ?)"] * n_batch)
+                values_params = ",".join(["(?, ?, ?, ?, ?)"] * n_batch)
 
                 all_params = []
                 for r in record_batch:
-                    all_params.extend((r.id, r.status, r.modified_on.timestamp(), compress_for_cache(r)))
+                    compressed_record = compress_for_cache(r)
+                    n_bytes += len(compressed_record)
+                    all_params.extend((r.id, r.status, r.modified_on.timestamp(), compressed_record, now))
 
-                stmt = f"REPLACE INTO records (id, status, modified_on, record) VALUES {values_params}"
+                stmt = f"REPLACE INTO records (id, status, modified_on, record, last_accessed) VALUES {values_params}"
 
                 self._conn.execute(stmt, all_params)
 
@@ -156,6 +253,54 @@ class RecordCache:
             r._record_cache = self
             r._cache_dirty = False
 
+        self._records_written(n_bytes)
+
+    def update_records_compressed(self, record_rows: Iterable[tuple[int, str, float, bytes]]):
+        """
+        Adds or replaces records that have already been compressed with :func:`compress_for_cache`
+
+        Each row is a tuple of (id, status, modified_on timestamp, compressed record). All the rows
+        are written in a single transaction.
+        """
+
+        self._assert_writable()
+
+        stmt = "REPLACE INTO records (id, status, modified_on, record, last_accessed) VALUES (?, ?, ?, ?, ?)"
+
+        n_bytes = 0
+        now = time.time()
+
+        def _rows():
+            nonlocal n_bytes
+            for rid, status, modified_on, compressed_record in record_rows:
+                n_bytes += len(compressed_record)
+                yield rid, status, modified_on, compressed_record, now
+
+        with self._conn:
+            self._conn.executemany(stmt, _rows())
+
+        self._records_written(n_bytes)
+
+    def get_records_modified_on(self) -> dict[int, float]:
+        """
+        Returns the modified_on timestamp of all records in the cache, keyed by record id
+        """
+
+        stmt = "SELECT id, modified_on FROM records"
+        return {rid: modified_on for rid, modified_on in self._conn.execute(stmt)}
+
+    def set_bulk_write_mode(self):
+        """
+        Sets up the connection for writing large amounts of data
+
+        This disables the rollback journal and syncing to disk, so it should only be used
+        when writing a new file (a crash while writing may leave the file corrupted).
+        """
+
+        self._assert_writable()
+        self._conn.pragma("journal_mode", "OFF")
+        self._conn.pragma("synchronous", "OFF")
+
     def writeback_record(self, record):
         self._assert_writable()
 
@@ -163,13 +308,24 @@ class RecordCache:
 
         # Only update if timestamp is same or newer, and if this record is larger
         # than what is stored already
-        stmt = f"""INSERT OR REPLACE INTO records (id, status, modified_on, record)
-                   SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM records WHERE id = ?
+        stmt = f"""INSERT OR REPLACE INTO records (id, status, modified_on, record, last_accessed)
+                   SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM records WHERE id = ?
                    AND (modified_on > ? OR (modified_on = ? and length(record) > ?)))"""
 
         ts = record.modified_on.timestamp()
-        row_data = (record.id, record.status, ts, compressed_record, record.id, ts, ts, len(compressed_record))
+        row_data = (
+            record.id,
+            record.status,
+            ts,
+            compressed_record,
+            time.time(),
+            record.id,
+            ts,
+            ts,
+            len(compressed_record),
+        )
         self._conn.execute(stmt, row_data)
+        self._records_written(len(compressed_record))
 
     def delete_record(self, record_id: int):
         self._assert_writable()
@@ -187,12 +343,19 @@ class RecordCache:
 
 
 class DatasetCache(RecordCache):
-    def __init__(self, cache_uri: str, read_only: bool, dataset_type: Type[_DATASET_T]):
+    def __init__(
+        self,
+        cache_uri: str,
+        read_only: bool,
+        dataset_type: Type[_DATASET_T],
+        *,
+        portal_cache: PortalCache | None = None,
+    ):
         self._entry_type = dataset_type._entry_type
         self._specification_type = dataset_type._specification_type
         self._record_type = dataset_type._record_type
 
-        RecordCache.__init__(self, cache_uri=cache_uri, read_only=read_only)
+        RecordCache.__init__(self, cache_uri=cache_uri, read_only=read_only, portal_cache=portal_cache)
 
     def _create_tables(self):
         RecordCache._create_tables(self)
@@ -229,6 +392,15 @@ class DatasetCache(RecordCache):
             )
         """)
 
+        # Status and modification time of records that have changed on the server (compared to what is cached)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS record_changes (
+                id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                modified_on DECIMAL NOT NULL
+            )
+        """)
+
         self._conn.execute("CREATE INDEX IF NOT EXISTS dataset_records_entry_name ON dataset_records (entry_name)")
         self._conn.execute(
             "CREATE INDEX IF NOT EXISTS dataset_records_specification_name ON dataset_records (specification_name)"
@@ -240,6 +412,63 @@ class DatasetCache(RecordCache):
         r = self._conn.execute(stmt, (key,)).fetchone()
         return deserialize(r[0], "msgpack", Any)
 
+    def get_record_changes_cursor(self) -> int | None:
+        """
+        Returns the (server) transaction id that changes have been stored up to with :meth:`update_record_changes`
+        """
+
+        stmt = "SELECT value FROM metadata WHERE key = 'record_changes_cursor'"
+        r = self._conn.execute(stmt).fetchone()
+        return None if r is None else deserialize(r[0], "msgpack", int)
+
+    def set_record_changes_cursor(self, cursor: int):
+        """
+        Sets the (server) transaction id that all changes have been stored up to
+        """
+
+        self._assert_writable()
+        self.update_metadata("record_changes_cursor", cursor)
+
+    def update_record_changes(self, changes: Iterable[tuple[int, RecordStatusEnum, datetime.datetime]]):
+        """
+        Stores information about records that have changed on the server
+
+        Only changes to records that are in the cache (and are older than the change) are kept.
+
+        Parameters
+        ----------
+        changes
+            Tuples of (record id, status, modified_on) of records as they are on the server
+        """
+
+        self._assert_writable()
+
+        with self._conn:
+            stmt = "REPLACE INTO record_changes (id, status, modified_on) VALUES (?, ?, ?)"
+            self._conn.executemany(stmt, ((rid, status, mtime.timestamp()) for rid, status, mtime in changes))
+
+            # Remove changes for records we don't have, or that are already up-to-date
+            stmt = """DELETE FROM record_changes WHERE NOT EXISTS
+                      (SELECT 1 FROM records r WHERE r.id = record_changes.id AND r.modified_on < record_changes.modified_on)"""
+            self._conn.execute(stmt)
+
+    def get_record_changes(self, record_ids: Iterable[int]) -> dict[int, tuple[str, datetime.datetime]]:
+        """
+        Returns the server status and modified_on of records that have changed on the server
+
+        Records that have not changed since they were cached are not included.
+        """
+
+        ret = {}
+        for record_id_batch in chunk_iterable(record_ids, _query_chunk_size):
+            record_id_params = ",".join("?" * len(record_id_batch))
+            stmt = f"SELECT id, status, modified_on FROM record_changes WHERE id IN ({record_id_params})"
+
+            for rid, status, modified_on in self._conn.execute(stmt, record_id_batch):
+                ret[rid] = (status, datetime.datetime.fromtimestamp(modified_on, tz=datetime.timezone.utc))
+
+        return ret
+
     def entry_exists(self, name: str) -> bool:
         stmt = "SELECT 1 FROM dataset_entries WHERE name=?"
         return self._conn.execute(stmt, (name,)).fetchone() is not None
@@ -366,7 +595,7 @@ class DatasetCache(RecordCache):
         return self._conn.execute(stmt, (entry_name, specification_name)).fetchone() is not None
 
     def get_dataset_record(self, entry_name: str, specification_name: str) -> _RECORD_T | None:
-        stmt = """SELECT r.record FROM records r
+        stmt = """SELECT r.id, r.record FROM records r
                   INNER JOIN dataset_records dr ON r.id = dr.record_id
                   WHERE dr.entry_name=? and dr.specification_name=?"""
 
@@ -374,8 +603,10 @@ class DatasetCache(RecordCache):
         if record_data is None:
             return None
 
-        record = decompress_from_cache(record_data[0], self._record_type)
+        record = decompress_from_cache(record_data[1], self._record_type)
         record._record_cache = self
+        self.stats.hits += 1
+        self._touch_records([record_data[0]])
 
         return record
 
@@ -391,9 +622,9 @@ class DatasetCache(RecordCache):
         for entry_names_batch in chunk_iterable(entry_names, _query_chunk_size):
             entry_params = ",".join("?" * len(entry_names_batch))
 
-            stmt = f"""SELECT dr.entry_name, dr.specification_name, r.record
+            stmt = f"""SELECT dr.entry_name, dr.specification_name, dr.record_id, r.record
                        FROM dataset_records dr
-                       INNER JOIN records r ON r.id = dr.record_id
+                       LEFT JOIN records r ON r.id = dr.record_id
                        WHERE dr.entry_name IN ({entry_params})
                        AND dr.specification_name IN ({specification_params})"""
 
@@ -401,16 +632,26 @@ class DatasetCache(RecordCache):
 
             if status:
                 status_params = ",".join("?" * len(status))
-                stmt = stmt + f"AND r.status IN ({status_params})"
+                stmt = stmt + f"AND (r.status IN ({status_params}) OR r.id IS NULL)"
                 all_params = (*all_params, *status)
 
             rdata = self._conn.execute(stmt, all_params).fetchall()
 
-            for ename, sname, compressed_record in rdata:
+            found_ids = []
+            for ename, sname, record_id, compressed_record in rdata:
+                # Records that are part of the dataset, but are not in the cache (ie, were evicted)
+                if compressed_record is None:
+                    self.stats.misses += 1
+                    continue
+
                 record = decompress_from_cache(compressed_record, self._record_type)
                 record._record_cache = self
 
                 all_records.append((ename, sname, record))
+                found_ids.append(record_id)
+
+            self.stats.hits += len(found_ids)
+            self._touch_records(found_ids)
 
         return all_records
 
@@ -517,12 +758,29 @@ class DatasetCache(RecordCache):
 
 
 class PortalCache:
+    """
+    Cache of records and datasets obtained from a server
+
+    Each dataset has its own cache file. If a maximum size is given, the least-recently-used
+    records (across all the dataset cache files) are evicted when the total size of the files
+    exceeds that size.
+    """
+
     def __init__(self, server_uri: str, cache_dir: str | None, max_size: int):
         parsed_url = urlparse(server_uri)
 
         # Should work as a reasonable fingerprint?
         self.server_fingerprint = f"{parsed_url.hostname}_{parsed_url.port}"
 
+        # Maximum size (in bytes) of all the cache files. 0 or None means no limit
+        self.max_size = max_size
+
+        # Statistics about cache usage by this process
+        self.stats = CacheStatistics()
+
+        # How much has been written since the last time the size was checked
+        self._bytes_since_check = 0
+
         if cache_dir:
             # _shared_memory shouldn't be used, so we don't set it and wait for errors
             self._is_disk = True
@@ -558,17 +816,216 @@ class PortalCache:
         uri = self.get_dataset_cache_uri(dataset_id)
 
         # If you are asking this for a dataset cache, it should be writable
-        return DatasetCache(uri, False, dataset_type)
+        return DatasetCache(uri, False, dataset_type, portal_cache=self)
 
     @property
     def is_disk(self) -> bool:
         return self._is_disk
 
+    def _get_cache_files(self) -> list[str]:
+        if not self._is_disk:
+            return []
+
+        return sorted(glob.glob(os.path.join(self.cache_dir, "dataset_*.sqlite")))
+
+    def get_cache_size(self) -> int:
+        """
+        Returns the total size (in bytes) of all the cache files
+        """
+
+        total_size = 0
+        for path in self._get_cache_files():
+            for suffix in ("", "-journal", "-wal"):
+                try:
+                    total_size += os.path.getsize(path + suffix)
+                except FileNotFoundError:
+                    pass
+
+        return total_size
+
+    @contextmanager
+    def _eviction_lock(self):
+        # Only one process should be evicting records from the cache files at a time. Other processes
+        # do not wait - they just skip eviction (SQLite takes care of locking for reading and writing)
+        if fcntl is None:
+            yield True
+            return
+
+        with open(os.path.join(self.cache_dir, ".eviction.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _open_cache_file(path: str) -> apsw.Connection:
+        conn = apsw.Connection(f"file:{path}", flags=apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_URI)
+        conn.setbusytimeout(_eviction_busy_timeout)
+        return conn
+
+    @staticmethod
+    def _free_pages(conn: apsw.Connection, full_vacuum: bool = False):
+        # Files created by older versions don't support incremental vacuum. A full vacuum
+        # converts them (this needs an exclusive lock, and is skipped if the file is busy)
+        if conn.pragma("auto_vacuum") != 2:
+            if not full_vacuum:
+                return
+            conn.pragma("auto_vacuum", "INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+
+    def record_bytes_written(self, n_bytes: int):
+        """
+        Called by the dataset caches when data is written to them
+
+        Every so often, this checks the total size of the cache, and evicts records if it is too large.
+        """
+
+        if not self._is_disk or not self.max_size:
+            return
+
+        self._bytes_since_check += n_bytes
+
+        # Don't check too often (stat-ing all the files is not free)
+        if self._bytes_since_check >= min(self.max_size // 20, 4 * 1024 * 1024):
+            self._bytes_since_check = 0
+            self.enforce_max_size()
+
+    def enforce_max_size(self) -> int:
+        """
+        Evicts least-recently-used records if the cache is larger than the maximum size
+
+        Records are evicted until the cache is at 90% of the maximum size, to avoid evicting records
+        every time something is written.
+
+        Returns
+        -------
+        :
+            Number of records evicted
+        """
+
+        if not self._is_disk or not self.max_size:
+            return 0
+
+        cache_size = self.get_cache_size()
+        if cache_size <= self.max_size:
+            return 0
+
+        with self._eviction_lock() as have_lock:
+            if not have_lock:
+                return 0
+
+            # Free pages left over from any previous deletions first
+            for path in self._get_cache_files():
+                conn = self._open_cache_file(path)
+                try:
+                    self._free_pages(conn, full_vacuum=True)
+                except apsw.BusyError:
+                    pass
+                finally:
+                    conn.close()
+
+            cache_size = self.get_cache_size()
+            if cache_size <= self.max_size:
+                return 0
+
+            return self._evict_records(cache_size - int(0.9 * self.max_size))
+
+    @staticmethod
+    def _iterate_lru_records(path: str, conn: apsw.Connection):
+        # Iterates over (last_accessed, path, record id, size) of the records in a cache file, oldest access first
+        columns = [x[1] for x in conn.execute("PRAGMA table_info(records)")]
+        if not columns:
+            return
+
+        last_accessed = "last_accessed" if "last_accessed" in columns else "0"
+        stmt = f"SELECT {last_accessed}, id, length(record) FROM records ORDER BY {last_accessed}"
+        for la, record_id, size in conn.execute(stmt):
+            yield la, path, record_id, size
+
+    def _evict_records(self, n_bytes: int) -> int:
+        # Evicts least-recently-used records (across all cache files) totalling at least n_bytes
+        # Should be called with the eviction lock held
+        conns = {path: self._open_cache_file(path) for path in self._get_cache_files()}
+
+        try:
+            record_iters = [self._iterate_lru_records(path, conn) for path, conn in conns.items()]
+
+            to_evict: dict[str, tuple[list[int], int]] = {}
+            selected_bytes = 0
+
+            for _, path, record_id, size in heapq.merge(*record_iters):
+                record_ids, path_bytes = to_evict.get(path, ([], 0))
+                record_ids.append(record_id)
+                to_evict[path] = (record_ids, path_bytes + size)
+
+                selected_bytes += size
+                if selected_bytes >= n_bytes:
+                    break
+
+            # Close the iterators (and their cursors) before modifying the files
+            for it in record_iters:
+                it.close()
+
+            n_evicted = 0
+            for path, (record_ids, path_bytes) in to_evict.items():
+                conn = conns[path]
+                try:
+                    with conn:
+                        for record_id_batch in chunk_iterable(record_ids, _query_chunk_size):
+                            record_id_params = ",".join("?" * len(record_id_batch))
+                            stmt = f"DELETE FROM records WHERE id IN ({record_id_params})"
+                            conn.execute(stmt, record_id_batch)
+                    self._free_pages(conn)
+                except apsw.BusyError:
+                    # Some other process is holding on to this file for a long time - try again later
+                    continue
+
+                n_evicted += len(record_ids)
+                self.stats.evicted_records += len(record_ids)
+                self.stats.evicted_bytes += path_bytes
+
+            return n_evicted
+
+        finally:
+            for conn in conns.values():
+                conn.close()
+
     def vacuum(self, cache_name: str | None = None):
-        if self._is_disk:
-            # TODO
+        """
+        Reclaims unused space in the cache files
+
+        Parameters
+        ----------
+        cache_name
+            Name of the cache to vacuum (for example, ``dataset_123``). If None, vacuum all cache files
+        """
+
+        if not self._is_disk:
             return
 
+        if cache_name is None:
+            paths = self._get_cache_files()
+        else:
+            paths = [self.get_cache_path(cache_name)]
+
+        for path in paths:
+            if not os.path.isfile(path):
+                continue
+
+            conn = self._open_cache_file(path)
+            try:
+                self._free_pages(conn, full_vacuum=True)
+            finally:
+                conn.close()
+
 
 def read_dataset_metadata(file_path: str):
     """
@@ -594,6 +1051,13 @@ def read_dataset_metadata(file_path: str):
     return d
 
 
+def _has_children(record_type: Type[_RECORD_T]) -> bool:
+    # Records that can have children override _fetch_children_multi
+    from .record_models import BaseRecord
+
+    return record_type._fetch_children_multi.__func__ is not BaseRecord._fetch_children_multi.__func__
+
+
 def get_records_with_cache(
     client: PortalClient | None,
     base_url_prefix: str,
@@ -619,7 +1083,9 @@ def get_records_with_cache(
 
     This function will fetch the children of the records if enough information
     is fetched of the parent record. This is handled by the various fetch_children_multi
-    class functions of the record types.
+    class functions of the record types. If `include` contains "**", all descendants of newly-fetched
+    records are fetched from the server at once and stored in the cache (if a cache is given), so that
+    children shared between records are only fetched once.
 
 
     Parameters
@@ -673,6 +1139,16 @@ def get_records_with_cache(
 
         existing_records += recs
 
+        # If the entire tree of records was requested, fetch all descendants of the new records at once
+        # and store them in the cache. Fetching the children (below) then finds them in the cache, rather than
+        # fetching each level of children from the server one after another
+        if _has_children(record_type) and include is not None and "**" in include and record_cache is not None:
+            for descendants in client._fetch_record_descendants(base_url_prefix, [r.id for r in recs], include):
+                record_cache.update_records(descendants)
+
+            # Everything below these records was just fetched
+            force_fetch = False
+
     # Fetch all children as well
     record_type.fetch_children_multi(existing_records, include=include, force_fetch=force_fetch)
 
@@ -3,8 +3,9 @@ from __future__ import annotations
 import logging
 import math
 import os
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple, Union, Sequence, Iterable, TypeVar, Type, Literal
+from typing import Any, Dict, List, Optional, Tuple, Union, Sequence, Iterable, Iterator, TypeVar, Type, Literal
 
 from tabulate import tabulate
 
@@ -108,6 +109,8 @@ from .record_models import (
     RecordModifyBody,
     RecordDeleteBody,
     RecordRevertBody,
+    RecordWatchBody,
+    RecordFetchDescendantsBody,
     BaseRecord,
     RecordQueryIterator,
     records_from_dicts,
@@ -127,6 +130,15 @@ from .utils import make_list, chunk_iterable, process_chunk_iterable
 
 _T = TypeVar("_T", bound=BaseRecord)
 
+# Statuses after which a record will no longer change (unless modified by a user)
+_finished_status = {
+    RecordStatusEnum.complete,
+    RecordStatusEnum.error,
+    RecordStatusEnum.cancelled,
+    RecordStatusEnum.invalid,
+    RecordStatusEnum.deleted,
+}
+
 
 class PortalClient(PortalClientBase):
     """
@@ -163,7 +175,8 @@ class PortalClient(PortalClientBase):
         cache_dir
             Directory to store an internal cache of records and other data
         cache_max_size
-            Maximum size of the cache directory
+            Maximum size of the cache directory (in bytes). Least-recently-used records are evicted
+            when the cache grows beyond this size. If 0, there is no limit
         """
 
         PortalClientBase.__init__(self, address, username, password, verify, show_motd)
@@ -804,6 +817,65 @@ class PortalClient(PortalClientBase):
         assert all((x is None or x.id == rid) for x, rid in zip(all_records, record_ids))
         return all_records
 
+    def _fetch_record_descendants(
+        self,
+        base_url_prefix: str,
+        record_ids: Sequence[int],
+        include: Optional[Iterable[str]] = None,
+    ) -> Iterator[List[BaseRecord]]:
+        """
+        Fetches all descendants (children, children of children, etc) of records from the remote server
+
+        Descendants of all types are fetched together, rather than level-by-level. They are returned in batches,
+        and each descendant is only returned once, even if it is shared between several of the given records.
+
+        This function does not link the descendants to their parents, and does not use caching at all.
+
+        Parameters
+        ----------
+        base_url_prefix
+            Prefix of all the URLs for fetching records
+        record_ids
+            IDs of the records whose descendants to fetch
+        include
+            Additional fields to include in the returned records
+
+        Returns
+        -------
+        :
+            An iterator over batches of records (of any type)
+        """
+
+        if include is not None:
+            # Always include the base stuff
+            include = list(include) + ["*"]
+
+        batch_size = self.api_limits["get_records"]
+        seen_ids = set()
+
+        for id_batch in chunk_iterable(record_ids, batch_size):
+            after_record_id = None
+
+            while True:
+                body = RecordFetchDescendantsBody(
+                    record_ids=id_batch, include=include, after_record_id=after_record_id, limit=batch_size
+                )
+                record_dicts = self.make_request(
+                    "post", f"{base_url_prefix}/records/descendants", List[Dict[str, Any]], body=body
+                )
+
+                # Descendants may be shared with records from a previous batch
+                new_record_dicts = [r for r in record_dicts if r["id"] not in seen_ids]
+                seen_ids.update(r["id"] for r in new_record_dicts)
+
+                if new_record_dicts:
+                    yield records_from_dicts(new_record_dicts, self, base_url_prefix)
+
+                if len(record_dicts) < batch_size:
+                    break
+
+                after_record_id = record_dicts[-1]["id"]
+
     def get_records(
         self,
         record_ids: Union[int, Sequence[int]],
@@ -1171,6 +1243,183 @@ class PortalClient(PortalClientBase):
         """
         return self.make_request("get", f"api/v1/records/{record_id}/waiting_reason", Dict[str, Any])
 
+    def _watch_records(
+        self,
+        record_ids: Optional[Sequence[int]],
+        dataset_id: Optional[int],
+        known_status: Dict[int, RecordStatusEnum],
+        timeout: float,
+        dataset_cursor: Optional[int] = None,
+    ) -> Dict[int, RecordStatusEnum]:
+        body = RecordWatchBody(
+            record_ids=record_ids,
+            dataset_id=dataset_id,
+            dataset_cursor=dataset_cursor,
+            known_status=known_status,
+            timeout=timeout,
+        )
+        return self.make_request("post", "api/v1/records/watch", Dict[int, RecordStatusEnum], body=body)
+
+    def _iterate_status_changes(
+        self,
+        record_ids: Optional[Union[int, Sequence[int]]],
+        dataset_id: Optional[int],
+        timeout: Optional[float],
+    ) -> Iterator[Tuple[int, RecordStatusEnum]]:
+        """
+        Yields the status of records as they change, until all of them are finished
+
+        The current status of all the records is yielded first. Afterwards, the server is
+        long-polled for changes, which are yielded as they happen.
+
+        Raises TimeoutError if the records are not all finished within the given timeout
+        """
+
+        record_ids = [] if record_ids is None else make_list(record_ids)
+
+        end_time = None if timeout is None else time.time() + timeout
+        batch_size = self.api_limits.get("watch_records", 10000)
+        max_poll_time = self.api_limits.get("watch_timeout", 30)
+
+        # The current status of everything. Records that don't exist are not returned
+        status = {}
+        if dataset_id is not None:
+            # Records of the dataset are returned in pages, ordered by id
+            dataset_cursor = None
+            while True:
+                page = self._watch_records(None, dataset_id, {}, 0.0, dataset_cursor)
+                status.update(page)
+                if len(page) < batch_size:
+                    break
+                dataset_cursor = max(page)
+        for record_id_batch in chunk_iterable(record_ids, batch_size):
+            status.update(self._watch_records(record_id_batch, None, {}, 0.0))
+
+        yield from status.items()
+
+        # Number of times in a row the server returned without waiting (ie, if too many other
+        # requests are already waiting). Used to back off from polling it
+        n_not_waited = 0
+
+        while True:
+            pending = [rid for rid, st in status.items() if st not in _finished_status]
+            if not pending:
+                return
+
+            poll_time = min(max_poll_time, self.timeout / 2)
+            if end_time is not None:
+                remaining = end_time - time.time()
+                if remaining <= 0.0:
+                    raise TimeoutError(f"Timed out waiting for {len(pending)} records to finish")
+                poll_time = min(poll_time, remaining)
+
+            # Only wait on the last batch. Otherwise, changes to records in other batches
+            # would not be noticed until the wait is over
+            batches = list(chunk_iterable(pending, batch_size))
+            for i, record_id_batch in enumerate(batches):
+                batch_time = poll_time if i == len(batches) - 1 else 0.0
+                known_status = {rid: status[rid] for rid in record_id_batch}
+                time_0 = time.time()
+                changed = self._watch_records(record_id_batch, None, known_status, batch_time)
+
+                # The server may return without waiting. Don't poll it in a tight loop
+                elapsed = time.time() - time_0
+                if not changed and elapsed < batch_time:
+                    time.sleep(min(batch_time - elapsed, max_poll_time, self._retry_wait_time(n_not_waited + 1)))
+                    n_not_waited += 1
+                elif batch_time > 0.0:
+                    n_not_waited = 0
+
+                status.update(changed)
+                yield from changed.items()
+
+                # Go back to waiting on the remaining records
+                if changed:
+                    break
+
+    def iterate_completed(
+        self,
+        record_ids: Optional[Union[int, Sequence[int]]] = None,
+        dataset_id: Optional[int] = None,
+        *,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Tuple[int, RecordStatusEnum]]:
+        """
+        Iterates over records as they finish computing
+
+        Records that have already finished are returned first. Then, the server is watched for changes
+        to the records (rather than repeatedly querying the status of all the records), and records
+        are returned as soon as they finish.
+
+        A record is finished when its status is complete, error, cancelled, invalid, or deleted. Records
+        that are not found on the server are not returned.
+
+        Parameters
+        ----------
+        record_ids
+            IDs of the records to wait for
+        dataset_id
+            ID of a dataset. All records of the dataset will be waited for
+        timeout
+            Max amount of time (in seconds) to wait. If None, will wait forever.
+
+        Returns
+        -------
+        :
+            An iterator of (record id, status) tuples, in the order the records finished
+
+        Raises
+        ------
+        TimeoutError
+            If not all records have finished within the timeout
+        """
+
+        for record_id, status in self._iterate_status_changes(record_ids, dataset_id, timeout):
+            if status in _finished_status:
+                yield record_id, status
+
+    def wait_for_records(
+        self,
+        record_ids: Optional[Union[int, Sequence[int]]] = None,
+        dataset_id: Optional[int] = None,
+        *,
+        timeout: Optional[float] = None,
+    ) -> Dict[int, RecordStatusEnum]:
+        """
+        Waits for records to finish computing
+
+        A record is finished when its status is complete, error, cancelled, invalid, or deleted. Rather
+        than repeatedly querying the status of all the records, the server is watched for changes
+        to the records.
+
+        Unlike :meth:`iterate_completed`, this does not raise an exception on timeout. Instead, the
+        status of all the records is returned, and can be checked to see what is not yet finished.
+
+        Parameters
+        ----------
+        record_ids
+            IDs of the records to wait for
+        dataset_id
+            ID of a dataset. All records of the dataset will be waited for
+        timeout
+            Max amount of time (in seconds) to wait. If None, will wait forever.
+
+        Returns
+        -------
+        :
+            Dictionary of record id to the latest status of the record. Records that are not found are
+            not included
+        """
+
+        status = {}
+        try:
+            for record_id, record_status in self._iterate_status_changes(record_ids, dataset_id, timeout):
+                status[record_id] = record_status
+        except TimeoutError:
+            pass
+
+        return status
+
     ##############################################################
     # Singlepoint calculations
     ##############################################################
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import hashlib
+import json
 import logging
 import os
 import random
@@ -152,6 +153,8 @@ class PortalClientBase:
         else:
             self._username = None
             self._password = None
+            self._jwt_access_token = None
+            self._jwt_refresh_token = None
             self._jwt_access_exp = None
             self._jwt_refresh_exp = None
 
@@ -270,6 +273,14 @@ class PortalClientBase:
 
     @property
     def encoding(self) -> str:
+        """
+        Encoding used for sending and receiving data
+
+        This is one of ``application/json`` (the default), ``application/msgpack``, or
+        ``application/msgpack-ndarray``. The last one is msgpack, but with numeric arrays (such as
+        the geometry of large molecules) sent as raw binary data, which is faster to handle on both ends.
+        It requires a server that supports it.
+        """
         return self._encoding
 
     @encoding.setter
@@ -325,9 +336,7 @@ class PortalClientBase:
                     if retry_count >= self.retry_max:
                         raise
 
-                    # eg, if jitter fraction is 0.05, then multiply by something on the range 0.95 to 1.05
-                    jitter = random.uniform(1.0 - self.retry_jitter_fraction, 1.0 + self.retry_jitter_fraction)
-                    time_to_wait = self.retry_delay * (self.retry_backoff**retry_count) * jitter
+                    time_to_wait = self._retry_wait_time(retry_count)
 
                     retry_count += 1
                     self._logger.warning(
@@ -348,38 +357,91 @@ class PortalClientBase:
 
         return ret
 
-    def _get_JWT_token(self) -> None:
+    def _retry_wait_time(self, retry_count: int) -> float:
+        """
+        Time to wait (in seconds) before retrying a request that has already been retried retry_count times
+        """
 
-        full_uri = self.address + "auth/v1/login"
-        json = {"username": self._username, "password": self._password}
+        # eg, if jitter fraction is 0.05, then multiply by something on the range 0.95 to 1.05
+        jitter = random.uniform(1.0 - self.retry_jitter_fraction, 1.0 + self.retry_jitter_fraction)
+        return self.retry_delay * (self.retry_backoff**retry_count) * jitter
 
-        req = requests.Request(method="POST", url=full_uri, json=json)
-        ret = self._send_request(req)
+    def _set_access_token(self, access_token: str) -> None:
+        """
+        Stores a new JWT access token (and its expiration time), and uses it for subsequent requests
+        """
 
-        if ret.status_code == 200:
-            ret_json = ret.json()
+        self._jwt_access_token = access_token
+        self._req_session.headers.update({"Authorization": f"Bearer {self._jwt_access_token}"})
+
+        # Store the expiration time of the access token
+        # (this is a unix epoch timestamp)
+        decoded_access_token = jwt.decode(
+            self._jwt_access_token, algorithms=["HS256"], options={"verify_signature": False}
+        )
+        self._jwt_access_exp = decoded_access_token["exp"]
+        self.user_id = int(decoded_access_token["sub"])  # "identity" "subject"
+
+    def _handle_JWT_login_response(self, status_code: int, ret_json: Optional[Dict[str, Any]], reason: str) -> None:
+        """
+        Handles the response of a login request, storing the tokens or raising an exception
+        """
+
+        if status_code == 200:
             self._jwt_refresh_token = ret_json["refresh_token"]
-            self._jwt_access_token = ret_json["access_token"]
-            self._req_session.headers.update({"Authorization": f"Bearer {self._jwt_access_token}"})
 
-            # Store the expiration time of the access and refresh tokens
-            # (these are unix epoch timestamps)
-            decoded_access_token = jwt.decode(
-                self._jwt_access_token, algorithms=["HS256"], options={"verify_signature": False}
-            )
+            # Store the expiration time of the refresh token
+            # (this is a unix epoch timestamp)
             decoded_refresh_token = jwt.decode(
                 self._jwt_refresh_token, algorithms=["HS256"], options={"verify_signature": False}
             )
-            self._jwt_access_exp = decoded_access_token["exp"]
             self._jwt_refresh_exp = decoded_refresh_token["exp"]
-            self.user_id = int(decoded_access_token["sub"]) # "identity" "subject"
+            self._set_access_token(ret_json["access_token"])
         else:
             try:
-                msg = ret.json()["msg"]
+                msg = ret_json["msg"]
             except:
-                msg = ret.reason
+                msg = reason
             raise AuthenticationFailure(msg)
 
+    def _handle_JWT_refresh_response(self, status_code: int, ret_json: Optional[Dict[str, Any]]) -> bool:
+        """
+        Handles the response of a token refresh request
+
+        Returns True if the refresh token has expired, and a new login is needed
+        """
+
+        if status_code == 200:
+            self._set_access_token(ret_json["access_token"])
+            return False
+
+        msg = ret_json.get("msg", "") if ret_json else ""
+
+        if status_code == 401 and "Token has expired" in msg:
+            # If the refresh token has expired, try to log in again
+            return True
+        elif status_code == 401 and f" is disabled" in msg:
+            raise AuthenticationFailure("User account has been disabled")
+        elif status_code == 401 and f" does not exist" in msg:
+            raise AuthenticationFailure("User account no longer exists")
+        else:  # shouldn't happen unless user is blacklisted or something
+            raise ConnectionRefusedError("Unable to refresh JWT authorization token! This is a server issue!!")
+
+    def _get_JWT_token(self) -> None:
+
+        full_uri = self.address + "auth/v1/login"
+        json = {"username": self._username, "password": self._password}
+
+        req = requests.Request(method="POST", url=full_uri, json=json)
+        ret = self._send_request(req)
+
+        try:
+            ret_json = ret.json()
+        except:
+            ret_json = None
+
+        self._handle_JWT_login_response(ret.status_code, ret_json, ret.reason)
+
     def _refresh_JWT_token(self) -> None:
 
         full_uri = self.address + "auth/v1/refresh"
@@ -388,28 +450,13 @@ class PortalClientBase:
         req = requests.Request(method="POST", url=full_uri, headers=headers)
         ret = self._send_request(req)
 
-        if ret.status_code == 200:
+        try:
             ret_json = ret.json()
-            self._jwt_access_token = ret_json["access_token"]
-            self._req_session.headers.update({"Authorization": f"Bearer {self._jwt_access_token}"})
+        except:
+            ret_json = None
 
-            # Store the expiration time of the access and refresh tokens
-            # (these are unix epoch timestamps)
-            decoded_access_token = jwt.decode(
-                self._jwt_access_token, algorithms=["HS256"], options={"verify_signature": False}
-            )
-            self._jwt_access_exp = decoded_access_token["exp"]
-
-        elif ret.status_code == 401 and "Token has expired" in ret.json()["msg"]:
-            # If the refresh token has expired, try to log in again
+        if self._handle_JWT_refresh_response(ret.status_code, ret_json):
             self._get_JWT_token()
-        elif ret.status_code == 401 and f" is disabled" in ret.json()["msg"]:
-            raise AuthenticationFailure("User account has been disabled")
-        elif ret.status_code == 401 and f" does not exist" in ret.json()["msg"]:
-            raise AuthenticationFailure("User account no longer exists")
-        else:  # shouldn't happen unless user is blacklisted or something
-            print(ret, ret.text)
-            raise ConnectionRefusedError("Unable to refresh JWT authorization token! This is a server issue!!")
 
     def _request(
         self,
@@ -456,19 +503,65 @@ class PortalClientBase:
             return self._request(method, endpoint, body=body, url_params=url_params, internal_retry=False)
 
         if r.status_code != 200:
-            try:
-                # For many errors returned by our code, the error details are returned as json
-                # with the error message stored under "msg"
-                details = r.json()
-            except:
-                # If this error comes from, ie, the web server or something else, then
-                # we have to use 'reason'
-                details = {"msg": r.reason}
-
-            raise PortalRequestError(f"Request failed: {details['msg']}", r.status_code, details)
+            self._raise_request_error(r.status_code, r.content, r.reason)
 
         return r
 
+    @staticmethod
+    def _raise_request_error(status_code: int, content: bytes, reason: str) -> None:
+        """
+        Raises a PortalRequestError, with details obtained from the content of an unsuccessful response
+        """
+
+        try:
+            # For many errors returned by our code, the error details are returned as json
+            # with the error message stored under "msg"
+            details = json.loads(content)
+            details["msg"]
+        except:
+            # If this error comes from, ie, the web server or something else, then
+            # we have to use 'reason'
+            details = {"msg": reason}
+
+        raise PortalRequestError(f"Request failed: {details['msg']}", status_code, details)
+
+    def _prepare_request_data(
+        self,
+        body_model: Optional[Type[_T]],
+        url_params_model: Optional[Type[_U]],
+        body: Optional[Union[_T, Dict[str, Any]]],
+        url_params: Optional[Union[_U, Dict[str, Any]]],
+    ) -> Tuple[Optional[bytes], Optional[Dict[str, Any]]]:
+        """
+        Validates and serializes the body and URL parameters of a request
+
+        Returns
+        -------
+        :
+            The serialized body (or None), and the URL parameters as a dictionary (or None)
+        """
+
+        # If body_model or url_params_model are None, then use the type given
+        if body_model is None and body is not None:
+            body_model = type(body)
+
+        if url_params_model is None and url_params is not None:
+            url_params_model = type(url_params)
+
+        serialized_body = None
+        if body_model is not None:
+            parsed_body = pydantic.TypeAdapter(body_model).validate_python(body)
+            serialized_body = serialize(parsed_body, self.encoding)
+
+        parsed_url_params = None
+        if url_params_model is not None:
+            parsed_url_params = pydantic.TypeAdapter(url_params_model).validate_python(url_params)
+
+        if isinstance(parsed_url_params, pydantic.BaseModel):
+            parsed_url_params = parsed_url_params.model_dump()
+
+        return serialized_body, parsed_url_params
+
     # Overload for giving a response model
     @overload
     def make_request(
@@ -517,24 +610,7 @@ class PortalClientBase:
         allow_retries: bool = True,
         additional_headers: Optional[Dict[str, Any]] = None,
     ) -> _V | None:
-        # If body_model or url_params_model are None, then use the type given
-        if body_model is None and body is not None:
-            body_model = type(body)
-
-        if url_params_model is None and url_params is not None:
-            url_params_model = type(url_params)
-
-        serialized_body = None
-        if body_model is not None:
-            parsed_body = pydantic.TypeAdapter(body_model).validate_python(body)
-            serialized_body = serialize(parsed_body, self.encoding)
-
-        parsed_url_params = None
-        if url_params_model is not None:
-            parsed_url_params = pydantic.TypeAdapter(url_params_model).validate_python(url_params)
-
-        if isinstance(parsed_url_params, pydantic.BaseModel):
-            parsed_url_params = parsed_url_params.model_dump()
+        serialized_body, parsed_url_params = self._prepare_request_data(body_model, url_params_model, body, url_params)
 
         if upload_files is not None:
             # Yes, a list of tuples. We always use the "files" key, and doing it this way
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import lzma
+import threading
 from enum import Enum
-from typing import Optional, Tuple, Any
+from functools import lru_cache
+from typing import Optional, Tuple, Any, Dict
 
 import msgpack
 import zstandard
@@ -18,6 +20,74 @@ class CompressionEnum(str, Enum):
     zstd = "zstd"
 
 
+# Trained zstd dictionaries that can be used for decompression, keyed by dictionary id
+# (which is stored in the header of zstd frames compressed with a dictionary)
+_zstd_dictionaries: Dict[int, zstandard.ZstdCompressionDict] = {}
+
+
+def register_zstd_dictionary(dict_data: bytes) -> zstandard.ZstdCompressionDict:
+    """
+    Registers a trained zstd dictionary, so that data compressed with it can be decompressed
+
+    Returns the dictionary object, which can be passed to :func:`compress`
+    """
+
+    zstd_dict = zstandard.ZstdCompressionDict(dict_data)
+    dict_id = zstd_dict.dict_id()
+
+    if dict_id == 0:
+        raise ValueError("Data is not a trained zstd dictionary (dictionary id is 0)")
+
+    _zstd_dictionaries[dict_id] = zstd_dict
+    return zstd_dict
+
+
+@lru_cache()
+def load_zstd_dictionary(path: str) -> zstandard.ZstdCompressionDict:
+    """
+    Loads a trained zstd dictionary from a file and registers it (see :func:`register_zstd_dictionary`)
+    """
+
+    with open(path, "rb") as f:
+        return register_zstd_dictionary(f.read())
+
+
+# Compressors are reused (creating them, especially with a dictionary, is expensive).
+# They are not thread-safe, so each thread gets its own
+_zstd_compressors = threading.local()
+
+
+def _get_zstd_compressor(
+    compression_level: int, n_threads: int, zstd_dict: Optional[zstandard.ZstdCompressionDict]
+) -> zstandard.ZstdCompressor:
+    if not hasattr(_zstd_compressors, "cache"):
+        _zstd_compressors.cache = {}
+
+    key = (compression_level, n_threads, None if zstd_dict is None else zstd_dict.dict_id())
+    cctx = _zstd_compressors.cache.get(key, None)
+    if cctx is None:
+        cctx = zstandard.ZstdCompressor(level=compression_level, dict_data=zstd_dict, threads=n_threads)
+        _zstd_compressors.cache[key] = cctx
+
+    return cctx
+
+
+def _get_zstd_decompressor(dict_id: int) -> zstandard.ZstdDecompressor:
+    if not hasattr(_zstd_compressors, "dcache"):
+        _zstd_compressors.dcache = {}
+
+    dctx = _zstd_compressors.dcache.get(dict_id, None)
+    if dctx is None:
+        zstd_dict = _zstd_dictionaries.get(dict_id, None)
+        if zstd_dict is None:
+            raise RuntimeError(f"Data was compressed with zstd dictionary {dict_id}, which has not been registered")
+
+        dctx = zstandard.ZstdDecompressor(dict_data=zstd_dict)
+        _zstd_compressors.dcache[dict_id] = dctx
+
+    return dctx
+
+
 def get_compressed_ext(compression_type: str) -> str:
     if compression_type == CompressionEnum.none:
         return ""
@@ -32,11 +102,18 @@ def compress(
     input_data: Any,
     compression_type: CompressionEnum = CompressionEnum.zstd,
     compression_level: Optional[int] = None,
+    *,
+    n_threads: int = 0,
+    zstd_dict: Optional[zstandard.ZstdCompressionDict] = None,
 ) -> Tuple[bytes, CompressionEnum, int]:
     """Serializes and compresses data given a compression scheme and level
 
     If compression_level is None, but a compression_type is specified, an appropriate default level is chosen
 
+    For zstd, the compression can use multiple threads (n_threads > 0, or -1 for the number of cpus), and
+    a trained dictionary. Data compressed with a dictionary can only be decompressed where that
+    dictionary has been registered.
+
     Returns a tuple containing the compressed data, applied compression type, and compression level (which may
     be different from the provided arguments)
     """
@@ -65,7 +142,10 @@ def compress(
                 compression_level = 6
             else:
                 compression_level = 16
-        data = zstandard.compress(data, level=compression_level)
+        if n_threads != 0 or zstd_dict is not None:
+            data = _get_zstd_compressor(compression_level, n_threads, zstd_dict).compress(data)
+        else:
+            data = zstandard.compress(data, level=compression_level)
     else:
         # Shouldn't ever happen, unless we change CompressionEnum but not the rest of this function
         raise TypeError(f"Unknown compression type: {compression_type}")
@@ -82,7 +162,11 @@ def decompress(compressed_data: bytes, compression_type: CompressionEnum) -> Any
     elif compression_type == CompressionEnum.lzma:
         decompressed_data = lzma.decompress(compressed_data)
     elif compression_type == CompressionEnum.zstd:
-        decompressed_data = zstandard.decompress(compressed_data)
+        dict_id = zstandard.get_frame_parameters(compressed_data).dict_id
+        if dict_id == 0:
+            decompressed_data = zstandard.decompress(compressed_data)
+        else:
+            decompressed_data = _get_zstd_decompressor(dict_id).decompress(compressed_data)
     else:
         # Shouldn't ever happen, unless we change CompressionEnum but not the rest of this function
         raise TypeError(f"Unknown compression type: {compression_type}")
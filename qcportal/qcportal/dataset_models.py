@@ -3,7 +3,7 @@ from __future__ import annotations
 import logging
 import math
 import os
-from collections.abc import Iterable, Callable, Sequence, Mapping
+from collections.abc import Iterable, Iterator, Callable, Sequence, Mapping
 from datetime import datetime
 from enum import Enum
 from typing import (
@@ -11,6 +11,7 @@ from typing import (
     Any,
     Type,
     ClassVar,
+    Literal,
 )
 
 import pydantic
@@ -25,7 +26,7 @@ from qcportal.external_files import ExternalFile
 from qcportal.internal_jobs import InternalJob, InternalJobStatusEnum
 from qcportal.metadata_models import DeleteMetadata, InsertMetadata, InsertCountsMetadata, UpdateMetadata
 from qcportal.record_models import PriorityEnum, RecordStatusEnum, BaseRecord
-from qcportal.utils import make_list, chunk_iterable
+from qcportal.utils import make_list, chunk_iterable, prefetch_iterable
 
 if TYPE_CHECKING:
     from qcportal.client import PortalClient
@@ -39,6 +40,7 @@ class DatasetAttachmentType(str, Enum):
 
     other = "other"
     view = "view"
+    properties = "properties"
 
 
 class DatasetAttachment(ExternalFile):
@@ -667,6 +669,7 @@ class BaseDataset(BaseModel):
         exclude: Iterable[str] | None = None,
         *,
         include_children: bool = True,
+        refresh_view_id: int | None = None,
     ) -> InternalJob:
         """
         Creates a view of this dataset on the server
@@ -694,6 +697,10 @@ class BaseDataset(BaseModel):
         include_children
             Specifies whether child records associated with the main records should also be included (recursively)
             in the view file.
+        refresh_view_id
+            ID of an existing view to update (see :meth:`list_views`). Only records that have changed since that
+            view was created are updated, which is much faster for large datasets. The other options should match
+            those used to create that view. The updated view is stored as a new view.
 
         Returns
         -------
@@ -708,11 +715,126 @@ class BaseDataset(BaseModel):
             include=include,
             exclude=exclude,
             include_children=include_children,
+            refresh_view_id=refresh_view_id,
         )
 
         job_id = self._client.make_request("post", f"{self._base_url}/create_view", int, body=body)
         return self.get_internal_job(job_id)
 
+    #########################################
+    # Properties files
+    #########################################
+    def list_properties_files(self):
+        return [x for x in self.attachments if x.attachment_type == DatasetAttachmentType.properties]
+
+    def create_properties_file(
+        self,
+        properties: Iterable[str],
+        description: str,
+        provenance: dict[str, Any],
+        status: Iterable[RecordStatusEnum] | None = None,
+        file_format: Literal["parquet", "arrow"] = "parquet",
+    ) -> InternalJob:
+        """
+        Creates a columnar file of record properties for this dataset on the server
+
+        The file contains one row per record, with the entry name, specification name, record id, and status,
+        plus one column per requested property. Once complete, the file is attached to the dataset, and
+        can be loaded with :meth:`get_properties_table`.
+
+        This function will return an :class:`~qcportal.internal_jobs.InternalJob` which can be used to watch
+        for completion if desired. The job will run server side without user interaction.
+
+        Parameters
+        ----------
+        properties
+            Keys of the record properties to include as columns
+        description
+            String describing the properties file
+        provenance
+            Dictionary with any metadata or other information about the file. Information regarding
+            the options used to create the file will be added.
+        status
+            List of statuses to include. Default is to include records with any status
+        file_format
+            Format of the file. Either "parquet" or "arrow" (Arrow IPC file format)
+
+        Returns
+        -------
+        :
+            An :class:`~qcportal.internal_job.InternalJob` object which can be used to watch for completion.
+        """
+
+        body = DatasetCreatePropertiesFileBody(
+            description=description,
+            provenance=provenance,
+            properties=make_list(properties),
+            status=status,
+            file_format=file_format,
+        )
+
+        job_id = self._client.make_request("post", f"{self._base_url}/create_properties_file", int, body=body)
+        return self.get_internal_job(job_id)
+
+    def get_properties_table(
+        self,
+        properties_file_id: int | None = None,
+        destination_path: str | None = None,
+    ):
+        """
+        Downloads a properties file for this dataset and loads it as a pyarrow Table
+
+        The file is memory-mapped rather than read into memory. Properties that are not numbers, strings, or
+        booleans (or that have a mixture of types) are stored as JSON strings.
+
+        Requires the `pyarrow` package.
+
+        Parameters
+        ----------
+        properties_file_id
+            ID of the properties file to load. See :meth:`list_properties_files`. If `None`, will use the latest file
+        destination_path
+            Full path to download the file to (including filename). If `None`, the file will be placed in the
+            cache directory (if caching to disk is enabled) or the current directory.
+
+        Returns
+        -------
+        :
+            A pyarrow Table containing the properties
+        """
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        my_files = self.list_properties_files()
+
+        if not my_files:
+            raise ValueError(f"No properties files available for this dataset")
+
+        if properties_file_id is None:
+            properties_file_id = max(my_files, key=lambda x: x.created_on).id
+
+        file_map = {x.id: x for x in my_files}
+        if properties_file_id not in file_map:
+            raise ValueError(f"File id {properties_file_id} is not a valid properties file for this dataset")
+
+        file_data = file_map[properties_file_id]
+
+        if destination_path is None:
+            if self._client.cache.is_disk:
+                destination_dir = self._client.cache.cache_dir
+            else:
+                destination_dir = os.getcwd()
+            destination_path = os.path.join(destination_dir, f"{properties_file_id}_{file_data.file_name}")
+
+        if not os.path.exists(destination_path):
+            self.download_attachment(properties_file_id, destination_path)
+
+        if file_data.file_name.endswith(".parquet"):
+            return pq.read_table(destination_path, memory_map=True)
+        else:
+            return pa.ipc.open_file(pa.memory_map(destination_path, "r")).read_all()
+
     #########################################
     # Various properties and getters/setters
     #########################################
@@ -1407,6 +1529,44 @@ class BaseDataset(BaseModel):
 
         return update_records
 
+    def _sync_record_changes(self):
+        """
+        Obtains information about records that have changed on the server since the last time this was called
+
+        The information is stored in the cache, so that the cost of finding out which records have
+        changed scales with the number of changes, rather than the number of records in the dataset.
+        """
+
+        since = self._cache_data.get_record_changes_cursor()
+        after = None
+        as_of = None
+
+        while True:
+            body = DatasetFetchRecordChangesBody(since=since, after=after)
+            record_changes = self._client.make_request(
+                "post",
+                f"{self._base_url}/records/changes",
+                DatasetRecordChanges,
+                body=body,
+            )
+
+            # Everything before the first as_of was finished when we started. Later pages may see more
+            # finished transactions, but may have missed changes from them on earlier pages
+            if as_of is None:
+                as_of = record_changes.as_of
+
+            # Also called with no changes, which removes stored changes for records that have since been updated
+            changes = record_changes.changes
+            self._cache_data.update_record_changes([(rid, rstatus, mtime) for _, _, rid, rstatus, mtime, _ in changes])
+
+            if not changes:
+                break
+
+            _, _, last_record_id, _, _, last_xid = changes[-1]
+            after = (last_xid, last_record_id)
+
+        self._cache_data.set_record_changes_cursor(as_of)
+
     def _internal_update_records(
         self,
         entry_names: Iterable[str],
@@ -1440,35 +1600,23 @@ class BaseDataset(BaseModel):
         if not updateable_record_info:
             return []
 
-        batch_size = math.ceil(self._client.api_limits["get_records"] / 4)
-        server_modified_time: dict[int, datetime] = {}  # record_id -> modified time on server
-
         # Find out which records have been updated on the server
-        for record_info_batch in chunk_iterable(updateable_record_info, batch_size):
-            record_id_batch = [x[2] for x in record_info_batch]
+        # (only records that have changed since they were cached are returned)
+        self._sync_record_changes()
+        server_record_info = self._cache_data.get_record_changes([x[2] for x in updateable_record_info])
 
-            # Do a raw call to the records/bulkGet endpoint. This allows us to only get
-            # the 'modified_on' and 'status' fields
-            server_record_info = self._client.make_request(
-                "post",
-                f"{self._base_url_prefix}/records/bulkGet",
-                list[dict[str, Any]],
-                body=CommonBulkGetBody(ids=record_id_batch, include=["id", "modified_on", "status"]),
-            )
-
-            # Too lazy to look up how pydantic stores datetime, so use pydantic to parse it
-            for sri in server_record_info:
-                # Only store if the status on the server matches what the caller wants
-                if status is None or sri["status"] in status:
-                    server_modified_time[sri["id"]] = pydantic.TypeAdapter(datetime).validate_python(sri["modified_on"])
+        batch_size = math.ceil(self._client.api_limits["get_records"] / 4)
 
         # Which ones need to be fully updated
         need_updating: dict[str, list[str]] = {}  # key is specification, value is list of entry names
         for entry_name, spec_name, record_id, _, local_mtime in updateable_record_info:
-            server_mtime = server_modified_time.get(record_id, None)
+            sri = server_record_info.get(record_id, None)
+            if sri is None:
+                continue
 
-            # Perhaps the record doesn't exist on the server anymore or something
-            if server_mtime is None:
+            # Only update if the status on the server matches what the caller wants
+            server_status, server_mtime = sri
+            if status is not None and server_status not in status:
                 continue
 
             if local_mtime < server_mtime:
@@ -1647,6 +1795,59 @@ class BaseDataset(BaseModel):
 
         return record
 
+    def _iterate_record_batches(
+        self,
+        entry_names: list[str],
+        specification_names: list[str],
+        status: list[RecordStatusEnum] | None,
+        include: Iterable[str] | None,
+        fetch_updated: bool,
+        force_refetch: bool,
+    ) -> Iterator[list[tuple[str, str, BaseRecord]]]:
+        """
+        Obtains records from the cache and/or the server, one batch (of entries and a single specification) at a time
+
+        Records in each batch are not returned in any particular order, and are not filtered by status
+        """
+
+        batch_size: int = math.ceil(self._client.api_limits["get_records"])
+
+        for spec_name in specification_names:
+            for entry_names_batch in chunk_iterable(entry_names, batch_size):
+                records_batch = []
+
+                # Handle existing records that need to be updated
+                if force_refetch:
+                    r = self._internal_fetch_records(entry_names_batch, [spec_name], status, include)
+                    records_batch.extend(r)
+
+                else:
+                    missing_entries = entry_names_batch.copy()
+
+                    if fetch_updated:
+                        updated_records = self._internal_update_records(missing_entries, [spec_name], status, include)
+                        records_batch.extend(updated_records)
+
+                        # what wasn't updated
+                        updated_entries = [x for x, _, _ in updated_records]
+                        missing_entries = [e for e in entry_names_batch if e not in updated_entries]
+
+                    # Check if we have any cached records
+                    cached_records = self._cache_data.get_dataset_records(missing_entries, [spec_name])
+                    for _, _, cr in cached_records:
+                        cr.propagate_client(self._client, self._base_url_prefix)
+
+                    records_batch.extend(cached_records)
+
+                    # what we need to fetch from the server
+                    cached_entries = [x[0] for x in cached_records]
+                    missing_entries = [e for e in missing_entries if e not in cached_entries]
+
+                    fetched_records = self._internal_fetch_records(missing_entries, [spec_name], status, include)
+                    records_batch.extend(fetched_records)
+
+                yield records_batch
+
     def iterate_records(
         self,
         entry_names: str | Iterable[str] | None = None,
@@ -1655,7 +1856,20 @@ class BaseDataset(BaseModel):
         include: Iterable[str] | None = None,
         fetch_updated: bool = True,
         force_refetch: bool = False,
+        prefetch: int = 0,
     ):
+        """
+        Iterate over records of the dataset, returning tuples of (entry name, specification name, record)
+
+        Records are obtained in batches. By default, each batch is obtained only when it is needed.
+        If ``prefetch`` is greater than zero (and connected to a server), up to that many batches are obtained
+        (from the cache or the server) in a background thread while the current batch is being processed.
+
+        The background thread uses this dataset's cache and client. While iterating with ``prefetch``,
+        the loop must not use this dataset, its client, or anything that may fetch data from the server
+        (such as fields of the records that have not been fetched yet - use ``include`` to fetch them up front).
+        """
+
         #########################################################
         # We duplicate a little bit of fetch_records here, since
         # we want to yield in the middle
@@ -1693,48 +1907,18 @@ class BaseDataset(BaseModel):
                     for e, s, r in record_data:
                         yield e, s, r
         else:
-            batch_size: int = math.ceil(self._client.api_limits["get_records"])
-
-            for spec_name in specification_names:
-                for entry_names_batch in chunk_iterable(entry_names, batch_size):
-                    records_batch = []
-
-                    # Handle existing records that need to be updated
-                    if force_refetch:
-                        r = self._internal_fetch_records(entry_names_batch, [spec_name], status, include)
-                        records_batch.extend(r)
-
-                    else:
-                        missing_entries = entry_names_batch.copy()
-
-                        if fetch_updated:
-                            updated_records = self._internal_update_records(
-                                missing_entries, [spec_name], status, include
-                            )
-                            records_batch.extend(updated_records)
-
-                            # what wasn't updated
-                            updated_entries = [x for x, _, _ in updated_records]
-                            missing_entries = [e for e in entry_names_batch if e not in updated_entries]
-
-                        # Check if we have any cached records
-                        cached_records = self._cache_data.get_dataset_records(missing_entries, [spec_name])
-                        for _, _, cr in cached_records:
-                            cr.propagate_client(self._client, self._base_url_prefix)
-
-                        records_batch.extend(cached_records)
-
-                        # what we need to fetch from the server
-                        cached_entries = [x[0] for x in cached_records]
-                        missing_entries = [e for e in missing_entries if e not in cached_entries]
+            record_batches = self._iterate_record_batches(
+                entry_names, specification_names, status, include, fetch_updated, force_refetch
+            )
 
-                        fetched_records = self._internal_fetch_records(missing_entries, [spec_name], status, include)
-                        records_batch.extend(fetched_records)
+            if prefetch > 0:
+                record_batches = prefetch_iterable(record_batches, prefetch)
 
-                    # Let the writeback mechanism handle writing to the cache
-                    for e, s, r in records_batch:
-                        if status is None or r.status in status:
-                            yield e, s, r
+            for records_batch in record_batches:
+                # Let the writeback mechanism handle writing to the cache
+                for e, s, r in records_batch:
+                    if status is None or r.status in status:
+                        yield e, s, r
 
     def remove_records(
         self,
@@ -2576,6 +2760,24 @@ class DatasetFetchRecordsBody(RestModelBase):
     status: list[RecordStatusEnum] | None = None
 
 
+class DatasetFetchRecordChangesBody(RestModelBase):
+    since: int | None = None
+    after: tuple[int, int] | None = None
+    limit: int | None = None
+
+
+class DatasetRecordChanges(BaseModel):
+    """
+    Records of a dataset that have changed on the server
+
+    Changes are (entry name, specification name, record id, status, modified_on, change transaction id).
+    All changes made by transactions before `as_of` are included.
+    """
+
+    changes: list[tuple[str, str, int, RecordStatusEnum, datetime, int]]
+    as_of: int
+
+
 class DatasetCreateViewBody(RestModelBase):
     description: str
     provenance: dict[str, Any]
@@ -2583,6 +2785,15 @@ class DatasetCreateViewBody(RestModelBase):
     include: list[str] | None = (None,)
     exclude: list[str] | None = (None,)
     include_children: bool = (True,)
+    refresh_view_id: int | None = None
+
+
+class DatasetCreatePropertiesFileBody(RestModelBase):
+    description: str
+    provenance: dict[str, Any]
+    properties: list[str]
+    status: list[RecordStatusEnum] | None = None
+    file_format: Literal["parquet", "arrow"] = "parquet"
 
 
 class DatasetSubmitBody(RestModelBase):
@@ -880,3 +880,37 @@ def run_dataset_model_view(ds, test_entries, test_spec, entry_extra_compare, tmp
     ds = ds._client.get_dataset_by_id(ds.id)
     assert len(ds.attachments) == 0
     assert len(ds.list_views()) == 0
+
+
+def run_dataset_model_properties_file(ds, test_entries, test_spec, tmp_path_factory):
+    pytest.importorskip("pyarrow")
+
+    ds.add_specification("spec_1", test_spec)
+    ds.add_entries(test_entries)
+    ds.submit()
+
+    for file_format in ["parquet", "arrow"]:
+        ij = ds.create_properties_file(["return_energy"], f"test_{file_format}", {"a": "b"}, file_format=file_format)
+        ij.watch(interval=0.1, timeout=10)
+        assert ij.status == InternalJobStatusEnum.complete
+
+    ds = ds._client.get_dataset_by_id(ds.id)
+    props_files = ds.list_properties_files()
+    assert len(props_files) == 2
+    assert len(ds.list_views()) == 0
+
+    for pf in props_files:
+        destfile = tmp_path_factory.mktemp("properties") / pf.file_name
+        table = ds.get_properties_table(pf.id, str(destfile))
+        assert destfile.exists()
+
+        assert table.column_names == ["entry_name", "specification_name", "record_id", "status", "return_energy"]
+        assert sorted(table.column("entry_name").to_pylist()) == sorted(ds.entry_names)
+        assert set(table.column("specification_name").to_pylist()) == {"spec_1"}
+        assert set(table.column("status").to_pylist()) == {RecordStatusEnum.waiting.value}
+
+    for pf in props_files:
+        ds.delete_attachment(pf.id)
+
+    ds = ds._client.get_dataset_by_id(ds.id)
+    assert len(ds.list_properties_files()) == 0
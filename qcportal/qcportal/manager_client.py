@@ -131,7 +131,13 @@ class ManagerClient(PortalClientBase):
         # Don't retry - will be handled elsewhere
         return self.make_request("post", "compute/v1/tasks/claim", List[RecordTask], body=body, allow_retries=False)
 
-    def return_finished(self, results_compressed: Dict[int, bytes]) -> TaskReturnMetadata:
+    def return_finished(
+        self, results_compressed: Dict[int, bytes], claimed_by: Optional[Dict[int, str]] = None
+    ) -> TaskReturnMetadata:
+        # claimed_by is for results returned on behalf of another (previous) manager
+        if claimed_by is None:
+            claimed_by = {}
+
         # Chunk based on the server limit
         results_flat = list(results_compressed.items())
         n_results = len(results_flat)
@@ -139,9 +145,11 @@ class ManagerClient(PortalClientBase):
 
         task_return_meta = TaskReturnMetadata()
         for chunk in range(0, n_results, limit):
+            results_chunk = {k: v for k, v in results_flat[chunk : chunk + limit]}
             body = TaskReturnBody(
                 name_data=self.manager_name_data,
-                results_compressed={k: v for k, v in results_flat[chunk : chunk + limit]},
+                results_compressed=results_chunk,
+                claimed_by={k: v for k, v in claimed_by.items() if k in results_chunk},
             )
 
             # Don't retry - will be handled elsewhere
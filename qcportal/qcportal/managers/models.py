@@ -60,6 +60,7 @@ class ComputeManager(BaseModel):
     compute_tags: list[str]
 
     claimed: int
+    claimed_generated_inline: int = 0
     successes: int
     failures: int
     rejected: int
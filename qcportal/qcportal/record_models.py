@@ -823,6 +823,22 @@ class RecordRevertBody(RestModelBase):
     record_ids: list[int]
 
 
+class RecordWatchBody(RestModelBase):
+    record_ids: list[int] | None = None
+    dataset_id: int | None = None
+    dataset_cursor: int | None = None
+    known_status: dict[int, RecordStatusEnum] = {}
+    timeout: float = 0.0
+
+
+class RecordFetchDescendantsBody(RestModelBase):
+    record_ids: list[int]
+    include: list[str] | None = None
+    exclude: list[str] | None = None
+    after_record_id: int | None = None
+    limit: int | None = None
+
+
 class RecordQueryFilters(QueryModelBase):
     record_id: list[int] | None = None
     record_type: list[str] | None = None
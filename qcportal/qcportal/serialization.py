@@ -1,5 +1,7 @@
 import base64
 import json
+import struct
+from functools import lru_cache
 from typing import Any, Type, TypeVar
 
 import msgpack
@@ -26,6 +28,45 @@ def _msgpack_encode(obj: Any) -> Any:
     return pydantic_core.to_jsonable_python(obj)
 
 
+# msgpack extension type code used for numpy arrays in the msgpack-ndarray encoding
+_ndarray_ext_code = 1
+
+
+@lru_cache(maxsize=256)
+def _ndarray_ext_header(dtype: str, shape: tuple[int, ...]) -> bytes:
+    header = msgpack.dumps((dtype, shape))
+    return struct.pack("<I", len(header)) + header
+
+
+def _msgpack_ndarray_encode(obj: Any) -> Any:
+    # Same as _msgpack_encode, but numpy arrays are kept as arrays (with their shape) rather than
+    # converted to lists. The data of the array is stored as raw little-endian bytes, so it can be
+    # read directly into an array by the receiver.
+    #
+    # The payload of the extension type is a 4-byte header length, the msgpack header
+    # (dtype string & shape), and then the raw array data
+    if isinstance(obj, np.ndarray) and obj.shape and obj.dtype.kind in "biuf":
+        if obj.dtype.byteorder == ">" or (obj.dtype.byteorder == "=" and np.little_endian is False):
+            obj = obj.astype(obj.dtype.newbyteorder("<"))
+
+        obj = np.ascontiguousarray(obj)
+        return msgpack.ExtType(_ndarray_ext_code, _ndarray_ext_header(obj.dtype.str, obj.shape) + obj.tobytes())
+
+    return _msgpack_encode(obj)
+
+
+def _msgpack_ndarray_decode(code: int, data: bytes) -> Any:
+    if code != _ndarray_ext_code:
+        return msgpack.ExtType(code, data)
+
+    (header_len,) = struct.unpack_from("<I", data)
+    dtype, shape = msgpack.loads(data[4 : 4 + header_len])
+
+    # Array is a read-only view into the received data (no copy)
+    arr = np.frombuffer(memoryview(data)[4 + header_len :], dtype=dtype)
+    return arr.reshape(shape)
+
+
 class _JSONEncoder(json.JSONEncoder):
     def default(self, obj: Any) -> Any:
         # JSON does not handle byte arrays
@@ -52,6 +93,9 @@ def deserialize(data: bytes | str, content_type: str, model: Type[_V]) -> _V:
     if content_type == "msgpack":
         d = msgpack.loads(data, raw=False, strict_map_key=False)
         return pydantic.TypeAdapter(model).validate_python(d)
+    elif content_type == "msgpack-ndarray":
+        d = msgpack.loads(data, raw=False, strict_map_key=False, ext_hook=_msgpack_ndarray_decode)
+        return pydantic.TypeAdapter(model).validate_python(d)
     elif content_type == "json":
         return pydantic.TypeAdapter(model).validate_json(data)
     else:
@@ -64,6 +108,8 @@ def serialize(data, content_type: str) -> bytes:
 
     if content_type == "msgpack":
         return msgpack.dumps(data, default=_msgpack_encode, use_bin_type=True)
+    elif content_type == "msgpack-ndarray":
+        return msgpack.dumps(data, default=_msgpack_ndarray_encode, use_bin_type=True)
     elif content_type == "json":
         return json.dumps(data, cls=_JSONEncoder).encode("utf-8")
     else:
@@ -154,3 +154,9 @@ def test_singlepoint_dataset_model_modify_records(snowflake_client: PortalClient
 def test_singlepoint_dataset_model_create_view(dataset_submit_test_client: PortalClient, tmp_path_factory):
     ds = dataset_submit_test_client.add_dataset("singlepoint", "Test dataset")
     ds_helpers.run_dataset_model_view(ds, test_entries, test_specs[0], entry_extra_compare, tmp_path_factory)
+
+
+@pytest.mark.skipif(not s3_tests_enabled, reason="S3 tests not enabled")
+def test_singlepoint_dataset_model_create_properties_file(dataset_submit_test_client: PortalClient, tmp_path_factory):
+    ds = dataset_submit_test_client.add_dataset("singlepoint", "Test dataset")
+    ds_helpers.run_dataset_model_properties_file(ds, test_entries, test_specs[0], tmp_path_factory)
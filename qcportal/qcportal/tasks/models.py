@@ -42,3 +42,8 @@ class TaskClaimBody(RestModelBase):
 class TaskReturnBody(RestModelBase):
     name_data: ManagerName = Field(..., description="Name information about this manager")
     results_compressed: dict[int, QCPortalBytes]
+    claimed_by: dict[int, str] = Field(
+        {},
+        description="For results returned on behalf of a previous manager (from its outbox), the name of the manager "
+        "that claimed the task",
+    )
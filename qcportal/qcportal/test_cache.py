@@ -1,10 +1,13 @@
 from __future__ import annotations
 
 import gc
+import os
 import threading
 from typing import TYPE_CHECKING
 from urllib.parse import urlparse
 
+import apsw
+
 from qcportal.dataset_models import load_dataset_view
 from qcportal.record_models import RecordStatusEnum
 from qcportal.singlepoint import SinglepointDataset
@@ -130,6 +133,43 @@ def test_dataset_cache_update(snowflake_client: PortalClient):
             assert r.status == RecordStatusEnum.cancelled
 
 
+def test_dataset_cache_record_changes(snowflake_client: PortalClient):
+    ds: SinglepointDataset = snowflake_client.add_dataset("singlepoint", "Test dataset")
+
+    ds.add_specification("spec_1", test_specs[0])
+    ds.add_entries(test_entries)
+    ds.submit()
+    ds.fetch_records()
+
+    # First sync gets info for all the records
+    assert ds._cache_data.get_record_changes_cursor() is None
+    r = ds.get_record(test_entries[0].name, "spec_1")
+    sync_cursor = ds._cache_data.get_record_changes_cursor()
+    assert sync_cursor is not None
+
+    # Nothing has changed, so nothing is stored
+    record_ids = [x[2] for x in ds._cache_data.get_existing_dataset_records(ds.entry_names, ["spec_1"])]
+    assert ds._cache_data.get_record_changes(record_ids) == {}
+
+    record_id = r.id
+    snowflake_client.cancel_records(record_id)
+    del r
+
+    # Stored by the sync, but removed by the next sync once the record is updated
+    ds._sync_record_changes()
+    changes = ds._cache_data.get_record_changes(record_ids)
+    assert list(changes.keys()) == [record_id]
+    assert changes[record_id][0] == RecordStatusEnum.cancelled
+    assert ds._cache_data.get_record_changes_cursor() > sync_cursor
+
+    r = ds.get_record(test_entries[0].name, "spec_1")
+    assert r.status == RecordStatusEnum.cancelled
+    del r
+
+    ds._sync_record_changes()
+    assert ds._cache_data.get_record_changes(record_ids) == {}
+
+
 def test_dataset_cache_multithread(snowflake: QCATestingSnowflake):
     snowflake_client: PortalClient = snowflake.client()
 
@@ -277,3 +317,164 @@ def test_dataset_cache_fromfile_view(snowflake: QCATestingSnowflake, tmp_path):
     ds2 = load_dataset_view(cachefile_path)
     assert ds2.is_view
     assert ds2.get_record(test_entries[0].name, "spec_1") is not None
+
+
+def test_dataset_cache_statistics(snowflake: QCATestingSnowflake, tmp_path):
+    client = snowflake.client(cache_dir=str(tmp_path / "ptlcache"))
+    ds: SinglepointDataset = client.add_dataset("singlepoint", "Test dataset")
+
+    ds.add_specification("spec_1", test_specs[0])
+    ds.add_entries(test_entries)
+    ds.submit()
+    ds.fetch_records()
+
+    stats = client.cache.stats
+    assert stats.hits == stats.misses == 0
+
+    for e in test_entries:
+        assert ds._cache_data.get_dataset_record(e.name, "spec_1") is not None
+    assert stats.hits == len(test_entries)
+
+    record_ids = [r.id for _, _, r in ds.iterate_records()]
+    assert ds._cache_data.get_records([*record_ids, 9999], ds._record_type)
+    assert stats.hits == 3 * len(test_entries)
+    assert stats.misses == 1
+
+
+def test_dataset_cache_access_times(snowflake: QCATestingSnowflake, tmp_path):
+    client = snowflake.client(cache_dir=str(tmp_path / "ptlcache"))
+    ds: SinglepointDataset = client.add_dataset("singlepoint", "Test dataset")
+
+    ds.add_specification("spec_1", test_specs[0])
+    ds.add_entries(test_entries)
+    ds.submit()
+    ds.fetch_records()
+
+    cache_data = ds._cache_data
+    cache_data.flush_access_times()
+    cache_data._conn.execute("UPDATE records SET last_accessed = 100")
+
+    # Reading does not write to the file every time
+    ename = test_entries[0].name
+    rid = cache_data.get_dataset_record(ename, "spec_1").id
+    stmt = "SELECT last_accessed FROM records WHERE id = ?"
+    assert cache_data._conn.execute(stmt, (rid,)).fetchone()[0] == 100
+
+    cache_data.flush_access_times()
+    assert cache_data._conn.execute(stmt, (rid,)).fetchone()[0] > 100
+
+    other_times = cache_data._conn.execute("SELECT last_accessed FROM records WHERE id != ?", (rid,)).fetchall()
+    assert all(t == 100 for (t,) in other_times)
+
+
+def test_dataset_cache_evict_lru(snowflake: QCATestingSnowflake, tmp_path):
+    client = snowflake.client(cache_dir=str(tmp_path / "ptlcache"))
+
+    ds1: SinglepointDataset = client.add_dataset("singlepoint", "Test dataset 1")
+    ds2: SinglepointDataset = client.add_dataset("singlepoint", "Test dataset 2")
+    for ds in (ds1, ds2):
+        ds.add_specification("spec_1", test_specs[0])
+        ds.add_entries(test_entries)
+        ds.submit()
+        ds.fetch_records()
+
+    # Set the access times explicitly. Oldest is in the second dataset
+    ename_1, ename_2 = test_entries[0].name, test_entries[1].name
+    rid_1 = ds1.get_record(ename_1, "spec_1").id
+    rid_2 = ds2.get_record(ename_2, "spec_1").id
+    ds1._cache_data._conn.execute("UPDATE records SET last_accessed = 200")
+    ds1._cache_data._conn.execute("UPDATE records SET last_accessed = 100 WHERE id = ?", (rid_1,))
+    ds2._cache_data._conn.execute("UPDATE records SET last_accessed = 300")
+    ds2._cache_data._conn.execute("UPDATE records SET last_accessed = 50 WHERE id = ?", (rid_2,))
+
+    assert client.cache._evict_records(1) == 1
+    assert rid_2 not in ds2._cache_data.get_records_modified_on()
+    assert rid_1 in ds1._cache_data.get_records_modified_on()
+
+    assert client.cache._evict_records(1) == 1
+    assert rid_1 not in ds1._cache_data.get_records_modified_on()
+    assert client.cache.stats.evicted_records == 2
+    assert client.cache.stats.evicted_bytes > 0
+
+    # Evicted records are fetched from the server again
+    assert ds2.get_record(ename_2, "spec_1").id == rid_2
+    assert rid_2 in ds2._cache_data.get_records_modified_on()
+
+    # Records evicted from the cache are still part of the dataset
+    records = list(ds1.iterate_records())
+    assert len(records) == len(test_entries)
+    assert rid_1 in ds1._cache_data.get_records_modified_on()
+
+
+def test_dataset_cache_max_size(snowflake: QCATestingSnowflake, tmp_path):
+    client = snowflake.client(cache_dir=str(tmp_path / "ptlcache"))
+    ds: SinglepointDataset = client.add_dataset("singlepoint", "Test dataset")
+
+    ds.add_specification("spec_1", test_specs[0])
+    ds.add_specification("spec_2", test_specs[1])
+    ds.add_entries(test_entries)
+    ds.submit()
+
+    # No limit
+    ds.fetch_records()
+    assert client.cache.enforce_max_size() == 0
+    assert len(ds._cache_data.get_records_modified_on()) == 2 * len(test_entries)
+
+    # Very small limit - everything is evicted as soon as it is written
+    client.cache.max_size = 1
+    ds.fetch_records(force_refetch=True)
+    assert ds._cache_data.get_records_modified_on() == {}
+    assert client.cache.stats.evicted_records >= 2 * len(test_entries)
+
+    # Everything still works without the records in the cache
+    assert len(list(ds.iterate_records())) == 2 * len(test_entries)
+
+    client.cache.max_size = 0
+    ds.fetch_records(force_refetch=True)
+    full_size = client.cache.get_cache_size()
+
+    # Nothing to do if under the limit
+    client.cache.max_size = full_size
+    assert client.cache.enforce_max_size() == 0
+
+    client.cache.max_size = full_size - 1
+    assert client.cache.enforce_max_size() > 0
+    assert len(ds._cache_data.get_records_modified_on()) < 2 * len(test_entries)
+
+
+def test_dataset_cache_vacuum(snowflake: QCATestingSnowflake, tmp_path):
+    client = snowflake.client(cache_dir=str(tmp_path / "ptlcache"))
+    ds: SinglepointDataset = client.add_dataset("singlepoint", "Test dataset")
+
+    ds.add_specification("spec_1", test_specs[0])
+    ds.add_entries(test_entries)
+
+    # Some large (fake) records, so that deleting them frees pages in the file
+    ds._cache_data.update_records_compressed([(1000 + i, "complete", 0.0, os.urandom(8192)) for i in range(20)])
+
+    cache_name = f"dataset_{ds.id}"
+    cache_path = client.cache.get_cache_path(cache_name)
+
+    def _pragma(name):
+        conn = apsw.Connection(cache_path, flags=apsw.SQLITE_OPEN_READONLY)
+        try:
+            return conn.pragma(name)
+        finally:
+            conn.close()
+
+    assert _pragma("auto_vacuum") == 2
+
+    # Convert to a file that does not support incremental vacuum (as created by older versions)
+    ds._cache_data._conn.pragma("auto_vacuum", "NONE")
+    ds._cache_data._conn.execute("VACUUM")
+    assert _pragma("auto_vacuum") == 0
+
+    ds._cache_data.delete_records(list(ds._cache_data.get_records_modified_on().keys()))
+    assert _pragma("freelist_count") > 0
+
+    client.cache.vacuum(cache_name)
+    assert _pragma("auto_vacuum") == 2
+    assert _pragma("freelist_count") == 0
+
+    # Vacuuming everything
+    client.cache.vacuum()
@@ -0,0 +1,35 @@
+from typing import Any
+
+import numpy as np
+import pytest
+
+from qcportal.serialization import serialize, deserialize
+
+
+@pytest.mark.parametrize("dtype", ["<f8", ">f8", "<f4", "<i8", ">i2", "|b1"])
+@pytest.mark.parametrize("shape", [(5,), (4, 3), (2, 3, 2)])
+def test_serialization_msgpack_ndarray(dtype: str, shape: tuple):
+    arr = np.arange(np.prod(shape)).astype(dtype).reshape(shape)
+
+    d = deserialize(serialize({"arr": arr, "other": [1, 2]}, "msgpack-ndarray"), "msgpack-ndarray", dict[str, Any])
+    assert d["other"] == [1, 2]
+    assert isinstance(d["arr"], np.ndarray)
+    assert d["arr"].shape == shape
+    assert d["arr"].dtype.byteorder in ("<", "|", "=")
+    assert np.array_equal(d["arr"], arr)
+
+    # Plain msgpack flattens into a list
+    d = deserialize(serialize({"arr": arr}, "msgpack"), "msgpack", dict[str, Any])
+    assert d["arr"] == arr.ravel().tolist()
+
+
+def test_serialization_msgpack_ndarray_other():
+    # Non-numeric arrays and scalars are converted as they are with plain msgpack
+    data = {"str": np.array(["H", "He"]), "scalar": np.array(5.0), "obj": np.array([1, "a"], dtype=object)}
+    d = deserialize(serialize(data, "msgpack-ndarray"), "msgpack-ndarray", dict[str, Any])
+    assert d == {"str": ["H", "He"], "scalar": 5.0, "obj": [1, "a"]}
+
+    # Non-contiguous arrays
+    arr = np.arange(20.0).reshape(4, 5)[:, 1:3]
+    d = deserialize(serialize(arr, "msgpack-ndarray"), "msgpack-ndarray", Any)
+    assert np.array_equal(d, arr)
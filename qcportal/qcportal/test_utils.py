@@ -1,4 +1,8 @@
-from qcportal.utils import chunk_iterable, seconds_to_hms, duration_to_seconds, is_included
+import time
+
+import pytest
+
+from qcportal.utils import chunk_iterable, seconds_to_hms, duration_to_seconds, is_included, prefetch_iterable
 
 
 def test_chunk_iterable():
@@ -90,3 +94,57 @@ def test_is_included():
         assert is_included("test", ["**"], ["test"], d) is False
         assert is_included("test", ["test"], ["test"], d) is False
         assert is_included("test", ["test2"], ["test"], d) is False
+
+
+def test_prefetch_iterable():
+    assert list(prefetch_iterable(range(100), 1)) == list(range(100))
+    assert list(prefetch_iterable(range(100), 5)) == list(range(100))
+    assert list(prefetch_iterable([], 2)) == []
+
+    # The iterable is computed ahead, but only by a limited amount
+    produced = []
+
+    def _gen():
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    it = prefetch_iterable(_gen(), 3)
+    assert next(it) == 0
+    time.sleep(0.5)
+    assert len(produced) <= 5
+
+    # Stopping early
+    it.close()
+    time.sleep(1.0)
+    assert len(produced) <= 6
+
+    # Exceptions are raised in order
+    def _gen_error():
+        yield 1
+        yield 2
+        raise RuntimeError("Error in iterable")
+
+    it = prefetch_iterable(_gen_error(), 2)
+    assert next(it) == 1
+    assert next(it) == 2
+    with pytest.raises(RuntimeError, match=r"Error in iterable"):
+        next(it)
+
+
+def test_prefetch_iterable_close_waits():
+    # Once closed, the iterable is no longer being used by the background thread
+    in_use = []
+
+    def _gen():
+        for i in range(20):
+            in_use.append(True)
+            time.sleep(0.2)
+            in_use.pop()
+            yield i
+
+    it = prefetch_iterable(_gen(), 1)
+    assert next(it) == 0
+    time.sleep(0.1)
+    it.close()
+    assert in_use == []
@@ -9,8 +9,10 @@ import itertools
 import json
 import logging
 import math
+import queue
 import random
 import re
+import threading
 import time
 from contextlib import contextmanager, redirect_stderr, redirect_stdout
 from hashlib import sha256
@@ -253,6 +255,78 @@ def process_iterable(
         yield from chunk
 
 
+def prefetch_iterable(it: Iterable[_T], n_prefetch: int) -> Generator[_T, None, None]:
+    """
+    Iterate over an iterable, while computing the next elements in a background thread
+
+    Up to 'n_prefetch' elements are computed ahead of the one being consumed, so that (for example) the next
+    batches of data can be downloaded while the current batch is being processed. The elements are returned
+    in order, and at most n_prefetch+2 elements (the one being consumed, the ones waiting, and the one being
+    computed) exist at once.
+
+    Exceptions raised while computing elements are raised when the corresponding element would be returned.
+
+    The iterable is advanced in the background thread while the caller is processing the elements it
+    has been given. Anything used by both the iterable and the caller must therefore be safe to use from
+    two threads at once. Once this generator is closed (or finishes), the background thread has stopped.
+    """
+
+    if n_prefetch < 1:
+        raise ValueError("n_prefetch must be >= 1")
+
+    result_queue = queue.Queue(maxsize=n_prefetch)
+    stop_event = threading.Event()
+
+    # Sentinel marking the end of the iterable
+    end_marker = object()
+
+    def _put(item) -> bool:
+        # Returns False if the consumer has stopped
+        while not stop_event.is_set():
+            try:
+                result_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for x in it:
+                if not _put((x, None)):
+                    break
+            else:
+                _put((end_marker, None))
+        except BaseException as e:
+            _put((end_marker, e))
+        finally:
+            # Close generators from the thread that was running them
+            if hasattr(it, "close"):
+                it.close()
+
+    producer = threading.Thread(target=_produce, name="prefetch_iterable", daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item, exception = result_queue.get()
+            if exception is not None:
+                raise exception
+            if item is end_marker:
+                break
+            yield item
+    finally:
+        stop_event.set()
+
+        # Make room for an element being added, then wait for the producer to finish with the iterable
+        while True:
+            try:
+                result_queue.get_nowait()
+            except queue.Empty:
+                break
+        producer.join()
+
+
 def seconds_to_hms(seconds: Union[float, int]) -> str:
     """
     Converts a number of seconds (as an integer) to a string representing hh:mm:ss